@@ -0,0 +1,9 @@
+"""
+Offline benchmarks for the pv_forecast package.
+
+All benchmarks run on synthetic DWD data (see synthetic_data.py), no network
+access is required. Run a single benchmark e.g. with:
+
+    python -m benchmark.bench_reshape
+
+"""
@@ -0,0 +1,71 @@
+"""
+Benchmark of the streaming back-test (see pv_forecast.backtest) against a one-shot
+run of the whole history: time and peak memory (tracemalloc) for 10 minute
+observations of 3 months, written to a csv file.
+
+The synthetic observations are generated per chunk (like reading the cache per day),
+so only the one-shot run holds the whole history in memory. Each chunk adds a fixed
+time (setup of the pvlib models per calculation, about 0.5 s), chunks of one week or
+longer keep this overhead small.
+
+Usage: python -m benchmark.bench_backtest
+
+"""
+import os, tempfile, configparser, tracemalloc
+import pandas as pd
+
+from benchmark.synthetic_data import observation_frame
+from benchmark.timing import best_time, print_table
+from pv_forecast.reshape import reshape_observation
+from pv_forecast.calculation import setup_solar_processing, setup_pv_system, calculate_forecast
+from pv_forecast.backtest import history_chunks, run_backtest, csv_writer
+
+CONFIG_FILE = os.path.join(os.path.dirname(__file__), "..", "configuration.ini")
+START = pd.Timestamp("2020-04-01", tz="utc")
+DAYS = 91
+
+
+def synthetic_history(start, end):
+    """ Reshaped synthetic observations within start / end (both included) """
+    periods = int((end - start) / pd.Timedelta(minutes=10)) + 1
+    return reshape_observation(observation_frame(start=start.tz_localize(None), periods=periods,
+                                                 seed=int(start.timestamp()) % 2**31))
+
+
+def measure(func):
+    """ Time [s] of a run and peak memory [MB] of a second run (tracemalloc slows down the run) """
+    seconds, _ = best_time(func, 1)
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def run():
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE)
+    solar_proc = setup_solar_processing(config)
+    pv_system = setup_pv_system(config, solar_proc.location)
+    end = START + pd.Timedelta(days=DAYS) - pd.Timedelta(minutes=10)
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        def one_shot():
+            dwddata = pd.concat(history_chunks(synthetic_history, START, end, pd.Timedelta(days=7)))
+            calculate_forecast(dwddata, solar_proc, pv_system).to_csv(os.path.join(tmp_dir, "one_shot.csv"))
+        seconds, peak = measure(one_shot)
+        rows.append(["one-shot", "-", "%.1f" % seconds, "%.0f" % peak])
+
+        for days in [1, 7, 28]:
+            seconds, peak = measure(lambda: run_backtest(
+                history_chunks(synthetic_history, START, end, pd.Timedelta(days=days)), solar_proc, pv_system,
+                [csv_writer(os.path.join(tmp_dir, "chunked.csv"))]))
+            rows.append(["chunked", "%d days" % days, "%.1f" % seconds, "%.0f" % peak])
+    pv_system.close()
+    print("%d days of 10 minute observations" % DAYS)
+    print_table(["run", "chunk", "time [s]", "peak memory [MB]"], rows)
+    return rows
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,85 @@
+"""
+Benchmark of the batch forecasting engine (pv_forecast.batch_forecast) for 10, 100
+and 1000 sites sharing 5 MOSMIX stations (240 h forecast, 1 to 3 arrays per site).
+The sites are spread around the stations (+-0.3 deg). The batch is run with the exact
+site coordinates and with coordinates rounded to 0.1 deg (location_decimals=1), which
+lets nearby sites share solar position, clearsky and irradiance decomposition.
+
+For reference, the per-site calculation as done by main.calculate (Solar_Processing
++ PVSystem / ModelChain set up per site) is timed for the smallest batch.
+
+Usage: python -m benchmark.bench_batch [workers]
+
+"""
+import sys
+import numpy as np
+import pandas as pd
+
+from benchmark.synthetic_data import mosmix_frame
+from benchmark.timing import best_time, print_table
+from pv_forecast.reshape import reshape_mosmix
+from pv_forecast.batch_forecast import BatchForecast
+from pv_forecast.solar_parameters import Solar_Processing
+from pv_forecast.pv_system import PVSystem
+from pv_forecast.calculation import calculate_forecast
+
+PV_MODULE = "LG_Electronics_Inc__LG355N1C_V5"
+INVERTER = "Kostal_Plenticore__Plus_4_2"
+STATIONS = ["P%04d" % i for i in range(5)]
+
+
+def site_tables(n_sites, seed=0):
+    """ Random sites around the stations with 1 - 3 arrays each. """
+    rng = np.random.default_rng(seed)
+    station_index = rng.integers(0, len(STATIONS), n_sites)
+    station_latitude = np.linspace(50.0, 53.0, len(STATIONS))[station_index]
+    station_longitude = np.linspace(6.0, 12.0, len(STATIONS))[station_index]
+    sites = pd.DataFrame({"site_id": ["site_%04d" % i for i in range(n_sites)],
+                          "latitude": np.round(station_latitude + rng.uniform(-0.3, 0.3, n_sites), 4),
+                          "longitude": np.round(station_longitude + rng.uniform(-0.3, 0.3, n_sites), 4),
+                          "altitude": np.round(rng.uniform(0.0, 100.0, n_sites), -2),
+                          "station": np.asarray(STATIONS)[station_index]})
+    rows = []
+    for site_id in sites["site_id"]:
+        for array in range(rng.integers(1, 4)):
+            rows.append((site_id, "array_%d" % array, rng.uniform(10.0, 45.0), rng.uniform(90.0, 270.0),
+                         int(rng.integers(4, 12))))
+    arrays = pd.DataFrame(rows, columns=["site_id", "array_id", "surface_tilt", "surface_azimuth", "modules_per_string"])
+    return sites, arrays
+
+
+def per_site_loop(weather, sites, arrays):
+    """ Calculation of each site on its own like main.calculate. """
+    for site in sites.itertuples(index=False):
+        solar_proc = Solar_Processing(site.latitude, site.longitude, site.altitude, "utc")
+        pv_system = PVSystem(inverter=INVERTER, pv_module=PV_MODULE, albedo=0.2, pvlib_location=solar_proc.location)
+        for array in arrays[arrays["site_id"] == site.site_id].itertuples(index=False):
+            pv_system.add_pv_system(id=array.array_id, surface_tilt=array.surface_tilt,
+                                    surface_azimuth=array.surface_azimuth,
+                                    modules_per_string=array.modules_per_string)
+        calculate_forecast(weather[site.station].copy(), solar_proc, pv_system)
+
+
+def run(repeat=1, workers=4):
+    weather = {station: reshape_mosmix(mosmix_frame(station_id=station, seed=i)) for i, station in enumerate(STATIONS)}
+    weather_source = lambda station: weather[station]
+
+    rows = []
+    for n_sites in [10, 100, 1000]:
+        sites, arrays = site_tables(n_sites)
+        if n_sites == 10:
+            loop_time, _ = best_time(lambda: per_site_loop(weather, sites, arrays), repeat)
+            rows.append([n_sites, len(arrays), "per site loop", n_sites, "-", "%.1f" % (n_sites / loop_time), "-", "-"])
+        for label, location_decimals in [("batch", None), ("batch 0.1 deg grid", 1)]:
+            batch = BatchForecast(weather_source, pv_module=PV_MODULE, inverter=INVERTER, workers=workers,
+                                  location_decimals=location_decimals)
+            batch_time, result = best_time(lambda: batch.run(sites, arrays), repeat)
+            rows.append([n_sites, len(arrays), label, batch.stats["locations"], len(result),
+                         "%.1f" % (n_sites / batch_time), "%.2f" % batch.stats["prepare_seconds"],
+                         "%.2f" % batch.stats["evaluate_seconds"]])
+    print_table(["sites", "arrays", "variant", "locations", "rows", "sites/s", "prepare [s]", "evaluate [s]"], rows)
+    return rows
+
+
+if __name__ == "__main__":
+    run(workers=int(sys.argv[1]) if len(sys.argv) > 1 else 4)
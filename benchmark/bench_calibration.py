@@ -0,0 +1,58 @@
+"""
+Benchmark of the parameter sweep (see pv_forecast.calibration) against running the
+complete calculation (calculate_forecast with pvlib ModelChains) once per combination.
+
+Input: 10 minute observations of one month, 1080 combinations of tilt, azimuth (east
+array), albedo, decomposition mode, aoi and spectral model. The ModelChain loop is
+timed for a few combinations and extrapolated.
+
+Usage: python -m benchmark.bench_calibration
+
+"""
+import os, configparser
+
+from benchmark.synthetic_data import observation_frame
+from benchmark.timing import best_time, print_table
+from pv_forecast.reshape import reshape_observation
+from pv_forecast.calculation import setup_solar_processing, setup_pv_system, calculate_forecast
+from pv_forecast.calibration import setup_parameter_sweep
+
+CONFIG_FILE = os.path.join(os.path.dirname(__file__), "..", "configuration.ini")
+
+GRID = {"surface_tilt": [20, 25, 30, 35, 40, 45],
+        "surface_azimuth_Ost": [90, 95, 100, 105, 110],
+        "albedo": [0.1, 0.2, 0.3],
+        "mode": ["clearsky", "disc", "dirint"],
+        "aoi_model": ["no_loss", "physical"],
+        "spectral_model": ["no_loss", "first_solar"]}
+
+
+def run(loop_samples=3):
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE)
+    dwddata = reshape_observation(observation_frame(periods=6 * 24 * 30))
+
+    # All modes of one combination per calculate_forecast run
+    solar_proc = setup_solar_processing(config)
+    pv_system = setup_pv_system(config, solar_proc.location)
+    loop_time, result = best_time(lambda: calculate_forecast(dwddata.copy(), solar_proc, pv_system), loop_samples)
+    pv_system.close()
+
+    sweep = setup_parameter_sweep(config)
+    prepare_time, _ = best_time(lambda: sweep.prepare(dwddata), 1)
+    combinations = sweep.combinations(GRID)
+    rank_time, ranking = best_time(lambda: sweep.rank(combinations, result["ALL_AC_POWER_disc"]), 1)
+
+    runs = len(combinations) // len(GRID["mode"])
+    rows = [["ModelChain loop (extrapolated)", len(combinations), "%.1f" % (loop_time * runs)],
+            ["sweep: prepare", "", "%.1f" % prepare_time],
+            ["sweep: simulate + rank", len(combinations), "%.1f" % rank_time]]
+    print("%d rows (%d evaluated), speedup %.0fx" % (len(dwddata), len(sweep.inputs["rows"]),
+                                                    loop_time * runs / (prepare_time + rank_time)))
+    print_table(["", "combinations", "time [s]"], rows)
+    print(ranking.head(5).to_string())
+    return rows
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,58 @@
+"""
+Benchmark of the component database (pv_forecast.component_db) against
+pvlib.pvsystem.retrieve_sam, which parses the whole SAM library for each lookup.
+
+Cases: lookup of one module / inverter by name (cold: database opened for the lookup,
+warm: database already open), prefix search and fuzzy search of a module name.
+The database is built once in a temporary directory, the build time is reported
+separately.
+
+Usage: python -m benchmark.bench_components
+
+"""
+import os, tempfile, time
+import pvlib
+
+from benchmark.timing import best_time, print_table
+from pv_forecast.component_db import build_database, ComponentDatabase
+
+MODULE = "LG_Electronics_Inc__LG335N1C_A5"
+INVERTER = "Kostal_Solar_Electric__Piko_5_3_US"
+
+
+def run(repeat=5):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "components.db")
+        start = time.perf_counter()
+        build_database(path)
+        build_time = time.perf_counter() - start
+
+        def cold(kind, name):
+            return ComponentDatabase(path).get(kind, name)
+
+        database = ComponentDatabase(path)
+        # First searches set up the sorted names / trigrams:
+        search_setup, _ = best_time(lambda: database.search("module", "LG Electronics"), 1)
+        fuzzy_setup, _ = best_time(lambda: database.fuzzy("module", "LG Electronic LG335N1C-A5"), 1)
+
+        rows = []
+        for kind, name, library in [("module", MODULE, "cecmod"), ("inverter", INVERTER, "cecinverter")]:
+            sam_time, _ = best_time(lambda: pvlib.pvsystem.retrieve_sam(library)[name], repeat)
+            cold_time, _ = best_time(lambda: cold(kind, name), repeat)
+            warm = ComponentDatabase(path)
+            # First lookup only (later lookups return the kept record)
+            warm_time, _ = best_time(lambda: warm._records.clear() or warm.get(kind, name), repeat)
+            rows.append([kind + " lookup", "%.1f" % (sam_time * 1e3), "%.2f" % (cold_time * 1e3),
+                         "%.3f" % (warm_time * 1e3), "%.0fx" % (sam_time / warm_time)])
+        prefix_time, _ = best_time(lambda: database.search("module", "LG Electronics Inc LG33"), repeat)
+        fuzzy_time, _ = best_time(lambda: database.fuzzy("module", "LG Electronic LG335N1C-A5"), repeat)
+
+    print("Build of the database: %.1f s" % build_time)
+    print_table(["case", "retrieve_sam [ms]", "cold [ms]", "warm [ms]", "speed-up (warm)"], rows)
+    print_table(["search", "first [ms]", "then [ms]"],
+                [["prefix", "%.1f" % (search_setup * 1e3), "%.3f" % (prefix_time * 1e3)],
+                 ["fuzzy", "%.1f" % (fuzzy_setup * 1e3), "%.2f" % (fuzzy_time * 1e3)]])
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,59 @@
+"""
+Benchmark of the forecast evaluation (pv_forecast.evaluation): one year of forecast
+runs (MOSMIX L, 240 h, issued each 6 hours, 3 modes) against one year of measured
+ac power (5 minute inverter log) on an hourly grid, and one year of 10 minute
+history calculations on a 10 minute grid.
+
+Usage: python -m benchmark.bench_evaluation
+
+"""
+import numpy as np
+import pandas as pd
+
+from benchmark.timing import best_time, print_table
+from pv_forecast.calculation import LIST_OF_MODES
+from pv_forecast.evaluation import measured_ac, evaluate, AC_POWER_CHANNELS
+
+
+def log_frame(start="2020-01-01", days=365, seed=0):
+    """ Synthetic inverter log (5 minutes) with the ac power of the phases """
+    rng = np.random.default_rng(seed)
+    index = pd.date_range(start, periods=days * 24 * 12, freq="5min", tz="UTC")
+    hours = index.hour.to_numpy() + index.minute.to_numpy() / 60.
+    power = 1400. * np.clip(np.sin((hours - 5.) / 15. * np.pi), 0., None) * rng.uniform(0.2, 1., len(index))
+    return pd.DataFrame({channel: (power / 3.).astype(np.float32) for channel in AC_POWER_CHANNELS}, index=index)
+
+
+def forecast_frame(measured, issue_times, horizon, freq, seed=1):
+    """ Long forecast table (all runs and modes) deviating randomly from the measurement """
+    rng = np.random.default_rng(seed)
+    step = pd.Timedelta(freq)
+    issue = np.repeat(issue_times.asi8, horizon)
+    target = issue + np.tile(np.arange(1, horizon + 1) * step.value, len(issue_times))
+    truth = measured.reindex(pd.DatetimeIndex(target, tz="UTC")).to_numpy()
+    frames = []
+    for number, mode in enumerate(LIST_OF_MODES):
+        frames.append(pd.DataFrame({"issue_time": pd.DatetimeIndex(issue, tz="UTC"),
+                                    "target_time": pd.DatetimeIndex(target, tz="UTC"), "mode": mode,
+                                    "ac": (truth * rng.normal(1. + 0.1 * number, 0.2, len(truth))).astype(np.float32)}))
+    return pd.concat(frames, ignore_index=True)
+
+
+def run(repeat=3):
+    log_data = log_frame()
+    rows = []
+    cases = [("forecast runs (6 h, 240 h)", "1h", pd.date_range("2020-01-01", "2020-12-21", freq="6h", tz="UTC"), 240),
+             ("history (10 min)", "10min", pd.date_range("2020-01-01", periods=1, tz="UTC"), 6 * 24 * 364)]
+    for label, freq, issue_times, horizon in cases:
+        resample_time, measured = best_time(lambda: measured_ac(log_data, freq), repeat)
+        forecasts = forecast_frame(measured, issue_times, horizon, freq)
+        evaluate_time, evaluation = best_time(lambda: evaluate(forecasts, measured, freq=freq), repeat)
+        rows.append([label, len(forecasts), "%.3f" % resample_time, "%.3f" % evaluate_time,
+                     "%.0f" % (len(forecasts) / evaluate_time),
+                     " ".join("%s %.2f" % item for item in evaluation["mode"]["skill"].items())])
+    print_table(["case", "forecast rows", "resample [s]", "evaluate [s]", "rows/s", "skill"], rows)
+    return rows
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,65 @@
+"""
+Scaling benchmark of the parallel execution of the model chains (all arrays x
+calculation modes in one pool of workers, see PVSystem.run_models) against the
+serial calculation.
+
+Input: 10 minute observations (history back-test) for a pv system with 2 and 8
+arrays. The result of each parallel run is checked to be identical to the serial one.
+
+Usage: python -m benchmark.bench_parallel [days]
+
+"""
+import os, sys
+import pandas as pd
+
+from benchmark.synthetic_data import observation_frame
+from benchmark.timing import best_time, print_table
+from pv_forecast.reshape import reshape_observation
+from pv_forecast.solar_parameters import Solar_Processing
+from pv_forecast.pv_system import PVSystem
+from pv_forecast.calculation import calculate_forecast
+
+PV_MODULE = "LG_Electronics_Inc__LG355N1C_V5"
+INVERTER = "Kostal_Plenticore__Plus_4_2"
+
+
+def setup_system(n_arrays, solar_proc, workers, executor):
+    pv_system = PVSystem(inverter=INVERTER, pv_module=PV_MODULE, albedo=0.14,
+                         pvlib_location=solar_proc.location, workers=workers, executor=executor)
+    for i in range(n_arrays):
+        pv_system.add_pv_system(id="array_%d" % i, surface_tilt=40, surface_azimuth=90 + 180 * i / max(n_arrays - 1, 1),
+                                modules_per_string=7)
+    return pv_system
+
+
+def run(days=365, repeat=1):
+    dwddata = reshape_observation(observation_frame(periods=6 * 24 * days))
+    solar_proc = Solar_Processing(51.4, 6.86, 90, "utc")
+    core_counts = sorted({1, 2, 4, os.cpu_count() or 1})
+
+    rows = []
+    for n_arrays in [2, 8]:
+        serial_system = setup_system(n_arrays, solar_proc, 1, "process")
+        serial_time, serial = best_time(lambda: calculate_forecast(dwddata.copy(), solar_proc, serial_system), repeat)
+        rows.append([n_arrays, "serial", 1, "%.2f" % serial_time, "1.0x", "-"])
+        for executor in ["process", "thread"]:
+            for workers in core_counts:
+                if workers == 1:
+                    continue
+                pv_system = setup_system(n_arrays, solar_proc, workers, executor)
+                try:
+                    # first run starts the pool / sets up the model chains within the workers
+                    calculate_forecast(dwddata.copy(), solar_proc, pv_system)
+                    parallel_time, parallel = best_time(lambda: calculate_forecast(dwddata.copy(), solar_proc, pv_system), repeat)
+                finally:
+                    pv_system.close()
+                identical = parallel.equals(serial)
+                rows.append([n_arrays, executor, workers, "%.2f" % parallel_time,
+                             "%.1fx" % (serial_time / parallel_time), identical])
+    print("%d days of 10 minute data (%d rows), %d cpus" % (days, len(dwddata), os.cpu_count() or 1))
+    print_table(["arrays", "executor", "workers", "time [s]", "speedup", "identical"], rows)
+    return rows
+
+
+if __name__ == "__main__":
+    run(days=int(sys.argv[1]) if len(sys.argv) > 1 else 365)
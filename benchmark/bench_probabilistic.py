@@ -0,0 +1,46 @@
+"""
+Benchmark of the probabilistic forecast (see pv_forecast.probabilistic): scenarios
+of a MOSMIX L forecast (240 h) evaluated as one batch, against running the
+deterministic calculation (calculate_forecast) once per scenario. The time per
+scenario of the loop is measured on 10 runs and extrapolated; calculate_forecast
+calculates all three modes, its time is divided by three for the one mode of the
+scenarios.
+
+Usage: python -m benchmark.bench_probabilistic
+
+"""
+import os, configparser
+
+from benchmark.synthetic_data import mosmix_frame
+from benchmark.timing import best_time, print_table
+from pv_forecast.reshape import reshape_mosmix
+from pv_forecast.calculation import LIST_OF_MODES, setup_solar_processing, setup_pv_system, calculate_forecast
+from pv_forecast.probabilistic import ProbabilisticForecast
+
+CONFIG_FILE = os.path.join(os.path.dirname(__file__), "..", "configuration.ini")
+LOOP_RUNS = 10
+
+
+def run():
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE)
+    solar_proc = setup_solar_processing(config)
+    pv_system = setup_pv_system(config, solar_proc.location)
+    dwddata = reshape_mosmix(mosmix_frame(hours=240))
+
+    loop_time, _ = best_time(lambda: [calculate_forecast(dwddata.copy(), solar_proc, pv_system)
+                                      for _ in range(LOOP_RUNS)], 1)
+    scenario_time = loop_time / LOOP_RUNS / len(LIST_OF_MODES)
+    rows = []
+    for scenarios in [100, 1000]:
+        forecast = ProbabilisticForecast(solar_proc, pv_system, scenarios=scenarios, seed=0)
+        batch_time, _ = best_time(lambda: forecast.calculate(dwddata), 3)
+        rows.append([scenarios, "%.2f" % batch_time, "%.1f" % (scenario_time * scenarios),
+                     "%.0fx" % (scenario_time * scenarios / batch_time)])
+    pv_system.close()
+    print("MOSMIX L forecast: %d hours" % len(dwddata))
+    print_table(["scenarios", "batch [s]", "loop of calculate_forecast [s] (one mode)", "speed-up"], rows)
+
+
+if __name__ == "__main__":
+    run()
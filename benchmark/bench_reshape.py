@@ -0,0 +1,66 @@
+"""
+Benchmark of the reshape stage: pivot_table + per-element lambdas (as used before)
+against the vectorized reshape in pv_forecast.reshape.
+
+Frames:
+- MOSMIX L (240 h x 9 elements) for a growing number of stations
+- 10 minute observations of one month and one year
+
+Usage: python -m benchmark.bench_reshape
+
+"""
+import pandas as pd
+
+from benchmark.synthetic_data import mosmix_frame, observation_frame
+from benchmark.timing import best_time, print_table
+from pv_forecast.reshape import reshape_mosmix, reshape_observation
+
+
+def legacy_reshape_mosmix(raw_data):
+    """ Reshape as done before by DWD_Forecast.reshape_data. """
+    reshaped_data = pd.pivot_table(raw_data, values="value", index=["date"], columns="parameter", aggfunc='first')
+    reshaped_data.index = reshaped_data.index - pd.offsets.Hour(1)
+    reshaped_data.columns = reshaped_data.columns.add_categories(["TEMPERATURE_AIR_200DEGC", "DEW_POINT_DEGC", "RAD_WH", "wind_speed"])
+    reshaped_data["TEMPERATURE_AIR_200DEGC"] = reshaped_data["TEMPERATURE_AIR_200"].apply(lambda x: x - 273.15)
+    reshaped_data["DEW_POINT_DEGC"] = reshaped_data["TEMPERATURE_DEW_POINT_200"].apply(lambda x: x - 273.15)
+    reshaped_data["RAD_WH"] = reshaped_data["RADIATION_GLOBAL"].apply(lambda x: x * 0.277778)
+    reshaped_data['WIND_SPEED'] = reshaped_data['WIND_SPEED'].astype(float)
+    return reshaped_data
+
+
+def legacy_reshape_observation(raw_data):
+    """ Reshape as done before by DWD_History.reshape_data. """
+    reshaped_data = pd.pivot_table(raw_data, values="value", index=["date"], columns="parameter", aggfunc='first')
+    reshaped_data.columns = reshaped_data.columns.add_categories(["RAD_WH", "RAD_DIFFUS", "PRESSURE_AIR_SURFACE_REDUCED", "WIND_SPEED", "TEMPERATURE_AIR_200DEGC", "DEW_POINT_DEGC"])
+    reshaped_data["TEMPERATURE_AIR_200DEGC"] = reshaped_data["temperature_air_200"]
+    reshaped_data["DEW_POINT_DEGC"] = reshaped_data["temperature_dew_point_200"]
+    reshaped_data["RAD_WH"] = reshaped_data["radiation_global"].apply(lambda x: x * 16.666666667)
+    reshaped_data["RAD_DIFFUS"] = reshaped_data["radiation_sky_diffuse"].apply(lambda x: x * 16.666666667)
+    reshaped_data['WIND_SPEED'] = reshaped_data['wind_speed'].astype(float)
+    reshaped_data["PRESSURE_AIR_SURFACE_REDUCED"] = reshaped_data["pressure_air_station_height"].astype(float)
+    return reshaped_data
+
+
+def run(repeat=3):
+    cases = []
+    for n_stations in [1, 10, 100]:
+        frames = [mosmix_frame(station_id="P%04d" % i, seed=i) for i in range(n_stations)]
+        cases.append(("MOSMIX L 240h x %d stations" % n_stations, frames,
+                      legacy_reshape_mosmix, reshape_mosmix))
+    for label, periods in [("observations 1 month", 6 * 24 * 30), ("observations 1 year", 6 * 24 * 365)]:
+        cases.append((label, [observation_frame(periods=periods)],
+                      legacy_reshape_observation, reshape_observation))
+
+    rows = []
+    for label, frames, legacy, vectorized in cases:
+        n_rows = sum(len(frame) for frame in frames)
+        legacy_time, _ = best_time(lambda: [legacy(frame) for frame in frames], repeat)
+        new_time, _ = best_time(lambda: [vectorized(frame) for frame in frames], repeat)
+        rows.append([label, n_rows, "%.0f" % (n_rows / legacy_time), "%.0f" % (n_rows / new_time),
+                     "%.1fx" % (legacy_time / new_time)])
+    print_table(["case", "rows", "before [rows/s]", "after [rows/s]", "speedup"], rows)
+    return rows
+
+
+if __name__ == "__main__":
+    run()
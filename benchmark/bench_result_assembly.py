@@ -0,0 +1,115 @@
+"""
+Benchmark of the result assembly (see pv_forecast.result_assembly) against the
+previous column by column assembly (combine_data inserting one column after the
+other, pd.concat per mode and of the weather data): time, peak memory (tracemalloc)
+and blocks of the result for one year of 10 minute observations (52560 rows, two
+pv systems, three modes, 150 columns).
+
+The model results are calculated once by the stacked engine, only their assembly
+is measured. "peak / result" is the peak memory in units of the result size, i.e.
+the number of copies of the result held at once.
+
+Usage: python -m benchmark.bench_result_assembly
+
+"""
+import os, configparser, tracemalloc
+import pandas as pd
+
+from benchmark.synthetic_data import observation_frame
+from benchmark.timing import best_time, print_table
+from pv_forecast.reshape import reshape_observation
+from pv_forecast.calculation import (LIST_OF_MODES, setup_solar_processing, setup_pv_system,
+                                     decompose_irradiance, mode_irradiance)
+from pv_forecast.pv_model import SolarGeometry
+from pv_forecast.result_assembly import RESULT_SERIES, RESULT_FRAMES, ResultAssembly
+
+CONFIG_FILE = os.path.join(os.path.dirname(__file__), "..", "configuration.ini")
+PERIODS = 365 * 144
+
+
+def previous_combine_data(results, ids, current_mode):
+    """ Previous PVSystem.combine_data: one column after the other, total by substring match """
+    data_dict = pd.DataFrame()
+    for id in ids:
+        pv_system = results[id]
+        for pv_key in RESULT_SERIES:
+            data_dict[id + "_" + pv_key + "_" + current_mode] = getattr(pv_system, pv_key)
+        for pv_key in RESULT_FRAMES:
+            data_ = getattr(pv_system, pv_key)
+            for column in data_.columns:
+                data_dict[id + "_" + pv_key + "_" + column + "_" + current_mode] = data_[column]
+    all_ac_columns = [col_name for col_name in data_dict.columns if "_ac" in col_name]
+    data_dict["ALL_AC_POWER" + "_" + current_mode] = 0
+    for col in all_ac_columns:
+        data_dict["ALL_AC_POWER" + "_" + current_mode] = data_dict["ALL_AC_POWER" + "_" + current_mode] + data_dict[col]
+    return data_dict
+
+
+def previous_assembly(dwddata, derived, results, ids):
+    """ Previous calculate_forecast: concat per mode, derived columns added to (a copy of) dwddata """
+    calc_data = pd.DataFrame()
+    for current_mode in LIST_OF_MODES:
+        calc_data = pd.concat([calc_data, previous_combine_data(results[current_mode], ids, current_mode)], axis=1)
+    whole_df = dwddata.copy()
+    for name, values in derived.items():
+        whole_df[name] = values
+    whole_df.columns = whole_df.columns.tolist()
+    return pd.concat([whole_df, calc_data], axis=1)
+
+
+def assembly(dwddata, derived, results, ids):
+    leading = {str(column): dwddata[column] for column in dwddata.columns}
+    leading.update(derived)
+    result = ResultAssembly(dwddata.index, leading, results, ids)
+    for current_mode in LIST_OF_MODES:
+        result.fill(current_mode)
+    return result.frame()
+
+
+def measure(func):
+    """ Time [s] (best of 3), peak memory [MB] of a further run and its result """
+    seconds, result = best_time(func, 3)
+    del result
+    tracemalloc.start()
+    result = func()
+    peak = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return seconds, peak, result
+
+
+def run():
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE)
+    config.set("Calculation", "Engine", "stacked")
+    solar_proc = setup_solar_processing(config)
+    pv_system = setup_pv_system(config, solar_proc.location)
+    dwddata = reshape_observation(observation_frame(start=pd.Timestamp("2020-01-01"), periods=PERIODS))
+
+    solar_proc.process_weather_data(dwddata.index)
+    decomposition = decompose_irradiance(dwddata, solar_proc)
+    geometry = SolarGeometry(solar_proc.solpos)
+    results = {}
+    for current_mode in LIST_OF_MODES:
+        ghi, dni, dhi = mode_irradiance(current_mode, dwddata, solar_proc, decomposition)
+        weather = pv_system.setup_weather_data(ghi=ghi, dhi=dhi, dni=dni, temp_air=dwddata.TEMPERATURE_AIR_200DEGC,
+                                               wind_speed=dwddata.WIND_SPEED)
+        results[current_mode] = dict(pv_system.run_stacked(weather, geometry))
+    derived = {"DHI_ERBS": decomposition["erbs", "dhi"], "DNI_DISC": decomposition["disc", "dni"],
+               "DNI_DIRINDEX": decomposition["dirindex", "dni"].values,
+               "GHI_CLEARSKY": solar_proc.clearsky.ghi, "DNI_CLEARSKY": solar_proc.clearsky.dni,
+               "DHI_CLEARSKY": solar_proc.clearsky.dhi, "AZIMUTH": solar_proc.solpos.azimuth,
+               "ZENITH": solar_proc.solpos.zenith, "ELEVATION": solar_proc.solpos.elevation}
+    ids = list(pv_system.model_chain)
+    pv_system.close()
+
+    rows = []
+    for name, func in [("column by column + concat", previous_assembly), ("preallocated block", assembly)]:
+        seconds, peak, result = measure(lambda: func(dwddata, derived, results, ids))
+        size = result.memory_usage(index=False).sum() / 2**20
+        rows.append([name, "%.3f" % seconds, "%.0f" % peak, "%.1f" % (peak / size), result._mgr.nblocks])
+    print("Result: %d rows x %d columns (%.0f MB)" % (result.shape + (size,)))
+    print_table(["assembly", "time [s]", "peak [MB]", "peak / result", "blocks"], rows)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,80 @@
+"""
+Benchmark of the load scheduler (see pv_forecast.scheduler): time of a complete plan
+for a growing number of loads (2/3 fixed loads, 1/3 EV charging) over a 48 h and a
+240 h forecast with 15 minute slots, against the brute force search of the fixed
+loads (self-consumed energy summed over the profile for each start slot, O(slots x
+duration) per load instead of the prefix sums).
+
+Usage: python -m benchmark.bench_scheduler
+
+"""
+import numpy as np
+import pandas as pd
+
+from benchmark.timing import best_time, print_table
+from pv_forecast.scheduler import Scheduler, Load
+
+LOAD_COUNTS = [1, 10, 50, 100]
+HORIZONS = [48, 240]
+
+
+def forecast(hours, seed=0):
+    """ Hourly ac power of sunny and cloudy days (UTC) """
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("2021-06-01", periods=hours, freq="H", tz="UTC")
+    clear = np.clip(np.sin((index.hour - 5) / 14 * np.pi), 0, None) * 8000
+    return pd.Series(clear * rng.uniform(0.2, 1.0, hours), index=index)
+
+
+def loads(count, hours, seed=0):
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp("2021-06-01", tz="UTC")
+    result = []
+    for number in range(count):
+        earliest = start + pd.Timedelta(hours=int(rng.integers(0, hours // 2)))
+        deadline = earliest + pd.Timedelta(hours=int(rng.integers(12, hours // 2 + 12)))
+        if number % 3 == 2:
+            result.append(Load("ev%d" % number, interruptible=True, energy=float(rng.uniform(5000, 30000)),
+                               power=11000., min_power=4100., earliest=earliest, deadline=deadline))
+        else:
+            profile = [[float(rng.choice([0.25, 0.5, 1.0])), float(rng.uniform(100, 2500))]
+                       for _ in range(int(rng.integers(1, 5)))]
+            result.append(Load("appliance%d" % number, profile=profile, earliest=earliest, deadline=deadline))
+    return result
+
+
+class BruteForceScheduler(Scheduler):
+    """ Fixed loads: self-consumed energy of each start slot summed over the whole profile """
+    def place_fixed(self, load, surplus, first, end, hours):
+        profile = np.concatenate([np.full(max(int(np.ceil(round(duration / hours, 9))), 1), power)
+                                  for duration, power in load.profile])
+        starts = range(first, end - len(profile) + 1)
+        if not len(starts):
+            return None
+        solar = [np.minimum(profile, surplus[start:start + len(profile)]).sum() for start in starts]
+        start = starts[int(np.argmax(np.round(solar, 3)))]
+        load_power = np.zeros(len(surplus))
+        load_power[start:start + len(profile)] = profile
+        return load_power
+
+
+def run():
+    rows = []
+    for hours in HORIZONS:
+        pv_power = forecast(hours)
+        for count in LOAD_COUNTS:
+            load_list = loads(count, hours)
+            seconds, schedule = best_time(lambda: Scheduler(load_list, base_load=300.).plan(pv_power), 3)
+            brute_seconds, brute_schedule = best_time(
+                lambda: BruteForceScheduler(load_list, base_load=300.).plan(pv_power), 1)
+            summary = schedule.to_dict()
+            assert abs(summary["solar_energy"] - brute_schedule.to_dict()["solar_energy"]) < 1.
+            rows.append([hours, count, len(schedule.plan), "%.4f" % seconds, "%.3f" % brute_seconds,
+                         "%.0f" % (brute_seconds / seconds), "%.0f" % (summary["solar_energy"] / 1000.),
+                         "%.0f" % (summary["grid_energy"] / 1000.)])
+    print_table(["horizon [h]", "loads", "slots", "prefix sums [s]", "brute force [s]", "speedup",
+                 "pv [kWh]", "grid [kWh]"], rows)
+
+
+if __name__ == "__main__":
+    run()
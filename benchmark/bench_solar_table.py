@@ -0,0 +1,61 @@
+"""
+Benchmark of the precomputed solar table (pv_forecast.solar_table) against the
+direct computation of solar position (SPA) and clearsky (Ineichen) done by
+Solar_Processing.process_weather_data.
+
+Cases: 48 h / 240 h forecast (hourly) and one year of 10 minute observations.
+The table (10 minutes, 3 years) is built once in a temporary directory, the build
+time is reported separately.
+
+Usage: python -m benchmark.bench_solar_table
+
+"""
+import tempfile, time
+import numpy as np
+import pandas as pd
+
+from benchmark.timing import best_time, print_table
+from pv_forecast.solar_parameters import Solar_Processing
+from pv_forecast.solar_table import build_solar_table, load_solar_table, default_time_grid
+
+LATITUDE, LONGITUDE, ALTITUDE = 51.4, 6.86, 90.0
+
+
+def run(repeat=3):
+    time_grid = default_time_grid()
+    year = time_grid[0].year + 1
+    cases = [("48 h hourly", pd.date_range("%d-06-01 01:00" % year, periods=48, freq="1h", tz="UTC")),
+             ("240 h hourly", pd.date_range("%d-06-01 01:00" % year, periods=240, freq="1h", tz="UTC")),
+             ("1 year 10 min", pd.date_range("%d-01-01" % year, periods=6 * 24 * 365, freq="10min", tz="UTC"))]
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        build_solar_table(directory, LATITUDE, LONGITUDE, ALTITUDE, time_grid)
+        build_time = time.perf_counter() - start
+        start = time.perf_counter()
+        table = load_solar_table(directory, LATITUDE, LONGITUDE, ALTITUDE)
+        open_time = time.perf_counter() - start
+
+        direct = Solar_Processing(LATITUDE, LONGITUDE, ALTITUDE, "UTC")
+        tabled = Solar_Processing(LATITUDE, LONGITUDE, ALTITUDE, "UTC", solar_table=table)
+
+        rows = []
+        for label, time_range in cases:
+            direct_time, _ = best_time(lambda: direct.process_weather_data(time_range), repeat)
+            table_time, _ = best_time(lambda: tabled.process_weather_data(time_range), repeat)
+            # shifted by 5 minutes: interpolated values
+            shifted = time_range + pd.Timedelta(minutes=5)
+            direct.process_weather_data(shifted)
+            tabled.process_weather_data(shifted)
+            rows.append([label, len(time_range), "%.4f" % direct_time, "%.4f" % table_time,
+                         "%.0fx" % (direct_time / table_time),
+                         "%.4f" % np.abs(direct.solpos["zenith"] - tabled.solpos["zenith"]).max(),
+                         "%.2f" % np.abs(direct.clearsky["ghi"] - tabled.clearsky["ghi"]).max()])
+
+    print("table: %d rows, build %.2f s (once), open %.4f s" % (len(time_grid), build_time, open_time))
+    print_table(["case", "rows", "direct [s]", "table [s]", "speedup", "max |d zenith| (+5min)", "max |d ghi| (+5min)"], rows)
+    return rows
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,67 @@
+"""
+Benchmark of the single-pass evaluation of all arrays (PVSystem engine "stacked",
+see pv_model.evaluate_arrays) against the per-array loop of pvlib ModelChains.
+
+Input: MOSMIX L forecast (240 h) and 10 minute observations of one month for a
+pv system with 2, 10 and 100 arrays (one calculation mode, disc).
+
+Usage: python -m benchmark.bench_stacked
+
+"""
+import numpy as np
+
+from benchmark.synthetic_data import mosmix_frame, observation_frame
+from benchmark.timing import best_time, print_table
+from pv_forecast.reshape import reshape_mosmix, reshape_observation
+from pv_forecast.solar_parameters import Solar_Processing
+from pv_forecast.pv_system import PVSystem
+from pv_forecast.pv_model import SolarGeometry
+
+PV_MODULE = "LG_Electronics_Inc__LG355N1C_V5"
+INVERTER = "Kostal_Plenticore__Plus_4_2"
+
+
+def setup_system(n_arrays, solar_proc, engine):
+    pv_system = PVSystem(inverter=INVERTER, pv_module=PV_MODULE, albedo=0.14,
+                         pvlib_location=solar_proc.location, engine=engine)
+    for i in range(n_arrays):
+        pv_system.add_pv_system(id="array_%d" % i, surface_tilt=10 + 40 * (i % 5) / 4,
+                                surface_azimuth=90 + 180 * i / max(n_arrays - 1, 1), modules_per_string=7)
+    return pv_system
+
+
+def weather_data(dwddata, solar_proc, pv_system):
+    solar_proc.process_weather_data(dwddata.index)
+    dni = solar_proc.calc_dni_disc(dwddata.index, dwddata.RAD_WH)["dni"]
+    dhi = solar_proc.calc_dhi_erbs(dwddata.index, dwddata.RAD_WH)["dhi"]
+    return pv_system.setup_weather_data(ghi=dwddata.RAD_WH, dhi=dhi, dni=dni,
+                                        temp_air=dwddata.TEMPERATURE_AIR_200DEGC, wind_speed=dwddata.WIND_SPEED)
+
+
+def run(repeat=3):
+    solar_proc = Solar_Processing(51.4, 6.86, 90, "utc")
+    cases = [("MOSMIX 240 h", reshape_mosmix(mosmix_frame())),
+             ("10 min, 1 month", reshape_observation(observation_frame(periods=6 * 24 * 30)))]
+
+    rows = []
+    for label, dwddata in cases:
+        for n_arrays in [2, 10, 100]:
+            loop_system = setup_system(n_arrays, solar_proc, "modelchain")
+            stacked_system = setup_system(n_arrays, solar_proc, "stacked")
+            weather = weather_data(dwddata, solar_proc, loop_system)
+
+            loop_time, _ = best_time(lambda: loop_system.run_model(weather), repeat)
+            # The solar geometry is part of the stacked run (ModelChain computes it per array)
+            stacked_time, _ = best_time(lambda: stacked_system.run_stacked(weather, SolarGeometry(solar_proc.solpos)),
+                                        repeat)
+
+            loop_ac = np.column_stack([loop_system.results[id].ac for id in loop_system.model_chain])
+            stacked_ac = np.column_stack([stacked_system.results[id].ac for id in stacked_system.model_chain])
+            rows.append([label, n_arrays, "%.3f" % loop_time, "%.3f" % stacked_time,
+                         "%.1fx" % (loop_time / stacked_time), "%.3f" % np.nanmax(np.abs(loop_ac - stacked_ac))])
+    print_table(["data", "arrays", "ModelChain loop [s]", "stacked [s]", "speedup", "max |d ac| [W]"], rows)
+    return rows
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,101 @@
+"""
+Benchmark of the telemetry ingestion (see pv_forecast.telemetry): two days of minutely
+readings (2880, 19 channels) written by TelemetryIngest in batches of growing size to
+the SQLite sink and encoded as InfluxDB line protocol, plus polling the simulated
+inverter via HTTP.
+
+"write amplification" is the number of bytes written to the files (wchar of /proc/self/io,
+i.e. database, write ahead log and journal) per byte of the readings (84 bytes: time
+and 19 float32 values), "disk / raw" the final size of the database per byte of the readings.
+
+Usage: python -m benchmark.bench_telemetry
+
+"""
+import os, time, tempfile
+import numpy as np
+
+from benchmark.timing import best_time, print_table
+from pv_forecast.kostal_reader import CHANNELS
+from pv_forecast.telemetry import (PROCESS_DATA, SQLiteSink, TelemetryIngest, PlenticoreSource, SimulatedInverter,
+                                   simulated_values, line_protocol)
+
+READINGS = 2 * 1440
+BATCH_SIZES = [1, 10, 60, 600]
+POLLS = 200
+RAW_BYTES = 8 + 4 * len(CHANNELS)
+START = 1622505600
+
+
+class ReplaySource:
+    """ Readings of the simulated inverter (one per minute) without HTTP """
+    channels = CHANNELS
+
+    def __init__(self) -> None:
+        self.now = START
+        self.keys = [PROCESS_DATA[channel][:2] for channel in CHANNELS]
+
+    def read(self):
+        values = simulated_values(self.now)
+        self.now += 60
+        return np.array([values[key] for key in self.keys], dtype=np.float32)
+
+
+def written_bytes():
+    """ Bytes written by this process so far (None if not available) """
+    try:
+        with open("/proc/self/io") as io_file:
+            return int(dict(line.split(": ") for line in io_file.read().splitlines())["wchar"])
+    except (OSError, KeyError):
+        return None
+
+
+def ingest(sink, batch_size):
+    run = TelemetryIngest(ReplaySource(), sink, interval=60, batch_size=batch_size, flush_interval=60 * batch_size,
+                          capacity=READINGS)
+    for minute in range(READINGS):
+        run.step(START + 60 * minute)
+    run.flush(START + 60 * READINGS, force=True)
+    return run.stats()
+
+
+def run():
+    rows = []
+    for batch_size in BATCH_SIZES:
+        with tempfile.TemporaryDirectory() as directory:
+            sink = SQLiteSink(os.path.join(directory, "telemetry.db"))
+            before = written_bytes()
+            start = time.perf_counter()
+            stats = ingest(sink, batch_size)
+            seconds = time.perf_counter() - start
+            after = written_bytes()
+            assert stats["written"] == READINGS and len(sink.read()) == READINGS
+            amplification = "-" if before is None else "%.1f" % ((after - before) / (READINGS * RAW_BYTES))
+            rows.append(["sqlite", batch_size, stats["batches"], "%.3f" % seconds, "%.0f" % (READINGS / seconds),
+                         amplification, "%.1f" % (sink.size() / (READINGS * RAW_BYTES))])
+
+    source = ReplaySource()
+    times = START + 60 * np.arange(READINGS)
+    values = np.array([source.read() for _ in range(READINGS)])
+    seconds, body = best_time(lambda: line_protocol(times, values, CHANNELS, tags={"inverter": 1}), 3)
+    rows.append(["influx (encoding)", READINGS, 1, "%.3f" % seconds, "%.0f" % (READINGS / seconds),
+                 "%.1f" % (len(body.encode("utf-8")) / (READINGS * RAW_BYTES)), "-"])
+    print_table(["sink", "batch size", "batches", "time [s]", "readings/s", "write amplification",
+                 "disk / raw"], rows)
+
+    inverter = SimulatedInverter().start()
+    try:
+        plenticore = PlenticoreSource(inverter.url)
+        plenticore.read()
+        start = time.perf_counter()
+        for _ in range(POLLS):
+            plenticore.read()
+        seconds = time.perf_counter() - start
+    finally:
+        inverter.stop()
+    print()
+    print_table(["polls (HTTP, simulated inverter)", "time [s]", "polls/s"],
+                [[POLLS, "%.3f" % seconds, "%.0f" % (POLLS / seconds)]])
+
+
+if __name__ == "__main__":
+    run()
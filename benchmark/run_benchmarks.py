@@ -0,0 +1,104 @@
+"""
+Offline benchmark suite of the complete pipeline (no network access): synthetic
+DWD data is reshaped and calculated like main.py does, with the instrumentation
+recording time and memory per stage.
+
+Cases:
+- forecast_48h:   MOSMIX L forecast, 48 hours (the default forecast window)
+- forecast_240h:  MOSMIX L forecast, 240 hours (LARGE)
+- history_1year:  10 minute observations of one year (back-test)
+
+The report (JSON, one entry per case with all stages) can be stored and used as
+baseline of later runs: stages slower than the baseline by more than the threshold
+are listed as regressions (exit code 1).
+
+Usage: python -m benchmark.run_benchmarks [--cases forecast_48h ...] [--output report.json]
+                                          [--baseline report.json] [--threshold 0.25] [--no-memory]
+
+"""
+import sys, json, argparse, configparser, os
+
+from benchmark.synthetic_data import mosmix_frame, observation_frame
+from pv_forecast.reshape import reshape_mosmix, reshape_observation
+from pv_forecast.calculation import setup_solar_processing, setup_pv_system, calculate_forecast
+from pv_forecast.instrumentation import Instrumentation, activate, stage
+
+CASES = {"forecast_48h": lambda: (mosmix_frame(hours=48), reshape_mosmix),
+         "forecast_240h": lambda: (mosmix_frame(hours=240), reshape_mosmix),
+         "history_1year": lambda: (observation_frame(), reshape_observation)}
+
+CONFIG_FILE = os.path.join(os.path.dirname(__file__), "..", "configuration.ini")
+
+
+def run_case(name, config, trace_memory=True):
+    """ Run the pipeline for one case, returns the instrumentation report. """
+    raw_data, reshape = CASES[name]()
+    instrumentation = Instrumentation(trace_memory=trace_memory)
+    with activate(instrumentation):
+        with stage("reshape_data"):
+            dwddata = reshape(raw_data)
+        with stage("setup"):
+            solar_proc = setup_solar_processing(config)
+            pv_system = setup_pv_system(config, solar_proc.location)
+        try:
+            with stage("calculate"):
+                result = calculate_forecast(dwddata, solar_proc, pv_system)
+        finally:
+            pv_system.close()
+    instrumentation.meta.update({"case": name, "rows": len(result), "columns": len(result.columns)})
+    return instrumentation
+
+
+def regressions(report, baseline, threshold):
+    """ Stages of the report slower than in the baseline by more than threshold (fraction). """
+    found = []
+    for case, case_report in report.items():
+        if case not in baseline:
+            continue
+        reference = {record["stage"]: record for record in baseline[case]["stages"]}
+        for record in case_report["stages"]:
+            before = reference.get(record["stage"])
+            # Very short stages are dominated by noise
+            if before is None or before["wall_seconds"] < 0.01:
+                continue
+            change = record["wall_seconds"] / before["wall_seconds"] - 1.
+            if change > threshold:
+                found.append((case, record["stage"], before["wall_seconds"], record["wall_seconds"], change))
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--output", help="write the report (JSON) to this file")
+    parser.add_argument("--baseline", help="report of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slow down per stage (fraction)")
+    parser.add_argument("--no-memory", action="store_true", help="do not trace the memory (faster)")
+    args = parser.parse_args(argv)
+
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE)
+
+    report = {}
+    for name in args.cases:
+        instrumentation = run_case(name, config, trace_memory=not args.no_memory)
+        report[name] = instrumentation.report()
+        print("== %s (%d rows)" % (name, instrumentation.meta["rows"]))
+        print(instrumentation.summary())
+        print()
+
+    if args.output:
+        with open(args.output, "w") as report_file:
+            json.dump(report, report_file, indent=1)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            found = regressions(report, json.load(baseline_file), args.threshold)
+        for case, stage_name, before, after, change in found:
+            print("REGRESSION %s %s: %.3f s -> %.3f s (+%.0f %%)" % (case, stage_name, before, after, 100. * change))
+        if found:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""
+Synthetic DWD data of realistic size and shape (long format like the data
+returned by wetterdienst) to run benchmarks without network access.
+
+"""
+import numpy as np
+import pandas as pd
+
+# Humanized MOSMIX parameters as returned by wetterdienst for MOSMIX_ELEMENTS
+MOSMIX_PARAMETERS = ["WIND_DIRECTION", "WIND_SPEED", "CLOUD_COVER_TOTAL", "PRESSURE_AIR_SURFACE_REDUCED",
+                     "RADIATION_GLOBAL", "PROBABILITY_RADIATION_GLOBAL_LAST_1H",
+                     "TEMPERATURE_DEW_POINT_200", "TEMPERATURE_AIR_200", "WEATHER_SIGNIFICANT"]
+
+# Humanized parameters of the 10 minute observations (see HISTORY_PARAMETERS)
+OBSERVATION_PARAMETERS = ["temperature_air_200", "radiation_global", "radiation_sky_diffuse",
+                          "temperature_dew_point_200", "pressure_air_station_height", "wind_speed"]
+
+
+def _daily_cycle(dates):
+    """ Simple daylight shape (0 at night, 1 at noon) for the given UTC dates. """
+    hours = dates.hour.to_numpy() + dates.minute.to_numpy() / 60.0
+    return np.clip(np.sin((hours - 5.0) / 15.0 * np.pi), 0.0, None)
+
+
+def mosmix_values(dates, rng):
+    """ Plausible MOSMIX values (DWD units) per parameter. """
+    n = len(dates)
+    daylight = _daily_cycle(dates)
+    cloud_cover = rng.uniform(0.0, 100.0, n)
+    return {"WIND_DIRECTION": rng.uniform(0.0, 360.0, n),
+            "WIND_SPEED": rng.uniform(0.0, 10.0, n),
+            "CLOUD_COVER_TOTAL": cloud_cover,
+            "PRESSURE_AIR_SURFACE_REDUCED": rng.normal(101325.0, 800.0, n),
+            # kJ/m^2 per hour
+            "RADIATION_GLOBAL": 3000.0 * daylight * (1.0 - 0.7 * cloud_cover / 100.0),
+            "PROBABILITY_RADIATION_GLOBAL_LAST_1H": np.where(daylight > 0, 100.0 - 0.7 * cloud_cover, np.nan),
+            "TEMPERATURE_DEW_POINT_200": 276.0 + rng.normal(0.0, 2.0, n),
+            "TEMPERATURE_AIR_200": 280.0 + 8.0 * daylight + rng.normal(0.0, 1.0, n),
+            "WEATHER_SIGNIFICANT": rng.integers(0, 4, n).astype(float)}
+
+
+def observation_values(dates, rng):
+    """ Plausible 10 minute observation values (DWD units) per parameter. """
+    n = len(dates)
+    daylight = _daily_cycle(dates)
+    clearness = rng.uniform(0.2, 1.0, n)
+    # J/cm^2 per 10 minutes
+    ghi = 50.0 * daylight * clearness
+    return {"temperature_air_200": 8.0 + 8.0 * daylight + rng.normal(0.0, 1.0, n),
+            "radiation_global": ghi,
+            "radiation_sky_diffuse": ghi * (1.0 - 0.6 * clearness),
+            "temperature_dew_point_200": 3.0 + rng.normal(0.0, 2.0, n),
+            "pressure_air_station_height": rng.normal(1005.0, 8.0, n),
+            "wind_speed": rng.uniform(0.0, 10.0, n)}
+
+
+def _long_frame(station_id, dates, values, parameters):
+    n = len(dates)
+    raw_data = pd.DataFrame({"station_id": np.repeat(station_id, n * len(parameters)),
+                             "date": np.tile(dates, len(parameters)),
+                             "parameter": np.repeat(parameters, n),
+                             "value": np.concatenate([values[parameter] for parameter in parameters]),
+                             "quality": np.nan})
+    raw_data["date"] = pd.to_datetime(raw_data["date"], utc=True)
+    raw_data["station_id"] = raw_data["station_id"].astype("category")
+    raw_data["parameter"] = pd.Categorical(raw_data["parameter"], categories=parameters)
+    return raw_data
+
+
+def mosmix_frame(station_id="P0031", issue="2021-04-01 03:00", hours=240, seed=0):
+    """ Synthetic MOSMIX L forecast (long format) with hourly values for the given number of hours. """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(pd.Timestamp(issue, tz="utc") + pd.Timedelta(hours=1), periods=hours, freq="H")
+    return _long_frame(station_id, dates, mosmix_values(dates, rng), MOSMIX_PARAMETERS)
+
+
+def observation_frame(station_id="01078", start="2020-01-01", periods=6 * 24 * 365, seed=0):
+    """ Synthetic 10 minute observations (long format), default one year. """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(pd.Timestamp(start, tz="utc"), periods=periods, freq="10min")
+    return _long_frame(station_id, dates, observation_values(dates, rng), OBSERVATION_PARAMETERS)
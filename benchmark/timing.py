@@ -0,0 +1,23 @@
+"""
+Small helpers to time benchmark runs.
+
+"""
+import time
+
+
+def best_time(func, repeat=5):
+    """ Run func repeat times and return the best wall time [s] and the last result. """
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def print_table(header, rows):
+    """ Print benchmark results as simple aligned table. """
+    widths = [max(len(str(value)) for value in column) for column in zip(header, *rows)]
+    for row in [header] + rows:
+        print("  ".join(str(value).rjust(width) for value, width in zip(row, widths)))
@@ -1,179 +1,305 @@
-import configparser
-import os
-import datetime
-import pandas as pd
-from pv_forecast.dwd_forecast import DWD_Forecast
-from pv_forecast.dwd_history import DWD_History
-from pv_forecast.solar_parameters import Solar_Processing
-from pv_forecast.pv_system import PVSystem
+"""
+Command line entry point: "python main.py [--mode ...] [--station ...] [--start ... --end ...] [--output ...]".
 
+Only the standard library is imported on startup. pandas, pvlib and the wetterdienst
+providers are imported by the steps of the selected mode which need them (e.g.
+from_file never imports wetterdienst, a forecast found in the cache neither). With
+"--import-report" the import time and the modules loaded per step are printed.
 
-def main():
+"""
+import argparse
+import configparser
+import contextlib
+import datetime
+import json
+import logging
+import os
+import signal
+import sys
+import time
+
+# Command line modes and their "Mode" within the DWD section of the configuration.ini
+MODES = {"forecast": "None", "from_history": "from_history", "from_file": "from_file"}
+
+# (step, seconds, newly loaded modules) of the import steps of this process
+IMPORT_STEPS = []
+
+
+@contextlib.contextmanager
+def import_step(name):
+    """ Record time and newly loaded modules of the imports within the block. """
+    loaded = set(sys.modules)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        IMPORT_STEPS.append((name, time.perf_counter() - start, sorted(set(sys.modules) - loaded)))
+
+
+def top_level_packages(modules):
+    """ Packages (not part of the standard library) of the modules """
+    packages = {module.split(".")[0] for module in modules} - set(sys.stdlib_module_names)
+    return sorted(package for package in packages if not package.startswith("_"))
+
+
+def import_report(path=None):
+    """ Print the import steps (and write them as JSON to path, if given). """
+    total = sum(seconds for _, seconds, _ in IMPORT_STEPS)
+    print("%-16s %8s %8s  %s" % ("import step", "time[s]", "modules", "packages"))
+    for name, seconds, modules in IMPORT_STEPS:
+        packages = top_level_packages(modules)
+        print("%-16s %8.3f %8d  %s" % (name, seconds, len(modules), ", ".join(packages[:8]) +
+                                       (" ..." if len(packages) > 8 else "")))
+    print("%-16s %8.3f %8d" % ("total", total, sum(len(modules) for _, _, modules in IMPORT_STEPS)))
+    if path:
+        report = {"seconds": total, "steps": [{"step": name, "seconds": seconds, "modules": modules}
+                                              for name, seconds, modules in IMPORT_STEPS],
+                  "packages": top_level_packages(sys.modules)}
+        with open(path, "w") as report_file:
+            json.dump(report, report_file, indent=1)
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="PV forecast based on DWD weather data")
+    parser.add_argument("--config", default="configuration.ini", help="configuration file (default: configuration.ini)")
+    parser.add_argument("--mode", choices=sorted(MODES), help="overrides Mode of the DWD section")
+    parser.add_argument("--station", help="DWD station (MOSMIX station of forecast, observation station of from_history)")
+    parser.add_argument("--start", help="begin of the period (UTC, e.g. 2021-04-01 or 2021-04-01T06:00)")
+    parser.add_argument("--end", help="end of the period (UTC)")
+    parser.add_argument("--input", help="csv file with the weather data of mode from_file (overrides File)")
+    parser.add_argument("--output", help="directory of the csv file of the result (written in any case)")
+    parser.add_argument("--instrument", action="store_true", default=None,
+                        help="record time and memory per stage (see section Instrumentation)")
+    parser.add_argument("--report", help="file the instrumentation report is appended to (JSON lines)")
+    parser.add_argument("--import-report", nargs="?", const="", default=None, metavar="FILE",
+                        help="print import time and loaded modules per step (and write them as JSON to FILE)")
+    return parser.parse_args(argv)
+
+
+def setup_config(args):
+    """ Read the configuration file, command line options override it. """
     config = configparser.ConfigParser()
-    config.read('configuration.ini')
-
+    config.read(args.config)
+    for section in ["DWD", "Instrumentation", "Output"]:
+        if not config.has_section(section):
+            config.add_section(section)
+    if args.mode:
+        config.set("DWD", "Mode", MODES[args.mode])
+    if args.station:
+        history = config.get("DWD", "Mode", raw=True, fallback="None") == "from_history"
+        config.set("DWD", "DWDStationHistory" if history else "DWDStation", args.station)
+    if args.input:
+        config.set("DWD", "File", args.input)
+    if args.output:
+        config.set("Output", "Directory", args.output)
+        # The csv file is requested explicitly (in addition to the result store, if enabled):
+        if not config.has_section("ResultStore"):
+            config.add_section("ResultStore")
+        config.set("ResultStore", "WriteCsv", "True")
+    if args.instrument:
+        config.set("Instrumentation", "Enabled", "True")
+    if args.report:
+        config.set("Instrumentation", "Report", args.report)
+    return config
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    config = setup_config(args)
+
+    if config.getboolean("Service", "RunAsService", fallback=False):
+        serve(config)
+        return
+
+    with import_step("instrumentation"):
+        from pv_forecast.instrumentation import setup_instrumentation, activate, report_path
+    instrumentation = setup_instrumentation(config)
+    with activate(instrumentation):
+        run(config, args.start, args.end)
+    if instrumentation is not None:
+        instrumentation.write_report(report_path(config))
+        print(instrumentation.summary())
+    if args.import_report is not None:
+        import_report(args.import_report)
+
+def get_period(wheater_mode, start=None, end=None, default=None):
+    """
+    Period (start, end) in UTC: the default window (default or the time window of the
+    mode), overridden by start / end.
+    """
+    import pandas as pd
+    if default is None:
+        with import_step("calculation"):
+            from pv_forecast.calculation import get_time_window
+        default = get_time_window(wheater_mode)
+    default_start, default_end = default
+    start = default_start if start is None else pd.Timestamp(start)
+    end = default_end if end is None else pd.Timestamp(end)
+    return tuple(time_stamp.tz_localize("utc") if time_stamp.tz is None else time_stamp.tz_convert("utc")
+                 for time_stamp in (start, end))
+
+def run(config, start=None, end=None):
+    """ Single run: retrieve the weather data and calculate the forecast. """
+    from pv_forecast.instrumentation import stage
     wheater_mode = config.get("DWD", "Mode", raw=True)
 
-
-
-
-
     if wheater_mode == "from_file":
-        #dwddata = get_wheater_from_dwd_forecast(config)
-        #TODO: implemnent simple analysis function (from file)
-        dwddata = None
-        pass
+        # Weather data (reshaped, e.g. the csv output of a previous run) of a file:
+        with stage("fetch"):
+            dwddata = get_wheater_from_file(config)
+        if start is not None or end is not None:
+            start, end = get_period(wheater_mode, start, end, default=(dwddata.index[0], dwddata.index[-1]))
+            dwddata = dwddata.loc[start:end]
 
     elif wheater_mode == "from_history":
         # Set up the time periode for history (adjust the timedelta for different aproach)
-        today = datetime.date.today() - datetime.timedelta(days=2)
-        start = datetime.datetime(year=today.year, month=today.month, day=today.day, hour=1)
-        start = pd.Timestamp(start).tz_localize('utc')
-        periode_end = datetime.date.today() 
-        end = datetime.datetime(year=periode_end.year, month=periode_end.month, day=periode_end.day, hour=23)
-        end = pd.Timestamp(end).tz_localize('utc')
+        start, end = get_period(wheater_mode, start, end)
         # In this mode, historical wheater data is used:
-        dwddata = get_wheater_from_dwd_history(config)
+        with stage("fetch"):
+            dwddata = get_wheater_from_dwd_history(config, start, end)
         dwddata = dwddata.loc[start:end]
     else:
-        # 
-        today = datetime.date.today()#
-        start = datetime.datetime(year=today.year, month=today.month, day=today.day, hour=1)
-        start = pd.Timestamp(start).tz_localize('utc')
-        periode_end = today + datetime.timedelta(days=2)
-        end = datetime.datetime(year=periode_end.year, month=periode_end.month, day=periode_end.day, hour=23)
-        end = pd.Timestamp(end).tz_localize('utc')
+        start, end = get_period(wheater_mode, start, end)
         # Default mode: use forecast from DWD Mosmix model
-        dwddata = get_wheater_from_dwd_forecast(config)
+        with stage("fetch"):
+            dwddata = get_wheater_from_dwd_forecast(config)
         dwddata = dwddata.loc[start:end]
-    
-    
 
     calculate(dwddata=dwddata, config=config)
 
+def get_wheater_from_file(config):
+    """ Weather data (reshaped, timestamps in UTC) of the csv file "File" of the DWD section. """
+    with import_step("from_file"):
+        from pv_forecast.reshape import read_weather_file
+    return read_weather_file(config.get("DWD", "File", fallback=""))
+
 def get_wheater_from_dwd_forecast(config):
 
+    with import_step("dwd_forecast"):
+        from pv_forecast.dwd_forecast import DWD_Forecast
+        from pv_forecast.dwd_cache import setup_cache
     # Initialize class for retrieving DWD Data:
-    dwd_fc = DWD_Forecast(config.get("DWD", "DWDStation", raw=True))
-    # Now get the latest weather data:
-    dwddata = dwd_fc.retrieve_data()
+    dwd_fc = DWD_Forecast(config.get("DWD", "DWDStation", raw=True), cache=setup_cache(config))
+    # Now get the latest weather data (wetterdienst is imported if it is not cached):
+    with import_step("fetch"):
+        dwddata = dwd_fc.retrieve_data()
 
     return dwddata
 
-def get_wheater_from_dwd_history(config):
+def get_wheater_from_dwd_history(config, start=None, end=None):
 
+    with import_step("dwd_history"):
+        from pv_forecast.dwd_history import DWD_History
+        from pv_forecast.dwd_cache import setup_cache
     # Initialize class for retrieving DWD Data:
-    dwd_fc = DWD_History(config.getint("DWD", "DWDStationHistory", raw=True))
-    # Now get the latest weather data:
-    dwddata = dwd_fc.retrieve_data()
+    dwd_fc = DWD_History(config.getint("DWD", "DWDStationHistory", raw=True), cache=setup_cache(config))
+    # Now get the weather data of the periode (wetterdienst is imported if it is not cached):
+    with import_step("fetch"):
+        dwddata = dwd_fc.retrieve_data(start, end)
 
     return dwddata
-  
 
 
-def calculate(dwddata, config):
 
-    # Initialize class for getting basic solar parameters:
-    mylatitude = config.getfloat("SolarSystem", "Latitude", raw=True)
-    mylongitude = config.getfloat("SolarSystem", "Longitute", raw=True)
-    myaltitude = config.getfloat("SolarSystem", "Altitude", raw=True)
-    mytimezone = config.get("SolarSystem", "MyTimezone", raw=True)
-
-    # Solar parameter processing:
-    solar_proc = Solar_Processing(mylatitude, mylongitude, myaltitude, mytimezone)
-
-
-    # Use the time range of the DWD Data as basis for further calculations
-    time_range = dwddata.index
-
-    # Now set up the weather data
-    solar_proc.process_weather_data(time_range)
- 
-    # Calc DNI using DISC model:
-    dni_disc = solar_proc.calc_dni_disc(time_range=time_range, ghi=dwddata.RAD_WH, mypressure=dwddata.PRESSURE_AIR_SURFACE_REDUCED)
-
-    # Calc DNI using DIRINT model:
-    dni_dirint = solar_proc.calc_dni_dirindex(time_range=time_range, ghi=dwddata.RAD_WH, dew_point=dwddata.DEW_POINT_DEGC)
-    #print(dni_dirint)
-
-    # Calc DHI using the ERBS model
-    dhi_erbs = solar_proc.calc_dhi_erbs(ghi=dwddata.RAD_WH, time_range=time_range)
-    #print(dhi_erbs)
-
-    # Initiate PV System
-    pvlib_location = solar_proc.location
-    pv_system = PVSystem(inverter=config.get("SolarSystem", "InverterName", raw=True),
-                        pv_module=config.get("SolarSystem", "ModuleName", raw=True),
-                        albedo=config.getfloat("SolarSystem", "Albedo", raw=True),
-                        pvlib_location=pvlib_location)
-
-    pv_system.add_pv_system(id="Ost",
-                            surface_tilt=config.getfloat("SolarSystem", "Elevation", raw=True),
-                            surface_azimuth=config.getfloat("SolarSystem", "Azimuth_1", raw=True),
-                            modules_per_string=config.getint("SolarSystem", "NumPanels_1", raw=True))
-
-    pv_system.add_pv_system(id="West",
-                            surface_tilt=config.getfloat("SolarSystem", "Elevation", raw=True),
-                            surface_azimuth=config.getfloat("SolarSystem", "Azimuth_2", raw=True),
-                            modules_per_string=config.getint("SolarSystem", "NumPanels_2", raw=True))
-
-    # the following list represents different calculation approaches to determine 
-    # several algorithmst to find the best-suiting approach for the calculation
-    # model.
-    list_of_modes = ["clearsky", "disc", "dirint"]
-
-    calc_data = pd.DataFrame()
-    for current_mode in list_of_modes:
-        if current_mode == "clearsky":
-            # Using Clearsky-Irradiance (no clouds - theoretical model) to compute
-            # theoretical generation potential for pv system.
-            weather_data = pv_system.setup_weather_data(ghi=solar_proc.clearsky.ghi,
-                                                        dhi=solar_proc.clearsky.dhi,
-                                                        dni=solar_proc.clearsky.dni,
-                                                        temp_air=dwddata.TEMPERATURE_AIR_200DEGC,
-                                                        wind_speed=dwddata.WIND_SPEED)
-        elif current_mode == "disc":
-            # Modue using DWD Forecast for calculation
-            weather_data = pv_system.setup_weather_data(ghi=dwddata.RAD_WH,
-                                                        dhi=dhi_erbs.dhi,
-                                                        dni=dni_disc.dni,
-                                                        temp_air=dwddata.TEMPERATURE_AIR_200DEGC,
-                                                        wind_speed=dwddata.WIND_SPEED)
-        elif current_mode == "dirint":
-            weather_data = pv_system.setup_weather_data(ghi=dwddata.RAD_WH,
-                                                        dhi=dni_dirint.values,
-                                                        dni=dni_disc.dni,
-                                                        temp_air=dwddata.TEMPERATURE_AIR_200DEGC,
-                                                        wind_speed=dwddata.WIND_SPEED)     
-
-        pv_system.run_model(wheater_data=weather_data)
-        my_data = pv_system.combine_data(current_mode)
-        calc_data = pd.concat([calc_data, my_data], axis=1)
-    
-    # Build up common dataframe to collect complete calculation data:
-    whole_df = dwddata
-    whole_df.columns = whole_df.columns.add_categories(["DHI_ERBS", "DNI_DISC", "DNI_DIRINDEX"])
-    whole_df["DHI_ERBS"] = dhi_erbs["dhi"]
-    whole_df["DNI_DISC"] = dni_disc["dni"]
-    whole_df["DNI_DIRINDEX"] = dni_dirint.values
-
-    whole_df.columns = whole_df.columns.add_categories(["GHI_CLEARSKY", "DNI_CLEARSKY", "DHI_CLEARSKY"])
-    whole_df["GHI_CLEARSKY"] = solar_proc.clearsky.ghi
-    whole_df["DNI_CLEARSKY"] = solar_proc.clearsky.dni
-    whole_df["DHI_CLEARSKY"] = solar_proc.clearsky.dhi
-
-    whole_df.columns = whole_df.columns.add_categories(["AZIMUTH", "ZENITH", "ELEVATION"])
-    whole_df["AZIMUTH"] = solar_proc.solpos.azimuth
-    whole_df["ZENITH"] = solar_proc.solpos.zenith
-    whole_df["ELEVATION"] = solar_proc.solpos.elevation
-    # Remove categorical index
-    whole_df.columns = whole_df.columns.tolist()
-
-    # Mege single datasets into one to have a common csv file.
-    result = pd.concat([whole_df, calc_data], axis=1)
-    #result = pd.merge(whole_df,my_data, left_index=True)
-    csv_filename = datetime.datetime.now().strftime("%Y_%m_%d_%H_%M_Uhr.csv")
-    result.to_csv(os.path.join("output", csv_filename))
+def calculate(dwddata, config):
+    with import_step("calculation"):
+        from pv_forecast.calculation import setup_solar_processing, setup_pv_system, calculate_forecast
+        from pv_forecast.incremental import setup_incremental_forecast
+        from pv_forecast.result_store import setup_result_writer
+        from pv_forecast.instrumentation import stage
+
+    with stage("setup"):
+        # Solar parameter processing:
+        solar_proc = setup_solar_processing(config)
+
+        # Initiate PV System
+        pv_system = setup_pv_system(config, solar_proc.location)
+
+        # Reuse the results of unchanged rows of the previous run (if enabled):
+        incremental = setup_incremental_forecast(config, solar_proc, pv_system)
+
+    try:
+        with stage("calculate"):
+            if incremental is not None:
+                result = incremental.calculate(dwddata)
+            else:
+                result = calculate_forecast(dwddata=dwddata, solar_proc=solar_proc, pv_system=pv_system)
+        # MOSMIX issue time of the weather data (stored with the result)
+        result.attrs["issue_time"] = dwddata.attrs.get("issue_time")
+        # Quantiles of the power and daily energy from scenarios of the weather data (if enabled):
+        probabilistic = None
+        if config.getboolean("Probabilistic", "Enabled", fallback=False):
+            with import_step("probabilistic"):
+                from pv_forecast.probabilistic import setup_probabilistic_forecast
+            probabilistic = setup_probabilistic_forecast(config, solar_proc, pv_system)
+        if probabilistic is not None:
+            with stage("probabilistic"):
+                quantiles, energy = probabilistic.calculate(dwddata)
+    finally:
+        pv_system.close()
+
+    write_result = setup_result_writer(config)
+    if write_result is not None:
+        with stage("write_result"):
+            write_result(result)
+    if write_result is None or config.getboolean("ResultStore", "WriteCsv", fallback=False):
+        with stage("to_csv"):
+            write_csv(result, config.get("Output", "Directory", fallback="output"))
+    if probabilistic is not None:
+        write_csv(quantiles, config.get("Output", "Directory", fallback="output"), "_quantiles")
+        write_csv(energy, config.get("Output", "Directory", fallback="output"), "_energy")
+    # Plan of the loads (appliances, EV charging) by the forecast (if enabled):
+    if config.getboolean("Scheduler", "Enabled", fallback=False):
+        with import_step("scheduler"):
+            from pv_forecast.scheduler import setup_scheduler, schedule_writer
+        with stage("schedule"):
+            scheduler = setup_scheduler(config)
+            forecast = config.get("DWD", "Mode", raw=True, fallback="None") not in ("from_history", "from_file")
+            schedule_writer(config, scheduler, from_now=forecast)(result)
+
+def write_csv(result, directory="output", suffix=""):
+    """ Store the result as csv file with timestamp in the output directory. """
+    os.makedirs(directory, exist_ok=True)
+    csv_filename = datetime.datetime.now().strftime("%Y_%m_%d_%H_%M_Uhr") + suffix + ".csv"
+    result.to_csv(os.path.join(directory, csv_filename))
+
+def serve(config):
+    """
+    Run as long running service: the models are set up once and the forecast is
+    refreshed each "RefreshInterval" hours. Sending SIGUSR1 triggers a refresh
+    on demand.
+    """
+    from pv_forecast.forecast_service import ForecastService
+    from pv_forecast.result_store import setup_result_writer
+    from pv_forecast.query_service import setup_query_service
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s: %(message)s")
+    service = ForecastService(config)
+    write_result = setup_result_writer(config)
+    if write_result is not None:
+        service.subscribe(write_result)
+    if config.getboolean("Service", "WriteCsv", fallback=True):
+        directory = config.get("Output", "Directory", fallback="output")
+        service.subscribe(lambda result: write_csv(result, directory))
+    # Re-plan the loads (appliances, EV charging) with each new forecast:
+    if config.getboolean("Scheduler", "Enabled", fallback=False):
+        from pv_forecast.scheduler import setup_scheduler, schedule_writer
+        service.subscribe(schedule_writer(config, setup_scheduler(config)))
+    # Latest forecast for home automation (HTTP / JSON):
+    query_service = setup_query_service(config)
+    if query_service is not None:
+        service.subscribe(query_service.update)
+        query_service.start()
+
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: service.request_refresh())
+
+    try:
+        service.run_forever()
+    except KeyboardInterrupt:
+        service.stop()
+        if query_service is not None:
+            query_service.stop()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
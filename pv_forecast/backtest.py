@@ -0,0 +1,169 @@
+"""
+Back-test runner for long observation histories (e.g. years of 10 minute data of
+several stations) with bounded memory.
+
+Instead of loading the whole history, calculating it at once and writing one csv
+file, the history is streamed in time chunks through a generator pipeline:
+
+    history_chunks   reshaped DWD data of one chunk (e.g. one week) at a time
+    with_context     adds the last row of the previous / first row of the next chunk
+    calculate_chunks solar position, decomposition and pv models of the chunk
+    run_backtest     passes each result to the writers (csv file, result store)
+
+The DIRINDEX decomposition uses the change of the clearness index to the previous
+and next row, all other models are evaluated per row. With one row of context on
+each side, the results of each chunk are identical to a one-shot run of the whole
+history. The peak memory depends on the chunk size only.
+
+"""
+import os, time, logging
+import pandas as pd
+
+from pv_forecast.calculation import calculate_forecast
+from pv_forecast.result_store import SOURCE_HISTORY
+from pv_forecast.dwd_history import NoObservationsError
+from pv_forecast.instrumentation import stage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK = pd.Timedelta(days=7)
+
+
+def history_chunks(retrieve_data, start, end, chunk=DEFAULT_CHUNK):
+    """
+    Reshaped DWD data of [start, end] in chunks of the given length.
+
+    retrieve_data: callable(start, end) returning the reshaped data within start / end
+                   (both included), e.g. DWD_History.retrieve_data (with cache per day).
+
+    Chunks without data (gaps of the observations) are skipped.
+    """
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    chunk_start = start
+    while chunk_start <= end:
+        chunk_end = min(chunk_start + chunk, end + pd.Timedelta(1, "ns"))
+        # end of the chunk excluded (start of the next chunk)
+        try:
+            dwddata = retrieve_data(chunk_start, chunk_end - pd.Timedelta(1, "ns"))
+        except NoObservationsError as exception:
+            logger.warning("Back-test chunk skipped: %s", exception)
+            dwddata = ()
+        if len(dwddata):
+            yield dwddata
+        chunk_start = chunk_end
+
+
+def frame_chunks(dwddata, rows):
+    """ Chunks of rows of data already in memory """
+    for first in range(0, len(dwddata), rows):
+        yield dwddata.iloc[first:first + rows]
+
+
+def with_context(chunks):
+    """
+    Each chunk with the last row of the previous and the first row of the next chunk
+    (if any). Yields (padded chunk, rows of the chunk itself).
+    """
+    previous = None
+    current = None
+    for following in chunks:
+        if current is not None:
+            yield _padded(previous, current, following), current.index
+            previous = current
+        current = following
+    if current is not None:
+        yield _padded(previous, current, None), current.index
+
+
+def _padded(previous, current, following):
+    parts = ([previous.iloc[-1:]] if previous is not None else []) + [current] + \
+            ([following.iloc[:1]] if following is not None else [])
+    return pd.concat(parts) if len(parts) > 1 else current.copy()
+
+
+def calculate_chunks(chunks, solar_proc, pv_system):
+    """ Results of the chunks (see calculate_forecast), the context rows are dropped. """
+    for padded, rows in with_context(chunks):
+        with stage("calculate_chunk"):
+            result = calculate_forecast(dwddata=padded, solar_proc=solar_proc, pv_system=pv_system)
+        yield result.loc[rows]
+
+
+def csv_writer(path):
+    """ Callable(result) appending each result to the csv file (header with the first result). """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    state = {"header": True}
+
+    def write_result(result):
+        result.to_csv(path, mode="w" if state["header"] else "a", header=state["header"])
+        state["header"] = False
+
+    return write_result
+
+
+def store_writer(result_store, site, issue_time=None):
+    """ Callable(result) appending each result to the result store as one history run. """
+    if issue_time is None:
+        issue_time = pd.Timestamp.now(tz="UTC").floor("min")
+
+    def write_result(result):
+        result_store.append(result, issue_time=issue_time, site=site, source=SOURCE_HISTORY)
+
+    return write_result
+
+
+def run_backtest(chunks, solar_proc, pv_system, writers):
+    """
+    Calculate all chunks and pass each result to the writers (callables). Only one chunk
+    (plus the context rows) is kept in memory.
+
+    Returns a dict with the number of chunks, rows and the time [s].
+    """
+    start_time = time.perf_counter()
+    stats = {"chunks": 0, "rows": 0}
+    for result in calculate_chunks(chunks, solar_proc, pv_system):
+        with stage("write_chunk"):
+            for write_result in writers:
+                write_result(result)
+        stats["chunks"] += 1
+        stats["rows"] += len(result)
+        logger.info("Back-test chunk %d: %s - %s (%d rows)", stats["chunks"], result.index[0], result.index[-1],
+                    len(result))
+    stats["seconds"] = time.perf_counter() - start_time
+    return stats
+
+
+if __name__ == "__main__":
+    # Back-test of the observations: python -m pv_forecast.backtest start end [station ...]
+    import sys, configparser
+    from pv_forecast.calculation import setup_solar_processing, setup_pv_system
+    from pv_forecast.dwd_history import DWD_History, PERIOD_AUTO
+    from pv_forecast.dwd_cache import setup_cache
+    from pv_forecast.result_store import setup_result_store
+    logging.basicConfig(level=logging.INFO)
+    config = configparser.ConfigParser()
+    config.read("configuration.ini")
+    stations = [int(station) for station in sys.argv[3:]] or [config.getint("DWD", "DWDStationHistory", raw=True)]
+    chunk = pd.Timedelta(config.get("Backtest", "Chunk", fallback="7D"))
+    fetch_span = pd.Timedelta(config.get("Backtest", "FetchSpan", fallback="365D"))
+    solar_proc = setup_solar_processing(config)
+    pv_system = setup_pv_system(config, solar_proc.location)
+    result_store = setup_result_store(config)
+    try:
+        for station in stations:
+            # Older chunks are in the recent / historical observations of DWD, downloaded once per span:
+            dwd_history = DWD_History(station, cache=setup_cache(config), period=PERIOD_AUTO,
+                                      fetch_span=max(fetch_span, chunk))
+            writers = [csv_writer(os.path.join(config.get("Backtest", "Directory", fallback="output"),
+                                               "backtest_%05d.csv" % station))]
+            if result_store is not None:
+                writers.append(store_writer(result_store, "%s_%05d" % (config.get("ResultStore", "Site"), station)))
+            stats = run_backtest(history_chunks(dwd_history.retrieve_data, pd.Timestamp(sys.argv[1], tz="utc"),
+                                                pd.Timestamp(sys.argv[2], tz="utc"), chunk),
+                                 solar_proc, pv_system, writers)
+            print("Station %d: %d rows in %d chunks, %.1f s" % (station, stats["rows"], stats["chunks"],
+                                                                stats["seconds"]))
+    finally:
+        pv_system.close()
@@ -0,0 +1,272 @@
+"""
+Batch forecasting of many pv sites (rooftops) sharing a small number of DWD stations.
+
+The sites are given as table (one row per site) with an arbitrary number of
+arrays (roof orientations) per site:
+
+sites:  site_id, latitude, longitude, altitude, station
+        optional: module, inverter, albedo (defaults of BatchForecast are used otherwise)
+arrays: site_id, array_id, surface_tilt, surface_azimuth, modules_per_string
+
+Each station is fetched only once. Solar position and clearsky are computed once
+per unique location and time grid, the irradiance decomposition once per location
+and station. The sites are evaluated in parallel using the functional pv model
+(see pv_model), results are returned in long format:
+
+site_id, array_id, mode, date, ac_power   (array_id "ALL" is the sum of all arrays of a site)
+
+"""
+import time, hashlib, logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from pv_forecast.calculation import LIST_OF_MODES, decompose_irradiance, mode_irradiance
+from pv_forecast.solar_parameters import Solar_Processing
+from pv_forecast.pv_system import TEMP_MOD_PARA, load_module_parameters, load_inverter_parameters
+from pv_forecast.pv_model import SolarGeometry, evaluate_arrays
+
+logger = logging.getLogger(__name__)
+
+SITE_COLUMNS = ["site_id", "latitude", "longitude", "altitude", "station"]
+ARRAY_COLUMNS = ["site_id", "array_id", "surface_tilt", "surface_azimuth", "modules_per_string"]
+RESULT_COLUMNS = ["site_id", "array_id", "mode", "date", "ac_power"]
+ALL_ARRAYS = "ALL"
+
+
+def time_grid_key(time_range):
+    """ Hashable key of a time grid (DatetimeIndex). """
+    return (len(time_range), hashlib.sha1(time_range.asi8.tobytes()).hexdigest())
+
+
+def prepare_location(latitude, longitude, altitude, timezone, station_weather, modes):
+    """
+    Solar geometry and model inputs of one location.
+
+    Parameter:
+    ==========
+
+    latitude, longitude, altitude, timezone: location of the sites
+    station_weather: dict station -> reshaped DWD data, all stations have the same time grid
+    modes: calculation modes
+
+    Returns (SolarGeometry, dict station -> dict mode -> dict of numpy arrays ghi, dni, dhi,
+    temp_air, wind_speed).
+    """
+    time_range = next(iter(station_weather.values())).index
+    solar_proc = Solar_Processing(latitude, longitude, altitude, timezone)
+    solar_proc.process_weather_data(time_range)
+    geometry = SolarGeometry(solar_proc.solpos)
+
+    station_inputs = {}
+    for station, dwddata in station_weather.items():
+        decomposition = decompose_irradiance(dwddata, solar_proc)
+        temp_air = dwddata["TEMPERATURE_AIR_200DEGC"].to_numpy(dtype=float)
+        wind_speed = dwddata["WIND_SPEED"].to_numpy(dtype=float)
+        mode_inputs = {}
+        for mode in modes:
+            ghi, dni, dhi = mode_irradiance(mode, dwddata, solar_proc, decomposition)
+            mode_inputs[mode] = {"ghi": np.asarray(ghi, dtype=float), "dni": np.asarray(dni, dtype=float),
+                                 "dhi": np.asarray(dhi, dtype=float),
+                                 "temp_air": temp_air, "wind_speed": wind_speed}
+        station_inputs[station] = mode_inputs
+    return geometry, station_inputs
+
+
+def evaluate_site(site_id, site_arrays, mode_inputs, geometry, module_parameters, inverter_parameters, albedo,
+                  shared_inverter=False):
+    """
+    Evaluate all arrays of one site for all modes (all arrays in one pass).
+
+    Parameter:
+    ==========
+
+    site_id: id of the site
+    site_arrays: list of (array_id, surface_tilt, surface_azimuth, modules_per_string)
+    mode_inputs: dict mode -> dict of numpy arrays ghi, dni, dhi, temp_air, wind_speed
+    geometry: SolarGeometry of the site location / time grid
+    shared_inverter: all arrays of the site are connected to one inverter (several MPPT inputs)
+
+    Returns a list of (site_id, array_id, mode, ac_power numpy array), including the sum
+    of all arrays as array_id "ALL".
+    """
+    results = []
+    if not site_arrays:
+        return results
+    array_ids, surface_tilt, surface_azimuth, modules_per_string = zip(*site_arrays)
+    inverter_groups = np.zeros(len(site_arrays)) if shared_inverter else None
+    for mode, inputs in mode_inputs.items():
+        ac = evaluate_arrays(geometry, inputs["ghi"], inputs["dni"], inputs["dhi"],
+                             inputs["temp_air"], inputs["wind_speed"],
+                             surface_tilt, surface_azimuth, modules_per_string,
+                             module_parameters, inverter_parameters, albedo, TEMP_MOD_PARA,
+                             inverter_groups=inverter_groups)["ac"]
+        for index, array_id in enumerate(array_ids):
+            results.append((site_id, array_id, mode, ac[:, index]))
+        results.append((site_id, ALL_ARRAYS, mode, ac.sum(axis=1)))
+    return results
+
+
+class BatchForecast:
+    """
+    Calculate the pv forecast of many sites at once.
+
+    Parameter:
+    ==========
+
+    weather_source: callable(station) returning the reshaped DWD data of the station
+                    (e.g. DWD_Forecast(station).retrieve_data).
+    pv_module / inverter / albedo: defaults for sites without own values.
+    timezone: timezone of the locations.
+    modes: calculation modes (see calculation.LIST_OF_MODES).
+    workers: number of parallel workers to evaluate the sites.
+    executor: "thread" or "process".
+    location_decimals: if set, site coordinates are rounded to this number of decimals
+                       to share the solar position between nearby sites.
+    shared_inverter: all arrays of a site are connected to one inverter (several MPPT inputs),
+                     otherwise each array has its own inverter (like the pvlib ModelChain).
+    components: ComponentDatabase of the module / inverter parameters (defaults to the
+                configured database, see component_db).
+    """
+    def __init__(self, weather_source, pv_module: str, inverter: str, albedo: float = 0.2, timezone: str = "utc",
+                 modes=LIST_OF_MODES, workers: int = 4, executor: str = "thread", location_decimals=None,
+                 shared_inverter: bool = False, components=None) -> None:
+        if executor not in ["thread", "process"]:
+            raise ValueError("Unknown executor: %s" % executor)
+        self.weather_source = weather_source
+        self.pv_module = pv_module
+        self.inverter = inverter
+        self.albedo = albedo
+        self.timezone = timezone
+        self.modes = list(modes)
+        self.workers = workers
+        self.executor = executor
+        self.location_decimals = location_decimals
+        self.shared_inverter = shared_inverter
+        self.components = components
+        self.stats = {}
+
+    def _site_table(self, sites):
+        missing = [column for column in SITE_COLUMNS if column not in sites.columns]
+        if missing:
+            raise ValueError("Missing site columns: %s" % missing)
+        sites = sites.copy()
+        for column, default in [("module", self.pv_module), ("inverter", self.inverter), ("albedo", self.albedo)]:
+            if column not in sites.columns:
+                sites[column] = default
+            else:
+                sites[column] = sites[column].fillna(default)
+        if self.location_decimals is not None:
+            sites[["latitude", "longitude", "altitude"]] = sites[["latitude", "longitude", "altitude"]].round(self.location_decimals)
+        return sites
+
+    def fetch_weather(self, stations):
+        """ Fetch the weather data of each station once. """
+        weather = {}
+        for station in stations:
+            weather[station] = self.weather_source(station)
+        return weather
+
+    def _map(self, func, tasks):
+        """ Run func(*task) for all tasks using the configured pool of workers. """
+        if self.workers > 1 and len(tasks) > 1:
+            pool = ThreadPoolExecutor if self.executor == "thread" else ProcessPoolExecutor
+            with pool(max_workers=self.workers) as executor:
+                return list(executor.map(func, *zip(*tasks)))
+        return [func(*task) for task in tasks]
+
+    def prepare_inputs(self, sites, weather):
+        """
+        Compute solar geometry once per location / time grid and the model inputs of
+        each mode once per location / station.
+
+        Returns (geometry dict, inputs dict) keyed by (latitude, longitude, altitude, station).
+        """
+        locations = {}
+        for key in sites[["latitude", "longitude", "altitude", "station"]].drop_duplicates().itertuples(index=False, name=None):
+            latitude, longitude, altitude, station = key
+            solar_key = (latitude, longitude, altitude, time_grid_key(weather[station].index))
+            locations.setdefault(solar_key, {})[station] = weather[station]
+
+        tasks = [(latitude, longitude, altitude, self.timezone, station_weather, self.modes)
+                 for (latitude, longitude, altitude, _), station_weather in locations.items()]
+        geometries = {}
+        inputs = {}
+        for (latitude, longitude, altitude, _), (geometry, station_inputs) in zip(locations, self._map(prepare_location, tasks)):
+            for station, mode_inputs in station_inputs.items():
+                geometries[(latitude, longitude, altitude, station)] = geometry
+                inputs[(latitude, longitude, altitude, station)] = mode_inputs
+        self.stats["locations"] = len(locations)
+        return geometries, inputs
+
+    def run(self, sites, arrays):
+        """
+        Run the forecast of all sites.
+
+        Parameter:
+        ==========
+
+        sites: pandas Dataframe - one row per site (see module description)
+        arrays: pandas Dataframe - one row per array of a site
+
+        Returns a pandas Dataframe in long format (site_id, array_id, mode, date, ac_power).
+        """
+        start = time.perf_counter()
+        sites = self._site_table(sites)
+        missing = [column for column in ARRAY_COLUMNS if column not in arrays.columns]
+        if missing:
+            raise ValueError("Missing array columns: %s" % missing)
+        site_arrays = {site_id: list(group[ARRAY_COLUMNS[1:]].itertuples(index=False, name=None))
+                       for site_id, group in arrays.groupby("site_id", sort=False)}
+
+        weather = self.fetch_weather(sites["station"].unique())
+        fetched = time.perf_counter()
+
+        geometries, inputs = self.prepare_inputs(sites, weather)
+        prepared = time.perf_counter()
+
+        tasks = []
+        for site in sites.itertuples(index=False):
+            key = (site.latitude, site.longitude, site.altitude, site.station)
+            tasks.append((site.site_id, site_arrays.get(site.site_id, []), inputs[key], geometries[key],
+                          load_module_parameters(site.module, self.components),
+                          load_inverter_parameters(site.inverter, self.components),
+                          site.albedo, self.shared_inverter))
+
+        site_results = self._map(evaluate_site, tasks)
+        evaluated = time.perf_counter()
+
+        result = self._long_frame(site_results, [task[3].times for task in tasks])
+        end = time.perf_counter()
+
+        self.stats.update({"sites": len(sites), "arrays": len(arrays), "stations": len(weather),
+                           "rows": len(result),
+                           "fetch_seconds": fetched - start, "prepare_seconds": prepared - fetched,
+                           "evaluate_seconds": evaluated - prepared, "combine_seconds": end - evaluated,
+                           "total_seconds": end - start,
+                           "sites_per_second": len(sites) / (end - start)})
+        logger.info("Batch forecast of %d sites (%d stations, %d locations) in %.2fs",
+                    len(sites), len(weather), self.stats["locations"], end - start)
+        return result
+
+    @staticmethod
+    def _long_frame(site_results, site_times):
+        """ Concatenate the results of all sites into one long-format dataframe. """
+        site_ids, array_ids, modes, dates, values = [], [], [], [], []
+        for results, times in zip(site_results, site_times):
+            for site_id, array_id, mode, ac in results:
+                site_ids.append(np.repeat(np.asarray([site_id], dtype=object), len(times)))
+                array_ids.append(np.repeat(np.asarray([array_id], dtype=object), len(times)))
+                modes.append(np.repeat(np.asarray([mode], dtype=object), len(times)))
+                dates.append(times.asi8)
+                values.append(ac)
+        if not values:
+            return pd.DataFrame(columns=RESULT_COLUMNS)
+        date_index = pd.DatetimeIndex(np.concatenate(dates))
+        if site_times[0].tz is not None:
+            date_index = date_index.tz_localize("utc").tz_convert(site_times[0].tz)
+        return pd.DataFrame({"site_id": np.concatenate(site_ids),
+                             "array_id": np.concatenate(array_ids),
+                             "mode": pd.Categorical(np.concatenate(modes)),
+                             "date": date_index,
+                             "ac_power": np.concatenate(values)})
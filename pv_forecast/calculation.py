@@ -0,0 +1,188 @@
+"""
+Calculation pipeline to determine the expected power output of the pv system
+based on (forecasted or historic) DWD weather data.
+
+The setup of the location and of the pv system (module / inverter data, model
+chains) is separated from the calculation itself. This way the models may be
+set up once and re-used for several calculations (e.g. by the forecast service).
+
+"""
+import datetime
+import pandas as pd
+
+from pv_forecast.solar_parameters import Solar_Processing
+from pv_forecast.solar_table import setup_solar_table
+from pv_forecast.pv_system import PVSystem
+from pv_forecast.component_db import setup_component_database
+from pv_forecast.pv_model import SolarGeometry
+from pv_forecast.result_assembly import ResultAssembly
+from pv_forecast.instrumentation import stage
+
+# the following list represents different calculation approaches to determine
+# several algorithmst to find the best-suiting approach for the calculation
+# model.
+LIST_OF_MODES = ["clearsky", "disc", "dirint"]
+
+
+def setup_solar_processing(config):
+    """ Initialize class for getting basic solar parameters from configuration. """
+    mylatitude = config.getfloat("SolarSystem", "Latitude", raw=True)
+    mylongitude = config.getfloat("SolarSystem", "Longitute", raw=True)
+    myaltitude = config.getfloat("SolarSystem", "Altitude", raw=True)
+    mytimezone = config.get("SolarSystem", "MyTimezone", raw=True)
+
+    # Precomputed solar position / clearsky (built once, rebuilt if the site changes):
+    solar_table = setup_solar_table(config)
+
+    return Solar_Processing(mylatitude, mylongitude, myaltitude, mytimezone, solar_table=solar_table)
+
+
+def setup_pv_system(config, pvlib_location):
+    """ Initiate PV System including both roof sides from configuration. """
+    pv_system = PVSystem(inverter=config.get("SolarSystem", "InverterName", raw=True),
+                        pv_module=config.get("SolarSystem", "ModuleName", raw=True),
+                        albedo=config.getfloat("SolarSystem", "Albedo", raw=True),
+                        pvlib_location=pvlib_location,
+                        workers=config.getint("Calculation", "Workers", fallback=1),
+                        executor=config.get("Calculation", "Executor", fallback="process"),
+                        engine=config.get("Calculation", "Engine", fallback="modelchain"),
+                        shared_inverter=config.getboolean("Calculation", "SharedInverter", fallback=False),
+                        components=setup_component_database(config))
+
+    pv_system.add_pv_system(id="Ost",
+                            surface_tilt=config.getfloat("SolarSystem", "Elevation", raw=True),
+                            surface_azimuth=config.getfloat("SolarSystem", "Azimuth_1", raw=True),
+                            modules_per_string=config.getint("SolarSystem", "NumPanels_1", raw=True))
+
+    pv_system.add_pv_system(id="West",
+                            surface_tilt=config.getfloat("SolarSystem", "Elevation", raw=True),
+                            surface_azimuth=config.getfloat("SolarSystem", "Azimuth_2", raw=True),
+                            modules_per_string=config.getint("SolarSystem", "NumPanels_2", raw=True))
+    return pv_system
+
+
+def get_time_window(wheater_mode, today=None):
+    """
+    Determine the time periode (start, end) in UTC to be calculated for the
+    given weather mode.
+
+    wheater_mode: "from_history" uses the last two days, otherwise the upcoming
+                  two days (forecast) are used.
+    today: datetime.date - reference day, defaults to the current day.
+    """
+    if today is None:
+        today = datetime.date.today()
+
+    if wheater_mode == "from_history":
+        # Set up the time periode for history (adjust the timedelta for different aproach)
+        periode_start = today - datetime.timedelta(days=2)
+        periode_end = today
+    else:
+        periode_start = today
+        periode_end = today + datetime.timedelta(days=2)
+
+    start = datetime.datetime(year=periode_start.year, month=periode_start.month, day=periode_start.day, hour=1)
+    start = pd.Timestamp(start).tz_localize('utc')
+    end = datetime.datetime(year=periode_end.year, month=periode_end.month, day=periode_end.day, hour=23)
+    end = pd.Timestamp(end).tz_localize('utc')
+    return start, end
+
+
+def decompose_irradiance(dwddata, solar_proc):
+    """
+    Split the global horizontal irradiance of the DWD data into direct and diffuse
+    parts (DISC, DIRINDEX and ERBS in one pass, using the pressure of the DWD data).
+    Solar position and clearsky of solar_proc have to be processed for the time
+    range of dwddata.
+
+    Returns a pandas Dataframe with the columns (model, ghi / dni / dhi), see
+    decomposition.decompose.
+    """
+    pressure = dwddata["PRESSURE_AIR_SURFACE_REDUCED"] if "PRESSURE_AIR_SURFACE_REDUCED" in dwddata else None
+    return solar_proc.decompose(time_range=dwddata.index, ghi=dwddata.RAD_WH, pressure=pressure,
+                                dew_point=dwddata.DEW_POINT_DEGC)
+
+
+def mode_irradiance(current_mode, dwddata, solar_proc, decomposition):
+    """ Get (ghi, dni, dhi) used as model input for the given calculation mode. """
+    if current_mode == "clearsky":
+        # Using Clearsky-Irradiance (no clouds - theoretical model) to compute
+        # theoretical generation potential for pv system.
+        return solar_proc.clearsky.ghi, solar_proc.clearsky.dni, solar_proc.clearsky.dhi
+    elif current_mode == "disc":
+        # Modue using DWD Forecast for calculation
+        return dwddata.RAD_WH, decomposition["disc", "dni"], decomposition["erbs", "dhi"]
+    elif current_mode == "dirint":
+        return dwddata.RAD_WH, decomposition["disc", "dni"], decomposition["dirindex", "dni"].values
+    raise ValueError("Unknown calculation mode: %s" % current_mode)
+
+
+def calculate_forecast(dwddata, solar_proc, pv_system):
+    """
+    Run the complete calculation for the given weather data using already set up
+    solar processing and pv system.
+
+    Parameter:
+    ==========
+
+    dwddata: pandas Dataframe - reshaped DWD data (forecast or history).
+    solar_proc: Solar_Processing - location specific solar parameters.
+    pv_system: PVSystem - pv system with all model chains added.
+
+    Returns a pandas Dataframe with weather data, irradiance and pv system results.
+    """
+    # Use the time range of the DWD Data as basis for further calculations
+    time_range = dwddata.index
+
+    # Now set up the weather data
+    with stage("process_weather_data"):
+        solar_proc.process_weather_data(time_range)
+    with stage("decompose"):
+        decomposition = decompose_irradiance(dwddata, solar_proc)
+
+    weather_by_mode = {}
+    with stage("setup_weather_data"):
+        for current_mode in LIST_OF_MODES:
+            ghi, dni, dhi = mode_irradiance(current_mode, dwddata, solar_proc, decomposition)
+            weather_by_mode[current_mode] = pv_system.setup_weather_data(ghi=ghi, dhi=dhi, dni=dni,
+                                                                         temp_air=dwddata.TEMPERATURE_AIR_200DEGC,
+                                                                         wind_speed=dwddata.WIND_SPEED)
+
+    if pv_system.engine == "stacked":
+        # All pv systems in one pass, sharing the solar geometry of the time range:
+        with stage("run_stacked"):
+            geometry = SolarGeometry(solar_proc.solpos)
+            results = {}
+            for current_mode in LIST_OF_MODES:
+                with stage(current_mode):
+                    results[current_mode] = pv_system.run_stacked(weather_by_mode[current_mode], geometry)
+    elif pv_system.workers > 1:
+        # All modes and pv systems are independent: run them at once using the pool of workers
+        with stage("run_models"):
+            results = pv_system.run_models(weather_by_mode)
+    else:
+        results = {}
+        for current_mode in LIST_OF_MODES:
+            with stage("run_model/" + current_mode):
+                pv_system.run_model(wheater_data=weather_by_mode[current_mode])
+            results[current_mode] = dict(pv_system.results)
+
+    # Common result of weather data, irradiance, solar position and all pv system results
+    # (one preallocated block, dwddata is not modified):
+    leading = {str(column): dwddata[column] for column in dwddata.columns}
+    leading.update({"DHI_ERBS": decomposition["erbs", "dhi"],
+                    "DNI_DISC": decomposition["disc", "dni"],
+                    "DNI_DIRINDEX": decomposition["dirindex", "dni"].values,
+                    "GHI_CLEARSKY": solar_proc.clearsky.ghi,
+                    "DNI_CLEARSKY": solar_proc.clearsky.dni,
+                    "DHI_CLEARSKY": solar_proc.clearsky.dhi,
+                    "AZIMUTH": solar_proc.solpos.azimuth,
+                    "ZENITH": solar_proc.solpos.zenith,
+                    "ELEVATION": solar_proc.solpos.elevation})
+    assembly = ResultAssembly(time_range, leading, results, list(pv_system.model_chain))
+    for current_mode in LIST_OF_MODES:
+        with stage("combine_data"):
+            assembly.fill(current_mode)
+    with stage("assemble"):
+        result = assembly.frame()
+    return result
@@ -0,0 +1,265 @@
+"""
+Parameter sweep to calibrate the pv system against the power measured by the inverter.
+
+Instead of editing the configuration and re-running main.py for each combination
+of parameters, all combinations of the parameter grids are evaluated on one fixed
+weather dataset (e.g. a month of 10 minute DWD observations):
+
+- surface_tilt (Elevation), surface_azimuth_<array> (Azimuth_1 / Azimuth_2), albedo
+- temperature_model (pvlib SAPM parameter sets, e.g. open_rack_glass_glass)
+- mode (decomposition: clearsky / disc / dirint, see calculation.LIST_OF_MODES)
+- aoi_model (see pv_model.AOI_MODELS), spectral_model (no_loss / first_solar)
+
+Solar position, clearsky and decomposition are computed once. The arrays of all
+combinations are stacked along the array axis of pv_model.evaluate_arrays and
+evaluated in batches (bounded memory). Night rows (no irradiance in any mode) are
+evaluated only once. The combinations are ranked by their error against the
+measured ac power.
+
+"""
+import itertools, logging, time
+import numpy as np
+import pandas as pd
+from pvlib import atmosphere, pvsystem
+from pvlib.temperature import TEMPERATURE_MODEL_PARAMETERS
+
+from pv_forecast.calculation import LIST_OF_MODES, setup_solar_processing, decompose_irradiance, mode_irradiance
+from pv_forecast.pv_model import SolarGeometry, evaluate_arrays, AOI_MODELS
+from pv_forecast.pv_system import load_module_parameters, load_inverter_parameters, TEMP_MOD_PARA
+from pv_forecast.component_db import setup_component_database
+
+logger = logging.getLogger(__name__)
+
+SPECTRAL_MODELS = ["no_loss", "first_solar"]
+# Sweep parameters common to all arrays (per array: surface_azimuth_<id>, modules_per_string_<id>)
+SWEEP_PARAMETERS = ["surface_tilt", "albedo", "temperature_model", "mode", "aoi_model", "spectral_model"]
+METRICS = ["rmse", "mae", "bias", "count"]
+# Elements (times x arrays) evaluated at once
+DEFAULT_BATCH_ELEMENTS = 2000000
+
+
+def temperature_model_name(parameters):
+    """ Name of the SAPM temperature model with the given parameters (a, b, deltaT). """
+    for name, model_parameters in TEMPERATURE_MODEL_PARAMETERS["sapm"].items():
+        if all(model_parameters[key] == parameters[key] for key in ["a", "b", "deltaT"]):
+            return name
+    raise ValueError("Unknown temperature model parameters: %s" % parameters)
+
+
+def relative_humidity(temp_air, temp_dew):
+    """ Relative humidity [%] from air and dew point temperature [degC] (Magnus formula). """
+    magnus = lambda temperature: np.exp(17.625 * temperature / (243.04 + temperature))
+    return np.clip(100. * magnus(temp_dew) / magnus(temp_air), 0., 100.)
+
+
+def parameter_grid(grid, base):
+    """
+    All combinations of the parameter grid as pandas Dataframe (one row per combination).
+
+    grid: dict parameter -> list of values
+    base: dict parameter -> value of all parameters not given in the grid
+    """
+    unknown = [key for key in grid if key not in base]
+    if unknown:
+        raise ValueError("Unknown sweep parameters: %s (available: %s)" % (", ".join(unknown), ", ".join(base)))
+    keys = list(base)
+    values = [list(grid[key]) if key in grid else [base[key]] for key in keys]
+    return pd.DataFrame(list(itertools.product(*values)), columns=keys)
+
+
+class ParameterSweep:
+    """
+    Evaluate many parameter combinations of the pv system on one weather dataset.
+
+    Parameter:
+    ==========
+
+    solar_proc: Solar_Processing - location specific solar parameters.
+    arrays: list of dicts with id, surface_azimuth and modules_per_string of each array
+            (roof side), all arrays of a combination sum up to the ac power of the system.
+    pv_module / inverter: names of the module / inverter (see PVSystem)
+    base: dict with the base value of the sweep parameters (see SWEEP_PARAMETERS)
+    batch_elements: number of elements (times x arrays) evaluated at once
+    """
+    def __init__(self, solar_proc, arrays, pv_module, inverter, base, batch_elements=DEFAULT_BATCH_ELEMENTS) -> None:
+        self.solar_proc = solar_proc
+        self.arrays = arrays
+        self.pv_module = load_module_parameters(pv_module)
+        self.inverter = load_inverter_parameters(inverter)
+        self.base = dict(base)
+        for array in arrays:
+            self.base.setdefault("surface_azimuth_" + array["id"], array["surface_azimuth"])
+            self.base.setdefault("modules_per_string_" + array["id"], array["modules_per_string"])
+        self.batch_elements = batch_elements
+        self.inputs = None
+
+    def prepare(self, dwddata):
+        """ Solar position, clearsky, decomposition and spectral modifiers of the weather data (once). """
+        time_range = dwddata.index
+        self.solar_proc.process_weather_data(time_range)
+        decomposition = decompose_irradiance(dwddata, self.solar_proc)
+        irradiance = {mode: [np.asarray(value, dtype=float)
+                             for value in mode_irradiance(mode, dwddata, self.solar_proc, decomposition)]
+                      for mode in LIST_OF_MODES}
+        geometry = SolarGeometry(self.solar_proc.solpos)
+        temp_air = dwddata.TEMPERATURE_AIR_200DEGC.to_numpy(dtype=float)
+
+        # First Solar spectral correction like the ModelChain (absolute airmass at the altitude of the site)
+        airmass_absolute = atmosphere.get_absolute_airmass(geometry.airmass_relative,
+                                                           atmosphere.alt2pres(self.solar_proc.myaltitude))
+        precipitable_water = atmosphere.gueymard94_pw(
+            temp_air, relative_humidity(temp_air, dwddata.DEW_POINT_DEGC.to_numpy(dtype=float)))
+        spectral = {"no_loss": np.ones(len(time_range)),
+                    "first_solar": np.asarray(pvsystem.PVSystem(module_parameters=self.pv_module)
+                                              .first_solar_spectral_loss(precipitable_water, airmass_absolute),
+                                              dtype=float)}
+
+        # Rows without any irradiance (night) give the same result if the same inputs are
+        # missing: one row per pattern of missing inputs is evaluated.
+        wind_speed = dwddata.WIND_SPEED.to_numpy(dtype=float)
+        values = [value for mode in LIST_OF_MODES for value in irradiance[mode]]
+        dark = np.logical_and.reduce([~(value > 0) for value in values])
+        missing = np.column_stack([np.isnan(value) for value in values + [temp_air, wind_speed]])
+        pattern = np.where(dark, missing @ (1 << np.arange(missing.shape[1], dtype=np.int64)),
+                           -1 - np.arange(len(time_range)))
+        _, first, inverse = np.unique(pattern, return_index=True, return_inverse=True)
+        order = np.argsort(first)
+        position = np.empty_like(order)
+        position[order] = np.arange(len(order))
+        rows = first[order]
+        self.inputs = {"index": time_range, "rows": rows, "row_of": position[inverse],
+                       "geometry": _select_rows(geometry, rows), "irradiance": irradiance, "spectral": spectral,
+                       "temp_air": temp_air, "wind_speed": wind_speed}
+        return self
+
+    def combinations(self, grid):
+        """ All combinations of the grid (dict parameter -> values) as pandas Dataframe. """
+        return parameter_grid(grid, self.base)
+
+    def _array_columns(self, combinations):
+        """ One row per array of each combination (row c * arrays + a: array a of combination c) """
+        columns = pd.DataFrame({key: np.repeat(combinations[key].to_numpy(), len(self.arrays))
+                                for key in SWEEP_PARAMETERS})
+        for key in ["surface_azimuth", "modules_per_string"]:
+            columns[key] = np.column_stack([combinations[key + "_" + array["id"]].to_numpy()
+                                            for array in self.arrays]).ravel()
+        return columns
+
+    def _evaluate_batch(self, combinations):
+        """ ac power of the system (times of the evaluated rows x combinations) """
+        inputs = self.inputs
+        rows = inputs["rows"]
+        columns = self._array_columns(combinations)
+        # Arrays with the same parameters in several combinations (e.g. only the other array
+        # differs) are evaluated once:
+        codes = columns.groupby(list(columns.columns), sort=False).ngroup().to_numpy()
+        unique = columns.drop_duplicates()
+
+        ghi, dni, dhi = [np.column_stack([inputs["irradiance"][mode][component][rows] for mode in unique["mode"]])
+                         for component in range(3)]
+        spectral_modifier = np.column_stack([inputs["spectral"][model][rows] for model in unique["spectral_model"]])
+        temperature_parameters = {key: [TEMPERATURE_MODEL_PARAMETERS["sapm"][name][key]
+                                        for name in unique["temperature_model"]] for key in ["a", "b", "deltaT"]}
+        result = evaluate_arrays(inputs["geometry"], ghi, dni, dhi, inputs["temp_air"][rows],
+                                 inputs["wind_speed"][rows], unique["surface_tilt"], unique["surface_azimuth"],
+                                 unique["modules_per_string"], self.pv_module, self.inverter,
+                                 unique["albedo"].to_numpy(dtype=float), temperature_parameters,
+                                 aoi_model=unique["aoi_model"].to_numpy(), spectral_modifier=spectral_modifier)
+        return result["ac"][:, codes].reshape(len(rows), len(combinations), len(self.arrays)).sum(axis=2)
+
+    def _batches(self, combinations):
+        batch_size = max(1, int(self.batch_elements // max(len(self.inputs["rows"]) * len(self.arrays), 1)))
+        for start in range(0, len(combinations), batch_size):
+            yield start, combinations.iloc[start:start + batch_size]
+
+    def simulate(self, combinations):
+        """
+        ac power of the whole system for each combination (pandas Dataframe: times x combinations).
+        """
+        if self.inputs is None:
+            raise RuntimeError("The weather data is not prepared (see prepare).")
+        ac = np.empty((len(self.inputs["index"]), len(combinations)))
+        for start, batch in self._batches(combinations):
+            ac[:, start:start + len(batch)] = self._evaluate_batch(batch)[self.inputs["row_of"]]
+        return pd.DataFrame(ac, index=self.inputs["index"], columns=combinations.index)
+
+    def rank(self, combinations, measured, metric="rmse"):
+        """
+        Error of each combination against the measured ac power (pandas Series on the time
+        grid of the weather data, see evaluation.measured_ac). Only the metrics are kept,
+        so any number of combinations can be ranked.
+
+        Returns the combinations with the columns rmse, mae, bias, count sorted by metric.
+        """
+        if self.inputs is None:
+            raise RuntimeError("The weather data is not prepared (see prepare).")
+        start_time = time.perf_counter()
+        measured = measured.reindex(self.inputs["index"]).to_numpy(dtype=float)
+        valid = ~np.isnan(measured)
+        metrics = np.empty((len(combinations), 3))
+        for start, batch in self._batches(combinations):
+            ac = self._evaluate_batch(batch)[self.inputs["row_of"][valid]]
+            error = ac - measured[valid, np.newaxis]
+            metrics[start:start + len(batch)] = np.column_stack([np.sqrt(np.mean(np.square(error), axis=0)),
+                                                                 np.mean(np.abs(error), axis=0),
+                                                                 np.mean(error, axis=0)])
+        ranking = combinations.copy()
+        ranking["rmse"], ranking["mae"], ranking["bias"] = metrics.T
+        ranking["count"] = int(valid.sum())
+        logger.info("%d combinations ranked in %.1f s", len(combinations), time.perf_counter() - start_time)
+        return ranking.sort_values(metric, key=np.abs if metric == "bias" else None, kind="stable")
+
+
+def setup_parameter_sweep(config, solar_proc=None, **kwargs):
+    """
+    Parameter sweep of the pv system of the configuration: the base values are the
+    values used by the forecast (see setup_pv_system), the arrays are Ost / West.
+    """
+    if solar_proc is None:
+        solar_proc = setup_solar_processing(config)
+    setup_component_database(config)
+    arrays = [{"id": "Ost", "surface_azimuth": config.getfloat("SolarSystem", "Azimuth_1", raw=True),
+               "modules_per_string": config.getint("SolarSystem", "NumPanels_1", raw=True)},
+              {"id": "West", "surface_azimuth": config.getfloat("SolarSystem", "Azimuth_2", raw=True),
+               "modules_per_string": config.getint("SolarSystem", "NumPanels_2", raw=True)}]
+    base = {"surface_tilt": config.getfloat("SolarSystem", "Elevation", raw=True),
+            "albedo": config.getfloat("SolarSystem", "Albedo", raw=True),
+            "temperature_model": temperature_model_name(TEMP_MOD_PARA),
+            "mode": "disc", "aoi_model": "no_loss", "spectral_model": "no_loss"}
+    return ParameterSweep(solar_proc, arrays, config.get("SolarSystem", "ModuleName", raw=True),
+                          config.get("SolarSystem", "InverterName", raw=True), base, **kwargs)
+
+
+def _select_rows(geometry, rows):
+    """ SolarGeometry of the selected rows """
+    selected = SolarGeometry.__new__(SolarGeometry)
+    selected.times = geometry.times[rows]
+    for key in ["apparent_zenith", "zenith", "azimuth", "dni_extra", "airmass_relative"]:
+        setattr(selected, key, getattr(geometry, key)[rows])
+    return selected
+
+
+if __name__ == "__main__":
+    # Calibration against the measured data: python -m pv_forecast.calibration start end
+    import sys, configparser
+    from pv_forecast.dwd_history import DWD_History
+    from pv_forecast.dwd_cache import setup_cache
+    from pv_forecast.telemetry import setup_measured_store
+    from pv_forecast.evaluation import measured_ac
+    config = configparser.ConfigParser()
+    config.read("configuration.ini")
+    start, end = pd.Timestamp(sys.argv[1], tz="utc"), pd.Timestamp(sys.argv[2], tz="utc")
+    dwd_history = DWD_History(config.getint("DWD", "DWDStationHistory", raw=True), cache=setup_cache(config))
+    dwddata = dwd_history.retrieve_data(start, end).loc[start:end]
+    # The 10 minute observations are not shifted (value at the end of its interval):
+    measured = measured_ac(setup_measured_store(config).read(start, end), freq="10min", label="right")
+    sweep = setup_parameter_sweep(config).prepare(dwddata)
+    base = sweep.base
+    ranking = sweep.rank(sweep.combinations(
+        {"surface_tilt": np.arange(base["surface_tilt"] - 10, base["surface_tilt"] + 11, 2.5),
+         "surface_azimuth_Ost": np.arange(base["surface_azimuth_Ost"] - 10, base["surface_azimuth_Ost"] + 11, 5),
+         "surface_azimuth_West": np.arange(base["surface_azimuth_West"] - 10, base["surface_azimuth_West"] + 11, 5),
+         "albedo": [0.1, 0.15, 0.2, 0.25], "mode": LIST_OF_MODES, "aoi_model": AOI_MODELS[:2],
+         "spectral_model": SPECTRAL_MODELS}), measured)
+    with pd.option_context("display.width", 200, "display.max_columns", 20):
+        print(ranking.head(20))
@@ -0,0 +1,298 @@
+"""
+Local database of pv modules and inverters (CEC parameters).
+
+pvlib.pvsystem.retrieve_sam parses the complete SAM library (csv, >20000 modules)
+each time just to pick one component. Components not (yet) included in the SAM
+libraries of pvlib are stored within pv_forecast/data:
+
+- LG355N1C_V5_Module.p: my LG_Electronics_Inc__LG355N1C_V5 modules, taken from the
+  cec-module repository (https://github.com/NREL/SAM/tree/develop/deploy/libraries)
+- Kostal_Plenticore__Plus_4_2.json: my Kostal Plenticore Plus 4.2 inverter, see
+  https://github.com/tinoetzold/KostalPlenticoreData-for-PVLIB
+
+The SAM libraries, the files of pv_forecast/data and of further directories with
+own components are compiled once into one binary file:
+
+    [magic, offset of the index] [record 1] [record 2] ... [index]
+
+Each record holds the parameters of one component (JSON), the index maps kind and
+name of the component to offset / length of its record. Opening the database reads
+the index only, a lookup by name reads and deserializes the single record (O(1)).
+Names are searched by prefix (bisect on the sorted, normalized names) or fuzzy
+(difflib on the names sharing the most trigrams). The database is rebuilt if one of its sources changes.
+
+Own components (files within the component directories):
+- *.json: parameters of one component, the name is the file name
+- *.p / *.pkl: pickled pandas Series (one component) or Dataframe (one component per column)
+- *.csv: library in SAM format (see pvlib.pvsystem.retrieve_sam)
+Inverters are recognized by their parameter "Paco", all other components are modules.
+Own components replace SAM components of the same name.
+
+"""
+import os, re, json, glob, bisect, collections, struct, difflib, hashlib, logging, threading
+import pandas as pd
+import pvlib
+
+logger = logging.getLogger(__name__)
+
+KIND_MODULE = "module"
+KIND_INVERTER = "inverter"
+KINDS = [KIND_MODULE, KIND_INVERTER]
+# SAM libraries of pvlib per kind
+SAM_LIBRARIES = {KIND_MODULE: "cecmod", KIND_INVERTER: "cecinverter"}
+SAM_FILES = {KIND_MODULE: "sam-library-cec-modules-2019-03-05.csv",
+             KIND_INVERTER: "sam-library-cec-inverters-2019-03-05.csv"}
+COMPONENT_EXTENSIONS = [".json", ".p", ".pkl", ".csv"]
+
+DATA_DIRECTORY = os.path.join(os.path.dirname(__file__), "data")
+# Independent of the working directory: cache/components.db next to the pv_forecast package
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "components.db")
+
+MAGIC = b"PVCOMPDB"
+HEADER = struct.Struct("<8sQ")
+DATABASE_VERSION = 1
+# Number of names compared by difflib in a fuzzy search
+FUZZY_CANDIDATES = 200
+
+
+def normalized(name: str) -> str:
+    """ Name used for searching: lower case letters and digits only """
+    return re.sub(r"[^0-9a-z]", "", str(name).lower())
+
+
+def component_kind(parameters) -> str:
+    return KIND_INVERTER if "Paco" in parameters else KIND_MODULE
+
+
+def component_files(directories):
+    """ Files with own components within the directories (sorted, missing directories are skipped) """
+    files = []
+    for directory in directories:
+        for extension in COMPONENT_EXTENSIONS:
+            files.extend(glob.glob(os.path.join(directory, "*" + extension)))
+    return sorted(files)
+
+
+def read_components(path):
+    """ Components of one file: list of (kind, name, parameters as pandas Series) """
+    name, extension = os.path.splitext(os.path.basename(path))
+    if extension == ".json":
+        with open(path) as component_file:
+            series = [pd.Series(json.load(component_file), name=name, dtype=object)]
+    elif extension == ".csv":
+        library = pvlib.pvsystem.retrieve_sam(path=path)
+        series = [library[column] for column in library.columns]
+    else:
+        data = pd.read_pickle(path)
+        if isinstance(data, pd.DataFrame):
+            series = [data[column] for column in data.columns]
+        else:
+            series = [data.rename(data.name if data.name is not None else name)]
+    return [(component_kind(parameters.index), str(parameters.name), parameters) for parameters in series]
+
+
+def source_files(directories):
+    """ SAM libraries and files of own components (in order of precedence, the last one wins) """
+    sam_directory = os.path.join(os.path.dirname(pvlib.__file__), "data")
+    return [os.path.join(sam_directory, SAM_FILES[kind]) for kind in KINDS] + component_files(directories)
+
+
+def fingerprint(directories) -> str:
+    """ Identifies the content of all sources (paths, sizes and modification times) """
+    state = [DATABASE_VERSION, pvlib.__version__]
+    for path in source_files(directories):
+        status = os.stat(path)
+        state.append([os.path.abspath(path), status.st_size, status.st_mtime_ns])
+    return hashlib.sha1(json.dumps(state).encode("utf-8")).hexdigest()
+
+
+def _record(parameters) -> bytes:
+    values = {str(key): value.item() if hasattr(value, "item") else value for key, value in parameters.items()}
+    return json.dumps(values).encode("utf-8")
+
+
+def build_database(path, directories=(DATA_DIRECTORY,)):
+    """
+    Compile the SAM libraries of pvlib and the own components of the directories into
+    the database file. Returns the opened ComponentDatabase.
+    """
+    directories = list(directories)
+    current = fingerprint(directories)
+    components = {kind: {} for kind in KINDS}
+    for kind in KINDS:
+        library = pvlib.pvsystem.retrieve_sam(SAM_LIBRARIES[kind])
+        for name, parameters in library.items():
+            components[kind][name] = parameters
+    for component_path in component_files(directories):
+        for kind, name, parameters in read_components(component_path):
+            if name in components[kind]:
+                logger.debug("Component %s (%s) replaced by %s", name, kind, component_path)
+            components[kind][name] = parameters
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    index = {kind: {} for kind in KINDS}
+    with open(path + ".tmp", "wb") as database_file:
+        database_file.write(HEADER.pack(MAGIC, 0))
+        for kind in KINDS:
+            # Records in the order of the normalized names (sorted index for the prefix search)
+            for name, parameters in sorted(components[kind].items(), key=lambda item: normalized(item[0])):
+                record = _record(parameters)
+                index[kind][name] = [database_file.tell(), len(record)]
+                database_file.write(record)
+        index_offset = database_file.tell()
+        database_file.write(json.dumps({"version": DATABASE_VERSION, "fingerprint": current,
+                                        "components": index}).encode("utf-8"))
+        database_file.seek(0)
+        database_file.write(HEADER.pack(MAGIC, index_offset))
+    os.replace(path + ".tmp", path)
+    logger.info("Component database built: %d modules, %d inverters",
+                len(index[KIND_MODULE]), len(index[KIND_INVERTER]))
+    return ComponentDatabase(path)
+
+
+def load_or_build(path=DEFAULT_PATH, directories=(DATA_DIRECTORY,)):
+    """ Open the database, (re-)build it if it is missing or if one of the sources changed. """
+    if os.path.exists(path):
+        database = ComponentDatabase(path)
+        if database.fingerprint == fingerprint(directories):
+            return database
+        logger.info("Sources of the component database changed, rebuilding %s", path)
+    return build_database(path, directories)
+
+
+class ComponentDatabase:
+    """
+    Read access to a database file built by build_database. Records are read on
+    first access and kept (the same Series is returned for subsequent lookups).
+
+    Parameter:
+    ==========
+
+    path: path of the database file
+    """
+    def __init__(self, path) -> None:
+        self.path = path
+        with open(path, "rb") as database_file:
+            magic, index_offset = HEADER.unpack(database_file.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError("%s is no component database" % path)
+            database_file.seek(index_offset)
+            index = json.loads(database_file.read())
+        self.version = index["version"]
+        self.fingerprint = index["fingerprint"]
+        self.index = index["components"]
+        self._records = {}
+        self._sorted = {}
+        self._trigrams = {}
+        self._lock = threading.Lock()
+
+    def names(self, kind):
+        return list(self.index[kind])
+
+    def get(self, kind, name):
+        """ Parameters of the component (pandas Series), KeyError with similar names if unknown """
+        key = (kind, name)
+        parameters = self._records.get(key)
+        if parameters is not None:
+            return parameters
+        try:
+            offset, length = self.index[kind][name]
+        except KeyError:
+            raise KeyError("Unknown %s %s, similar: %s" % (kind, name, ", ".join(self.fuzzy(kind, name, cutoff=0.3)) or "-"))
+        with open(self.path, "rb") as database_file:
+            database_file.seek(offset)
+            record = database_file.read(length)
+        parameters = pd.Series(json.loads(record), name=name, dtype=object)
+        with self._lock:
+            return self._records.setdefault(key, parameters)
+
+    def module(self, name):
+        return self.get(KIND_MODULE, name)
+
+    def inverter(self, name):
+        return self.get(KIND_INVERTER, name)
+
+    def _sorted_names(self, kind):
+        """ (normalized names, names) sorted by the normalized name, set up on first search """
+        entry = self._sorted.get(kind)
+        if entry is None:
+            # The index is stored in this order already (sorting is linear then)
+            pairs = sorted((normalized(name), name) for name in self.index[kind])
+            entry = self._sorted[kind] = ([pair[0] for pair in pairs], [pair[1] for pair in pairs])
+        return entry
+
+    def search(self, kind, prefix, limit=None):
+        """ Names starting with prefix (case, blanks and punctuation ignored) """
+        keys, names = self._sorted_names(kind)
+        prefix = normalized(prefix)
+        first = bisect.bisect_left(keys, prefix)
+        last = bisect.bisect_right(keys, prefix + "\x7f")
+        return names[first:last if limit is None else min(last, first + limit)]
+
+    def _trigram_index(self, kind):
+        """ trigram -> positions of the sorted names containing it, set up on first fuzzy search """
+        trigrams = self._trigrams.get(kind)
+        if trigrams is None:
+            trigrams = {}
+            for position, key in enumerate(self._sorted_names(kind)[0]):
+                for trigram in {key[start:start + 3] for start in range(len(key) - 2)}:
+                    trigrams.setdefault(trigram, []).append(position)
+            self._trigrams[kind] = trigrams
+        return trigrams
+
+    def fuzzy(self, kind, text, limit=5, cutoff=0.6, candidates=FUZZY_CANDIDATES):
+        """ Most similar names (e.g. with typos), best match first """
+        keys, names = self._sorted_names(kind)
+        text = normalized(text)
+        # Only the names sharing the most trigrams with the text are compared by difflib
+        trigrams = self._trigram_index(kind)
+        shared = collections.Counter(position for trigram in {text[start:start + 3] for start in range(len(text) - 2)}
+                                     for position in trigrams.get(trigram, []))
+        lookup = {keys[position]: names[position] for position, _ in shared.most_common(candidates)}
+        return [lookup[key] for key in difflib.get_close_matches(text, list(lookup), n=limit, cutoff=cutoff)]
+
+
+# Database used if none is passed explicitly (see setup_component_database)
+_default_database = None
+_default_lock = threading.Lock()
+
+
+def default_database():
+    """ The configured database, opened (or built) at DEFAULT_PATH on first use """
+    global _default_database
+    with _default_lock:
+        if _default_database is None:
+            _default_database = load_or_build(DEFAULT_PATH)
+        return _default_database
+
+
+def setup_component_database(config):
+    """
+    Open (or build) the database as configured in the "Components" section (DEFAULT_PATH
+    if no "Database" is given) and use it as default database. Own components are read
+    from the configured directory in addition to pv_forecast/data.
+    """
+    global _default_database
+    directories = [DATA_DIRECTORY]
+    own_directory = config.get("Components", "Directory", fallback="")
+    if own_directory:
+        directories.append(own_directory)
+    database = load_or_build(config.get("Components", "Database", fallback=DEFAULT_PATH), directories)
+    with _default_lock:
+        _default_database = database
+    return database
+
+
+if __name__ == "__main__":
+    # Build the database and search components: python -m pv_forecast.component_db [module|inverter text]
+    import sys, configparser
+    logging.basicConfig(level=logging.INFO)
+    config = configparser.ConfigParser()
+    config.read("configuration.ini")
+    database = setup_component_database(config)
+    if len(sys.argv) > 2:
+        kind, text = sys.argv[1], " ".join(sys.argv[2:])
+        for name in database.search(kind, text, limit=20) or database.fuzzy(kind, text, limit=20):
+            print(name)
@@ -0,0 +1,252 @@
+"""
+Decomposition of the global horizontal irradiance (ghi) into direct normal (dni) and
+diffuse horizontal (dhi) irradiance by the DISC, DIRINDEX and ERBS models in one pass.
+
+Calling pvlib.irradiance.disc, dirindex and erbs separately recomputes the same
+intermediates for the same time range and zenith: extraterrestrial irradiance,
+cos(zenith), airmass and clearness index; dirindex runs dirint (incl. DISC) for the
+ghi and for the clearsky ghi, although the DISC of the ghi is known already. Here,
+these intermediates are computed once with numpy and shared by all models:
+
+    shared:     day angle / extraterrestrial irradiance, cos(zenith), absolute airmass
+                (per timestamp pressure), zenith and dew point bins of DIRINT
+    per ghi:    clearness index, DISC (ghi and clearsky ghi), DIRINT coefficients
+    models:     disc (DISC), dirindex (DIRINDEX), erbs (ERBS)
+
+The equations follow pvlib (see pvlib.irradiance), the results match pvlib within
+floating point tolerance. The dhi of DISC and DIRINDEX follows from the closure
+equation dhi = ghi - dni * cos(zenith).
+
+"""
+import numpy as np
+import pandas as pd
+from pvlib import irradiance
+
+from pv_forecast.instrumentation import stage
+
+MODELS = ["disc", "dirindex", "erbs"]
+COMPONENTS = ["ghi", "dni", "dhi"]
+STANDARD_PRESSURE = 101325.
+
+# Solar constants used by pvlib: DISC (and DIRINT) and ERBS (get_extra_radiation default)
+SOLAR_CONSTANT_DISC = 1370.
+SOLAR_CONSTANT_ERBS = 1366.1
+
+# Bins of DIRINT (lower bounds, MATLAB-style bin numbers start with 1, 0: not assigned)
+KT_PRIME_BINS = [0., 0.24, 0.4, 0.56, 0.7, 0.8]
+ZENITH_BINS = [0., 25., 40., 55., 70., 80.]
+W_BINS = [0., 1., 2., 3.]
+DELTA_KT_PRIME_BINS = [0., 0.015, 0.035, 0.07, 0.15, 0.3]
+
+# Attributes of SharedIntermediates with one value per timestamp
+PER_TIME_VALUES = ["zenith", "distance_factor", "cos_zenith", "cos_zenith_limited", "bad_zenith", "airmass",
+                   "kt_prime_factor", "knc", "zenith_bin", "w_bin"]
+
+
+def _bins(values, lower_bounds, upper_limit=np.inf):
+    """ Bin number (1 ...) of the values, 0 outside of [lower_bounds[0], upper_limit] or for nan """
+    bins = np.digitize(values, lower_bounds)
+    return np.where(np.isnan(values) | (values > upper_limit), 0, bins)
+
+
+class SharedIntermediates:
+    """
+    Intermediates depending on time, zenith, pressure and dew point only (shared
+    by all models and by the ghi / clearsky ghi).
+
+    Parameter:
+    ==========
+
+    times: pandas DatetimeIndex
+    zenith: solar zenith [deg] (numpy array or pandas Series)
+    pressure: pressure [Pa] per timestamp or scalar, missing values: standard pressure
+    temp_dew: dew point [degC] per timestamp, None: not used by DIRINT
+    """
+    def __init__(self, times, zenith, pressure=None, temp_dew=None,
+                 min_cos_zenith=0.065, max_zenith=87, max_airmass=12) -> None:
+        self.times = times
+        self.zenith = np.asarray(zenith, dtype=float)
+        self.max_zenith = max_zenith
+
+        # Earth-sun distance factor (spencer), day angle of the day of year:
+        day_angle = (2. * np.pi / 365.) * (times.dayofyear.to_numpy() - 1)
+        self.distance_factor = (1.00011 + 0.034221 * np.cos(day_angle) + 0.00128 * np.sin(day_angle) +
+                                0.000719 * np.cos(2 * day_angle) + 7.7e-05 * np.sin(2 * day_angle))
+        self.cos_zenith = np.cos(np.radians(self.zenith))
+        self.cos_zenith_limited = np.maximum(self.cos_zenith, min_cos_zenith)
+        self.bad_zenith = self.zenith > max_zenith
+
+        # Absolute airmass (kasten1966) like DISC, limited to max_airmass
+        pressure = STANDARD_PRESSURE if pressure is None else np.asarray(pressure, dtype=float)
+        pressure = np.where(np.isnan(pressure), STANDARD_PRESSURE, pressure)
+        with np.errstate(invalid="ignore"):
+            zenith_limited = np.where(self.zenith > 90, np.nan, self.zenith)
+            airmass = 1.0 / (np.cos(np.radians(zenith_limited)) + 0.15 * ((93.885 - zenith_limited) ** -1.253))
+        self.airmass = np.minimum(airmass * pressure / STANDARD_PRESSURE, max_airmass)
+        self.kt_prime_factor = 1.031 * np.exp(-1.4 / (0.9 + 9.4 / self.airmass)) + 0.1
+
+        # DIRINT: Knc of DISC, zenith and dew point bins
+        airmass = self.airmass
+        self.knc = 0.866 - 0.122 * airmass + 0.0121 * airmass**2 - 0.000653 * airmass**3 + 1.4e-05 * airmass**4
+        self.zenith_bin = _bins(self.zenith, ZENITH_BINS)
+        if temp_dew is None:
+            self.w_bin = np.full(len(self.zenith), 5)
+        else:
+            self.w_bin = _bins(np.exp(0.07 * np.asarray(temp_dew, dtype=float) - 0.075), W_BINS)
+
+    def as_columns(self):
+        """
+        Per timestamp values as column vectors (times x 1), so they broadcast with the ghi
+        of several scenarios (times x scenarios).
+        """
+        for name in PER_TIME_VALUES:
+            setattr(self, name, np.reshape(getattr(self, name), (-1, 1)))
+        return self
+
+    def clearness_index(self, ghi, solar_constant):
+        kt = ghi / (solar_constant * self.distance_factor * self.cos_zenith_limited)
+        return np.minimum(np.maximum(kt, 0), 1)
+
+    def disc(self, ghi):
+        """ dni of DISC and the clearness index kt """
+        extra_radiation = SOLAR_CONSTANT_DISC * self.distance_factor
+        kt = self.clearness_index(ghi, SOLAR_CONSTANT_DISC)
+        kt2 = kt * kt
+        kt3 = kt2 * kt
+        low = kt <= 0.6
+        a = np.where(low, 0.512 - 1.56 * kt + 2.286 * kt2 - 2.222 * kt3,
+                     -5.743 + 21.77 * kt - 27.49 * kt2 + 11.56 * kt3)
+        b = np.where(low, 0.37 + 0.962 * kt, 41.4 - 118.5 * kt + 66.05 * kt2 + 31.9 * kt3)
+        c = np.where(low, -0.28 + 0.932 * kt - 2.048 * kt2, -47.01 + 184.2 * kt - 222.0 * kt2 + 73.81 * kt3)
+        dni = (self.knc - (a + b * np.exp(c * self.airmass))) * extra_radiation
+        dni = np.where(self.bad_zenith | (ghi < 0) | (dni < 0), 0, dni)
+        return dni, kt
+
+    def dirint(self, dni_disc, kt):
+        """ dni of DIRINT based on the DISC results (with the change of kt' to the neighbour rows) """
+        kt_prime = np.minimum(np.maximum(kt / self.kt_prime_factor, 0), 1)
+        kt_next = np.empty_like(kt_prime)
+        kt_previous = np.empty_like(kt_prime)
+        kt_next[:-1] = kt_prime[1:]
+        kt_previous[1:] = kt_prime[:-1]
+        # First / last row: the only neighbour is used (nan for a single row)
+        kt_next[-1:] = kt_previous[-1] if len(kt_prime) > 1 else np.nan
+        kt_previous[:1] = kt_next[0] if len(kt_prime) > 1 else np.nan
+        change_next = np.abs(kt_prime - kt_next)
+        change_previous = np.abs(kt_prime - kt_previous)
+        # Missing values count as 0 unless both are missing
+        delta_kt_prime = 0.5 * np.where(np.isnan(change_next), change_previous,
+                                        np.where(np.isnan(change_previous), change_next,
+                                                 change_next + change_previous))
+
+        kt_prime_bin = _bins(kt_prime, KT_PRIME_BINS, upper_limit=1)
+        delta_bin = _bins(delta_kt_prime, DELTA_KT_PRIME_BINS, upper_limit=1)
+        assigned = (kt_prime_bin > 0) & (self.zenith_bin > 0) & (self.w_bin > 0) & (delta_bin > 0)
+        coefficients = irradiance._get_dirint_coeffs()[kt_prime_bin - 1, self.zenith_bin - 1,
+                                                       delta_bin - 1, self.w_bin - 1]
+        return dni_disc * np.where(assigned, coefficients, np.nan)
+
+    def erbs(self, ghi):
+        """ (dni, dhi) of ERBS """
+        kt = self.clearness_index(ghi, SOLAR_CONSTANT_ERBS)
+        diffuse_fraction = np.where((kt > 0.22) & (kt <= 0.8),
+                                    0.9511 - 0.1604 * kt + 4.388 * kt**2 - 16.638 * kt**3 + 12.336 * kt**4,
+                                    1 - 0.09 * kt)
+        diffuse_fraction = np.where(kt > 0.8, 0.165, diffuse_fraction)
+        dhi = diffuse_fraction * ghi
+        dni = (ghi - dhi) / self.cos_zenith
+        bad_values = self.bad_zenith | (ghi < 0) | (dni < 0)
+        return np.where(bad_values, 0, dni), np.where(bad_values, ghi, dhi)
+
+    def closure_dhi(self, ghi, dni):
+        return ghi - dni * self.cos_zenith
+
+
+def decompose(times, ghi, zenith, ghi_clearsky=None, dni_clearsky=None, pressure=None, temp_dew=None,
+              models=MODELS):
+    """
+    ghi, dni and dhi of the requested decomposition models in one vectorized pass.
+
+    Parameter:
+    ==========
+
+    times: pandas DatetimeIndex
+    ghi: global horizontal irradiance [W/m2]
+    zenith: solar zenith [deg]
+    ghi_clearsky, dni_clearsky: clearsky irradiance [W/m2] (required by dirindex)
+    pressure: pressure [Pa] per timestamp (or scalar), None / missing values: standard pressure
+    temp_dew: dew point [degC] per timestamp (DIRINT), None: not used
+    models: subset of MODELS
+
+    Returns a pandas Dataframe (one float block) indexed by times with the columns
+    (model, ghi / dni / dhi).
+    """
+    unknown = set(models) - set(MODELS)
+    if unknown:
+        raise ValueError("Unknown decomposition models: %s" % ", ".join(sorted(unknown)))
+    ghi = np.asarray(ghi, dtype=float)
+    with stage("shared"):
+        shared = SharedIntermediates(times, zenith, pressure, temp_dew)
+        if "disc" in models or "dirindex" in models:
+            # DISC of the ghi is the first step of DIRINT as well
+            dni_disc, kt = shared.disc(ghi)
+
+    values = np.empty((len(ghi), len(models) * len(COMPONENTS)))
+    for number, model in enumerate(models):
+        with stage(model):
+            if model == "disc":
+                dni = dni_disc
+                dhi = shared.closure_dhi(ghi, dni)
+            elif model == "dirindex":
+                dni_dirint = shared.dirint(dni_disc, kt)
+                ghi_clearsky = np.asarray(ghi_clearsky, dtype=float)
+                dni_dirint_clearsky = shared.dirint(*shared.disc(ghi_clearsky))
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    dni = np.asarray(dni_clearsky, dtype=float) * dni_dirint / dni_dirint_clearsky
+                dni = np.where(dni < 0, 0., dni)
+                dhi = shared.closure_dhi(ghi, dni)
+            else:
+                dni, dhi = shared.erbs(ghi)
+            values[:, number * 3] = ghi
+            values[:, number * 3 + 1] = dni
+            values[:, number * 3 + 2] = dhi
+    columns = pd.MultiIndex.from_product([list(models), COMPONENTS], names=["model", "component"])
+    return pd.DataFrame(values, index=times, columns=columns)
+
+
+def decompose_scenarios(times, ghi, zenith, components, ghi_clearsky=None, dni_clearsky=None, pressure=None,
+                        temp_dew=None):
+    """
+    Decomposition of the ghi of several scenarios (numpy array times x scenarios) at once,
+    the intermediates of the timestamps are shared by all scenarios.
+
+    Parameter:
+    ==========
+
+    components: list of (model, component), e.g. [("disc", "dni"), ("erbs", "dhi")]
+    (further parameters see decompose, one value per timestamp)
+
+    Returns a dict (model, component) -> numpy array (times x scenarios).
+    """
+    models = {model for model, _ in components}
+    unknown = models - set(MODELS)
+    if unknown:
+        raise ValueError("Unknown decomposition models: %s" % ", ".join(sorted(unknown)))
+    ghi = np.asarray(ghi, dtype=float)
+    shared = SharedIntermediates(times, zenith, pressure, temp_dew).as_columns()
+    values = {}
+    if "disc" in models or "dirindex" in models:
+        dni_disc, kt = shared.disc(ghi)
+        values["disc"] = (dni_disc, shared.closure_dhi(ghi, dni_disc))
+    if "dirindex" in models:
+        dni_dirint = shared.dirint(dni_disc, kt)
+        # The clearsky ghi is the same for all scenarios:
+        ghi_clearsky = np.reshape(np.asarray(ghi_clearsky, dtype=float), (-1, 1))
+        dni_dirint_clearsky = shared.dirint(*shared.disc(ghi_clearsky))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            dni = np.reshape(np.asarray(dni_clearsky, dtype=float), (-1, 1)) * dni_dirint / dni_dirint_clearsky
+        dni = np.where(dni < 0, 0., dni)
+        values["dirindex"] = (dni, shared.closure_dhi(ghi, dni))
+    if "erbs" in models:
+        values["erbs"] = shared.erbs(ghi)
+    return {(model, component): values[model][COMPONENTS.index(component) - 1] for model, component in components}
@@ -0,0 +1,289 @@
+"""
+Concurrent acquisition of DWD data (MOSMIX L forecasts and 10 minute observations)
+for several stations at once.
+
+DWD_Forecast / DWD_History download one station after another (wetterdienst). For the
+verification the forecast and the observations of the same periode are required
+together, often for several stations. Here, all files are requested concurrently:
+
+- MOSMIX L: one KMZ file per station (single_stations/<station>/kml/MOSMIX_L_LATEST_<station>.kmz)
+- observations: one ZIP file per station and dataset (air_temperature, solar, wind)
+  of the 10 minute observations (period "now" or "recent")
+
+The downloads share one pooled HTTP session (requests), are bounded by a maximum number
+of parallel connections and are retried with increasing delay on connection errors,
+timeouts and server errors. Each station is parsed into the long format of wetterdienst
+(station_id, date, parameter, value, quality) and reshaped (see reshape.py) as soon as
+its files have arrived, so the caller may start with the first station while the others
+are still downloaded.
+
+"""
+import io, asyncio, logging, zipfile, collections, concurrent.futures
+import xml.etree.ElementTree as ET
+import numpy as np
+import pandas as pd
+import requests
+
+from wetterdienst.provider.dwd.forecast.metadata.parameter import DwdMosmixParameter
+from wetterdienst.provider.dwd.observation.metadata.parameter import DwdObservationDatasetTree
+
+from pv_forecast.dwd_forecast import MOSMIX_ELEMENTS
+from pv_forecast.dwd_history import DWD_History, HISTORY_PARAMETERS
+from pv_forecast.reshape import reshape_mosmix, reshape_observation
+from pv_forecast.instrumentation import stage
+
+logger = logging.getLogger(__name__)
+
+KIND_FORECAST = "forecast"
+KIND_HISTORY = "history"
+
+DWD_SERVER = "https://opendata.dwd.de"
+MOSMIX_L_PATH = "/weather/local_forecasts/mos/MOSMIX_L/single_stations/{station}/kml/MOSMIX_L_LATEST_{station}.kmz"
+OBSERVATION_PATH = ("/climate_environment/CDC/observations_germany/climate/10_minutes/{directory}/{period}/"
+                    "10minutenwerte_{tag}_{station}_{suffix}.zip")
+# Period of the observations: directory and file suffix
+OBSERVATION_PERIODS = {"now": "now", "recent": "akt"}
+# Datasets of the 10 minute observations: directory, file tag and parameters
+OBSERVATION_DATASETS = {"air_temperature": ("TU", DwdObservationDatasetTree.MINUTE_10.TEMPERATURE_AIR),
+                        "solar": ("SOLAR", DwdObservationDatasetTree.MINUTE_10.SOLAR),
+                        "wind": ("wind", DwdObservationDatasetTree.MINUTE_10.WIND)}
+
+KML_NS = {"kml": "http://www.opengis.net/kml/2.2",
+          "dwd": "https://opendata.dwd.de/weather/lib/pointforecast_dwd_extension_V1_0.xsd"}
+MISSING_VALUE = -999
+# HTTP status codes worth a retry
+RETRY_STATUS = [429, 500, 502, 503, 504]
+
+# Result of one station: kind (forecast / history), station id, reshaped data, raw data
+# (long format), issue time (MOSMIX) and the exception if the station failed (data is None).
+Acquired = collections.namedtuple("Acquired", ["kind", "station_id", "data", "raw_data", "issue_time", "error"])
+
+
+def _long_frame(station_id, dates, values, quality=np.nan):
+    """ Long format like wetterdienst (tidy): dict parameter -> values at dates """
+    parameters = list(values)
+    n = len(dates)
+    raw_data = pd.DataFrame({"station_id": np.repeat(str(station_id), n * len(parameters)),
+                             "date": np.tile(np.asarray(dates), len(parameters)),
+                             "parameter": np.repeat(parameters, n),
+                             "value": np.concatenate([values[parameter] for parameter in parameters])
+                             if parameters else np.array([], dtype=float),
+                             "quality": np.tile(np.broadcast_to(quality, n), len(parameters)).astype(float)})
+    raw_data["date"] = pd.to_datetime(raw_data["date"], utc=True)
+    raw_data["station_id"] = raw_data["station_id"].astype("category")
+    raw_data["parameter"] = pd.Categorical(raw_data["parameter"], categories=parameters)
+    return raw_data
+
+
+def parse_mosmix_kmz(content, station_id, elements=MOSMIX_ELEMENTS):
+    """
+    Parse a MOSMIX KMZ file (zipped KML) of a single station.
+
+    Returns the raw data in long format (humanized parameters like wetterdienst) and
+    the issue time.
+    """
+    with zipfile.ZipFile(io.BytesIO(content)) as kmz:
+        root = ET.fromstring(kmz.read(kmz.namelist()[0]))
+    definition = root.find("kml:Document/kml:ExtendedData/dwd:ProductDefinition", KML_NS)
+    issue_time = pd.Timestamp(definition.find("dwd:IssueTime", KML_NS).text)
+    dates = pd.to_datetime([step.text for step in definition.find("dwd:ForecastTimeSteps", KML_NS)], utc=True)
+
+    humanized = {parameter.value: parameter.name for parameter in DwdMosmixParameter.LARGE}
+    requested = {element.lower() for element in elements}
+    values = {}
+    for placemark in root.iterfind("kml:Document/kml:Placemark", KML_NS):
+        if placemark.find("kml:name", KML_NS).text.strip() != station_id:
+            continue
+        for forecast in placemark.iterfind("kml:ExtendedData/dwd:Forecast", KML_NS):
+            element = forecast.get("{%s}elementName" % KML_NS["dwd"]).lower()
+            if element not in requested:
+                continue
+            text = forecast.find("dwd:value", KML_NS).text.split()
+            if len(text) != len(dates):
+                raise ValueError("MOSMIX %s: %d values of %s for %d time steps"
+                                 % (station_id, len(text), element, len(dates)))
+            values[humanized.get(element, element.upper())] = pd.to_numeric(
+                pd.Series(text).replace("-", np.nan)).to_numpy(dtype=float)
+    if not values:
+        raise ValueError("MOSMIX file does not contain station %s" % station_id)
+    return _long_frame(station_id, dates, values), issue_time
+
+
+def parse_observation_zip(content, station_id, parameters=HISTORY_PARAMETERS):
+    """
+    Parse a ZIP file of the 10 minute observations (produkt_zehn_*.txt, one dataset).
+
+    Returns the raw data (long format) of the requested parameters contained in the file.
+    """
+    with zipfile.ZipFile(io.BytesIO(content)) as archive:
+        names = [name for name in archive.namelist() if name.startswith("produkt")]
+        if not names:
+            raise ValueError("No data file in the observations of station %s" % station_id)
+        table = pd.read_csv(archive.open(names[0]), sep=";", skipinitialspace=True, na_values=[MISSING_VALUE],
+                            dtype={"MESS_DATUM": str})
+    table.columns = table.columns.str.strip().str.lower()
+    dates = pd.to_datetime(table["mess_datum"], format="%Y%m%d%H%M", utc=True)
+    values = {parameter.name.lower(): table[parameter.value].to_numpy(dtype=float)
+              for parameter in parameters if parameter.value in table.columns}
+    quality = table["qn"].to_numpy(dtype=float) if "qn" in table.columns else np.nan
+    return _long_frame(station_id, dates, values, quality)
+
+
+def observation_datasets(parameters=HISTORY_PARAMETERS):
+    """ Datasets (directories) of the 10 minute observations containing the parameters """
+    values = {parameter.value for parameter in parameters}
+    return [directory for directory, (_, dataset) in OBSERVATION_DATASETS.items()
+            if any(member.value in values for member in dataset)]
+
+
+class AsyncDWDClient:
+    """
+    Concurrent download of DWD files over one pooled HTTP session.
+
+    Parameter:
+    ==========
+
+    server: base url of the DWD open data server (or a mirror / test server)
+    max_connections: maximum number of parallel downloads
+    timeout: timeout [s] of connect and read of one request
+    retries: number of retries of a failed request (connection error, timeout, 429 / 5xx)
+    backoff: delay [s] before the first retry, doubled for each further retry
+    """
+    def __init__(self, server=DWD_SERVER, max_connections=4, timeout=30., retries=3, backoff=1.) -> None:
+        self.server = server.rstrip("/")
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # Blocking requests run in worker threads, one per connection
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_connections,
+                                                               thread_name_prefix="dwd_download")
+        self._semaphores = {}
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _get(self, url):
+        response = self.session.get(url, timeout=self.timeout)
+        if response.status_code in RETRY_STATUS:
+            raise requests.ConnectionError("%s: HTTP %d" % (url, response.status_code))
+        response.raise_for_status()
+        return response.content
+
+    async def fetch(self, path):
+        """ Content of the file at the path of the server (bytes). """
+        url = self.server + path
+        loop = asyncio.get_running_loop()
+        # One semaphore per event loop (the client may be used by several asyncio.run)
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            self._semaphores = {loop: asyncio.Semaphore(self.max_connections)}
+            semaphore = self._semaphores[loop]
+        for attempt in range(self.retries + 1):
+            try:
+                async with semaphore:
+                    return await loop.run_in_executor(self._executor, self._get, url)
+            except (requests.ConnectionError, requests.Timeout) as exception:
+                if attempt == self.retries:
+                    raise
+                delay = self.backoff * 2 ** attempt
+                logger.warning("Download of %s failed (%s), retry in %.1f s", url, exception, delay)
+                await asyncio.sleep(delay)
+
+    async def forecast(self, station_id):
+        """ Latest MOSMIX L forecast of the station (Acquired). """
+        content = await self.fetch(MOSMIX_L_PATH.format(station=station_id))
+        raw_data, issue_time = parse_mosmix_kmz(content, station_id)
+        with stage("reshape_data"):
+            data = reshape_mosmix(raw_data)
+        return Acquired(KIND_FORECAST, station_id, data, raw_data, issue_time, None)
+
+    async def history(self, station_id, start=None, end=None, period="now"):
+        """ 10 minute observations of the station within start / end (Acquired). """
+        station = "%05d" % int(station_id)
+        paths = [OBSERVATION_PATH.format(directory=directory, period=period, tag=OBSERVATION_DATASETS[directory][0],
+                                         station=station, suffix=OBSERVATION_PERIODS[period])
+                 for directory in observation_datasets()]
+        contents = await asyncio.gather(*[self.fetch(path) for path in paths])
+        raw_data = pd.concat([parse_observation_zip(content, station_id) for content in contents], ignore_index=True)
+        raw_data["station_id"] = raw_data["station_id"].astype("category")
+        raw_data["parameter"] = raw_data["parameter"].astype("category")
+        raw_data = DWD_History._select(raw_data, start, end)
+        with stage("reshape_data"):
+            data = reshape_observation(raw_data)
+        return Acquired(KIND_HISTORY, station_id, data, raw_data, None, None)
+
+    async def acquire(self, forecast_stations=(), history_stations=(), start=None, end=None, period="now"):
+        """
+        Download the forecasts and observations of all stations concurrently. Yields one
+        Acquired per station as soon as its data is available (order of arrival). A failed
+        station is yielded with the exception as error (data None).
+        """
+        jobs = {}
+        for station_id in forecast_stations:
+            jobs[asyncio.ensure_future(self.forecast(station_id))] = (KIND_FORECAST, station_id)
+        for station_id in history_stations:
+            jobs[asyncio.ensure_future(self.history(station_id, start, end, period))] = (KIND_HISTORY, station_id)
+        pending = set(jobs)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for job in done:
+                    if job.exception() is None:
+                        yield job.result()
+                    else:
+                        kind, station_id = jobs[job]
+                        logger.error("Acquisition of %s %s failed: %s", kind, station_id, job.exception())
+                        yield Acquired(kind, station_id, None, None, None, job.exception())
+        finally:
+            for job in pending:
+                job.cancel()
+
+
+def acquire_all(client, forecast_stations=(), history_stations=(), start=None, end=None, period="now"):
+    """ Synchronous acquisition (see AsyncDWDClient.acquire), returns the list of Acquired. """
+    async def collect():
+        return [acquired async for acquired in client.acquire(forecast_stations, history_stations,
+                                                              start, end, period)]
+    return asyncio.run(collect())
+
+
+def setup_client(config):
+    """ AsyncDWDClient as configured in the "Acquisition" section. """
+    return AsyncDWDClient(server=config.get("Acquisition", "Server", fallback=DWD_SERVER),
+                          max_connections=config.getint("Acquisition", "MaxConnections", fallback=4),
+                          timeout=config.getfloat("Acquisition", "Timeout", fallback=30.),
+                          retries=config.getint("Acquisition", "Retries", fallback=3))
+
+
+def configured_stations(config):
+    """ Stations (forecast, history) of the "Acquisition" section, defaults to the stations of the DWD section. """
+    stations = lambda key, fallback: [station.strip() for station in
+                                      config.get("Acquisition", key, fallback=fallback).split(",") if station.strip()]
+    return (stations("ForecastStations", config.get("DWD", "DWDStation", fallback="")),
+            stations("HistoryStations", config.get("DWD", "DWDStationHistory", fallback="")))
+
+
+if __name__ == "__main__":
+    # Forecast and observations of the configured stations: python -m pv_forecast.dwd_async
+    import configparser
+    logging.basicConfig(level=logging.INFO)
+    config = configparser.ConfigParser()
+    config.read("configuration.ini")
+    forecast_stations, history_stations = configured_stations(config)
+    with setup_client(config) as client:
+        for acquired in acquire_all(client, forecast_stations, history_stations):
+            if acquired.error is None:
+                print(acquired.kind, acquired.station_id, acquired.data.index.min(), acquired.data.index.max(),
+                      len(acquired.data))
@@ -0,0 +1,192 @@
+"""
+Local on-disk cache for the raw DWD data (MOSMIX forecasts and observations).
+
+The raw long-format dataframes (station_id, date, parameter, value, quality) are
+stored as HDF5 files (pytables). Each entry is keyed by:
+- kind of data ("mosmix" or "observation")
+- station id
+- parameter set (hashed list of requested parameters)
+- key time: MOSMIX issue time or the day of observation.
+
+Entries are evicted if they are older than a maximum age or if the whole cache
+exceeds the maximum size (oldest entries are removed first).
+
+"""
+import hashlib
+import logging
+import os
+import time
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+KIND_MOSMIX = "mosmix"
+KIND_OBSERVATION = "observation"
+
+# MOSMIX L forecasts are issued every 6 hours, the files are available on the
+# DWD server a while after the issue time.
+MOSMIX_L_ISSUE_HOURS = [3, 9, 15, 21]
+MOSMIX_AVAILABILITY_DELAY = pd.Timedelta(hours=2)
+
+KEY_FORMAT = "%Y%m%d%H%M"
+FILE_EXTENSION = ".h5"
+HDF_KEY = "raw_data"
+LAST_FETCH_MARKER = "last_fetch"
+
+
+def latest_mosmix_issue(now=None):
+    """ Determine the MOSMIX L issue time which should be available at time now (UTC). """
+    if now is None:
+        now = pd.Timestamp.now(tz="utc")
+    available = now - MOSMIX_AVAILABILITY_DELAY
+    day = available.floor("D")
+    issue_hours = [hour for hour in MOSMIX_L_ISSUE_HOURS if day + pd.Timedelta(hours=hour) <= available]
+    if not issue_hours:
+        return day - pd.Timedelta(days=1) + pd.Timedelta(hours=MOSMIX_L_ISSUE_HOURS[-1])
+    return day + pd.Timedelta(hours=issue_hours[-1])
+
+
+def parameter_hash(parameters):
+    """ Short hash identifying a set of requested parameters. """
+    names = sorted(str(getattr(parameter, "value", parameter)) for parameter in parameters)
+    return hashlib.sha1(",".join(names).encode("utf-8")).hexdigest()[:10]
+
+
+class DWD_Cache:
+    """
+    Parameter:
+    ==========
+
+    cache_dir: directory to store the cached files
+    max_size_mb: maximum size of the whole cache [MB], None for unlimited
+    max_age_days: maximum age of an entry [days], None for unlimited
+    """
+    def __init__(self, cache_dir: str, max_size_mb: float = None, max_age_days: float = None) -> None:
+        self.cache_dir = cache_dir
+        self.max_size_mb = max_size_mb
+        self.max_age_days = max_age_days
+
+    def _entry_dir(self, kind, station_id, parameters):
+        return os.path.join(self.cache_dir, kind, str(station_id), parameter_hash(parameters))
+
+    def _entry_path(self, kind, station_id, parameters, key):
+        key = pd.Timestamp(key)
+        if key.tzinfo is None:
+            key = key.tz_localize("utc")
+        filename = key.tz_convert("utc").strftime(KEY_FORMAT) + FILE_EXTENSION
+        return os.path.join(self._entry_dir(kind, station_id, parameters), filename)
+
+    def keys(self, kind, station_id, parameters):
+        """ Sorted list of cached key times (UTC). """
+        entry_dir = self._entry_dir(kind, station_id, parameters)
+        if not os.path.isdir(entry_dir):
+            return []
+        keys = [pd.Timestamp(pd.to_datetime(name[:-len(FILE_EXTENSION)], format=KEY_FORMAT), tz="utc")
+                for name in os.listdir(entry_dir) if name.endswith(FILE_EXTENSION)]
+        return sorted(keys)
+
+    def latest_key(self, kind, station_id, parameters):
+        keys = self.keys(kind, station_id, parameters)
+        return keys[-1] if keys else None
+
+    def contains(self, kind, station_id, parameters, key) -> bool:
+        return os.path.isfile(self._entry_path(kind, station_id, parameters, key))
+
+    def load(self, kind, station_id, parameters, key):
+        """ Load a cached raw dataframe, returns None if not cached. """
+        path = self._entry_path(kind, station_id, parameters, key)
+        if not os.path.isfile(path):
+            return None
+        with pd.HDFStore(path, mode="r") as store:
+            raw_data = store.get(HDF_KEY)
+            categories = getattr(store.get_storer(HDF_KEY).attrs, "categories", {})
+        # Restore categorical columns with their original order of categories
+        for column, column_categories in categories.items():
+            raw_data[column] = pd.Categorical(raw_data[column], categories=column_categories)
+        return raw_data
+
+    def store(self, kind, station_id, parameters, key, raw_data) -> None:
+        """ Store a raw dataframe and apply the eviction policy afterwards. """
+        path = self._entry_path(kind, station_id, parameters, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        storable = raw_data.copy()
+        categories = {}
+        for column in storable.columns:
+            if pd.api.types.is_categorical_dtype(storable[column]):
+                categories[column] = [str(category) for category in storable[column].cat.categories]
+                storable[column] = storable[column].astype(str)
+            elif column in ["value", "quality"]:
+                values = storable[column].where(storable[column].notna(), np.nan)
+                storable[column] = pd.to_numeric(values, errors="coerce").astype(float)
+        # Write to a temporary file first, so readers never see incomplete files.
+        tmp_path = path + ".tmp"
+        with pd.HDFStore(tmp_path, mode="w") as store:
+            store.put(HDF_KEY, storable, format="fixed")
+            store.get_storer(HDF_KEY).attrs.categories = categories
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def mark_fetched(self, kind, station_id, parameters) -> None:
+        """ Remember the time of the last (successful) download. """
+        entry_dir = self._entry_dir(kind, station_id, parameters)
+        os.makedirs(entry_dir, exist_ok=True)
+        with open(os.path.join(entry_dir, LAST_FETCH_MARKER), "w") as marker:
+            marker.write(pd.Timestamp.now(tz="utc").isoformat())
+
+    def last_fetched(self, kind, station_id, parameters):
+        """ Time (UTC) of the last download or None. """
+        marker = os.path.join(self._entry_dir(kind, station_id, parameters), LAST_FETCH_MARKER)
+        if not os.path.isfile(marker):
+            return None
+        return pd.Timestamp(os.path.getmtime(marker), unit="s", tz="utc")
+
+    def _entries(self):
+        """ All cached files as list of (modification time, size, path). """
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(FILE_EXTENSION):
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def size(self) -> int:
+        """ Size of all cached entries [bytes]. """
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self) -> int:
+        """
+        Remove entries exceeding the maximum age first, then the oldest entries
+        until the cache fits into the maximum size. Returns the number of removed entries.
+        """
+        entries = self._entries()
+        removed = 0
+        if self.max_age_days is not None:
+            min_mtime = time.time() - self.max_age_days * 86400.0
+            for entry in [entry for entry in entries if entry[0] < min_mtime]:
+                os.remove(entry[2])
+                entries.remove(entry)
+                removed += 1
+        if self.max_size_mb is not None:
+            max_size = self.max_size_mb * 1024 * 1024
+            total_size = sum(size for _, size, _ in entries)
+            while entries and total_size > max_size:
+                _, size, path = entries.pop(0)
+                os.remove(path)
+                total_size -= size
+                removed += 1
+        if removed:
+            logger.info("Evicted %d entries from DWD cache", removed)
+        return removed
+
+
+def setup_cache(config):
+    """ Set up the cache as defined in the "Cache" section of the configuration (None if disabled). """
+    if not config.getboolean("Cache", "Enabled", fallback=False):
+        return None
+    max_size_mb = config.getfloat("Cache", "MaxSizeMB", fallback=None)
+    max_age_days = config.getfloat("Cache", "MaxAgeDays", fallback=None)
+    return DWD_Cache(config.get("Cache", "Directory", fallback="cache", raw=True),
+                     max_size_mb=max_size_mb, max_age_days=max_age_days)
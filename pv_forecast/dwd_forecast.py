@@ -8,22 +8,53 @@ The global radiation values need to be transformed to Wh/m^2
 Details on DWD weather forecast data may be found here:
 https://www.dwd.de/DE/leistungen/met_verfahren_mosmix/met_verfahren_mosmix.html
 
+The raw data may be cached locally (see dwd_cache.py), then the DWD server is only
+accessed if a new MOSMIX issue is expected to be available. If the server can not be
+reached, the latest cached issue is used.
+
 """
+import logging
 import pandas as pd
 
-from wetterdienst.provider.dwd.forecast import DwdMosmixRequest, DwdMosmixType
-from wetterdienst.provider.dwd.forecast.metadata.dates import DwdForecastDate
+from pv_forecast.dwd_cache import KIND_MOSMIX, latest_mosmix_issue
+from pv_forecast.reshape import reshape_mosmix
+from pv_forecast.instrumentation import stage
 
-# Conversion factor: kJ/m^2 to Wh/m^2 (only valid for hourly time interval)
-J_to_KW = 0.277778
+logger = logging.getLogger(__name__)
 
 # List of parameters to determine from DWD data, see following link for details:
 # https://opendata.dwd.de/weather/lib/MetElementDefinition.xml
 MOSMIX_ELEMENTS = ["DD", "ww", "Rad1h", "RRad1", "TTT", "FF", "PPPP", "Td", "N"]
 
+# Do not ask the DWD server more often for a new issue (if cache is used)
+MIN_FETCH_INTERVAL = pd.Timedelta(minutes=10)
+
 class DWD_Forecast:
-    def __init__(self, station_id) -> None:
+    def __init__(self, station_id, cache=None, fetcher=None) -> None:
+        """
+        station_id: MOSMIX station id (e.g. "P0031")
+        cache: DWD_Cache - optional local cache for the raw data
+        fetcher: optional callable(station_id) returning the raw MOSMIX data in long
+                 format and its issue time. Defaults to download from the DWD server.
+        """
+        self.station_id = station_id
+        self.cache = cache
+        self.request = None
+        self.stations = None
+        # Issue time of the latest retrieved MOSMIX data (None if unknown)
+        self.issue_time = None
 
+        if fetcher is None:
+            fetcher = self.fetch_from_dwd
+        self.fetcher = fetcher
+
+    def setup_request(self):
+        """
+        Set up the request of the station (on the first download, wetterdienst is only
+        imported if the data is not taken from the cache).
+        """
+        from wetterdienst.provider.dwd.forecast import DwdMosmixRequest, DwdMosmixType
+        from wetterdienst.provider.dwd.forecast.metadata.dates import DwdForecastDate
         # create request
         self.request = DwdMosmixRequest(
         parameter=MOSMIX_ELEMENTS,
@@ -33,15 +64,60 @@ class DWD_Forecast:
         humanize=True,
         )
         # Assign the station:
-        self.stations = self.request.filter(station_id=station_id)
+        self.stations = self.request.filter(station_id=self.station_id)
 
+    def fetch_from_dwd(self, station_id):
+        """ Get raw data and its issue time from DWD server. """
+        if self.stations is None:
+            self.setup_request()
+        values = self.stations.values
+        respone = next(values.query())
+        issue_time = values.kml.metadata.get("issue_time")
+        return respone.df, issue_time
+
+    def retrieve_raw_data(self):
+        """ Get raw data from the cache if the latest issue is available there, otherwise from DWD server. """
+        if self.cache is None:
+            raw_data, self.issue_time = self.fetcher(self.station_id)
+            return raw_data
+
+        now = pd.Timestamp.now(tz="utc")
+        latest = self.cache.latest_key(KIND_MOSMIX, self.station_id, MOSMIX_ELEMENTS)
+        last_fetched = self.cache.last_fetched(KIND_MOSMIX, self.station_id, MOSMIX_ELEMENTS)
+        if latest is not None:
+            if latest >= latest_mosmix_issue(now) or \
+                    (last_fetched is not None and now - last_fetched < MIN_FETCH_INTERVAL):
+                self.issue_time = latest
+                return self.cache.load(KIND_MOSMIX, self.station_id, MOSMIX_ELEMENTS, latest)
+
+        try:
+            raw_data, issue_time = self.fetcher(self.station_id)
+        except Exception:
+            if latest is None:
+                raise
+            # Offline: fall back to the latest cached issue.
+            logger.warning("DWD server not available, using cached MOSMIX issue %s", latest)
+            self.issue_time = latest
+            return self.cache.load(KIND_MOSMIX, self.station_id, MOSMIX_ELEMENTS, latest)
+
+        self.cache.mark_fetched(KIND_MOSMIX, self.station_id, MOSMIX_ELEMENTS)
+        if issue_time is None:
+            issue_time = now.floor("H")
+        self.issue_time = issue_time
+        if not self.cache.contains(KIND_MOSMIX, self.station_id, MOSMIX_ELEMENTS, issue_time):
+            self.cache.store(KIND_MOSMIX, self.station_id, MOSMIX_ELEMENTS, issue_time, raw_data)
+        return raw_data
 
     def retrieve_data(self):
-        """ Get data from DWD server. """
-        respone = next(self.stations.values.query())
-        
+        """ Get data from DWD server (or cache). """
+        with stage("retrieve_raw_data"):
+            raw_data = self.retrieve_raw_data()
+
         # Reshape the data for later use.
-        data = self.reshape_data(respone.df)
+        with stage("reshape_data"):
+            data = self.reshape_data(raw_data)
+        # MOSMIX issue time of the data (stored with the result, see result_store)
+        data.attrs["issue_time"] = self.issue_time
         
         return data
 
@@ -50,21 +126,7 @@ class DWD_Forecast:
         input:
         raw_data: pandas Dataframe having DWD Mosmix shape.
         """
-        # First, create a table from plain DWD data using DATE as index
-        reshaped_data = pd.pivot_table(raw_data, values="value", index=["date"], columns="parameter", aggfunc='first')
-        # Now, shift values by 1h to the past, since the DWD Values are assigned to the end of the periode, whereas the
-        # PVLIB values are assigned to the beginning of a cycle.
-        reshaped_data.index = reshaped_data.index - pd.offsets.Hour(1)
-        # Add some columns in advance (otherwise will not work since columns are categorical)
-        reshaped_data.columns = reshaped_data.columns.add_categories(["TEMPERATURE_AIR_200DEGC", "DEW_POINT_DEGC", "RAD_WH", "wind_speed"])
-        # For pvlib, temperatures need to be available in degC:
-        reshaped_data["TEMPERATURE_AIR_200DEGC"] = reshaped_data["TEMPERATURE_AIR_200"].apply(lambda x: x - 273.15)
-        reshaped_data["DEW_POINT_DEGC"] = reshaped_data["TEMPERATURE_DEW_POINT_200"].apply(lambda x: x - 273.15)
-        # Given global radiation is in kJ/m^2, tranform into Wh/m^2
-        reshaped_data["RAD_WH"] = reshaped_data["RADIATION_GLOBAL"].apply(lambda x: x * J_to_KW)
-        reshaped_data['WIND_SPEED'] = reshaped_data['WIND_SPEED'].astype(float)
-
-        return reshaped_data
+        return reshape_mosmix(raw_data)
 
 
 if __name__ == "__main__":
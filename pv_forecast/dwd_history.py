@@ -8,73 +8,217 @@ The global radiation values need to be transformed to Wh/m^2
 Details on DWD weather forecast data may be found here:
 https://www.dwd.de/DE/leistungen/met_verfahren_mosmix/met_verfahren_mosmix.html
 
+The raw data may be cached locally per day (see dwd_cache.py), then only days
+not yet cached (or the current day) need to be downloaded.
+
 """
+import logging
 import pandas as pd
 
-from wetterdienst.provider.dwd.observation import (DwdObservationParameter,
-                                                  DwdObservationRequest,
-                                                  DwdObservationResolution,
-                                                  DwdObservationParameter,
-                                                  DwdObservationPeriod)
+from pv_forecast.dwd_cache import KIND_OBSERVATION
+from pv_forecast.reshape import reshape_observation
+from pv_forecast.instrumentation import stage
 
-# Conversion factor: kJ/cm^2 to W/m^2 (only valid for 10 minute intervall)
-J_to_KW = 16.666666667
+logger = logging.getLogger(__name__)
 
 # List of parameters to determine from DWD data, see following link for details:
 # https://opendata.dwd.de/weather/lib/MetElementDefinition.xml
 MOSMIX_ELEMENTS = ["DD", "ww", "Rad1h", "RRad1", "TTT", "FF", "PPPP", "Td", "N"]
 
+# Parameters of the 10 minute observations used for the calculation (names of
+# DwdObservationParameter.MINUTE_10 and their DWD codes, the codes identify the
+# parameters within the cache):
+HISTORY_PARAMETER_NAMES = ["TEMPERATURE_AIR_200", "RADIATION_GLOBAL", "RADIATION_SKY_DIFFUSE",
+                           "TEMPERATURE_DEW_POINT_200", "PRESSURE_AIR_STATION_HEIGHT", "WIND_SPEED"]
+HISTORY_PARAMETER_CODES = ["tt_10", "gs_10", "ds_10", "td_10", "pp_10", "ff_10"]
+
+# Periods of the DWD observations requested: "now" - the latest observations (about the
+# last day), "auto" - the periods (historical / recent / now) covering the requested time range
+PERIOD_NOW = "now"
+PERIOD_AUTO = "auto"
+
+# Do not ask the DWD server more often for new observations (if cache is used), the
+# 10 minute observations of the current day are updated about every 10 minutes
+MIN_FETCH_INTERVAL = pd.Timedelta(minutes=10)
+
+
+class NoObservationsError(ValueError):
+    """ No observations of the station within the requested time range """
+
+
+def history_parameters():
+    """ wetterdienst parameters of the 10 minute observations (imports wetterdienst) """
+    from wetterdienst.provider.dwd.observation import DwdObservationParameter
+    return [getattr(DwdObservationParameter.MINUTE_10, name) for name in HISTORY_PARAMETER_NAMES]
+
+
+def __getattr__(name):
+    # HISTORY_PARAMETERS is set up on access: wetterdienst is only imported if needed
+    if name == "HISTORY_PARAMETERS":
+        return history_parameters()
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
 class DWD_History:
-    def __init__(self, station_id) -> None:
+    def __init__(self, station_id, cache=None, fetcher=None, period=PERIOD_NOW, fetch_span=None) -> None:
+        """
+        station_id: DWD observation station id (e.g. 1078)
+        cache: DWD_Cache - optional local cache for the raw data (stored per day)
+        fetcher: optional callable(station_id) returning the raw observation data in
+                 long format (period "auto": callable(station_id, start, end)). Defaults
+                 to download from the DWD server.
+        period: PERIOD_NOW or PERIOD_AUTO (e.g. back-test of older periods)
+        fetch_span: period "auto" - download at least this time span (pandas Timedelta,
+                    whole days) from the start of a request. The observations of the span
+                    are kept (and stored in the cache), following requests within the span
+                    are served without download. The historical observations of DWD are
+                    zip files of several years, requesting them week by week would download
+                    and parse the same archive again for each week.
+        """
+        self.station_id = station_id
+        self.cache = cache
+        self.period = period
+        self.fetch_span = None if fetch_span is None else pd.Timedelta(fetch_span)
+        self.request = None
+        # (start, end, raw data) of the last span downloaded (period "auto" with fetch_span)
+        self._span = None
+
+        if fetcher is None:
+            fetcher = self.fetch_from_dwd
+        self.fetcher = fetcher
 
+    def setup_request(self):
+        """ Set up the request of the station (on the first download, imports wetterdienst). """
+        from wetterdienst.provider.dwd.observation import (DwdObservationRequest,
+                                                          DwdObservationResolution,
+                                                          DwdObservationPeriod)
         # create request
         self.request = DwdObservationRequest(
-        parameter=[
-        DwdObservationParameter.MINUTE_10.TEMPERATURE_AIR_200,
-        DwdObservationParameter.MINUTE_10.RADIATION_GLOBAL,
-        DwdObservationParameter.MINUTE_10.RADIATION_SKY_DIFFUSE,
-        DwdObservationParameter.MINUTE_10.TEMPERATURE_DEW_POINT_200,
-        DwdObservationParameter.MINUTE_10.PRESSURE_AIR_STATION_HEIGHT,
-        DwdObservationParameter.MINUTE_10.WIND_SPEED,
-        ],
+        parameter=history_parameters(),
         resolution=DwdObservationResolution.MINUTE_10,
         period=DwdObservationPeriod.NOW
-        ).filter(station_id=(station_id, ))      # 1078 = Duesseldorf Flughafen
-        # Assign the station:
-        #self.stations = self.request.filter(station_id=station_id)
+        ).filter(station_id=(self.station_id, ))      # 1078 = Duesseldorf Flughafen
+
+    def fetch_from_dwd(self, station_id, start=None, end=None):
+        """
+        Get raw data from DWD server: the latest observations or, with start / end, the
+        observations of the periods covering start / end.
+        """
+        if start is not None:
+            from wetterdienst.provider.dwd.observation import DwdObservationRequest, DwdObservationResolution
+            request = DwdObservationRequest(parameter=history_parameters(),
+                                            resolution=DwdObservationResolution.MINUTE_10,
+                                            start_date=pd.Timestamp(start),
+                                            end_date=pd.Timestamp(end if end is not None else pd.Timestamp.now(tz="utc"))
+                                            ).filter(station_id=(station_id, ))
+            return request.values.all().df
+        if self.request is None:
+            self.setup_request()
+        return self.request.values.all().df
+
+    def _fetch(self, start, end):
+        if self.period == PERIOD_AUTO and start is not None:
+            if self.fetch_span is None:
+                return self.fetcher(self.station_id, start, end)
+            start = pd.Timestamp(start)
+            end = pd.Timestamp(end) if end is not None else pd.Timestamp.now(tz="utc")
+            if self._span is None or not (self._span[0] <= start and end <= self._span[1]):
+                span_start = start.floor("D")
+                span_end = max(end, min(span_start + self.fetch_span - pd.Timedelta(1, "ns"),
+                                        pd.Timestamp.now(tz=start.tz)))
+                self._span = (span_start, span_end, self.fetcher(self.station_id, span_start, span_end))
+            return self._span[2]
+        return self.fetcher(self.station_id)
+
+    def retrieve_raw_data(self, start=None, end=None):
+        """
+        Get raw data within start / end (UTC timestamps). If a cache is used, the
+        DWD server is only accessed if days within the periode are missing in the
+        cache or the periode reaches the current day and the last download is older
+        than MIN_FETCH_INTERVAL.
+        """
+        if self.cache is None:
+            raw_data = self._select(self._fetch(start, end), start, end)
+            if not len(raw_data):
+                raise NoObservationsError(f"No observations available for station {self.station_id} from {start} to {end}")
+            return raw_data
+
+        now = pd.Timestamp.now(tz="utc")
+        today = now.floor("D")
+        days = []
+        if start is not None:
+            last_day = today if end is None else min(pd.Timestamp(end).floor("D"), today)
+            days = list(pd.date_range(pd.Timestamp(start).floor("D"), last_day, freq="D"))
+
+        last_fetched = self.cache.last_fetched(KIND_OBSERVATION, self.station_id, HISTORY_PARAMETER_CODES)
+        outdated = last_fetched is None or now - last_fetched >= MIN_FETCH_INTERVAL
+        fetched = None
+        if any(not self._is_cached(day) for day in days) or \
+                (outdated and (start is None or any(day >= today for day in days))):
+            try:
+                fetched = self._fetch(start, end)
+            except Exception:
+                if not self.cache.keys(KIND_OBSERVATION, self.station_id, HISTORY_PARAMETER_CODES):
+                    raise
+                # Offline: fall back to the cached days.
+                logger.warning("DWD server not available, using cached observations")
+            else:
+                self.cache.mark_fetched(KIND_OBSERVATION, self.station_id, HISTORY_PARAMETER_CODES)
+                self._store_days(fetched)
+
+        if start is None:
+            if fetched is not None:
+                return self._select(fetched, start, end)
+            days = self.cache.keys(KIND_OBSERVATION, self.station_id, HISTORY_PARAMETER_CODES)
+
+        day_frames = [self.cache.load(KIND_OBSERVATION, self.station_id, HISTORY_PARAMETER_CODES, day) for day in days]
+        day_frames = [day_data for day_data in day_frames if day_data is not None]
+        if not day_frames:
+            raise NoObservationsError(f"No observations available for station {self.station_id} from {start} to {end}")
+        raw_data = pd.concat(day_frames, ignore_index=True)
+        for column in ["station_id", "parameter"]:
+            raw_data[column] = raw_data[column].astype("category")
+        return self._select(raw_data, start, end)
+
+    def _is_cached(self, day):
+        return self.cache.contains(KIND_OBSERVATION, self.station_id, HISTORY_PARAMETER_CODES, day)
+
+    def _store_days(self, raw_data):
+        """ Store the observations per day, merged with already cached values of the day. """
+        for day, day_data in raw_data.groupby(raw_data["date"].dt.floor("D")):
+            cached = self.cache.load(KIND_OBSERVATION, self.station_id, HISTORY_PARAMETER_CODES, day)
+            if cached is not None:
+                day_data = pd.concat([cached.astype({"station_id": str, "parameter": str}),
+                                      day_data.astype({"station_id": str, "parameter": str})], ignore_index=True)
+                day_data = day_data.drop_duplicates(subset=["date", "parameter"], keep="last")
+                day_data = day_data.sort_values(["parameter", "date"], kind="stable")
+            self.cache.store(KIND_OBSERVATION, self.station_id, HISTORY_PARAMETER_CODES, day, day_data)
 
+    @staticmethod
+    def _select(raw_data, start, end):
+        """ Select the rows of the raw data within start / end. """
+        mask = pd.Series(True, index=raw_data.index)
+        if start is not None:
+            mask &= raw_data["date"] >= start
+        if end is not None:
+            mask &= raw_data["date"] <= end
+        return raw_data[mask]
 
-    def retrieve_data(self):
-        """ Get data from DWD server. """
-        #respone = next(self.stations.values.query())
-        station_data = self.request.values.all().df
+    def retrieve_data(self, start=None, end=None):
+        """ Get data from DWD server (or cache). """
+        with stage("retrieve_raw_data"):
+            station_data = self.retrieve_raw_data(start, end)
         # Reshape the data for later use.
-        data = self.reshape_data(station_data)
+        with stage("reshape_data"):
+            data = self.reshape_data(station_data)
         
         return data
 
     def reshape_data(self, raw_data):
         """
         input:
-        raw_data: pandas Dataframe having DWD Mosmix shape.
+        raw_data: pandas Dataframe having DWD observation shape.
         """
-        # First, create a table from plain DWD data using DATE as index
-        reshaped_data = pd.pivot_table(raw_data, values="value", index=["date"], columns="parameter", aggfunc='first')
-        # Now, shift values by 1h to the past, since the DWD Values are assigned to the end of the periode, whereas the
-        # PVLIB values are assigned to the beginning of a cycle.
-        reshaped_data.index = reshaped_data.index# - pd.offsets.Hour(1)
-        # Add some columns in advance (otherwise will not work since columns are categorical)
-        reshaped_data.columns = reshaped_data.columns.add_categories(["RAD_WH", "RAD_DIFFUS", "PRESSURE_AIR_SURFACE_REDUCED","WIND_SPEED", "TEMPERATURE_AIR_200DEGC", "DEW_POINT_DEGC"])
-        # For pvlib, temperatures need to be available in degC:
-        reshaped_data["TEMPERATURE_AIR_200DEGC"] = reshaped_data["temperature_air_200"]
-        reshaped_data["DEW_POINT_DEGC"] = reshaped_data["temperature_dew_point_200"]
-        # Given global radiation is in kJ/m^2, tranform into Wh/m^2
-        reshaped_data["RAD_WH"] = reshaped_data["radiation_global"].apply(lambda x: x * J_to_KW)
-        reshaped_data["RAD_DIFFUS"] = reshaped_data["radiation_sky_diffuse"].apply(lambda x: x * J_to_KW)
-        reshaped_data['WIND_SPEED'] = reshaped_data['wind_speed'].astype(float)
-        reshaped_data["PRESSURE_AIR_SURFACE_REDUCED"] = reshaped_data["pressure_air_station_height"].astype(float)
-
-        return reshaped_data
+        return reshape_observation(raw_data)
 
 
 if __name__ == "__main__":
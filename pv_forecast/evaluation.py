@@ -0,0 +1,155 @@
+"""
+Evaluation of the forecasts against the power measured by the inverter.
+
+The forecasted ac power of the whole system (ALL_AC_POWER_<mode>, i.e. array "ALL"
+of the result store) is joined with the measured ac power (AC1 P + AC2 P + AC3 P of
+the inverter log) on a common time grid. All forecast runs and modes are evaluated
+at once (long table: issue_time, target_time, mode, ac):
+
+    error = forecast - measured [W]
+    mae / rmse / bias per mode, lead time (target - issue time) and issue time
+    skill versus clearsky: 1 - mse(mode) / mse(clearsky) of the same rows
+    daily energy error [kWh] of complete days per mode
+
+"""
+import logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+AC_POWER_CHANNELS = ["AC1 P", "AC2 P", "AC3 P"]
+REFERENCE_MODE = "clearsky"
+
+
+def measured_ac(log_data, freq="1h", label="left"):
+    """
+    Measured ac power [W] (sum of the phases) as mean of each interval of the time grid.
+
+    label: "left" - the value at t is the mean of [t, t + freq) like the forecast (the MOSMIX
+           values are shifted to the begin of their hour by reshape_mosmix, see also the
+           query service); "right" - the mean of (t - freq, t] (e.g. unshifted observations)
+    """
+    ac_power = log_data[AC_POWER_CHANNELS].sum(axis=1, min_count=1).astype(np.float64)
+    return ac_power.resample(freq, label=label, closed=label).mean().rename("measured")
+
+
+def align(forecasts, measured):
+    """
+    Join the forecasts (long table with issue_time, target_time, mode, ac) with the measured
+    ac power (pandas Series on the time grid). Rows without measurement are dropped.
+
+    Returns a pandas Dataframe with the additional columns measured, error, lead_time [h]
+    and reference_error (error of the clearsky forecast of the same issue / target time).
+    """
+    measured = measured[~measured.index.duplicated()]
+    values = measured.reindex(pd.DatetimeIndex(forecasts["target_time"])).to_numpy()
+    valid = ~np.isnan(values) & ~np.isnan(forecasts["ac"].to_numpy(np.float64))
+    aligned = forecasts.loc[valid, ["issue_time", "target_time", "mode", "ac"]].copy()
+    aligned["ac"] = aligned["ac"].astype(np.float64)
+    aligned["measured"] = values[valid]
+    aligned["error"] = aligned["ac"].to_numpy() - aligned["measured"].to_numpy()
+    aligned["lead_time"] = (aligned["target_time"] - aligned["issue_time"]) / pd.Timedelta(hours=1)
+    # Error of the clearsky forecast of the same run and target time (reference of the skill)
+    reference = aligned.loc[aligned["mode"] == REFERENCE_MODE, ["issue_time", "target_time", "error"]]
+    reference = reference.drop_duplicates(["issue_time", "target_time"]).rename(columns={"error": "reference_error"})
+    return aligned.merge(reference, on=["issue_time", "target_time"], how="left", sort=False)
+
+
+def error_metrics(aligned, keys):
+    """
+    Error metrics of the aligned data grouped by keys (list of columns).
+
+    Returns a pandas Dataframe indexed by keys with count, bias, mae, rmse, measured_mean
+    and skill (versus clearsky, NaN if clearsky is not evaluated).
+    """
+    error = aligned["error"].to_numpy()
+    reference_error = aligned["reference_error"].to_numpy()
+    has_reference = ~np.isnan(reference_error)
+    grouped = aligned.assign(abs_error=np.abs(error), squared_error=np.square(error),
+                             paired_error=np.where(has_reference, np.square(error), 0.),
+                             paired_reference=np.where(has_reference, np.square(reference_error), 0.),
+                             ).groupby(keys, sort=True)
+    metrics = grouped.agg(count=("error", "size"), bias=("error", "mean"), mae=("abs_error", "mean"),
+                          mse=("squared_error", "mean"), measured_mean=("measured", "mean"),
+                          paired_error=("paired_error", "sum"), paired_reference=("paired_reference", "sum"))
+    metrics["rmse"] = np.sqrt(metrics["mse"])
+    # Only rows with a clearsky forecast of the same issue / target time count for the skill
+    with np.errstate(divide="ignore", invalid="ignore"):
+        metrics["skill"] = 1. - metrics["paired_error"] / metrics["paired_reference"].where(
+            metrics["paired_reference"] > 0)
+    return metrics[["count", "bias", "mae", "rmse", "measured_mean", "skill"]]
+
+
+def daily_energy(aligned, freq="1h", timezone="UTC"):
+    """
+    Forecasted and measured energy [kWh] per mode, issue time and (complete) day.
+    """
+    step_hours = pd.Timedelta(freq) / pd.Timedelta(hours=1)
+    steps_per_day = int(round(24 / step_hours))
+    day = pd.DatetimeIndex(aligned["target_time"]).tz_convert(timezone).normalize()
+    grouped = aligned.assign(day=day).groupby(["mode", "issue_time", "day"], sort=True)
+    energy = grouped.agg(forecast=("ac", "sum"), measured=("measured", "sum"), count=("ac", "size"))
+    energy = energy[energy["count"] == steps_per_day].drop(columns="count")
+    energy[["forecast", "measured"]] *= step_hours / 1000.
+    energy["error"] = energy["forecast"] - energy["measured"]
+    return energy
+
+
+def evaluate(forecasts, measured, freq="1h", timezone="UTC", lead_time_step=1):
+    """
+    Evaluate all forecasts against the measured ac power.
+
+    Parameter:
+    ==========
+
+    forecasts: long table with issue_time, target_time, mode, ac (see ResultStore.forecasts)
+    measured: measured ac power on the time grid (see measured_ac)
+    freq: time grid
+    timezone: timezone of the days of the daily energy
+    lead_time_step: width of the lead time groups [h]
+
+    Returns a dict of pandas Dataframes: mode, lead_time, issue_time (error metrics, see
+    error_metrics), daily_energy (per day, see daily_energy) and daily_energy_error
+    (per mode: count, bias / mae / rmse of the daily energy [kWh]).
+    """
+    aligned = align(forecasts, measured)
+    aligned["lead_time"] = np.floor(aligned["lead_time"] / lead_time_step) * lead_time_step
+    energy = daily_energy(aligned, freq, timezone)
+    energy_error = energy.groupby("mode")["error"].agg(
+        count="size", bias="mean", mae=lambda error: error.abs().mean(),
+        rmse=lambda error: np.sqrt(np.square(error).mean()))
+    return {"mode": error_metrics(aligned, ["mode"]),
+            "lead_time": error_metrics(aligned, ["mode", "lead_time"]),
+            "issue_time": error_metrics(aligned, ["mode", "issue_time"]),
+            "daily_energy": energy,
+            "daily_energy_error": energy_error}
+
+
+def evaluate_stored(result_store, log_store, start, end, site="default", source="forecast", freq="1h",
+                    inverter=1, **kwargs):
+    """
+    Evaluate the forecasts of the result store for target times in [start, end) against
+    the inverter log store (see evaluate for the kwargs).
+    """
+    forecasts = result_store.forecasts(start, end, site, source, mode=None, columns=["ac"])
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    log_data = log_store.read(start - pd.Timedelta(freq), end + pd.Timedelta(freq), inverter,
+                              channels=AC_POWER_CHANNELS)
+    return evaluate(forecasts, measured_ac(log_data, freq), freq=freq, **kwargs)
+
+
+if __name__ == "__main__":
+    # Evaluation of the stored forecasts: python -m pv_forecast.evaluation start end
+    import sys, configparser
+    from pv_forecast.result_store import ResultStore
+    from pv_forecast.telemetry import setup_measured_store
+    config = configparser.ConfigParser()
+    config.read("configuration.ini")
+    result_store = ResultStore(config.get("ResultStore", "Directory", fallback="results"))
+    evaluation = evaluate_stored(result_store, setup_measured_store(config), sys.argv[1], sys.argv[2],
+                                 site=config.get("ResultStore", "Site", fallback="default"))
+    with pd.option_context("display.width", 200, "display.max_rows", 100):
+        print(evaluation["mode"])
+        print(evaluation["daily_energy_error"])
+        print(evaluation["lead_time"])
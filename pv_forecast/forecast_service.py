@@ -0,0 +1,210 @@
+"""
+Long running forecast service.
+
+The service sets up the location, the pv system and its model chains only once
+and keeps them in memory. The forecast is refreshed on a regular basis (e.g. each
+6 hours) or on demand, the latest result is held in memory and published to all
+registered subscribers (e.g. a csv writer).
+
+Startup latency (setup of the models) and refresh latency (data retrieval and
+calculation) are reported separately.
+
+"""
+import datetime
+import logging
+import threading
+import time
+
+from pv_forecast.calculation import (setup_solar_processing, setup_pv_system,
+                                     get_time_window, calculate_forecast)
+from pv_forecast.dwd_cache import setup_cache
+from pv_forecast.incremental import setup_incremental_forecast
+from pv_forecast.instrumentation import setup_instrumentation, activate, stage, report_path
+
+logger = logging.getLogger(__name__)
+
+# Default refresh interval [h] - MOSMIX L is issued every 6 hours.
+DEFAULT_REFRESH_INTERVAL = 6.0
+
+
+def setup_weather_source(config):
+    """
+    Set up a callable returning the reshaped DWD data for the configured mode.
+    The DWD request objects are created only once.
+    """
+    wheater_mode = config.get("DWD", "Mode", raw=True)
+    cache = setup_cache(config)
+
+    if wheater_mode == "from_history":
+        from pv_forecast.dwd_history import DWD_History
+        dwd_source = DWD_History(config.getint("DWD", "DWDStationHistory", raw=True), cache=cache)
+    elif wheater_mode == "from_file":
+        # Weather data of a csv file (e.g. the output of a previous run), read on each refresh:
+        from pv_forecast.reshape import read_weather_file
+        path = config.get("DWD", "File", fallback="")
+        return lambda: read_weather_file(path)
+    else:
+        from pv_forecast.dwd_forecast import DWD_Forecast
+        dwd_source = DWD_Forecast(config.get("DWD", "DWDStation", raw=True), cache=cache)
+
+    def weather_source():
+        start, end = get_time_window(wheater_mode)
+        if wheater_mode == "from_history":
+            dwddata = dwd_source.retrieve_data(start, end)
+        else:
+            dwddata = dwd_source.retrieve_data()
+        return dwddata.loc[start:end]
+
+    return weather_source
+
+
+class ForecastService:
+    """
+    Keep the solar processing and the pv system warm between forecast runs.
+
+    Parameter:
+    ==========
+
+    config: configparser.ConfigParser - the configuration (see configuration.ini)
+    weather_source: callable without arguments returning the reshaped DWD data
+                    to calculate. Defaults to the source defined by the "Mode"
+                    in the configuration.
+    """
+    def __init__(self, config, weather_source=None) -> None:
+        start_time = time.perf_counter()
+
+        self.config = config
+        self.refresh_interval = config.getfloat("Service", "RefreshInterval",
+                                                fallback=DEFAULT_REFRESH_INTERVAL) * 3600.0
+
+        # Set up the models once:
+        self.solar_proc = setup_solar_processing(config)
+        self.pv_system = setup_pv_system(config, self.solar_proc.location)
+        self.incremental = setup_incremental_forecast(config, self.solar_proc, self.pv_system)
+        if weather_source is None:
+            weather_source = setup_weather_source(config)
+        self.weather_source = weather_source
+
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._latest = None
+        self._latest_time = None
+        self._refresh_requested = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+        self.refresh_count = 0
+        self.last_refresh = {}
+        self.startup_seconds = time.perf_counter() - start_time
+        logger.info("Forecast service set up in %.3f s", self.startup_seconds)
+
+    @property
+    def latest(self):
+        """ The latest calculation result (pandas Dataframe) or None. """
+        with self._lock:
+            return self._latest
+
+    @property
+    def latest_time(self):
+        """ UTC timestamp of the latest calculation result or None. """
+        with self._lock:
+            return self._latest_time
+
+    def subscribe(self, callback) -> None:
+        """
+        Register a callback which is called with the result dataframe after
+        each successful refresh.
+        """
+        self._subscribers.append(callback)
+
+    def refresh(self):
+        """
+        Retrieve the latest weather data and recalculate the forecast using
+        the models kept in memory. Returns the result dataframe.
+        """
+        with self._refresh_lock:
+            # Report of time and memory per stage (if enabled):
+            instrumentation = setup_instrumentation(self.config)
+            with activate(instrumentation):
+                start_time = time.perf_counter()
+                with stage("fetch"):
+                    dwddata = self.weather_source()
+                fetched_time = time.perf_counter()
+
+                with stage("calculate"):
+                    if self.incremental is not None:
+                        result = self.incremental.calculate(dwddata)
+                    else:
+                        result = calculate_forecast(dwddata=dwddata,
+                                                    solar_proc=self.solar_proc,
+                                                    pv_system=self.pv_system)
+                # MOSMIX issue time of the weather data (stored with the result)
+                result.attrs["issue_time"] = dwddata.attrs.get("issue_time")
+                calculated_time = time.perf_counter()
+
+            with self._lock:
+                self._latest = result
+                self._latest_time = datetime.datetime.now(datetime.timezone.utc)
+
+            # Subscribers are called without the lock (they may read latest):
+            with stage("publish"):
+                for callback in self._subscribers:
+                    try:
+                        callback(result)
+                    except Exception:
+                        logger.exception("Publishing forecast result failed")
+            published_time = time.perf_counter()
+            if instrumentation is not None:
+                instrumentation.meta["refresh"] = self.refresh_count + 1
+                instrumentation.write_report(report_path(self.config))
+
+            self.refresh_count += 1
+            self.last_refresh = {"fetch_seconds": fetched_time - start_time,
+                                 "calculate_seconds": calculated_time - fetched_time,
+                                 "publish_seconds": published_time - calculated_time,
+                                 "total_seconds": published_time - start_time}
+            if self.incremental is not None:
+                self.last_refresh["reused_fraction"] = self.incremental.last_run["reused_fraction"]
+            logger.info("Forecast refreshed in %.3f s (fetch %.3f s, calculate %.3f s)",
+                        self.last_refresh["total_seconds"],
+                        self.last_refresh["fetch_seconds"],
+                        self.last_refresh["calculate_seconds"])
+        return result
+
+    def stats(self):
+        """ Latency report: startup and last refresh reported separately. """
+        return {"startup_seconds": self.startup_seconds,
+                "refresh_count": self.refresh_count,
+                "last_refresh": dict(self.last_refresh)}
+
+    def request_refresh(self) -> None:
+        """ Trigger a refresh on demand (e.g. when a new MOSMIX run was issued). """
+        self._refresh_requested.set()
+
+    def run_forever(self) -> None:
+        """ Refresh the forecast on schedule or on demand until stop() is called. """
+        self._stopped.clear()
+        while not self._stopped.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                # Keep the latest result and try again with the next cycle.
+                logger.exception("Forecast refresh failed")
+            self._refresh_requested.wait(timeout=self.refresh_interval)
+            self._refresh_requested.clear()
+
+    def start(self) -> threading.Thread:
+        """ Run the service in a background thread. """
+        self._thread = threading.Thread(target=self.run_forever, name="ForecastService", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout=None) -> None:
+        """ Stop the service after the currently running refresh and shut down the workers. """
+        self._stopped.set()
+        self._refresh_requested.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.pv_system.close()
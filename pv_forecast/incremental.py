@@ -0,0 +1,158 @@
+"""
+Incremental re-forecast: only the rows (timestamps) whose inputs changed are
+recomputed, the results of all other rows are taken from the previous run.
+
+A new MOSMIX issue often shifts the forecast window by a few hours or changes
+only part of the values. All models of the calculation are evaluated per row,
+except the DIRINDEX / DIRINT decomposition using the change of the clearness
+index to the previous and next row. So the result of a row only depends on the
+inputs (all columns of the DWD data and the timestamp) of the row itself and of
+its neighbours. Each row is identified by a hash of these three rows:
+
+- rows with the same hash as in the previous run are reused
+- all other rows are recomputed together with their neighbours (padding, so the
+  DIRINT neighbours are the same as in a full run), the padding rows are dropped
+
+The merged result is identical to a full recompute of the whole window.
+
+"""
+import os, time, hashlib, logging
+import numpy as np
+import pandas as pd
+
+from pv_forecast.calculation import calculate_forecast
+
+logger = logging.getLogger(__name__)
+
+# Hash of a non-existing neighbour (first / last row)
+NO_NEIGHBOUR = np.uint64(0)
+
+
+def row_context(dwddata):
+    """
+    Hash (uint64) per row of the inputs of the row and its previous / next row,
+    incl. the timestamps.
+    """
+    row_hash = pd.util.hash_pandas_object(dwddata, index=True).to_numpy(np.uint64)
+    previous_hash = np.concatenate([[NO_NEIGHBOUR], row_hash[:-1]]) if len(row_hash) else row_hash
+    next_hash = np.concatenate([row_hash[1:], [NO_NEIGHBOUR]]) if len(row_hash) else row_hash
+    context = pd.DataFrame({"previous": previous_hash, "row": row_hash, "next": next_hash})
+    return pd.util.hash_pandas_object(context, index=False).to_numpy(np.uint64)
+
+
+def setup_key(config, sections=("SolarSystem", "Calculation", "SolarTable")):
+    """ Key of the configuration the cached results are valid for. """
+    items = [(section, key, value) for section in sections if config.has_section(section)
+             for key, value in config.items(section, raw=True)]
+    return hashlib.sha1(repr(items).encode("utf-8")).hexdigest()[:12]
+
+
+class IncrementalForecast:
+    """
+    Calculation of the forecast reusing the results of unchanged rows of the previous run.
+
+    Parameter:
+    ==========
+
+    solar_proc: Solar_Processing - location specific solar parameters.
+    pv_system: PVSystem - pv system with all model chains added.
+    cache_path: file to keep the previous run between program runs (optional,
+                otherwise kept in memory only, e.g. by the forecast service).
+    key: key of the configuration (see setup_key), a cache of another key is not used.
+    """
+    def __init__(self, solar_proc, pv_system, cache_path=None, key=None) -> None:
+        self.solar_proc = solar_proc
+        self.pv_system = pv_system
+        self.cache_path = cache_path
+        self.key = key
+        self._context = None
+        self._result = None
+        self.last_run = {}
+        self._load()
+
+    def _load(self):
+        if self.cache_path is None or not os.path.exists(self.cache_path):
+            return
+        try:
+            cached = pd.read_pickle(self.cache_path)
+        except Exception:
+            logger.warning("Unable to read the incremental cache %s, starting from scratch", self.cache_path)
+            return
+        if cached.get("key") == self.key:
+            self._context, self._result = cached["context"], cached["result"]
+
+    def _save(self):
+        if self.cache_path is None:
+            return
+        directory = os.path.dirname(self.cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        pd.to_pickle({"key": self.key, "context": self._context, "result": self._result}, self.cache_path + ".tmp")
+        os.replace(self.cache_path + ".tmp", self.cache_path)
+
+    def reusable_rows(self, dwddata, context=None):
+        """ Boolean array: the result of the row is available from the previous run. """
+        if context is None:
+            context = row_context(dwddata)
+        if self._context is None:
+            return np.zeros(len(dwddata), dtype=bool)
+        previous = self._context.reindex(dwddata.index).to_numpy()
+        return ~pd.isna(previous) & (previous == context)
+
+    def calculate(self, dwddata):
+        """
+        Calculate the forecast for the DWD data like calculation.calculate_forecast
+        (the DWD data is not modified). Returns the result dataframe.
+        """
+        start_time = time.perf_counter()
+        context = row_context(dwddata)
+        reuse = self.reusable_rows(dwddata, context)
+        recompute = ~reuse
+
+        # Recomputed rows plus their neighbours:
+        padded = recompute.copy()
+        padded[1:] |= recompute[:-1]
+        padded[:-1] |= recompute[1:]
+
+        parts = []
+        if reuse.any():
+            parts.append(self._result.loc[dwddata.index[reuse]])
+        if recompute.any():
+            calculated = calculate_forecast(dwddata=dwddata[padded].copy(), solar_proc=self.solar_proc,
+                                            pv_system=self.pv_system)
+            calculated = calculated.loc[dwddata.index[recompute]]
+            if parts:
+                parts[0] = parts[0].reindex(columns=calculated.columns)
+            parts.append(calculated)
+
+        if parts:
+            result = pd.concat(parts).reindex(dwddata.index)
+        else:
+            result = calculate_forecast(dwddata=dwddata.copy(), solar_proc=self.solar_proc, pv_system=self.pv_system)
+        result.index = dwddata.index
+
+        self._context = pd.Series(context, index=dwddata.index, dtype=np.uint64)
+        self._result = result
+        self._save()
+
+        rows = len(dwddata)
+        self.last_run = {"rows": rows, "reused_rows": int(reuse.sum()), "recomputed_rows": int(recompute.sum()),
+                         "calculated_rows": int(padded.sum()),
+                         "reused_fraction": float(reuse.sum()) / rows if rows else 0.,
+                         "seconds": time.perf_counter() - start_time}
+        logger.info("Incremental forecast: %d of %d rows reused (%.0f %%), %d rows calculated in %.3f s",
+                    self.last_run["reused_rows"], rows, 100. * self.last_run["reused_fraction"],
+                    self.last_run["calculated_rows"], self.last_run["seconds"])
+        return result
+
+
+def setup_incremental_forecast(config, solar_proc, pv_system):
+    """
+    IncrementalForecast as configured in the "Calculation" section ("Incremental",
+    "IncrementalCache"), None if disabled.
+    """
+    if not config.getboolean("Calculation", "Incremental", fallback=False):
+        return None
+    cache_path = config.get("Calculation", "IncrementalCache",
+                            fallback=os.path.join("cache", "incremental_forecast.p"))
+    return IncrementalForecast(solar_proc, pv_system, cache_path=cache_path or None, key=setup_key(config))
@@ -0,0 +1,182 @@
+"""
+Timing and memory instrumentation of the calculation pipeline.
+
+The stages of a run (DWD fetch, reshape, solar position, decomposition, model
+chains per mode and array, combine / assemble, output) are wrapped by stage(name).
+Without an active Instrumentation, stage() does nothing. With an active one
+(see activate), each stage records:
+
+- wall time [s] (time.perf_counter)
+- cpu time [s] of the process (time.process_time)
+- peak of the memory allocated by python during the stage [MB] (tracemalloc,
+  optional as it slows down the calculation)
+
+Stages are nested (e.g. "calculate/decompose/disc") and aggregated per path over
+all calls. The report of a run is a dict, written as one JSON line per run.
+
+Stages of worker threads are recorded as well, but the cpu time and the memory
+peak are measured for the whole process. Work done in worker processes is part of
+the stage of the submitting (main) process.
+
+"""
+import os, json, time, datetime, threading, tracemalloc, contextlib, logging
+
+logger = logging.getLogger(__name__)
+
+_active = None
+_null_stage = contextlib.nullcontext()
+
+
+class Instrumentation:
+    """
+    Recorder of the stages of one run.
+
+    Parameter:
+    ==========
+
+    trace_memory: bool - record the memory peak per stage (tracemalloc)
+    """
+    def __init__(self, trace_memory=True) -> None:
+        self.trace_memory = trace_memory
+        self.started = datetime.datetime.now(datetime.timezone.utc)
+        self.meta = {}
+        self._stages = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._start_time = time.perf_counter()
+        self._started_tracing = False
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def start(self):
+        """ Start memory tracing (if enabled). """
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._start_time = time.perf_counter()
+
+    def stop(self):
+        """ Stop memory tracing (if started by start). """
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """ Record wall time, cpu time and memory peak of the enclosed code. """
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        path = parent["path"] + "/" + name if parent else name
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if parent is not None:
+                # the peak so far belongs to the parent stage
+                parent["peak"] = max(parent["peak"], peak - parent["base"])
+            tracemalloc.reset_peak()
+        else:
+            current = 0
+        with self._lock:
+            # Listed in order of the first call (parents before their stages)
+            self._stages.setdefault(path, {"stage": path, "calls": 0, "wall_seconds": 0.,
+                                           "cpu_seconds": 0., "peak_memory_mb": None})
+        entry = {"path": path, "base": current, "peak": 0}
+        stack.append(entry)
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+            stack.pop()
+            if tracing and tracemalloc.is_tracing():
+                peak = max(entry["peak"], tracemalloc.get_traced_memory()[1] - entry["base"])
+                if parent is not None:
+                    parent["peak"] = max(parent["peak"], peak + entry["base"] - parent["base"])
+            else:
+                peak = None
+            self._record(path, wall, cpu, peak)
+
+    def _record(self, path, wall, cpu, peak):
+        with self._lock:
+            record = self._stages[path]
+            record["calls"] += 1
+            record["wall_seconds"] += wall
+            record["cpu_seconds"] += cpu
+            if peak is not None:
+                record["peak_memory_mb"] = max(record["peak_memory_mb"] or 0., peak / 2**20)
+
+    def report(self):
+        """ Machine-readable report of the run (dict). """
+        with self._lock:
+            stages = [dict(record) for record in self._stages.values()]
+        return {"started": self.started.isoformat(), "pid": os.getpid(),
+                "total_wall_seconds": time.perf_counter() - self._start_time,
+                "trace_memory": self.trace_memory, "meta": dict(self.meta), "stages": stages}
+
+    def write_report(self, path):
+        """ Append the report of the run as one JSON line to the file. """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "a") as report_file:
+            report_file.write(json.dumps(self.report()) + "\n")
+
+    def summary(self):
+        """ Report as text table (one line per stage). """
+        lines = ["%-48s %6s %10s %10s %10s" % ("stage", "calls", "wall [s]", "cpu [s]", "peak [MB]")]
+        for record in self.report()["stages"]:
+            peak = record["peak_memory_mb"]
+            lines.append("%-48s %6d %10.3f %10.3f %10s" % (record["stage"], record["calls"], record["wall_seconds"],
+                                                           record["cpu_seconds"],
+                                                           "-" if peak is None else "%.1f" % peak))
+        return "\n".join(lines)
+
+
+def stage(name):
+    """ Stage of the active instrumentation (does nothing if none is active). """
+    instrumentation = _active
+    if instrumentation is None:
+        return _null_stage
+    return instrumentation.stage(name)
+
+
+def active():
+    """ The active Instrumentation or None. """
+    return _active
+
+
+@contextlib.contextmanager
+def activate(instrumentation):
+    """ Record all stages of the enclosed code by the instrumentation (None: no recording). """
+    global _active
+    previous = _active
+    _active = instrumentation
+    if instrumentation is not None:
+        instrumentation.start()
+    try:
+        yield instrumentation
+    finally:
+        if instrumentation is not None:
+            instrumentation.stop()
+        _active = previous
+
+
+def setup_instrumentation(config, enabled=None):
+    """
+    Instrumentation as configured in the "Instrumentation" section, None if disabled.
+
+    enabled: overrides the "Enabled" option (e.g. from the command line)
+    """
+    if enabled is None:
+        enabled = config.getboolean("Instrumentation", "Enabled", fallback=False)
+    if not enabled:
+        return None
+    return Instrumentation(trace_memory=config.getboolean("Instrumentation", "TraceMemory", fallback=True))
+
+
+def report_path(config):
+    """ File the reports are appended to (JSON lines). """
+    return config.get("Instrumentation", "Report", fallback=os.path.join("results", "instrumentation.jsonl"))
@@ -0,0 +1,241 @@
+"""
+Reader of the log data exported by Kostal Plenticore inverters (pv_data/*.csv).
+
+File layout (tab separated):
+
+    Wechselrichter Logdaten
+    Wechselrichter Nr:	1
+    Name:	scb
+    akt. Zeit:	1617298898                  <- time of the export (epoch seconds)
+
+    Logdaten U[V], I[mA], P[W], E[kWh], ...  <- units
+    Zeit	DC1 U	DC1 I	DC1 P	...         <- 56 columns
+    1616626801	8	0	0	...             <- one row each 5 minutes (epoch seconds)
+
+Rows carrying events / energy counters only (no DC / AC values) are dropped.
+The files are read in chunks with explicit dtypes (float32) and only the needed
+channels are parsed, so logs of many years are read in bounded memory.
+
+The rows are sorted by time: InverterLogStore.ingest seeks (binary search on the
+byte offset) to the first row newer than the last stored timestamp, so only new
+rows of growing or overlapping exports are parsed.
+
+"""
+import os, logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+TIME_COLUMN = "Zeit"
+# DC inputs (strings) and AC phases: U [V], I [mA], P [W]
+DC_CHANNELS = ["DC%d %s" % (number, value) for number in [1, 2, 3] for value in ["U", "I", "P"]]
+AC_CHANNELS = ["AC%d %s" % (number, value) for number in [1, 2, 3] for value in ["U", "I", "P"]] + ["AC F"]
+CHANNELS = DC_CHANNELS + AC_CHANNELS
+NA_VALUES = ["-"]
+DEFAULT_CHUNKSIZE = 50000
+
+HEADER_KEYS = {"Wechselrichter Nr:": "inverter", "Name:": "name", "akt. Zeit:": "export_time"}
+
+
+def read_header(path):
+    """
+    Metadata of the log file.
+
+    Returns a dict with inverter (number), name, export_time (UTC timestamp), units,
+    columns (list of all column names) and data_offset (byte offset of the first data row).
+    """
+    header = {}
+    with open(path, "rb") as log_file:
+        for line in log_file:
+            text = line.decode("latin-1").rstrip("\r\n")
+            fields = text.split("\t")
+            if fields[0] in HEADER_KEYS:
+                header[HEADER_KEYS[fields[0]]] = fields[1].strip()
+            elif fields[0].startswith("Logdaten "):
+                header["units"] = fields[0][len("Logdaten "):]
+            elif fields[0] == TIME_COLUMN:
+                header["columns"] = fields
+                header["data_offset"] = log_file.tell()
+                break
+    if "columns" not in header:
+        raise ValueError("%s is no Kostal log file (no column header found)." % path)
+    if "inverter" in header:
+        header["inverter"] = int(header["inverter"])
+    if "export_time" in header:
+        header["export_time"] = pd.Timestamp(int(header["export_time"]), unit="s", tz="UTC")
+    return header
+
+
+def _row_time(log_file, position, data_offset):
+    """ Start of the first row at / after the byte position and its time (None at the end of the file). """
+    log_file.seek(max(position, data_offset) - 1)
+    log_file.readline()
+    row_start = log_file.tell()
+    line = log_file.readline()
+    if not line:
+        return row_start, None
+    return row_start, int(line.split(b"\t", 1)[0])
+
+
+def find_offset(path, after, header=None):
+    """
+    Byte offset of the first row with time > after (epoch seconds) by binary search,
+    the rows of the file are sorted by time.
+    """
+    if header is None:
+        header = read_header(path)
+    data_offset = header["data_offset"]
+    with open(path, "rb") as log_file:
+        low, high = data_offset, os.fstat(log_file.fileno()).st_size
+        while low < high:
+            middle = (low + high) // 2
+            _, row_time = _row_time(log_file, middle, data_offset)
+            if row_time is None or row_time > after:
+                high = middle
+            else:
+                low = middle + 1
+        return _row_time(log_file, low, data_offset)[0]
+
+
+def iter_log_chunks(path, channels=CHANNELS, chunksize=DEFAULT_CHUNKSIZE, after=None, header=None):
+    """
+    Read the log file in chunks.
+
+    Parameter:
+    ==========
+
+    channels: columns to read (see CHANNELS)
+    chunksize: number of rows per chunk
+    after: only rows newer than this time (UTC timestamp) are read
+
+    Yields pandas Dataframes indexed by time (UTC) with float32 columns.
+    """
+    if header is None:
+        header = read_header(path)
+    missing = [channel for channel in channels if channel not in header["columns"]]
+    if missing:
+        raise ValueError("Channels not in %s: %s" % (path, ", ".join(missing)))
+    offset = header["data_offset"]
+    if after is not None:
+        after = pd.Timestamp(after)
+        after = after.tz_localize("UTC") if after.tz is None else after
+        offset = find_offset(path, after.value // 10**9, header)
+
+    dtype = {channel: np.float32 for channel in channels}
+    dtype[TIME_COLUMN] = np.int64
+    with open(path, "rb") as log_file:
+        log_file.seek(offset)
+        reader = pd.read_csv(log_file, sep="\t", header=None, names=header["columns"],
+                             usecols=[TIME_COLUMN] + list(channels), dtype=dtype, na_values=NA_VALUES,
+                             chunksize=chunksize, encoding="latin-1")
+        for chunk in reader:
+            chunk = chunk.dropna(subset=list(channels), how="all")
+            if len(chunk) == 0:
+                continue
+            chunk.index = pd.DatetimeIndex(pd.to_datetime(chunk.pop(TIME_COLUMN).to_numpy(), unit="s", utc=True),
+                                           name="time")
+            yield chunk[list(channels)]
+
+
+def read_log(path, channels=CHANNELS, after=None):
+    """ Whole log file (see iter_log_chunks) as one pandas Dataframe. """
+    chunks = list(iter_log_chunks(path, channels, after=after))
+    if not chunks:
+        return pd.DataFrame(columns=list(channels), dtype=np.float32,
+                            index=pd.DatetimeIndex([], tz="UTC", name="time"))
+    return pd.concat(chunks)
+
+
+class InverterLogStore:
+    """
+    HDF5 store (pytables) of the inverter log data, one table per inverter
+    ("inverter_<number>"), rows appended in time order.
+
+    Parameter:
+    ==========
+
+    path: file of the store
+    channels: columns stored (see CHANNELS)
+    """
+    def __init__(self, path, channels=CHANNELS) -> None:
+        self.path = path
+        self.channels = list(channels)
+
+    @staticmethod
+    def _key(inverter):
+        return "inverter_%d" % inverter
+
+    def last_timestamp(self, inverter=1):
+        """ Time of the last stored row (None if nothing is stored yet). """
+        if not os.path.exists(self.path):
+            return None
+        with pd.HDFStore(self.path, mode="r") as store:
+            key = self._key(inverter)
+            if key not in store:
+                return None
+            nrows = store.get_storer(key).nrows
+            if nrows == 0:
+                return None
+            return store.select(key, start=nrows - 1, stop=nrows).index[0]
+
+    def ingest(self, path, chunksize=DEFAULT_CHUNKSIZE):
+        """ Append the rows of the log file newer than the last stored row. Returns the number of new rows. """
+        header = read_header(path)
+        inverter = header.get("inverter", 1)
+        last = self.last_timestamp(inverter)
+        rows = 0
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with pd.HDFStore(self.path, mode="a", complevel=5, complib="blosc") as store:
+            for chunk in iter_log_chunks(path, self.channels, chunksize, after=last, header=header):
+                store.append(self._key(inverter), chunk, format="table", index=False)
+                rows += len(chunk)
+        logger.info("%s: %d new rows of inverter %d", path, rows, inverter)
+        return rows
+
+    def ingest_directory(self, directory="pv_data", chunksize=DEFAULT_CHUNKSIZE):
+        """
+        Ingest all log files of the directory in order of their first row,
+        (overlapping exports are fine). Returns the number of new rows.
+        """
+        paths = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".csv")]
+        first_rows = {}
+        for path in paths:
+            header = read_header(path)
+            with open(path, "rb") as log_file:
+                first_rows[path] = _row_time(log_file, header["data_offset"], header["data_offset"])[1]
+        paths = sorted((path for path in paths if first_rows[path] is not None), key=first_rows.get)
+        return sum(self.ingest(path, chunksize) for path in paths)
+
+    def read(self, start=None, end=None, inverter=1, channels=None):
+        """ Stored rows with time in [start, end) """
+        where = []
+        if start is not None:
+            start = pd.Timestamp(start)
+            start = start.tz_localize("UTC") if start.tz is None else start
+            where.append("index >= start")
+        if end is not None:
+            end = pd.Timestamp(end)
+            end = end.tz_localize("UTC") if end.tz is None else end
+            where.append("index < end")
+        with pd.HDFStore(self.path, mode="r") as store:
+            # start / end are taken from the local scope by pandas
+            return store.select(self._key(inverter), where=" & ".join(where) or None, columns=channels)
+
+
+def setup_inverter_log_store(config):
+    """ Store of the inverter log data as configured in the "PVData" section. """
+    return InverterLogStore(config.get("PVData", "Store", fallback=os.path.join("results", "pv_data.h5")))
+
+
+if __name__ == "__main__":
+    # Incremental ingest of the inverter logs: python -m pv_forecast.kostal_reader [directory]
+    import sys, configparser
+    logging.basicConfig(level=logging.INFO)
+    config = configparser.ConfigParser()
+    config.read("configuration.ini")
+    directory = sys.argv[1] if len(sys.argv) > 1 else config.get("PVData", "Directory", fallback="pv_data")
+    store = setup_inverter_log_store(config)
+    print("%d new rows stored in %s" % (store.ingest_directory(directory), store.path))
@@ -0,0 +1,307 @@
+"""
+Probabilistic pv forecast: quantiles (e.g. P10 / P50 / P90) of the ac power and of
+the daily energy, calculated from N scenarios of the MOSMIX forecast.
+
+Scenarios perturb the clear-sky index k = ghi / ghi_clearsky of the forecast by the
+error statistics of its class. The class is given by the total cloud cover (N) and
+the relative global irradiance (RRad1, PROBABILITY_RADIATION_GLOBAL_LAST_1H). The
+air temperature is perturbed by its error std:
+
+    k_s(t) = clip(k(t) + bias(class) + std(class) * e_s(t), 0, K_MAX)
+    temp_s(t) = temp(t) + temp_std * u_s(t)
+
+e and u are AR(1) series along the time ("Correlation" per hour), so an error persists
+for some hours like the error of a forecasted weather situation. The daily energy
+quantiles are quantiles of the daily energy of the scenarios (not sums of the power
+quantiles).
+
+All scenarios are decomposed (decomposition.decompose_scenarios, same models as
+the calculation mode) and run through the pv model (pv_model.evaluate_arrays, scenarios
+and arrays stacked along the second axis) as one batch. Rows without clearsky
+irradiance are evaluated once for all scenarios.
+
+The error statistics are calibrated from past forecasts and observations
+("python -m pv_forecast.probabilistic forecast.csv observed.csv", csv files of
+main.py runs in forecast / from_history mode). Without a calibration, DEFAULT_STD is used.
+
+"""
+import os, json, logging
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+
+from pv_forecast.decomposition import decompose_scenarios
+from pv_forecast.pv_model import SolarGeometry, evaluate_arrays
+from pv_forecast.pv_system import TEMP_MOD_PARA
+from pv_forecast.instrumentation import stage
+
+logger = logging.getLogger(__name__)
+
+# Irradiance of each calculation mode (like calculation.mode_irradiance): dni, dhi
+MODE_COMPONENTS = {"disc": [("disc", "dni"), ("erbs", "dhi")],
+                   "dirint": [("disc", "dni"), ("dirindex", "dni")]}
+
+# Classes of the error statistics: lower bounds of cloud cover and relative irradiance [%]
+CLOUD_COVER_BINS = [0., 20., 40., 60., 80.]
+RELATIVE_IRRADIANCE_BINS = [0., 20., 40., 60., 80.]
+# Std of the clear-sky index error per cloud cover class (broken clouds are hardest to forecast)
+DEFAULT_STD = [0.08, 0.15, 0.22, 0.25, 0.2]
+DEFAULT_TEMP_STD = 1.5
+# Minimum number of samples of a class to take its calibrated statistics
+MIN_SAMPLES = 20
+
+K_MAX = 1.2
+# Below this clearsky ghi [W/m2], the forecasted ghi is not perturbed (clear-sky index undefined)
+MIN_CLEARSKY_GHI = 10.
+
+
+def _classes(values, bins):
+    """ Class of the values (0 ...), the middle class for missing values """
+    values = np.asarray(values, dtype=float)
+    classes = np.digitize(values, bins) - 1
+    return np.where(np.isnan(values), len(bins) // 2, np.clip(classes, 0, len(bins) - 1))
+
+
+def _column(dwddata, name):
+    return dwddata[name].to_numpy(dtype=float) if name in dwddata else np.full(len(dwddata), np.nan)
+
+
+def clearsky_index(ghi, ghi_clearsky):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(ghi_clearsky > MIN_CLEARSKY_GHI, ghi / ghi_clearsky, np.nan)
+
+
+class ErrorStatistics:
+    """
+    Bias and std of the clear-sky index error (observed - forecasted) per class
+    (cloud cover x relative irradiance) and std of the temperature error [K].
+    """
+    def __init__(self, bias=None, std=None, temp_std=DEFAULT_TEMP_STD) -> None:
+        shape = (len(CLOUD_COVER_BINS), len(RELATIVE_IRRADIANCE_BINS))
+        self.bias = np.zeros(shape) if bias is None else np.asarray(bias, dtype=float)
+        self.std = np.repeat(np.reshape(DEFAULT_STD, (-1, 1)), shape[1], axis=1) if std is None else \
+            np.asarray(std, dtype=float)
+        self.temp_std = float(temp_std)
+
+    def lookup(self, cloud_cover, relative_irradiance):
+        """ (bias, std) of each timestamp """
+        cloud = _classes(cloud_cover, CLOUD_COVER_BINS)
+        relative = _classes(relative_irradiance, RELATIVE_IRRADIANCE_BINS)
+        return self.bias[cloud, relative], self.std[cloud, relative]
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as statistics_file:
+            json.dump({"bias": self.bias.tolist(), "std": self.std.tolist(), "temp_std": self.temp_std},
+                      statistics_file, indent=1)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as statistics_file:
+            return cls(**json.load(statistics_file))
+
+
+def error_statistics(forecast, observed, ghi_clearsky, min_samples=MIN_SAMPLES):
+    """
+    Calibrate the error statistics from forecasts and observations of the same timestamps.
+
+    Parameter:
+    ==========
+
+    forecast: pandas Dataframe - reshaped MOSMIX data (RAD_WH, TEMPERATURE_AIR_200DEGC,
+              CLOUD_COVER_TOTAL, PROBABILITY_RADIATION_GLOBAL_LAST_1H)
+    observed: pandas Dataframe - observed RAD_WH and TEMPERATURE_AIR_200DEGC (e.g. hourly means
+              of the 10 minute observations)
+    ghi_clearsky: pandas Series - clearsky ghi of the forecast timestamps
+
+    Classes with less than min_samples samples keep the defaults.
+    """
+    observed = observed.reindex(forecast.index)
+    ghi_clearsky = np.asarray(ghi_clearsky, dtype=float)
+    error = clearsky_index(_column(observed, "RAD_WH"), ghi_clearsky) - \
+        np.minimum(clearsky_index(_column(forecast, "RAD_WH"), ghi_clearsky), K_MAX)
+    statistics = ErrorStatistics()
+    cloud = _classes(_column(forecast, "CLOUD_COVER_TOTAL"), CLOUD_COVER_BINS)
+    relative = _classes(_column(forecast, "PROBABILITY_RADIATION_GLOBAL_LAST_1H"), RELATIVE_IRRADIANCE_BINS)
+    valid = ~np.isnan(error)
+    for row in range(statistics.std.shape[0]):
+        for column in range(statistics.std.shape[1]):
+            samples = error[valid & (cloud == row) & (relative == column)]
+            if len(samples) >= min_samples:
+                statistics.bias[row, column] = samples.mean()
+                statistics.std[row, column] = samples.std(ddof=1)
+    temp_error = _column(observed, "TEMPERATURE_AIR_200DEGC") - _column(forecast, "TEMPERATURE_AIR_200DEGC")
+    temp_error = temp_error[~np.isnan(temp_error)]
+    if len(temp_error) >= min_samples:
+        statistics.temp_std = temp_error.std(ddof=1)
+    logger.info("Error statistics calibrated from %d timestamps", valid.sum())
+    return statistics
+
+
+def ar1_noise(rng, shape, correlation):
+    """ Standard normal AR(1) series along the first axis (times x scenarios) """
+    noise = rng.standard_normal(shape)
+    scale = np.sqrt(1. - correlation**2)
+    # The first value is taken as is (stationary start):
+    noise[0] /= scale
+    return lfilter([scale], [1., -correlation], noise, axis=0)
+
+
+class ProbabilisticForecast:
+    """
+    Quantiles of the ac power and daily energy of the pv system from scenarios of the
+    weather forecast.
+
+    Parameter:
+    ==========
+
+    solar_proc: Solar_Processing - location specific solar parameters.
+    pv_system: PVSystem - pv system (its parameters are evaluated by pv_model).
+    statistics: ErrorStatistics
+    scenarios: number of scenarios
+    quantiles: quantiles [%], e.g. (10, 50, 90)
+    mode: calculation mode (disc, dirint) defining the decomposition
+    correlation: correlation of the errors of subsequent hours
+    seed: seed of the random numbers (None: different scenarios each run)
+    """
+    def __init__(self, solar_proc, pv_system, statistics=None, scenarios=1000, quantiles=(10, 50, 90),
+                 mode="disc", correlation=0.8, seed=None) -> None:
+        if mode not in MODE_COMPONENTS:
+            raise ValueError("Unknown mode of the probabilistic forecast: %s" % mode)
+        self.solar_proc = solar_proc
+        self.pv_system = pv_system
+        self.statistics = ErrorStatistics() if statistics is None else statistics
+        self.scenarios = scenarios
+        self.quantiles = list(quantiles)
+        self.mode = mode
+        self.correlation = correlation
+        self.seed = seed
+
+    def scenario_weather(self, dwddata, rng):
+        """ ghi and air temperature of the scenarios (times x scenarios) """
+        ghi = dwddata["RAD_WH"].to_numpy(dtype=float)
+        ghi_clearsky = self.solar_proc.clearsky.ghi.to_numpy(dtype=float)
+        step = np.median(np.diff(dwddata.index.asi8)) / 3.6e12 if len(dwddata) > 1 else 1.
+        correlation = self.correlation ** step
+        shape = (len(dwddata), self.scenarios)
+
+        bias, std = self.statistics.lookup(_column(dwddata, "CLOUD_COVER_TOTAL"),
+                                           _column(dwddata, "PROBABILITY_RADIATION_GLOBAL_LAST_1H"))
+        index = clearsky_index(ghi, ghi_clearsky)[:, None]
+        scenario_index = index + bias[:, None] + std[:, None] * ar1_noise(rng, shape, correlation)
+        scenario_index = np.clip(scenario_index, 0., np.maximum(index, K_MAX))
+        scenario_ghi = np.where(np.isnan(index), ghi[:, None], scenario_index * ghi_clearsky[:, None])
+        temp_air = dwddata["TEMPERATURE_AIR_200DEGC"].to_numpy(dtype=float)[:, None] + \
+            self.statistics.temp_std * ar1_noise(rng, shape, correlation)
+        return scenario_ghi, temp_air
+
+    def evaluate(self, rows, ghi, dni, dhi, temp_air, wind_speed):
+        """ Total ac power (times x scenarios) of the pv system for the rows (boolean) """
+        pv_system = self.pv_system
+        parameters = list(pv_system.system_parameters.values())
+        scenarios = ghi.shape[1]
+        arrays = len(parameters)
+        # Columns: scenario 1 (array 1 ... n), scenario 2 (array 1 ... n), ...
+        stacked = lambda values: np.repeat(values[rows], arrays, axis=1)
+        tiled = lambda key: np.tile([para[key] for para in parameters], scenarios)
+        result = evaluate_arrays(SolarGeometry(self.solar_proc.solpos[rows]), stacked(ghi), stacked(dni),
+                                 stacked(dhi), stacked(temp_air), wind_speed[rows],
+                                 tiled("surface_tilt"), tiled("surface_azimuth"), tiled("modules_per_string"),
+                                 pv_system.pv_module, pv_system.inverter, pv_system.albedo, TEMP_MOD_PARA,
+                                 strings_per_inverter=tiled("strings_per_inverter"),
+                                 inverter_groups=np.repeat(np.arange(scenarios), arrays)
+                                 if pv_system.shared_inverter else None)
+        return result["ac"].reshape(-1, scenarios, arrays).sum(axis=2)
+
+    def calculate(self, dwddata):
+        """
+        Quantiles of the forecast.
+
+        Returns (power, energy) pandas Dataframes: power quantiles [W] per timestamp
+        (ALL_AC_POWER_P<q>_<mode>) and daily energy quantiles [kWh] per local day
+        (ALL_AC_ENERGY_P<q>_<mode>, HOURS: hours of the day covered by the forecast).
+        """
+        rng = np.random.default_rng(self.seed)
+        with stage("process_weather_data"):
+            self.solar_proc.process_weather_data(dwddata.index)
+        with stage("scenarios"):
+            ghi, temp_air = self.scenario_weather(dwddata, rng)
+        with stage("decompose"):
+            pressure = dwddata["PRESSURE_AIR_SURFACE_REDUCED"] if "PRESSURE_AIR_SURFACE_REDUCED" in dwddata else None
+            components = decompose_scenarios(dwddata.index, ghi, self.solar_proc.solpos.zenith,
+                                             MODE_COMPONENTS[self.mode], ghi_clearsky=self.solar_proc.clearsky.ghi,
+                                             dni_clearsky=self.solar_proc.clearsky.dni, pressure=pressure,
+                                             temp_dew=dwddata["DEW_POINT_DEGC"])
+            dni, dhi = [components[key] for key in MODE_COMPONENTS[self.mode]]
+
+        wind_speed = dwddata["WIND_SPEED"].to_numpy(dtype=float)
+        ac = np.empty(ghi.shape)
+        with stage("pv_model"):
+            # Rows with irradiance: all scenarios; other rows: once (same result for all scenarios)
+            day = (self.solar_proc.clearsky.ghi.to_numpy(dtype=float) > 0) | (ghi.max(axis=1) > 0)
+            if day.any():
+                ac[day] = self.evaluate(day, ghi, dni, dhi, temp_air, wind_speed)
+            if (~day).any():
+                ac[~day] = self.evaluate(~day, ghi[:, :1], dni[:, :1], dhi[:, :1], temp_air[:, :1], wind_speed)
+
+        with stage("quantiles"):
+            power = pd.DataFrame(np.percentile(ac, self.quantiles, axis=1).T, index=dwddata.index,
+                                 columns=["ALL_AC_POWER_P%g_%s" % (q, self.mode) for q in self.quantiles])
+            energy = self.daily_energy(ac, dwddata.index)
+        return power, energy
+
+    def daily_energy(self, ac, index):
+        """ Quantiles of the daily energy [kWh] of the scenarios per local day """
+        hours = np.median(np.diff(index.asi8)) / 3.6e12 if len(index) > 1 else 1.
+        days = index.tz_convert(self.solar_proc.location.tz).normalize().tz_localize(None)
+        day_codes, day_labels = pd.factorize(days)
+        daily = np.zeros((len(day_labels), ac.shape[1]))
+        np.add.at(daily, day_codes, np.nan_to_num(ac) * hours / 1000.)
+        energy = pd.DataFrame(np.percentile(daily, self.quantiles, axis=1).T, index=pd.Index(day_labels, name="day"),
+                              columns=["ALL_AC_ENERGY_P%g_%s" % (q, self.mode) for q in self.quantiles])
+        energy["HOURS"] = np.bincount(day_codes) * hours
+        return energy
+
+
+def setup_probabilistic_forecast(config, solar_proc, pv_system):
+    """ ProbabilisticForecast as configured in the "Probabilistic" section, None if disabled. """
+    if not config.getboolean("Probabilistic", "Enabled", fallback=False):
+        return None
+    path = config.get("Probabilistic", "ErrorStatistics", fallback=os.path.join("cache", "error_statistics.json"))
+    if path and os.path.exists(path):
+        statistics = ErrorStatistics.load(path)
+    else:
+        logger.info("No calibrated error statistics (%s), using the defaults", path)
+        statistics = ErrorStatistics()
+    quantiles = [float(q) for q in config.get("Probabilistic", "Quantiles", fallback="10, 50, 90").split(",")]
+    seed = config.get("Probabilistic", "Seed", fallback="")
+    return ProbabilisticForecast(solar_proc, pv_system, statistics,
+                                 scenarios=config.getint("Probabilistic", "Scenarios", fallback=1000),
+                                 quantiles=quantiles,
+                                 mode=config.get("Probabilistic", "Mode", fallback="disc"),
+                                 correlation=config.getfloat("Probabilistic", "Correlation", fallback=0.8),
+                                 seed=int(seed) if seed else None)
+
+
+if __name__ == "__main__":
+    # Calibrate the error statistics: python -m pv_forecast.probabilistic forecast.csv [...] observed.csv [...]
+    # (csv files of main.py, forecast files first; observations are averaged to the forecast timestamps)
+    import sys, configparser
+    from pv_forecast.calculation import setup_solar_processing
+    logging.basicConfig(level=logging.INFO)
+    config = configparser.ConfigParser()
+    config.read("configuration.ini")
+    read = lambda path: pd.read_csv(path, index_col=0, parse_dates=True)
+    frames = [read(path) for path in sys.argv[1:]]
+    forecast = pd.concat([frame for frame in frames if "CLOUD_COVER_TOTAL" in frame])
+    forecast = forecast[~forecast.index.duplicated(keep="last")].sort_index()
+    observed = pd.concat([frame[["RAD_WH", "TEMPERATURE_AIR_200DEGC"]] for frame in frames
+                          if "CLOUD_COVER_TOTAL" not in frame]).sort_index()
+    # Hourly means of the observations, labeled like the (shifted) MOSMIX values:
+    observed = observed.resample("1h").mean()
+    solar_proc = setup_solar_processing(config)
+    solar_proc.process_weather_data(forecast.index)
+    statistics = error_statistics(forecast, observed, solar_proc.clearsky.ghi)
+    statistics.save(config.get("Probabilistic", "ErrorStatistics", fallback=os.path.join("cache", "error_statistics.json")))
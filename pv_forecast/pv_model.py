@@ -0,0 +1,230 @@
+"""
+Functional pv model working on plain numpy arrays.
+
+It reproduces the pvlib ModelChain as set up by PVSystem.add_pv_system:
+- solar position / airmass / extraterrestrial irradiance (shared, see SolarGeometry)
+- transposition into the plane of array (Hay-Davies model)
+- no aoi / spectral losses (default, optionally aoi models of pvlib.iam and a given
+  spectral modifier)
+- SAPM cell temperature model
+- CEC single diode model (dc)
+- Sandia inverter model (ac)
+
+Other than the ModelChain, the solar geometry is computed only once and may be
+shared by all arrays and sites at the same location and time grid. All arrays of
+a location are evaluated at once (stacked along the second axis, see
+evaluate_arrays), arrays may share one inverter with several MPPT inputs.
+
+"""
+import numpy as np
+import pandas as pd
+from pvlib import atmosphere, irradiance, temperature, pvsystem, inverter, iam
+
+TRANSPOSITION_MODEL = "haydavies"
+AIRMASS_MODEL = "kastenyoung1989"
+# Incidence angle modifiers (aoi_model of the pvlib ModelChain)
+AOI_MODELS = ["no_loss", "physical", "ashrae", "martin_ruiz"]
+
+# Module parameters used by pvlib.pvsystem.calcparams_cec
+CEC_PARAMETERS = ["a_ref", "I_L_ref", "I_o_ref", "R_sh_ref", "R_s", "alpha_sc",
+                  "Adjust", "EgRef", "dEgdT", "irrad_ref", "temp_ref"]
+
+# Results in the same order as attributes / columns of the pvlib ModelChain
+DC_KEYS = ["i_sc", "v_oc", "i_mp", "v_mp", "p_mp", "i_x", "i_xx"]
+DIODE_KEYS = ["I_L", "I_o", "R_s", "R_sh", "nNsVth"]
+POA_KEYS = ["poa_global", "poa_direct", "poa_diffuse", "poa_sky_diffuse", "poa_ground_diffuse"]
+
+
+class SolarGeometry:
+    """
+    Solar position dependent values of one location and time grid.
+
+    Parameter:
+    ==========
+
+    solpos: pandas Dataframe - solar position (e.g. Solar_Processing.solpos)
+            including columns apparent_zenith, zenith and azimuth.
+    """
+    def __init__(self, solpos) -> None:
+        self.times = solpos.index
+        self.apparent_zenith = solpos["apparent_zenith"].to_numpy(dtype=float)
+        self.zenith = solpos["zenith"].to_numpy(dtype=float)
+        self.azimuth = solpos["azimuth"].to_numpy(dtype=float)
+        self.dni_extra = irradiance.get_extra_radiation(self.times).to_numpy(dtype=float)
+        self.airmass_relative = np.asarray(atmosphere.get_relative_airmass(self.apparent_zenith, AIRMASS_MODEL),
+                                           dtype=float)
+
+
+def module_cec_parameters(module_parameters):
+    """ Select the parameters of the CEC single diode model from the module parameters. """
+    return {key: module_parameters[key] for key in CEC_PARAMETERS if key in module_parameters}
+
+
+def temperature_sapm_parameters(temperature_model_parameters):
+    return {key: temperature_model_parameters[key] for key in ["a", "b", "deltaT"]}
+
+
+def aoi_modifier(aoi, aoi_model, module_parameters):
+    """
+    Incidence angle modifier like the aoi_model of the pvlib ModelChain (parameters of
+    the iam model are taken from the module parameters if available, pvlib defaults otherwise).
+    """
+    if aoi_model == "no_loss":
+        return 1.
+    if aoi_model not in AOI_MODELS:
+        raise ValueError("Unknown aoi model: %s" % aoi_model)
+    kwargs = {key: module_parameters[key] for key in iam._IAM_MODEL_PARAMS[aoi_model] if key in module_parameters}
+    return getattr(iam, aoi_model)(aoi, **kwargs)
+
+
+def scale_voltage_current_power(dc, voltage=1, current=1):
+    """
+    Scale the single diode results of one module to the string and replace missing
+    values by 0 (like pvlib ModelChain).
+    """
+    scale = {"v_oc": voltage, "v_mp": voltage, "p_mp": voltage * current}
+    scaled = {}
+    for key in DC_KEYS:
+        value = dc[key] * scale.get(key, current)
+        scaled[key] = np.where(np.isnan(value), 0., value)
+    return scaled
+
+
+def shared_inverter_ac(v_mp, p_mp, inverter_parameters, inverter_groups):
+    """
+    AC power of inverters with several MPPT inputs (e.g. one inverter for the east and
+    the west roof) using pvlib.inverter.sandia_multi.
+
+    Parameter:
+    ==========
+
+    v_mp, p_mp: numpy arrays (times x arrays) - dc voltage / power of each array
+    inverter_groups: numpy array (arrays) - inverter of each array, arrays of the same
+                     group are connected to the same inverter.
+
+    Returns (ac of each array, ac of each inverter): the ac power of an inverter is
+    allocated to its arrays by their share of the dc power (equally if there is no dc power).
+    """
+    groups, group_index = np.unique(np.asarray(inverter_groups), return_inverse=True)
+    ac = np.empty_like(p_mp)
+    inverter_ac = np.empty((p_mp.shape[0], len(groups)))
+    for group in range(len(groups)):
+        members = np.flatnonzero(group_index == group)
+        group_p_mp = p_mp[:, members]
+        inverter_ac[:, group] = inverter.sandia_multi(v_mp[:, members].T, group_p_mp.T, inverter_parameters)
+        power_dc = group_p_mp.sum(axis=1, keepdims=True)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            share = np.where(power_dc > 0, group_p_mp / power_dc, 1. / len(members))
+        ac[:, members] = share * inverter_ac[:, [group]]
+    return ac, inverter_ac
+
+
+def evaluate_arrays(geometry, ghi, dni, dhi, temp_air, wind_speed, surface_tilt, surface_azimuth,
+                    modules_per_string, module_parameters, inverter_parameters, albedo,
+                    temperature_model_parameters, strings_per_inverter=1, inverter_groups=None,
+                    aoi_model="no_loss", spectral_modifier=1.):
+    """
+    Run the pv model of several arrays (roof orientations) of one location in a single pass.
+    The arrays are stacked along the second axis, all results have the shape (times x arrays).
+
+    Parameter:
+    ==========
+
+    geometry: SolarGeometry of the location / time grid
+    ghi, dni, dhi: numpy arrays (times) - irradiance [W/m2], or (times x arrays)
+    temp_air: numpy array (times) - air temperature [degC]
+    wind_speed: numpy array (times) - wind speed [m/s]
+    surface_tilt, surface_azimuth: numpy arrays (arrays) - orientation of the modules [deg]
+    modules_per_string: numpy array (arrays) - number of modules in the string
+    module_parameters / inverter_parameters: CEC module and Sandia inverter parameters
+    albedo: ground albedo (scalar or per array)
+    temperature_model_parameters: SAPM temperature model parameters (a, b, deltaT), scalars
+                                  or numpy arrays (arrays)
+    inverter_groups: None - each array has its own inverter (like the pvlib ModelChain), or
+                     numpy array (arrays) - arrays of the same group share one inverter
+                     (see shared_inverter_ac).
+    aoi_model: incidence angle modifier (see AOI_MODELS), one for all or one per array
+    spectral_modifier: scalar or numpy array (times x arrays), e.g. first solar spectral correction
+
+    Returns a dict with keys like the ModelChain attributes: ac, aoi, cell_temperature,
+    effective_irradiance (numpy arrays) and dc, diode_params, total_irrad (dicts of numpy arrays).
+    With inverter_groups, the ac power of each inverter is added as inverter_ac (times x inverters).
+    """
+    column = lambda value: np.asarray(value, dtype=float) if np.ndim(value) == 2 else \
+        np.asarray(value, dtype=float).reshape(-1, 1)
+    row = lambda value: np.asarray(value, dtype=float).reshape(1, -1)
+    ghi, dni, dhi = column(ghi), column(dni), column(dhi)
+    surface_tilt, surface_azimuth = row(surface_tilt), row(surface_azimuth)
+    shape = np.broadcast_shapes(ghi.shape, surface_tilt.shape, surface_azimuth.shape)
+
+    apparent_zenith = column(geometry.apparent_zenith)
+    azimuth = column(geometry.azimuth)
+    total_irrad = irradiance.get_total_irradiance(surface_tilt, surface_azimuth,
+                                                  apparent_zenith, azimuth,
+                                                  dni, ghi, dhi,
+                                                  dni_extra=column(geometry.dni_extra),
+                                                  airmass=column(geometry.airmass_relative),
+                                                  model=TRANSPOSITION_MODEL,
+                                                  albedo=row(albedo) if np.ndim(albedo) else albedo)
+    total_irrad = {key: np.broadcast_to(total_irrad[key], shape) for key in POA_KEYS}
+    aoi = np.broadcast_to(irradiance.aoi(surface_tilt, surface_azimuth, apparent_zenith, azimuth), shape)
+
+    # Aoi / spectral losses (like ModelChain.effective_irradiance_model):
+    if isinstance(aoi_model, str):
+        aoi_loss = aoi_modifier(aoi, aoi_model, module_parameters)
+    else:
+        aoi_model = np.asarray(aoi_model)
+        aoi_loss = np.ones(shape)
+        for model in np.unique(aoi_model):
+            aoi_loss[:, aoi_model == model] = aoi_modifier(aoi[:, aoi_model == model], model, module_parameters)
+    fd = module_parameters.get("FD", 1.)
+    if isinstance(aoi_model, str) and aoi_model == "no_loss" and np.isscalar(spectral_modifier) \
+            and spectral_modifier == 1:
+        effective_irradiance = total_irrad["poa_direct"] + fd * total_irrad["poa_diffuse"]
+    else:
+        effective_irradiance = spectral_modifier * (total_irrad["poa_direct"] * aoi_loss
+                                                    + fd * total_irrad["poa_diffuse"])
+        effective_irradiance = np.broadcast_to(effective_irradiance, shape)
+
+    temperature_parameters = {key: row(value) if np.ndim(value) else value
+                              for key, value in temperature_sapm_parameters(temperature_model_parameters).items()}
+    cell_temperature = temperature.sapm_cell(total_irrad["poa_global"], column(temp_air), column(wind_speed),
+                                             **temperature_parameters)
+
+    # The single diode model is evaluated on the flattened arrays:
+    diode_params = pvsystem.calcparams_cec(effective_irradiance.ravel(), cell_temperature.ravel(),
+                                           **module_cec_parameters(module_parameters))
+    diode_params = [np.broadcast_to(value, effective_irradiance.size) for value in diode_params]
+    dc = pvsystem.singlediode(*diode_params)
+    dc = {key: np.reshape(dc[key], shape) for key in DC_KEYS}
+    dc = scale_voltage_current_power(dc, voltage=row(modules_per_string), current=row(strings_per_inverter))
+
+    result = {"aoi": np.asarray(aoi, dtype=float),
+              "cell_temperature": np.asarray(cell_temperature, dtype=float),
+              "effective_irradiance": np.asarray(effective_irradiance, dtype=float),
+              "dc": dc,
+              "diode_params": {key: np.reshape(value, shape) for key, value in zip(DIODE_KEYS, diode_params)},
+              "total_irrad": {key: np.asarray(value, dtype=float) for key, value in total_irrad.items()}}
+
+    if inverter_groups is None:
+        result["ac"] = np.asarray(inverter.sandia(dc["v_mp"], dc["p_mp"], inverter_parameters), dtype=float)
+    else:
+        result["ac"], result["inverter_ac"] = shared_inverter_ac(dc["v_mp"], dc["p_mp"], inverter_parameters,
+                                                                  inverter_groups)
+    return result
+
+
+def evaluate_array(geometry, ghi, dni, dhi, temp_air, wind_speed, surface_tilt, surface_azimuth,
+                   modules_per_string, module_parameters, inverter_parameters, albedo,
+                   temperature_model_parameters, strings_per_inverter=1):
+    """
+    Run the pv model of one array (one roof orientation), see evaluate_arrays.
+
+    Returns a dict with keys like the ModelChain attributes: ac, aoi, cell_temperature,
+    effective_irradiance (numpy arrays) and dc, diode_params, total_irrad (dicts of numpy arrays).
+    """
+    result = evaluate_arrays(geometry, ghi, dni, dhi, temp_air, wind_speed, [surface_tilt], [surface_azimuth],
+                             [modules_per_string], module_parameters, inverter_parameters, albedo,
+                             temperature_model_parameters, strings_per_inverter)
+    return {key: {k: v[:, 0] for k, v in value.items()} if isinstance(value, dict) else value[:, 0]
+            for key, value in result.items()}
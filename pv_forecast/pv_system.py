@@ -1,80 +1,154 @@
-import os, json
+import uuid, threading
+from types import SimpleNamespace
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import pvlib
 import pandas as pd
+from pv_forecast import pv_model, component_db
+from pv_forecast.instrumentation import stage
+from pv_forecast.result_assembly import RESULT_SERIES, RESULT_FRAMES, combine_results
 from pvlib.temperature import TEMPERATURE_MODEL_PARAMETERS
 
 TEMP_MOD_PARA = TEMPERATURE_MODEL_PARAMETERS['sapm']['open_rack_glass_glass']
 AOI_MODEL = "no_loss"
 SPECTRAL_MODEL = "no_loss"
+
+def load_module_parameters(pv_module: str, components=None):
+    """
+    Get the CEC parameters of the pv module (pandas Series) from the component database
+    (see component_db, defaults to the configured database).
+    """
+    if components is None:
+        components = component_db.default_database()
+    return components.module(pv_module)
+
+
+def load_inverter_parameters(inverter: str, components=None):
+    """
+    Get the CEC parameters of the inverter (pandas Series) from the component database
+    (see component_db, defaults to the configured database).
+    """
+    if components is None:
+        components = component_db.default_database()
+    return components.inverter(inverter)
+
+
+def build_model_chain(system_parameters: dict, location_parameters: dict):
+    """
+    Set up the pvlib ModelChain of one pv system (array) from plain parameters.
+
+    system_parameters: keyword arguments of pvlib.pvsystem.PVSystem
+    location_parameters: keyword arguments of pvlib.location.Location
+    """
+    solar_sys = pvlib.pvsystem.PVSystem(**system_parameters)
+    location = pvlib.location.Location(**location_parameters)
+    return pvlib.modelchain.ModelChain(system=solar_sys,
+                                       location=location,
+                                       aoi_model=AOI_MODEL,
+                                       orientation_strategy=None,
+                                       spectral_model=SPECTRAL_MODEL
+                                       )
+
+
+# ModelChains set up within a worker (per thread, since a ModelChain stores its results),
+# re-used for subsequent runs of the same system.
+_worker_state = threading.local()
+
+
+def run_model_chain(key, system_parameters: dict, location_parameters: dict, wheater_data):
+    """
+    Run the ModelChain of one pv system within a worker (process or thread).
+    Only the parameters and the weather data are shipped to the worker, the
+    ModelChain is rebuilt there (once per worker and system).
+
+    Returns a dict with the model results (see RESULT_SERIES / RESULT_FRAMES).
+    """
+    model_chains = getattr(_worker_state, "model_chains", None)
+    if model_chains is None:
+        model_chains = _worker_state.model_chains = {}
+    model_chain = model_chains.get(key)
+    if model_chain is None:
+        model_chain = build_model_chain(system_parameters, location_parameters)
+        model_chains[key] = model_chain
+    model_chain.run_model(wheater_data)
+    return model_results(model_chain)
+
+
+def model_results(model_chain) -> dict:
+    """ Results of the last run of the ModelChain (kept if the ModelChain runs again) """
+    return {pv_key: getattr(model_chain, pv_key) for pv_key in RESULT_SERIES + RESULT_FRAMES}
+
+
 class PVSystem:
-    def __init__(self, inverter: str, pv_module: str, albedo: float, pvlib_location) -> None:
+    def __init__(self, inverter: str, pv_module: str, albedo: float, pvlib_location,
+                 workers: int = 1, executor: str = "process", engine: str = "modelchain",
+                 shared_inverter: bool = False, components=None) -> None:
         
         self.pv_systems = {}
         self.model_chain = {}
+        self.system_parameters = {}
+        self._setup_keys = {}
+        self.results = {}
         self.inverter_id = inverter
         self.module_id = pv_module
         self.albedo = albedo
         self.pvlib_location = pvlib_location
         self.model_data = pd.DataFrame()
 
-        # Setup pv-modules
-        if "LG_Electronics_Inc__LG355N1C_V5" in pv_module:
-            # This step is necessary since my LG_Electronics_Inc__LG355N1C_V5 - Modules
-            # are currently not included in pvlib module library. Therefore I took it from
-            # cec-module repository and stored it locally until it will be included in pvlib.
-            # see https://github.com/NREL/SAM/tree/develop/deploy/libraries for latest cec-modules
-            file_path = os.path.dirname(__file__)
-            self.pv_module = pd.read_pickle(os.path.join(file_path, "data", "LG355N1C_V5_Module.p"))
-        else:
-            sandia_modules = pvlib.pvsystem.retrieve_sam('cecmod')
-            self.pv_module = sandia_modules[pv_module]
-
-        # Setup inverter:
-        # I am using Kostal Plenticore Plus 4.2 iverter, which is unfortunatelly not part of
-        # the cec-inverter libary (see https://github.com/NREL/SAM/tree/develop/deploy/libraries).
-        # I set up the data in the github repo https://github.com/tinoetzold/KostalPlenticoreData-for-PVLIB
-        # TODO: bring data to pickle file or something.
-        if "Kostal_Plenticore__Plus_4_2" in inverter:
-            # My inverter (setu)
-            file_path = os.path.dirname(__file__)
-            with open(os.path.join(file_path, "data", "Kostal_Plenticore__Plus_4_2.json")) as converter_data:
-                myinv = json.load(converter_data)
-            self.inverter = pd.Series(myinv)
-        else:
-            cec_inverters = pvlib.pvsystem.retrieve_sam('cecinverter')
-            self.inverter = cec_inverters[inverter]
-        
+        # Parallel execution of the model chains (workers > 1):
+        if executor not in ["process", "thread"]:
+            raise ValueError("Unknown executor: %s" % executor)
+        self.workers = workers
+        self.executor = executor
+        self._pool = None
+
+        # Calculation engine: "modelchain" (one pvlib ModelChain per pv system) or "stacked"
+        # (all pv systems evaluated at once, see pv_model.evaluate_arrays). The stacked engine
+        # supports one inverter shared by all pv systems (e.g. east / west roof connected to
+        # the MPPT inputs of the same inverter).
+        if engine not in ["modelchain", "stacked"]:
+            raise ValueError("Unknown engine: %s" % engine)
+        if shared_inverter and engine != "stacked":
+            raise ValueError("A shared inverter is only supported by the stacked engine.")
+        self.engine = engine
+        self.shared_inverter = shared_inverter
+
+        # Setup pv-modules and inverter (from the component database, see component_db):
+        self.pv_module = load_module_parameters(pv_module, components)
+        self.inverter = load_inverter_parameters(inverter, components)
 
     def add_pv_system(self, id: str, surface_tilt: float, surface_azimuth: float, modules_per_string: int) -> None:
         """
         This function is used to add a solar configuration, e.g. if modules are mounted with different
         directions of the roof like EAST and WEST. The pvlib-inverter model (currently) does not support
-        strings with different azimuths, where each has a specific module load.
+        strings with different azimuths, where each has a specific module load. Use the stacked engine
+        with shared_inverter to connect all pv systems to one inverter.
         """
-        solar_sys = pvlib.pvsystem.PVSystem(surface_tilt=surface_tilt,
-                                            surface_azimuth=surface_azimuth,
-                                            module=self.module_id,
-                                            module_parameters=self.pv_module,
-                                            inverter=self.inverter_id,
-                                            inverter_parameters=self.inverter,
-                                            albedo=self.albedo,
-                                            modules_per_string=modules_per_string,
-                                            racking_model="open_rack",
-                                            temperature_model_parameters=TEMP_MOD_PARA,
-                                            strings_per_inverter=1,
-                                            )
+        system_parameters = dict(surface_tilt=surface_tilt,
+                                 surface_azimuth=surface_azimuth,
+                                 module=self.module_id,
+                                 module_parameters=self.pv_module,
+                                 inverter=self.inverter_id,
+                                 inverter_parameters=self.inverter,
+                                 albedo=self.albedo,
+                                 modules_per_string=modules_per_string,
+                                 racking_model="open_rack",
+                                 temperature_model_parameters=TEMP_MOD_PARA,
+                                 strings_per_inverter=1,
+                                 )
         # Store the configuration
-        self.pv_systems[id] = solar_sys
+        self.system_parameters[id] = system_parameters
+        self._setup_keys[id] = uuid.uuid4().hex
 
         # Now set up a model chain with the defined pvsystem:
-        model_chain = pvlib.modelchain.ModelChain(system=solar_sys,
-                                                location=self.pvlib_location,
-                                                aoi_model=AOI_MODEL,
-                                                orientation_strategy=None,
-                                                spectral_model=SPECTRAL_MODEL
-                                                )
+        model_chain = build_model_chain(system_parameters, self._location_parameters())
+        self.pv_systems[id] = model_chain.system
         self.model_chain[id] = model_chain
-    
+
+    def _location_parameters(self):
+        location = self.pvlib_location
+        return dict(latitude=location.latitude, longitude=location.longitude, tz=location.tz,
+                    altitude=location.altitude, name=location.name)
+
     def setup_weather_data(self, ghi, dhi, dni, temp_air=None, wind_speed=None):
         """ 
         Setup a pandas Dataframe carrying the weather information. All inputs are defined
@@ -93,36 +167,93 @@ class PVSystem:
         weather_data:   pandas Dataframe including releavant weather and irradiance
                         information
         """
-        for _, pv_system in self.model_chain.items():
-            pv_system.run_model(wheater_data)
+        if self.workers > 1:
+            self.results = self.run_models({None: wheater_data})[None]
+            return
+        for id, pv_system in self.model_chain.items():
+            with stage(id):
+                pv_system.run_model(wheater_data)
+            self.results[id] = SimpleNamespace(**model_results(pv_system))
 
-    def combine_data(self, current_mode: str):
+    def run_models(self, wheater_data_by_mode: dict) -> dict:
         """
-        Setup a dataframe with all the results. 
+        Run the models of all pv systems for several weather data sets (e.g. one per
+        calculation mode). All combinations of weather data and pv system are independent
+        and run in parallel using a pool of "workers" processes (or threads).
+
+        Parameter:
+        wheater_data_by_mode: dict mode -> pandas Dataframe with weather data
+
+        Returns a dict mode -> dict id -> results (to be passed to combine_data).
         """
-        data_dict = pd.DataFrame()
-        plain_series = ["ac", "aoi", "cell_temperature", "effective_irradiance",]
-        nested_series = ["dc", "diode_params", "total_irrad"]
+        location_parameters = self._location_parameters()
+        tasks = [(mode, pv_id) for mode in wheater_data_by_mode for pv_id in self.model_chain]
+        pool = self._get_pool()
+        futures = [pool.submit(run_model_chain, self._setup_keys[pv_id],
+                               self.system_parameters[pv_id], location_parameters,
+                               wheater_data_by_mode[mode])
+                   for mode, pv_id in tasks]
 
-        # Loop about each pv system and build up unique column names
-        for id, pv_system in self.model_chain.items():
-            # Assign plain stored Series:
-            for pv_key in plain_series:
-                data_ = getattr(pv_system, pv_key)
-                data_dict[id + "_" + pv_key + "_" + current_mode] = data_
-            
-            # Assign nested stored Series:
-            for pv_key in nested_series:
-                data_ = getattr(pv_system, pv_key)
-                for column in data_.columns:
-                    data_dict[id + "_" + pv_key + "_" + column + "_" + current_mode] = data_[column]
-        
-        column_names = data_dict.columns
-        all_ac_columns =[col_name for col_name in column_names if "_ac" in col_name]
-        data_dict["ALL_AC_POWER" + "_" + current_mode] = 0
-        for col in all_ac_columns:
-            data_dict["ALL_AC_POWER" + "_" + current_mode] = data_dict["ALL_AC_POWER" + "_" + current_mode] + data_dict[col]
-        return data_dict
+        results = {mode: {} for mode in wheater_data_by_mode}
+        for (mode, pv_id), future in zip(tasks, futures):
+            results[mode][pv_id] = SimpleNamespace(**future.result())
+        return results
+
+    def run_stacked(self, wheater_data, geometry) -> dict:
+        """
+        Run the model of all pv systems in one vectorized pass (pv_model.evaluate_arrays).
+
+        Parameter:
+        wheater_data:   pandas Dataframe including releavant weather and irradiance
+                        information
+        geometry:       pv_model.SolarGeometry of the time range of wheater_data
+
+        Returns a dict id -> results (to be passed to combine_data), also kept as self.results.
+        """
+        ids = list(self.system_parameters)
+        parameters = [self.system_parameters[id] for id in ids]
+        result = pv_model.evaluate_arrays(geometry, wheater_data["ghi"], wheater_data["dni"], wheater_data["dhi"],
+                                          wheater_data["temp_air"], wheater_data["wind_speed"],
+                                          [para["surface_tilt"] for para in parameters],
+                                          [para["surface_azimuth"] for para in parameters],
+                                          [para["modules_per_string"] for para in parameters],
+                                          self.pv_module, self.inverter, self.albedo, TEMP_MOD_PARA,
+                                          strings_per_inverter=[para["strings_per_inverter"] for para in parameters],
+                                          inverter_groups=[0] * len(ids) if self.shared_inverter else None)
+
+        index = wheater_data.index
+        self.results = {}
+        for column, id in enumerate(ids):
+            series = {pv_key: pd.Series(result[pv_key][:, column], index=index) for pv_key in RESULT_SERIES}
+            frames = {pv_key: pd.DataFrame({key: value[:, column] for key, value in result[pv_key].items()}, index=index)
+                      for pv_key in RESULT_FRAMES}
+            self.results[id] = SimpleNamespace(**series, **frames)
+        return self.results
+
+    def _get_pool(self):
+        """ The pool of workers is created once and kept for further runs. """
+        if self._pool is None:
+            pool = ProcessPoolExecutor if self.executor == "process" else ThreadPoolExecutor
+            self._pool = pool(max_workers=self.workers)
+        return self._pool
+
+    def close(self) -> None:
+        """ Shut down the pool of workers (if any). """
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def combine_data(self, current_mode: str, results: dict = None):
+        """
+        Setup a dataframe with all the results (one preallocated block, see result_assembly).
+
+        results: dict id -> results of the pv systems (see run_models), defaults to the
+                 results of the last call of run_model.
+        """
+        if results is None:
+            results = self.results
+        ids = list(self.model_chain)
+        return combine_results(results[ids[0]].ac.index, {current_mode: results}, ids)
 
 if __name__ == "__main__":
     pass
\ No newline at end of file
@@ -0,0 +1,293 @@
+"""
+HTTP / JSON query service for home automation (e.g. Node-RED): the latest forecast
+is held in memory and queried without reading csv files.
+
+Queries (GET, times as ISO 8601, default UTC; mode: clearsky / disc / dirint):
+
+- /forecast?hours=N[&start=t][&mode=m]:       expected ac power [W] of the next N hours
+- /energy?start=t1&end=t2[&mode=m]:           expected energy [Wh] between t1 and t2
+- /best_window?hours=k[&start=t1][&end=t2][&mode=m]: k hour window with the most energy
+  (e.g. to schedule the washing machine or charging the car)
+- /status:                                    time of the latest result, modes, time range
+
+Each result is converted once into a snapshot: numpy arrays of the times and of the
+ac power per mode plus the cumulated energy (prefix sums). Energies and the best window
+are computed from the cumulated energy by interpolation, so each query takes only
+O(log n) / O(n) operations on small arrays. A new result is swapped in atomically by
+replacing the snapshot (running queries still use the previous one).
+
+Responses carry an ETag (version of the snapshot and the query, queries starting now
+refer to the running interval); a request with a matching If-None-Match header is
+answered by "304 Not Modified" without body, so pollers only download changed data.
+
+"""
+import json, hashlib, logging, threading, urllib.parse, http.server
+import numpy as np
+import pandas as pd
+
+from pv_forecast.calculation import LIST_OF_MODES
+
+logger = logging.getLogger(__name__)
+
+AC_POWER_COLUMN = "ALL_AC_POWER_{mode}"
+DEFAULT_MODE = "disc"
+DEFAULT_HOURS = 24
+NANOSECONDS_PER_HOUR = 3600 * 10**9
+
+
+class QueryError(ValueError):
+    """ Invalid query (answered by HTTP 400) """
+
+
+class ForecastSnapshot:
+    """
+    Immutable, query-optimized copy of one calculation result.
+
+    Parameter:
+    ==========
+
+    result: pandas Dataframe - result of calculate_forecast (ALL_AC_POWER_<mode> columns,
+            UTC time index, each value is the mean power from its time to the next time)
+    updated: time of the result (defaults to now)
+    """
+    def __init__(self, result, updated=None) -> None:
+        index = pd.DatetimeIndex(result.index)
+        index = index.tz_localize("UTC") if index.tz is None else index.tz_convert("UTC")
+        order = np.argsort(index.asi8, kind="stable")
+        self.times = index.asi8[order]
+        step = int(np.median(np.diff(self.times))) if len(self.times) > 1 else NANOSECONDS_PER_HOUR
+        # Boundaries of the intervals (the last interval has the typical length):
+        self.boundaries = np.append(self.times, self.times[-1] + step) if len(self.times) else self.times
+        self.power = {}
+        self.energy = {}
+        for mode in LIST_OF_MODES:
+            column = AC_POWER_COLUMN.format(mode=mode)
+            if column not in result.columns:
+                continue
+            power = result[column].to_numpy(dtype=float)[order]
+            self.power[mode] = power
+            # Cumulated energy [Wh] at the boundaries (only production, no inverter consumption at night)
+            interval_hours = np.diff(self.boundaries) / NANOSECONDS_PER_HOUR
+            interval_energy = np.clip(np.nan_to_num(power), 0., None) * interval_hours
+            self.energy[mode] = np.concatenate([[0.], np.cumsum(interval_energy)])
+        self.updated = pd.Timestamp.now(tz="UTC") if updated is None else pd.Timestamp(updated)
+        self.etag = hashlib.sha1(self.times.tobytes() + b"".join(
+            self.power[mode].tobytes() for mode in sorted(self.power))).hexdigest()[:16]
+
+    def _mode(self, mode):
+        mode = mode or DEFAULT_MODE
+        if mode not in self.power:
+            raise QueryError("Unknown mode %s (available: %s)" % (mode, ", ".join(self.power)))
+        return mode
+
+    def _cumulated(self, mode, times):
+        """ Cumulated energy [Wh] at the times (ns), constant outside of the forecast """
+        return np.interp(times, self.boundaries, self.energy[mode])
+
+    @staticmethod
+    def _time(value):
+        return pd.Timestamp(value).value
+
+    def _available(self):
+        if not len(self.times):
+            raise QueryError("No forecast available yet")
+
+    def interval_start(self, time):
+        """ Start (ns) of the interval running at the time (the first / last one outside of the forecast) """
+        self._available()
+        position = np.searchsorted(self.boundaries, self._time(time), side="right") - 1
+        return int(self.boundaries[min(max(position, 0), len(self.times) - 1)])
+
+    def forecast(self, start, hours, mode=None):
+        """ ac power [W] of the intervals starting within [start, start + hours) """
+        mode = self._mode(mode)
+        start = self._time(start)
+        first = max(np.searchsorted(self.boundaries, start, side="right") - 1, 0)
+        last = np.searchsorted(self.times, start + int(hours * NANOSECONDS_PER_HOUR), side="left")
+        return {"mode": mode, "unit": "W",
+                "times": [pd.Timestamp(value, tz="UTC").isoformat() for value in self.times[first:last]],
+                "ac_power": [None if np.isnan(value) else round(float(value), 1)
+                             for value in self.power[mode][first:last]]}
+
+    def energy_between(self, start, end, mode=None):
+        """ Expected energy [Wh] between start and end """
+        mode = self._mode(mode)
+        self._available()
+        start, end = self._time(start), self._time(end)
+        if end < start:
+            raise QueryError("end is before start")
+        energy = self._cumulated(mode, [start, end])
+        return {"mode": mode, "unit": "Wh", "start": pd.Timestamp(start, tz="UTC").isoformat(),
+                "end": pd.Timestamp(end, tz="UTC").isoformat(), "energy": round(float(energy[1] - energy[0]), 1)}
+
+    def best_window(self, hours, start=None, end=None, mode=None):
+        """ Start of the window of the given length within [start, end] with the most energy """
+        mode = self._mode(mode)
+        self._available()
+        length = int(hours * NANOSECONDS_PER_HOUR)
+        if length <= 0:
+            raise QueryError("hours has to be positive")
+        start = self.boundaries[0] if start is None else max(self._time(start), self.boundaries[0])
+        end = self.boundaries[-1] if end is None else min(self._time(end), self.boundaries[-1])
+        # The energy is linear in the start between the times the window starts or ends at a
+        # boundary: candidates are these times and the start
+        candidates = np.concatenate([[start], self.boundaries, self.boundaries - length])
+        candidates = np.unique(candidates[(candidates >= start) & (candidates + length <= end)])
+        if not len(candidates):
+            raise QueryError("No window of %s hours within the forecast" % hours)
+        energy = self._cumulated(mode, candidates + length) - self._cumulated(mode, candidates)
+        best = int(np.argmax(energy))
+        return {"mode": mode, "unit": "Wh", "hours": hours,
+                "start": pd.Timestamp(candidates[best], tz="UTC").isoformat(),
+                "end": pd.Timestamp(candidates[best] + length, tz="UTC").isoformat(),
+                "energy": round(float(energy[best]), 1)}
+
+    def status(self):
+        return {"updated": self.updated.isoformat(), "modes": list(self.power), "rows": len(self.times),
+                "start": pd.Timestamp(self.boundaries[0], tz="UTC").isoformat() if len(self.times) else None,
+                "end": pd.Timestamp(self.boundaries[-1], tz="UTC").isoformat() if len(self.times) else None,
+                "version": self.etag}
+
+
+class QueryService:
+    """
+    HTTP server answering the queries on the latest snapshot (one thread per request).
+
+    Parameter:
+    ==========
+
+    host, port: address to listen on (port 0: any free port, see address)
+    mode: calculation mode used if a query does not name one
+    """
+    def __init__(self, host="127.0.0.1", port=8765, mode=DEFAULT_MODE) -> None:
+        self.mode = mode
+        self._snapshot = None
+        self.server = http.server.ThreadingHTTPServer((host, port), QueryHandler)
+        self.server.daemon_threads = True
+        self.server.query_service = self
+        self._thread = None
+
+    @property
+    def address(self):
+        return self.server.server_address[:2]
+
+    @property
+    def snapshot(self):
+        return self._snapshot
+
+    def update(self, result):
+        """ Swap in a new calculation result (e.g. as subscriber of the ForecastService). """
+        snapshot = ForecastSnapshot(result)
+        # Replacing the reference is atomic, running queries keep the previous snapshot
+        self._snapshot = snapshot
+        logger.info("Query service updated (%d rows, version %s)", len(snapshot.times), snapshot.etag)
+
+    def query(self, path, parameters, now=None):
+        """
+        Answer of a query (dict). Raises QueryError (invalid parameters), KeyError (unknown
+        query) or LookupError (no forecast available yet). Queries start now by default.
+        """
+        return self.answer(path, parameters, now)[0]
+
+    def answer(self, path, parameters, now=None):
+        """
+        Answer of a query (see query) and its ETag: the version of the snapshot and the
+        normalised query parameters. Queries starting now are identified by the running
+        interval of the forecast, so pollers get "304 Not Modified" until a new result is
+        swapped in or the next interval starts.
+        """
+        if path not in ["/forecast", "/energy", "/best_window", "/status"]:
+            raise KeyError(path)
+        snapshot = self._snapshot
+        if snapshot is None:
+            raise LookupError("No forecast available yet")
+        get = lambda key, default=None: parameters.get(key, [default])[0]
+        mode = get("mode", self.mode)
+        if now is None:
+            now = pd.Timestamp.now(tz="UTC")
+        try:
+            start, end = _timestamp(get("start")), _timestamp(get("end"))
+            begin = now if start is None else start
+            if path == "/forecast":
+                answer = snapshot.forecast(begin, float(get("hours", DEFAULT_HOURS)), mode)
+            elif path == "/energy":
+                answer = snapshot.energy_between(begin, _timestamp(get("end"), required=True), mode)
+            elif path == "/best_window":
+                answer = snapshot.best_window(float(get("hours", 1)), begin, end, mode)
+            else:
+                return snapshot.status(), '"%s"' % snapshot.etag
+            # Normalised query: the same times / numbers in other notations give the same ETag
+            query = {"mode": mode, "hours": None if get("hours") is None else float(get("hours")),
+                     "start": ["now", snapshot.interval_start(now)] if start is None else start.value,
+                     "end": None if end is None else end.value}
+        except (TypeError, ValueError) as exception:
+            raise QueryError(str(exception))
+        version = json.dumps([snapshot.etag, path, query], sort_keys=True).encode("utf-8")
+        return answer, '"%s"' % hashlib.sha1(version).hexdigest()[:16]
+
+    def start(self):
+        """ Serve in a background thread. """
+        self._thread = threading.Thread(target=self.server.serve_forever, name="QueryService", daemon=True)
+        self._thread.start()
+        logger.info("Query service listening on %s:%d", *self.address)
+        return self._thread
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def _timestamp(value, required=False):
+    """ UTC timestamp of a query parameter (None if not given) """
+    if value is None:
+        if required:
+            raise QueryError("Missing time parameter")
+        return None
+    timestamp = pd.Timestamp(value)
+    return timestamp.tz_localize("UTC") if timestamp.tz is None else timestamp.tz_convert("UTC")
+
+
+class QueryHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        try:
+            answer, etag = self.server.query_service.answer(url.path, urllib.parse.parse_qs(url.query))
+        except QueryError as exception:
+            return self._send(400, {"error": str(exception)})
+        except KeyError:
+            return self._send(404, {"error": "Unknown query %s" % url.path})
+        except LookupError as exception:
+            return self._send(503, {"error": str(exception)})
+
+        if etag in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self._send(200, answer, etag)
+
+    def _send(self, status, answer, etag=None):
+        body = answer if isinstance(answer, bytes) else json.dumps(answer).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-cache")
+        if etag is not None:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+def setup_query_service(config):
+    """ QueryService as configured in the "QueryService" section, None if disabled. """
+    if not config.getboolean("QueryService", "Enabled", fallback=False):
+        return None
+    return QueryService(host=config.get("QueryService", "Host", fallback="127.0.0.1"),
+                        port=config.getint("QueryService", "Port", fallback=8765),
+                        mode=config.get("QueryService", "Mode", fallback=DEFAULT_MODE))
@@ -0,0 +1,130 @@
+"""
+Reshape the DWD data (long format: one row per date and parameter) into a table
+with one row per date and one column per parameter, as required for the pvlib
+calculations.
+
+Instead of pandas.pivot_table, the values are scattered directly into a
+preallocated numpy array. Unit conversions are done vectorized on whole columns.
+The resulting columns are plain float columns with plain (non-categorical) labels.
+
+"""
+import numpy as np
+import pandas as pd
+
+# Conversion factor: kJ/m^2 to Wh/m^2 (only valid for hourly time interval)
+KJ_M2_TO_WH_M2 = 0.277778
+
+# Conversion factor: J/cm^2 to W/m^2 (only valid for 10 minute intervall)
+J_CM2_TO_W_M2 = 16.666666667
+
+# Conversion: Kelvin to degree Celsius
+KELVIN_OFFSET = 273.15
+
+# Conversion: hPa to Pa
+HPA_TO_PA = 100.
+
+# Within a result csv file, the weather data is followed by the calculated columns starting with:
+FIRST_CALCULATED_COLUMN = "DHI_ERBS"
+
+
+def _to_float(series):
+    """ Convert a value column (may be object dtype with missing values) into a float array. """
+    if series.dtype == object:
+        series = series.where(series.notna(), np.nan)
+    return pd.to_numeric(series, errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+
+
+def unstack_long_frame(raw_data, index="date", columns="parameter", values="value"):
+    """
+    Turn a long-format dataframe into a wide table.
+
+    Same result as pd.pivot_table(raw_data, values=values, index=[index], columns=columns,
+    aggfunc='first'): for duplicated cells the first valid value is used, rows and
+    columns without any valid value are dropped. The index is sorted, the columns are
+    sorted by the order of categories (categorical) or alphabetically.
+    """
+    value_array = _to_float(raw_data[values])
+    row_codes, row_labels = pd.factorize(raw_data[index], sort=True)
+    col_codes, col_labels = pd.factorize(raw_data[columns], sort=True)
+    n_rows, n_cols = len(row_labels), len(col_labels)
+
+    valid = ~np.isnan(value_array)
+    rows = row_codes[valid]
+    cols = col_codes[valid]
+    value_array = value_array[valid]
+
+    flat_index = rows * n_cols + cols
+    flat_index_ = pd.Index(flat_index)
+    if not flat_index_.is_unique:
+        # keep the first valid value of duplicated cells (like aggfunc='first')
+        first = ~flat_index_.duplicated(keep="first")
+        flat_index = flat_index[first]
+        value_array = value_array[first]
+
+    table = np.full(n_rows * n_cols, np.nan)
+    table[flat_index] = value_array
+    table = table.reshape(n_rows, n_cols)
+
+    # Drop rows / columns without any valid values
+    row_valid = np.bincount(rows, minlength=n_rows) > 0
+    col_valid = np.bincount(cols, minlength=n_cols) > 0
+    table = table[row_valid][:, col_valid]
+
+    date_index = pd.Index(row_labels)[row_valid]
+    date_index.name = index
+    column_index = pd.Index(np.asarray(col_labels, dtype=object)[col_valid], dtype=object, name=columns)
+    return pd.DataFrame(table, index=date_index, columns=column_index)
+
+
+def reshape_mosmix(raw_data):
+    """
+    Reshape DWD MOSMIX data (humanized parameters) for the pvlib calculations.
+
+    input:
+    raw_data: pandas Dataframe having DWD Mosmix shape.
+    """
+    reshaped_data = unstack_long_frame(raw_data)
+    # Now, shift values by 1h to the past, since the DWD Values are assigned to the end of the periode, whereas the
+    # PVLIB values are assigned to the beginning of a cycle.
+    reshaped_data.index = reshaped_data.index - pd.offsets.Hour(1)
+    # For pvlib, temperatures need to be available in degC:
+    reshaped_data["TEMPERATURE_AIR_200DEGC"] = reshaped_data["TEMPERATURE_AIR_200"].to_numpy() - KELVIN_OFFSET
+    reshaped_data["DEW_POINT_DEGC"] = reshaped_data["TEMPERATURE_DEW_POINT_200"].to_numpy() - KELVIN_OFFSET
+    # Given global radiation is in kJ/m^2, tranform into Wh/m^2
+    reshaped_data["RAD_WH"] = reshaped_data["RADIATION_GLOBAL"].to_numpy() * KJ_M2_TO_WH_M2
+    return reshaped_data
+
+
+def reshape_observation(raw_data):
+    """
+    Reshape DWD 10 minute observations (humanized parameters) for the pvlib calculations.
+
+    input:
+    raw_data: pandas Dataframe having DWD observation shape.
+    """
+    reshaped_data = unstack_long_frame(raw_data)
+    # Observed temperatures are already given in degC:
+    reshaped_data["TEMPERATURE_AIR_200DEGC"] = reshaped_data["temperature_air_200"]
+    reshaped_data["DEW_POINT_DEGC"] = reshaped_data["temperature_dew_point_200"]
+    # Given radiation is in J/cm^2 per 10 minutes, tranform into W/m^2
+    reshaped_data["RAD_WH"] = reshaped_data["radiation_global"].to_numpy() * J_CM2_TO_W_M2
+    reshaped_data["RAD_DIFFUS"] = reshaped_data["radiation_sky_diffuse"].to_numpy() * J_CM2_TO_W_M2
+    reshaped_data["WIND_SPEED"] = reshaped_data["wind_speed"]
+    # Observed pressure is given in hPa, the MOSMIX pressure (and pvlib) in Pa:
+    reshaped_data["PRESSURE_AIR_SURFACE_REDUCED"] = reshaped_data["pressure_air_station_height"].to_numpy() * HPA_TO_PA
+    return reshaped_data
+
+
+def read_weather_file(path):
+    """
+    Weather data (reshaped, timestamps in UTC) of a csv file, e.g. the output of a
+    previous run. Calculated columns following the weather data are skipped.
+    """
+    if not path:
+        raise ValueError("Mode from_file requires a csv file (File of the DWD section or --input)")
+    dwddata = pd.read_csv(path, index_col=0, parse_dates=True)
+    if dwddata.index.tz is None:
+        dwddata.index = dwddata.index.tz_localize("utc")
+    if FIRST_CALCULATED_COLUMN in dwddata.columns:
+        dwddata = dwddata.iloc[:, :dwddata.columns.get_loc(FIRST_CALCULATED_COLUMN)]
+    return dwddata
@@ -0,0 +1,120 @@
+"""
+Assembly of the calculation results into one preallocated float block.
+
+Building the result column by column (data_dict[name] = series) reallocates the
+DataFrame blocks with each new column, pd.concat of the modes and of the weather
+data copies everything again. Here, the columns of the result are laid out first
+(weather data, derived irradiance / solar position, per mode the ModelChain results
+of each pv system and the total ac power), one float64 block is allocated and filled
+in place. The result is a DataFrame on this block without further copies:
+
+    [weather data | DHI_ERBS ... ELEVATION | <id>_<key>[_<column>]_<mode> ... ALL_AC_POWER_<mode> | ...]
+
+The total ac power of a mode is one reduction over the ac columns of the pv systems
+(exact column match, not a substring of the column name). The input data is not
+modified. Leading columns which are not numeric (e.g. a station id within the csv file
+of mode from_file) are kept out of the block and inserted unchanged at their position.
+
+"""
+import numpy as np
+import pandas as pd
+
+# Results of the ModelChain (Series / Dataframes) per pv system
+RESULT_SERIES = ["ac", "aoi", "cell_temperature", "effective_irradiance"]
+RESULT_FRAMES = ["dc", "diode_params", "total_irrad"]
+TOTAL_AC_POWER = "ALL_AC_POWER"
+
+
+def _values(values, index):
+    """ Values as float array in the order of index (Series are aligned like a column assignment) """
+    if isinstance(values, pd.Series) and not values.index.equals(index):
+        values = values.reindex(index)
+    return np.asarray(values, dtype=float)
+
+
+def _is_numeric(values) -> bool:
+    """ Values stored in the float block (numbers, booleans) """
+    return pd.api.types.is_numeric_dtype(values.dtype if hasattr(values, "dtype") else np.asarray(values).dtype)
+
+
+def mode_layout(results: dict, ids, mode: str):
+    """
+    Columns of the results of one mode and their sources.
+
+    Returns (column names, sources) with sources being (id, key, column of the result
+    frame or None) of each column except the total ac power (last column).
+    """
+    columns, sources = [], []
+    for id in ids:
+        result = results[id]
+        for pv_key in RESULT_SERIES:
+            columns.append(id + "_" + pv_key + "_" + mode)
+            sources.append((id, pv_key, None))
+        for pv_key in RESULT_FRAMES:
+            for column in getattr(result, pv_key).columns:
+                columns.append(id + "_" + pv_key + "_" + column + "_" + mode)
+                sources.append((id, pv_key, column))
+    columns.append(TOTAL_AC_POWER + "_" + mode)
+    return columns, sources
+
+
+class ResultAssembly:
+    """
+    Result of a calculation as one preallocated float block.
+
+    Parameter:
+    ==========
+
+    index: pandas DatetimeIndex of the result
+    leading: dict column name -> values (Series / arrays) preceding the model results,
+             e.g. the weather data (non-numeric values are kept as they are)
+    results_by_mode: dict mode -> dict id -> results of the pv systems (ModelChain or
+                     namespace with RESULT_SERIES / RESULT_FRAMES)
+    ids: pv systems in the order of the columns
+    """
+    def __init__(self, index, leading: dict, results_by_mode: dict, ids) -> None:
+        self.index = index
+        self.results_by_mode = results_by_mode
+        # Non-numeric leading columns: (position, name, values), inserted into the frame
+        self.others = [(position, name, values) for position, (name, values) in enumerate(leading.items())
+                       if not _is_numeric(values)]
+        leading = {name: values for name, values in leading.items() if _is_numeric(values)}
+        self.columns = list(leading)
+        self.layouts = {}
+        for mode, results in results_by_mode.items():
+            columns, sources = mode_layout(results, ids, mode)
+            self.layouts[mode] = (len(self.columns), sources)
+            self.columns.extend(columns)
+        self.block = np.empty((len(index), len(self.columns)))
+        for position, values in enumerate(leading.values()):
+            self.block[:, position] = _values(values, index)
+
+    def fill(self, mode: str) -> None:
+        """ Copy the results of the mode into the block and add up the total ac power. """
+        offset, sources = self.layouts[mode]
+        results = self.results_by_mode[mode]
+        ac_positions = []
+        for position, (id, pv_key, column) in enumerate(sources, start=offset):
+            values = getattr(results[id], pv_key)
+            if column is not None:
+                values = values[column]
+            self.block[:, position] = _values(values, self.index)
+            if pv_key == "ac":
+                ac_positions.append(position)
+        total = offset + len(sources)
+        self.block[:, total] = self.block[:, ac_positions].sum(axis=1)
+
+    def frame(self) -> pd.DataFrame:
+        """ The block as pandas Dataframe (not copied) with the non-numeric leading columns """
+        frame = pd.DataFrame(self.block, index=self.index, columns=self.columns, copy=False)
+        for position, name, values in self.others:
+            frame.insert(position, name, values)
+        return frame
+
+
+def combine_results(index, results_by_mode: dict, ids, leading: dict = None) -> pd.DataFrame:
+    """ Assemble the results of all modes (and the leading columns) into one Dataframe. """
+    assembly = ResultAssembly(index, leading or {}, results_by_mode, ids)
+    for mode in results_by_mode:
+        assembly.fill(mode)
+    return assembly.frame()
@@ -0,0 +1,350 @@
+"""
+Append-only store of the forecast results (replacing the csv files in output/).
+
+Each forecast run (issue time = time of the calculation) is appended to a
+partitioned HDF5 dataset (pytables):
+
+<directory>/<site>/<source>/<YYYY-MM>.h5    partition by month of the target time
+    table "pv":      issue_time, target_time, mode, array + float32 result columns
+                     (ac, aoi, ..., dc_p_mp, ..., total_irrad_poa_global, ...) - one
+                     row per target time, mode and array ("ALL" = sum of all arrays)
+    table "weather": issue_time, target_time, parameter, value (float32) - weather and
+                     irradiance data used for the calculation
+<directory>/<site>/catalog.json             list of stored runs
+
+source: "forecast" (DWD MOSMIX) or "history" (DWD observations).
+
+Readers select the partitions of the requested target times and query the tables
+by issue / target time, so the whole history is never read.
+
+"""
+import os, re, json, glob, logging, datetime
+import numpy as np
+import pandas as pd
+
+from pv_forecast.calculation import LIST_OF_MODES
+from pv_forecast.pv_system import RESULT_SERIES
+from pv_forecast.pv_model import DC_KEYS, DIODE_KEYS, POA_KEYS
+
+logger = logging.getLogger(__name__)
+
+SOURCE_FORECAST = "forecast"
+SOURCE_HISTORY = "history"
+ALL_ARRAYS = "ALL"
+
+# Result columns of one array (see PVSystem.combine_data)
+PV_METRICS = (RESULT_SERIES + ["dc_" + key for key in DC_KEYS] + ["diode_params_" + key for key in DIODE_KEYS]
+              + ["total_irrad_" + key for key in POA_KEYS])
+KEY_COLUMNS = ["issue_time", "target_time", "mode", "array"]
+WEATHER_KEY_COLUMNS = ["issue_time", "target_time", "parameter"]
+
+# Files written before the calculation modes were introduced have no mode suffix
+LEGACY_MODE = "disc"
+
+_metrics = "|".join(sorted(PV_METRICS, key=len, reverse=True))
+_modes = "|".join(LIST_OF_MODES)
+PV_COLUMN_PATTERN = re.compile(r"^(?P<array>.+?)_(?P<metric>%s)(?:_(?P<mode>%s))?$" % (_metrics, _modes))
+ALL_AC_PATTERN = re.compile(r"^ALL_AC_POWER(?:_(?P<mode>%s))?$" % _modes)
+
+# Name of the csv files written to output/ (with or without minutes)
+CSV_NAME_PATTERN = re.compile(r"^(\d{4})_(\d{2})_(\d{2})_(\d{2})(?:_(\d{2}))?_Uhr\.csv$")
+
+
+def split_result(result, issue_time, default_mode=LEGACY_MODE):
+    """
+    Split the (wide) result of calculate_forecast into the long tables pv and weather.
+
+    Returns (pv, weather) pandas Dataframes.
+    """
+    target_time = pd.DatetimeIndex(result.index)
+    if target_time.tz is None:
+        target_time = target_time.tz_localize("UTC")
+    target_time = target_time.tz_convert("UTC")
+
+    pv_columns = {}
+    weather_columns = []
+    for column in result.columns:
+        match_all = ALL_AC_PATTERN.match(str(column))
+        match = PV_COLUMN_PATTERN.match(str(column))
+        if match_all:
+            pv_columns.setdefault((match_all.group("mode") or default_mode, ALL_ARRAYS), {})["ac"] = column
+        elif match:
+            key = (match.group("mode") or default_mode, match.group("array"))
+            pv_columns.setdefault(key, {})[match.group("metric")] = column
+        else:
+            weather_columns.append(column)
+
+    n_times = len(target_time)
+    pv_parts = []
+    for (mode, array), metrics in pv_columns.items():
+        part = {"issue_time": np.repeat(issue_time, n_times), "target_time": target_time,
+                "mode": np.repeat(mode, n_times), "array": np.repeat(array, n_times)}
+        for metric in PV_METRICS:
+            if metric in metrics:
+                part[metric] = pd.to_numeric(result[metrics[metric]], errors="coerce").to_numpy(dtype=np.float32)
+            else:
+                part[metric] = np.full(n_times, np.nan, dtype=np.float32)
+        pv_parts.append(pd.DataFrame(part))
+    pv = pd.concat(pv_parts, ignore_index=True) if pv_parts else pd.DataFrame(columns=KEY_COLUMNS + PV_METRICS)
+
+    values = np.column_stack([pd.to_numeric(result[column], errors="coerce").to_numpy(dtype=np.float32)
+                              for column in weather_columns]) if weather_columns else np.empty((n_times, 0), np.float32)
+    weather = pd.DataFrame({"issue_time": np.repeat(issue_time, values.size),
+                            "target_time": np.repeat(target_time, len(weather_columns)),
+                            "parameter": np.tile(np.asarray(weather_columns, dtype=str), n_times),
+                            "value": values.ravel()})
+    return pv, weather
+
+
+class ResultStore:
+    """
+    Partitioned store of all forecast runs.
+
+    Parameter:
+    ==========
+
+    directory: root directory of the store
+    """
+    def __init__(self, directory) -> None:
+        self.directory = directory
+
+    def _site_dir(self, site):
+        return os.path.join(self.directory, str(site))
+
+    def _partition_path(self, site, source, month):
+        return os.path.join(self._site_dir(site), source, month + ".h5")
+
+    def _partitions(self, site, source, start=None, end=None):
+        """ Partition files of the site / source with target times in [start, end) """
+        paths = sorted(glob.glob(os.path.join(self._site_dir(site), source, "*.h5")))
+        if start is None and end is None:
+            return paths
+        selected = []
+        for path in paths:
+            month = pd.Timestamp(os.path.basename(path)[:-3] + "-01", tz="UTC")
+            if (end is None or month < end) and (start is None or month + pd.offsets.MonthBegin(1) > start):
+                selected.append(path)
+        return selected
+
+    # Catalog of stored runs:
+    def _catalog_path(self, site):
+        return os.path.join(self._site_dir(site), "catalog.json")
+
+    def runs(self, site="default", source=None):
+        """ List of stored runs (dicts with issue_time, source, rows, partitions). """
+        path = self._catalog_path(site)
+        if not os.path.exists(path):
+            return []
+        with open(path) as catalog_file:
+            runs = json.load(catalog_file)
+        return [run for run in runs if source is None or run["source"] == source]
+
+    def contains(self, issue_time, site="default", source=SOURCE_FORECAST) -> bool:
+        issue_time = self._time_window(issue_time, issue_time)[0].isoformat()
+        return any(run["issue_time"] == issue_time for run in self.runs(site, source))
+
+    def _add_run(self, site, run):
+        runs = self.runs(site)
+        for stored in runs:
+            # Run appended in parts (e.g. chunks of a back-test)
+            if stored["issue_time"] == run["issue_time"] and stored["source"] == run["source"]:
+                stored["rows"] += run["rows"]
+                stored["partitions"] = sorted(set(stored["partitions"]) | set(run["partitions"]))
+                break
+        else:
+            runs.append(run)
+        path = self._catalog_path(site)
+        with open(path + ".tmp", "w") as catalog_file:
+            json.dump(runs, catalog_file, indent=1)
+        os.replace(path + ".tmp", path)
+
+    def append(self, result, issue_time=None, site="default", source=SOURCE_FORECAST, default_mode=LEGACY_MODE):
+        """
+        Append the result of one forecast run (wide dataframe as returned by calculate_forecast).
+
+        issue_time: issue time of the forecast (UTC, e.g. of the MOSMIX run), defaults to now.
+        """
+        if issue_time is None:
+            issue_time = pd.Timestamp.now(tz="UTC").floor("min")
+        issue_time = pd.Timestamp(issue_time)
+        issue_time = issue_time.tz_localize("UTC") if issue_time.tz is None else issue_time.tz_convert("UTC")
+
+        pv, weather = split_result(result, issue_time, default_mode)
+        months = pv["target_time"].dt.strftime("%Y-%m") if len(pv) else pd.Series([], dtype=str)
+        weather_months = weather["target_time"].dt.strftime("%Y-%m")
+        partitions = sorted(set(months) | set(weather_months))
+        for month in partitions:
+            path = self._partition_path(site, source, month)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with pd.HDFStore(path, mode="a", complevel=5, complib="blosc") as store:
+                pv_part = pv[(months == month).to_numpy()]
+                if len(pv_part):
+                    store.append("pv", pv_part, format="table", data_columns=KEY_COLUMNS, index=False,
+                                 min_itemsize={"mode": 16, "array": 32})
+                weather_part = weather[(weather_months == month).to_numpy()]
+                if len(weather_part):
+                    store.append("weather", weather_part, format="table", data_columns=WEATHER_KEY_COLUMNS,
+                                 index=False, min_itemsize={"parameter": 48})
+        self._add_run(site, {"issue_time": issue_time.isoformat(), "source": source, "rows": len(pv),
+                             "partitions": partitions})
+        return issue_time
+
+    def _select(self, key, site, source, start, end, where=None, columns=None):
+        """ Read the rows of the table with target time in [start, end) from the partitions. """
+        conditions = ["target_time >= start", "target_time < end"] + (where or [])
+        frames = []
+        for path in self._partitions(site, source, start, end):
+            with pd.HDFStore(path, mode="r") as store:
+                if key not in store:
+                    continue
+                # start / end are taken from the local scope by pandas
+                frames.append(store.select(key, where=" & ".join(conditions), columns=columns))
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(frames, ignore_index=True)
+
+    @staticmethod
+    def _time_window(start, end):
+        start = pd.Timestamp(start)
+        start = start.tz_localize("UTC") if start.tz is None else start.tz_convert("UTC")
+        end = pd.Timestamp(end)
+        end = end.tz_localize("UTC") if end.tz is None else end.tz_convert("UTC")
+        return start, end
+
+    def forecasts(self, start, end, site="default", source=SOURCE_FORECAST, mode=None, array=ALL_ARRAYS,
+                  columns=None):
+        """
+        All stored forecasts (all issue times) for target times in [start, end).
+
+        mode / array: select one mode / array (None: all)
+        columns: result columns to read (defaults to all)
+        """
+        start, end = self._time_window(start, end)
+        where = []
+        if mode is not None:
+            where.append("mode == %r" % mode)
+        if array is not None:
+            where.append("array == %r" % array)
+        if columns is not None:
+            columns = KEY_COLUMNS + [column for column in columns if column not in KEY_COLUMNS]
+        data = self._select("pv", site, source, start, end, where, columns)
+        return data.sort_values(["target_time", "issue_time"], ignore_index=True) if len(data) else data
+
+    def forecasts_for_day(self, day, site="default", **kwargs):
+        """ All forecasts for the target day (UTC). """
+        start = pd.Timestamp(day).normalize()
+        return self.forecasts(start, start + pd.Timedelta(days=1), site, **kwargs)
+
+    def latest_forecast(self, start, end, site="default", as_of=None, **kwargs):
+        """
+        Latest forecast per target time in [start, end), only considering forecasts
+        issued until "as_of" (defaults to all).
+        """
+        data = self.forecasts(start, end, site, **kwargs)
+        if as_of is not None:
+            as_of = self._time_window(as_of, as_of)[0]
+            data = data[data["issue_time"] <= as_of]
+        data = data.sort_values("issue_time", kind="stable")
+        data = data.drop_duplicates(["target_time", "mode", "array"], keep="last")
+        return data.sort_values(["target_time", "mode", "array"], ignore_index=True)
+
+    def weather(self, start, end, site="default", source=SOURCE_FORECAST, issue_time=None, parameters=None):
+        """
+        Weather / irradiance data in [start, end) as wide table (one column per parameter),
+        of the given issue time (defaults to the latest issue per target time).
+        """
+        start, end = self._time_window(start, end)
+        where = []
+        if issue_time is not None:
+            issue = self._time_window(issue_time, issue_time)[0]
+            where.append("issue_time == issue")
+        if parameters is not None:
+            where.append("parameter in %r" % list(parameters))
+        conditions = ["target_time >= start", "target_time < end"] + where
+        frames = []
+        for path in self._partitions(site, source, start, end):
+            with pd.HDFStore(path, mode="r") as store:
+                if "weather" in store:
+                    frames.append(store.select("weather", where=" & ".join(conditions)))
+        if not frames:
+            return pd.DataFrame()
+        data = pd.concat(frames, ignore_index=True).sort_values("issue_time", kind="stable")
+        data = data.drop_duplicates(["target_time", "parameter"], keep="last")
+        return data.pivot(index="target_time", columns="parameter", values="value")
+
+
+def setup_result_store(config):
+    """ Result store as configured in the "ResultStore" section (None if disabled). """
+    if not config.getboolean("ResultStore", "Enabled", fallback=False):
+        return None
+    return ResultStore(config.get("ResultStore", "Directory", fallback="results"))
+
+
+def setup_result_writer(config):
+    """
+    Callable(result) appending each calculated result to the configured result store
+    (source according to the DWD "Mode"), None if the store is disabled. The issue time
+    is taken from result.attrs["issue_time"] (MOSMIX issue time of the weather data),
+    the time of the run if it is not given (e.g. history).
+    """
+    store = setup_result_store(config)
+    if store is None:
+        return None
+    site = config.get("ResultStore", "Site", fallback="default")
+    source = SOURCE_HISTORY if config.get("DWD", "Mode", raw=True) == "from_history" else SOURCE_FORECAST
+
+    def write_result(result):
+        store.append(result, issue_time=result.attrs.get("issue_time"), site=site, source=source)
+
+    return write_result
+
+
+def csv_issue_time(file_name, timezone="Europe/Berlin"):
+    """
+    Issue time (UTC) of a csv file written to output/: the file name carries the local
+    time of the calculation (%Y_%m_%d_%H_%M_Uhr.csv or %Y_%m_%d_%H_Uhr.csv).
+    """
+    match = CSV_NAME_PATTERN.match(os.path.basename(file_name))
+    if match is None:
+        return None
+    year, month, day, hour, minute = [int(value) if value else 0 for value in match.groups()]
+    local_time = pd.Timestamp(datetime.datetime(year, month, day, hour, minute))
+    return local_time.tz_localize(timezone).tz_convert("UTC")
+
+
+def import_csv_files(store, directory="output", site="default", timezone="Europe/Berlin"):
+    """
+    Migrate the csv files written to output/ into the result store. Files already
+    imported (same issue time) are skipped. Files based on DWD observations
+    (column radiation_sky_diffuse) are stored as source "history".
+
+    timezone: timezone of the time within the file names (local time of the calculation)
+
+    Returns the list of imported files.
+    """
+    imported = []
+    for path in sorted(glob.glob(os.path.join(directory, "*_Uhr.csv"))):
+        issue_time = csv_issue_time(path, timezone)
+        if issue_time is None:
+            logger.warning("Skipping %s: unknown file name", path)
+            continue
+        result = pd.read_csv(path, index_col=0)
+        result.index = pd.to_datetime(result.index, utc=True)
+        source = SOURCE_HISTORY if "radiation_sky_diffuse" in result.columns else SOURCE_FORECAST
+        if store.contains(issue_time, site, source):
+            continue
+        store.append(result, issue_time=issue_time, site=site, source=source)
+        imported.append(path)
+    return imported
+
+
+if __name__ == "__main__":
+    # Migration of the csv files: python -m pv_forecast.result_store [output directory]
+    import sys, configparser
+    logging.basicConfig(level=logging.INFO)
+    config = configparser.ConfigParser()
+    config.read("configuration.ini")
+    store = ResultStore(config.get("ResultStore", "Directory", fallback="results"))
+    imported = import_csv_files(store, sys.argv[1] if len(sys.argv) > 1 else "output",
+                                site=config.get("ResultStore", "Site", fallback="default"))
+    print("Imported %d csv files into %s" % (len(imported), store.directory))
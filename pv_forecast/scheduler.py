@@ -0,0 +1,346 @@
+"""
+Scheduler of appliances and EV charging maximizing the self-consumption of the
+forecasted pv power.
+
+The forecast (ALL_AC_POWER_<mode> of calculate_forecast) minus the base load gives
+the surplus power per slot ("Resolution", e.g. 15 minutes). The loads are placed one
+after the other, each one using the surplus left by the loads placed before:
+
+- Fixed loads (not interruptible, e.g. dishwasher, washing machine) have a power
+  profile of phases (hours, power). The self-consumed energy of a start slot is
+  the sum over the phases of min(phase power, surplus); with the prefix sums of
+  min(phase power, surplus) it is computed for all start slots at once (O(slots)
+  per phase instead of O(slots x duration)). The start with the most self-consumed
+  energy within [earliest, deadline] is taken (the earliest one of equal starts).
+- Interruptible loads (e.g. EV charging) need an energy within [earliest, deadline]
+  at a power between min_power and power. They are charged in the slots with the
+  highest surplus first (by the surplus, at least min_power), which maximizes the
+  self-consumed energy. No slot is charged below min_power: the slot completing the
+  energy takes power from the slots before or rounds the energy up. The energy missing then is charged from the grid as late as
+  possible (a later run with a newer forecast may still cover it by pv power).
+
+Fixed loads are placed first (the largest energy first), interruptible loads then
+fill the remaining surplus (the earliest deadline first). Re-planning dozens of loads
+over a 240 h forecast takes milliseconds, see "python -m benchmark.bench_scheduler".
+
+Loads are defined in a JSON file (see loads.json), times as ISO 8601 (UTC if no time
+zone is given) or "HH:MM" (next time of day in the local time zone after the start of
+the planning / the earliest start):
+
+    {"name": "dishwasher", "profile": [[0.5, 2000], [1.0, 150], [0.5, 1800]], "deadline": "18:00"}
+    {"name": "car", "interruptible": true, "energy": 20000, "power": 11000, "min_power": 4100,
+     "earliest": "08:00", "deadline": "07:00"}
+
+"""
+import os, re, json, logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+AC_POWER_COLUMN = "ALL_AC_POWER_{mode}"
+NANOSECONDS_PER_HOUR = 3600 * 10**9
+TIME_OF_DAY = re.compile(r"^\d{1,2}:\d{2}$")
+
+
+class Load:
+    """
+    Load to be scheduled.
+
+    Parameter:
+    ==========
+
+    name: name of the load
+    profile: fixed loads - phases [(hours, power [W]), ...], or power / duration
+    interruptible: True - energy [Wh] charged at power [W] (maximum) / min_power [W]
+    earliest, deadline: time window (pandas Timestamp, ISO 8601 or "HH:MM"), None: forecast
+    """
+    def __init__(self, name, profile=None, power=None, duration=None, energy=None, min_power=0.,
+                 interruptible=False, earliest=None, deadline=None) -> None:
+        self.name = name
+        self.interruptible = interruptible
+        self.earliest = earliest
+        self.deadline = deadline
+        if interruptible:
+            if energy is None or power is None:
+                raise ValueError("Interruptible load %s requires energy and power" % name)
+            self.energy = float(energy)
+            self.power = float(power)
+            self.min_power = min(float(min_power), self.power)
+            self.profile = None
+        else:
+            if profile is None:
+                if power is None or duration is None:
+                    raise ValueError("Load %s requires a profile or power and duration" % name)
+                profile = [(duration, power)]
+            self.profile = [(float(hours), float(power)) for hours, power in profile]
+            self.energy = sum(hours * power for hours, power in self.profile)
+            self.power = max(power for _, power in self.profile)
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(**values)
+
+
+def read_loads(path):
+    """ Loads of a JSON file (list of load definitions, see Load) """
+    with open(path) as loads_file:
+        return [Load.from_dict(values) for values in json.load(loads_file)]
+
+
+def _time(value, reference, timezone):
+    """ UTC timestamp of a time of the load definition, "HH:MM": next time of day after reference """
+    if value is None:
+        return None
+    if isinstance(value, str) and TIME_OF_DAY.match(value):
+        local = reference.tz_convert(timezone)
+        hour, minute = [int(part) for part in value.split(":")]
+        time = local.normalize() + pd.Timedelta(hours=hour, minutes=minute)
+        if time <= local:
+            time += pd.Timedelta(days=1)
+        return time.tz_convert("UTC")
+    time = pd.Timestamp(value)
+    return time.tz_localize("UTC") if time.tz is None else time.tz_convert("UTC")
+
+
+class Schedule:
+    """
+    Result of the scheduler: the planned loads and the power per slot.
+
+    entries: list of dicts per load (name, start, end, energy, solar / grid energy [Wh],
+             feasible, slots: [(start, power [W]), ...] of interruptible loads)
+    plan: pandas Dataframe per slot - PV, BASE_LOAD, power of each load and SURPLUS left [W]
+    """
+    def __init__(self, entries, plan) -> None:
+        self.entries = entries
+        self.plan = plan
+
+    def to_dict(self):
+        return {"loads": self.entries,
+                "solar_energy": round(sum(entry["solar_energy"] for entry in self.entries), 1),
+                "grid_energy": round(sum(entry["grid_energy"] for entry in self.entries), 1)}
+
+
+class Scheduler:
+    """
+    Parameter:
+    ==========
+
+    loads: list of Load
+    base_load: base load [W]: scalar, 24 values (local hour of the day) or pandas Series
+    resolution: length of a slot (pandas time span)
+    mode: calculation mode of the forecast (ALL_AC_POWER_<mode>)
+    timezone: local time zone of times of day ("HH:MM") and of the base load profile
+    """
+    def __init__(self, loads, base_load=0., resolution="15min", mode="disc", timezone="UTC") -> None:
+        self.loads = list(loads)
+        self.base_load = base_load
+        self.resolution = pd.Timedelta(resolution)
+        self.mode = mode
+        self.timezone = timezone
+
+    def slots(self, forecast, now=None):
+        """
+        Slots (start times) from now (or the start of the forecast) to its end and the
+        mean pv power [W] of each slot (from the cumulated energy of the forecast).
+        """
+        index = pd.DatetimeIndex(forecast.index)
+        index = index.tz_localize("UTC") if index.tz is None else index.tz_convert("UTC")
+        times = index.asi8
+        step = int(np.median(np.diff(times))) if len(times) > 1 else NANOSECONDS_PER_HOUR
+        boundaries = np.append(times, times[-1] + step)
+        power = np.clip(np.nan_to_num(forecast.to_numpy(dtype=float)), 0., None)
+        energy = np.concatenate([[0.], np.cumsum(power * np.diff(boundaries) / NANOSECONDS_PER_HOUR)])
+
+        start = index[0] if now is None else max(_time(now, index[0], self.timezone).ceil(self.resolution), index[0])
+        slots = pd.date_range(start, pd.Timestamp(boundaries[-1], tz="UTC") - self.resolution, freq=self.resolution)
+        slot_boundaries = np.append(slots.asi8, slots.asi8[-1] + self.resolution.value) if len(slots) else slots.asi8
+        slot_energy = np.diff(np.interp(slot_boundaries, boundaries, energy))
+        # Rounded (mW), equal power of the slots of one forecast interval compares equal:
+        return slots, np.round(slot_energy / (self.resolution.value / NANOSECONDS_PER_HOUR), 3)
+
+    def base_load_power(self, slots):
+        """ Base load [W] of the slots """
+        if isinstance(self.base_load, pd.Series):
+            base_load = self.base_load.copy()
+            base_load.index = pd.DatetimeIndex(base_load.index).tz_convert("UTC") if base_load.index.tz else \
+                pd.DatetimeIndex(base_load.index).tz_localize("UTC")
+            return base_load.sort_index().reindex(slots, method="ffill").fillna(0.).to_numpy(dtype=float)
+        if np.ndim(self.base_load):
+            return np.asarray(self.base_load, dtype=float)[slots.tz_convert(self.timezone).hour]
+        return np.full(len(slots), float(self.base_load))
+
+    def _window(self, load, slots, hours):
+        """ First slot and end slot (exclusive) of the time window of the load """
+        reference = slots[0]
+        earliest = _time(load.earliest, reference, self.timezone)
+        deadline = _time(load.deadline, earliest if earliest is not None else reference, self.timezone)
+        first = 0 if earliest is None else int(np.searchsorted(slots.asi8, earliest.value, side="left"))
+        # Slots ending before the deadline:
+        end = len(slots) if deadline is None else \
+            int(np.searchsorted(slots.asi8 + self.resolution.value, deadline.value, side="right"))
+        return first, end
+
+    def place_fixed(self, load, surplus, first, end, hours):
+        """ Power of the load per slot (start with the most self-consumed energy), None if it does not fit """
+        phases = [(max(int(np.ceil(round(duration / hours, 9))), 1), power) for duration, power in load.profile]
+        length = sum(slot_count for slot_count, _ in phases)
+        starts = np.arange(first, end - length + 1)
+        if not len(starts):
+            return None
+        # Self-consumed energy of each start: prefix sums of min(power, surplus) per phase power
+        prefix = {power: np.concatenate([[0.], np.cumsum(np.minimum(power, surplus))])
+                  for power in {power for _, power in phases}}
+        solar = np.zeros(len(starts))
+        offset = 0
+        for slot_count, power in phases:
+            solar += prefix[power][starts + offset + slot_count] - prefix[power][starts + offset]
+            offset += slot_count
+        start = starts[int(np.argmax(np.round(solar, 3)))]
+        load_power = np.zeros(len(surplus))
+        offset = start
+        for slot_count, power in phases:
+            load_power[offset:offset + slot_count] = power
+            offset += slot_count
+        return load_power
+
+    def place_interruptible(self, load, surplus, first, end, hours):
+        """ Power of the load per slot: highest surplus first, the rest as late as possible """
+        load_power = np.zeros(len(surplus))
+        window = np.arange(first, end)
+        # Charged by pv power: slots by surplus, descending (stable: the earlier slot of equal surplus)
+        order = window[np.argsort(-surplus[window], kind="stable")]
+        order = order[surplus[order] > 0]
+        power = np.clip(surplus[order], load.min_power, load.power)
+        remaining = _fill(load_power, order, power, load.energy, hours, load.min_power)
+        if remaining > 0:
+            # Charged from the grid: the latest slots first, up to the maximum power
+            order = window[::-1]
+            remaining = _fill(load_power, order, load.power - load_power[order], remaining, hours, load.min_power)
+        return load_power, remaining <= 1e-9
+
+    def plan(self, forecast, now=None):
+        """
+        Schedule of all loads.
+
+        Parameter:
+        ==========
+
+        forecast: pandas Dataframe (result of calculate_forecast) or Series of the ac power [W]
+        now: start of the planning (UTC if no time zone is given, default: start of the forecast)
+        """
+        if isinstance(forecast, pd.DataFrame):
+            forecast = forecast[AC_POWER_COLUMN.format(mode=self.mode)]
+        slots, pv_power = self.slots(forecast, now)
+        base_load = self.base_load_power(slots)
+        surplus = np.clip(pv_power - base_load, 0., None)
+        hours = self.resolution.value / NANOSECONDS_PER_HOUR
+
+        plan = {"PV": pv_power, "BASE_LOAD": base_load}
+        entries = []
+        # Fixed loads first (largest energy first), interruptible loads fill the remaining surplus
+        fixed = sorted([load for load in self.loads if not load.interruptible], key=lambda load: -load.energy)
+        flexible = sorted([load for load in self.loads if load.interruptible],
+                          key=lambda load: (_time(load.deadline, slots[0], self.timezone) or slots[-1]) if len(slots)
+                          else 0)
+        for load in fixed + flexible:
+            first, end = self._window(load, slots, hours) if len(slots) else (0, 0)
+            if load.interruptible:
+                load_power, feasible = self.place_interruptible(load, surplus, first, end, hours)
+            else:
+                load_power = self.place_fixed(load, surplus, first, end, hours)
+                feasible = load_power is not None
+                if load_power is None:
+                    load_power = np.zeros(len(slots))
+            solar = np.minimum(load_power, surplus)
+            surplus = surplus - solar
+            plan[load.name] = load_power
+            entries.append(_entry(load, slots, load_power, solar, hours, feasible))
+            if not feasible:
+                logger.warning("Load %s does not fit into its time window", load.name)
+        plan["SURPLUS"] = surplus
+        return Schedule(entries, pd.DataFrame(plan, index=slots))
+
+
+def _fill(load_power, order, power, energy, hours, min_power=0.):
+    """
+    Add power to the slots in order until the energy is reached, returns the energy missing.
+
+    The slot completing the energy gets at least min_power: the power missing is moved
+    from the slots filled before (the last ones first, down to min_power), the rest
+    rounds the energy up.
+    """
+    cumulated = np.cumsum(power * hours)
+    count = int(np.searchsorted(cumulated, energy - 1e-9, side="left"))
+    if count >= len(order):
+        load_power[order] += power
+        return energy - (cumulated[-1] if len(cumulated) else 0.)
+    power = power[:count + 1].copy()
+    power[count] = (energy - (cumulated[count - 1] if count else 0.)) / hours
+    missing = min_power - (load_power[order[count]] + power[count])
+    if missing > 1e-9:
+        spare = np.clip(np.minimum(power[:count], load_power[order[:count]] + power[:count] - min_power), 0., None)
+        taken = np.clip(missing - np.concatenate([[0.], np.cumsum(spare[::-1])[:-1]]), 0., spare[::-1])[::-1]
+        power[:count] -= taken
+        power[count] += missing
+    load_power[order[:count + 1]] += power
+    return 0.
+
+
+def _entry(load, slots, load_power, solar, hours, feasible):
+    active = np.flatnonzero(load_power > 0)
+    isoformat = lambda position: slots[position].isoformat()
+    entry = {"name": load.name, "interruptible": load.interruptible, "feasible": bool(feasible),
+             "start": isoformat(active[0]) if len(active) else None,
+             "end": (slots[active[-1]] + (slots.freq or pd.Timedelta(hours=hours))).isoformat() if len(active) else None,
+             "energy": round(float(load_power.sum() * hours), 1),
+             "solar_energy": round(float(solar.sum() * hours), 1),
+             "grid_energy": round(float((load_power - solar).sum() * hours), 1)}
+    if load.interruptible:
+        entry["slots"] = [[isoformat(position), round(float(load_power[position]), 1)] for position in active]
+    return entry
+
+
+def setup_scheduler(config):
+    """ Scheduler as configured in the "Scheduler" section, None if disabled. """
+    if not config.getboolean("Scheduler", "Enabled", fallback=False):
+        return None
+    base_load = [float(value) for value in config.get("Scheduler", "BaseLoad", fallback="0").split(",")]
+    return Scheduler(read_loads(config.get("Scheduler", "Loads", fallback="loads.json")),
+                     base_load=base_load[0] if len(base_load) == 1 else base_load,
+                     resolution=config.get("Scheduler", "Resolution", fallback="15min"),
+                     mode=config.get("Scheduler", "Mode", fallback="disc"),
+                     timezone=config.get("SolarSystem", "MyTimezone", raw=True, fallback="UTC"))
+
+
+def schedule_writer(config, scheduler, from_now=True):
+    """
+    Callback planning the loads for a new result and writing the schedule (JSON).
+    from_now: plan from the current time, False: from the start of the result (e.g. history).
+    """
+    path = config.get("Scheduler", "Schedule", fallback=os.path.join("output", "schedule.json"))
+
+    def write_schedule(result):
+        schedule = scheduler.plan(result, now=pd.Timestamp.now(tz="UTC") if from_now else None)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as schedule_file:
+            json.dump(schedule.to_dict(), schedule_file, indent=1)
+        summary = schedule.to_dict()
+        logger.info("Schedule written to %s (pv energy used: %.0f Wh, from the grid: %.0f Wh)", path,
+                    summary["solar_energy"], summary["grid_energy"])
+        return schedule
+    return write_schedule
+
+
+if __name__ == "__main__":
+    # Plan the loads for a result csv file: python -m pv_forecast.scheduler output/<result>.csv [start]
+    import sys, configparser
+    logging.basicConfig(level=logging.INFO)
+    config = configparser.ConfigParser()
+    config.read("configuration.ini")
+    config.set("Scheduler", "Enabled", "True")
+    result = pd.read_csv(sys.argv[1], index_col=0, parse_dates=True)
+    schedule = setup_scheduler(config).plan(result, now=sys.argv[2] if len(sys.argv) > 2 else None)
+    print(json.dumps(schedule.to_dict(), indent=1))
@@ -8,16 +8,19 @@ from datetime import time
 import pandas as pd
 import pvlib
 from pvlib.irradiance import erbs, disc, dirindex
+from pv_forecast.decomposition import decompose, MODELS
 
 class Solar_Processing:
 
-    def __init__(self, latitude: float, longitude: float, altitude: float, timezone: str) -> None:
+    def __init__(self, latitude: float, longitude: float, altitude: float, timezone: str, solar_table=None) -> None:
         self.mylatitude = latitude
         self.mylongitude = longitude
         self.myaltitude = altitude
         self.mytimezone = timezone
         self.solpos = None       # Dataframe for solar position
         self.clearsky = None     # Dataframe for clearsky conditions (no clouds present)
+        # Precomputed solar position / clearsky of this site (see solar_table.SolarTable), optional
+        self.solar_table = solar_table
 
         # Set up the pvlib location object:
         self.location = pvlib.location.Location(longitude=self.mylongitude,
@@ -30,12 +33,19 @@ class Solar_Processing:
         self.clearsky = self.get_clearsky_weather(time_range)
         self.solpos = self.get_solar_postition(time_range)
    
+    def _use_solar_table(self, time_range):
+        return self.solar_table is not None and self.solar_table.covers(time_range)
+
     def get_clearsky_weather(self, time_range):
         """ Determine clearsky irradiation conditions. """
+        if self._use_solar_table(time_range):
+            return self.solar_table.clearsky(time_range)
         return self.location.get_clearsky(time_range, model='ineichen')
 
     def get_solar_postition(self, time_range):
         """ Get the sun position within the given time range. """
+        if self._use_solar_table(time_range):
+            return self.solar_table.solar_position(time_range)
         solpos = pvlib.solarposition.get_solarposition(time = time_range,
                                                         latitude=self.mylatitude, 
                                                         longitude=self.mylongitude, 
@@ -43,7 +53,6 @@ class Solar_Processing:
         return solpos
 
     #TODO: Check meaning of max / min zenith values --> kept constant for testing purpose.
-    #TODO: use real pressure values in the considered time range for comp.
     def calc_dni_disc(self, time_range, ghi, mypressure=101325):
         """ 
         Compute the dni-value based on given ghi value within a time range using
@@ -54,9 +63,9 @@ class Solar_Processing:
 
         time_range: pandas Series - time range.
         ghi: pandas Series - with global horizontal irradiance (ghi) >> taken from DWD Forecast. [W/m2]
-
+        mypressure: pressure [Pa] (scalar or pandas Series)
         """
-        dni = disc(ghi=ghi, solar_zenith=self.solpos.zenith, datetime_or_doy=time_range)
+        dni = disc(ghi=ghi, solar_zenith=self.solpos.zenith, datetime_or_doy=time_range, pressure=mypressure)
         return dni
 
     def calc_dni_dirindex(self, time_range, ghi, mypressure=101325, dew_point=None):
@@ -90,6 +99,25 @@ class Solar_Processing:
         dhi = erbs(ghi=ghi, zenith=self.solpos.zenith, datetime_or_doy=time_range)
         return dhi
 
+    def decompose(self, time_range, ghi, pressure=None, dew_point=None, models=MODELS):
+        """
+        Compute ghi, dni and dhi of the DISC, DIRINDEX and ERBS models in one pass, sharing
+        the intermediates of the models (see decomposition.decompose). Same results as
+        calc_dni_disc, calc_dni_dirindex and calc_dhi_erbs.
+
+        Parameter:
+        ==========
+
+        time_range: pandas Series - time range.
+        ghi: pandas Series - with global horizontal irradiance (ghi) >> taken from DWD Forecast. [W/m2]
+        pressure: pandas Series of the pressure [Pa], missing values: standard pressure
+        dew_point: pandas Series of Dew Point [degC]
+
+        Returns a pandas Dataframe with the columns (model, ghi / dni / dhi).
+        """
+        return decompose(time_range, ghi, self.solpos.zenith, ghi_clearsky=self.clearsky.ghi,
+                         dni_clearsky=self.clearsky.dni, pressure=pressure, temp_dew=dew_point, models=models)
+
 if __name__ ==  "__main__":
 
     wp = Solar_Processing(51.2, 6.8, 90, 'utc')
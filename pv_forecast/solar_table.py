@@ -0,0 +1,229 @@
+"""
+Precomputed table of solar position and clearsky irradiance of one site.
+
+For a fixed site, solar position (SPA) and clearsky irradiance (Ineichen incl. the
+Linke turbidity climatology) depend on the timestamp only. The table holds these
+values on a regular time grid (default: 10 minutes for 3 years) and is stored as
+numpy file, which is memory-mapped when used. Values for arbitrary time indexes are
+interpolated linearly (exact values for timestamps on the grid).
+
+Building the table is a separate step (build_solar_table or
+"python -m pv_forecast.solar_table"). The table is identified by the site parameters,
+load_or_build rebuilds it if the site parameters (or the grid) change. A run only
+opens an existing table (setup_solar_table), time ranges not covered by it (or all,
+without table) are computed directly.
+
+"""
+import os, json, hashlib, logging, datetime
+import numpy as np
+import pandas as pd
+import pvlib
+
+logger = logging.getLogger(__name__)
+
+SOLPOS_COLUMNS = ["apparent_zenith", "zenith", "apparent_elevation", "elevation", "azimuth", "equation_of_time"]
+CLEARSKY_COLUMNS = ["ghi", "dni", "dhi"]
+COLUMNS = SOLPOS_COLUMNS + CLEARSKY_COLUMNS
+# Angles interpolated on the circle (jump 360 -> 0 deg)
+CIRCULAR_COLUMNS = ["azimuth"]
+
+DEFAULT_FREQ = "10min"
+DEFAULT_YEARS = 3
+TABLE_VERSION = 1
+
+
+def site_key(latitude: float, longitude: float, altitude: float) -> str:
+    """ Identifier of the site used as file name of the table. """
+    site = json.dumps([float(latitude), float(longitude), float(altitude)])
+    return hashlib.sha1(site.encode("utf-8")).hexdigest()[:12]
+
+
+def default_time_grid(years=DEFAULT_YEARS, today=None, freq=DEFAULT_FREQ):
+    """
+    Time grid starting at the first day of the last year covering "years" years,
+    i.e. history back-tests of the last year as well as upcoming forecasts.
+    """
+    if today is None:
+        today = datetime.date.today()
+    start = pd.Timestamp(year=today.year - 1, month=1, day=1, tz="UTC")
+    end = pd.Timestamp(year=today.year - 1 + years, month=1, day=1, tz="UTC")
+    return pd.date_range(start, end, freq=freq, inclusive="left")
+
+
+def _table_paths(directory, latitude, longitude, altitude):
+    name = "solar_table_" + site_key(latitude, longitude, altitude)
+    return os.path.join(directory, name + ".npy"), os.path.join(directory, name + ".json")
+
+
+def build_solar_table(directory, latitude: float, longitude: float, altitude: float, time_grid=None):
+    """
+    Compute solar position and clearsky irradiance of the site on the time grid and
+    store them in the directory. Returns the (memory-mapped) SolarTable.
+
+    time_grid: pandas DatetimeIndex with fixed frequency, defaults to default_time_grid().
+    """
+    if time_grid is None:
+        time_grid = default_time_grid()
+    if time_grid.freq is None:
+        raise ValueError("The time grid of the solar table needs a fixed frequency.")
+    time_grid = time_grid.tz_convert("UTC") if time_grid.tz is not None else time_grid.tz_localize("UTC")
+
+    location = pvlib.location.Location(latitude=latitude, longitude=longitude, altitude=altitude, tz="UTC")
+    solpos = pvlib.solarposition.get_solarposition(time=time_grid, latitude=latitude,
+                                                   longitude=longitude, altitude=altitude)
+    clearsky = location.get_clearsky(time_grid, model='ineichen')
+
+    os.makedirs(directory, exist_ok=True)
+    data_path, meta_path = _table_paths(directory, latitude, longitude, altitude)
+    table = np.lib.format.open_memmap(data_path + ".tmp", mode="w+", dtype=np.float64,
+                                      shape=(len(time_grid), len(COLUMNS)))
+    table[:, :len(SOLPOS_COLUMNS)] = solpos[SOLPOS_COLUMNS].to_numpy()
+    table[:, len(SOLPOS_COLUMNS):] = clearsky[CLEARSKY_COLUMNS].to_numpy()
+    table.flush()
+    del table
+    # numpy adds no extension to an existing file name: move into place when complete
+    os.replace(data_path + ".tmp", data_path)
+
+    meta = {"version": TABLE_VERSION, "latitude": latitude, "longitude": longitude, "altitude": altitude,
+            "start": time_grid[0].value, "step": pd.Timedelta(time_grid.freq).value, "periods": len(time_grid),
+            "columns": COLUMNS, "pvlib": pvlib.__version__}
+    with open(meta_path + ".tmp", "w") as meta_file:
+        json.dump(meta, meta_file)
+    os.replace(meta_path + ".tmp", meta_path)
+    logger.info("Solar table of %d rows built for site %.4f / %.4f / %.0f", len(time_grid), latitude, longitude, altitude)
+    return SolarTable(data_path, meta)
+
+
+def load_solar_table(directory, latitude: float, longitude: float, altitude: float):
+    """ Open the table of the site (memory-mapped), returns None if not available or outdated. """
+    data_path, meta_path = _table_paths(directory, latitude, longitude, altitude)
+    if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+        return None
+    with open(meta_path) as meta_file:
+        meta = json.load(meta_file)
+    if (meta.get("version") != TABLE_VERSION or meta.get("columns") != COLUMNS or meta.get("pvlib") != pvlib.__version__
+            or [meta["latitude"], meta["longitude"], meta["altitude"]] != [latitude, longitude, altitude]):
+        return None
+    return SolarTable(data_path, meta)
+
+
+def load_or_build(directory, latitude: float, longitude: float, altitude: float, time_grid=None):
+    """
+    Open the table of the site, (re-)build it if it is missing, if the site parameters
+    changed or if it does not match the requested time grid.
+    """
+    table = load_solar_table(directory, latitude, longitude, altitude)
+    if table is not None and (time_grid is None or table.matches(time_grid)):
+        return table
+    return build_solar_table(directory, latitude, longitude, altitude, time_grid)
+
+
+class SolarTable:
+    """
+    Memory-mapped table of solar position and clearsky irradiance of one site.
+
+    Parameter:
+    ==========
+
+    data_path: path of the numpy file (rows: time grid, columns: see COLUMNS)
+    meta: dict with site parameters and time grid (start [ns], step [ns], periods)
+    """
+    def __init__(self, data_path, meta) -> None:
+        self.data_path = data_path
+        self.meta = meta
+        self.latitude = meta["latitude"]
+        self.longitude = meta["longitude"]
+        self.altitude = meta["altitude"]
+        self.start = meta["start"]
+        self.step = meta["step"]
+        self.periods = meta["periods"]
+        self.data = np.load(data_path, mmap_mode="r")
+
+    @property
+    def end(self):
+        """ Last timestamp of the grid [ns since epoch] """
+        return self.start + (self.periods - 1) * self.step
+
+    def matches(self, time_grid) -> bool:
+        """ The table is set up on the given time grid """
+        return (len(time_grid) == self.periods and time_grid[0].value == self.start
+                and pd.Timedelta(time_grid.freq).value == self.step)
+
+    def covers(self, time_range) -> bool:
+        """ All timestamps of the time range are within the table """
+        if len(time_range) == 0:
+            return True
+        values = time_range.asi8
+        return values.min() >= self.start and values.max() <= self.end
+
+    def lookup(self, time_range, columns=COLUMNS):
+        """
+        Interpolate the columns of the table to the time range (pandas DatetimeIndex).
+        Returns a pandas Dataframe indexed by time_range.
+        """
+        if not self.covers(time_range):
+            raise ValueError("Time range is not covered by the solar table.")
+        position = (time_range.asi8 - self.start) / self.step
+        index_0 = np.floor(position).astype(np.int64)
+        fraction = position - index_0
+        index_1 = np.minimum(index_0 + 1, self.periods - 1)
+
+        column_index = [COLUMNS.index(column) for column in columns]
+        # Only the required rows are read from the memory-mapped file:
+        value_0 = self.data[index_0][:, column_index]
+        value_1 = self.data[index_1][:, column_index]
+        difference = value_1 - value_0
+        for number, column in enumerate(columns):
+            if column in CIRCULAR_COLUMNS:
+                difference[:, number] = (difference[:, number] + 180.) % 360. - 180.
+        values = value_0 + fraction[:, np.newaxis] * difference
+        on_grid = fraction == 0
+        values[on_grid] = value_0[on_grid]
+        for number, column in enumerate(columns):
+            if column in CIRCULAR_COLUMNS:
+                values[:, number] = values[:, number] % 360.
+        return pd.DataFrame(values, index=time_range, columns=columns)
+
+    def solar_position(self, time_range):
+        """ Solar position like pvlib.solarposition.get_solarposition """
+        return self.lookup(time_range, SOLPOS_COLUMNS)
+
+    def clearsky(self, time_range):
+        """ Clearsky irradiance like pvlib.location.Location.get_clearsky (ineichen) """
+        return self.lookup(time_range, CLEARSKY_COLUMNS)
+
+
+def setup_solar_table(config, build=False):
+    """
+    Open the solar table of the configured site, if enabled within the "SolarTable"
+    section of the configuration. Returns None otherwise or if the table is missing
+    (build: build the table if it is missing or does not match the configured grid).
+    """
+    if not config.getboolean("SolarTable", "Enabled", fallback=False):
+        return None
+    directory = config.get("SolarTable", "Directory", fallback=os.path.join("cache", "solar_table"))
+    site = dict(latitude=config.getfloat("SolarSystem", "Latitude", raw=True),
+                longitude=config.getfloat("SolarSystem", "Longitute", raw=True),
+                altitude=config.getfloat("SolarSystem", "Altitude", raw=True))
+    if not build:
+        table = load_solar_table(directory, **site)
+        if table is None:
+            logger.warning("No solar table of the site in %s (build it by \"python -m pv_forecast.solar_table\"), "
+                           "solar position and clearsky are computed directly", directory)
+        return table
+    time_grid = default_time_grid(years=config.getint("SolarTable", "Years", fallback=DEFAULT_YEARS),
+                                  freq=config.get("SolarTable", "Resolution", fallback=DEFAULT_FREQ))
+    return load_or_build(directory, time_grid=time_grid, **site)
+
+
+if __name__ == "__main__":
+    # Separate build step: python -m pv_forecast.solar_table [configuration.ini]
+    import sys, configparser
+    logging.basicConfig(level=logging.INFO)
+    config = configparser.ConfigParser()
+    config.read(sys.argv[1] if len(sys.argv) > 1 else "configuration.ini")
+    if not config.has_section("SolarTable"):
+        config.add_section("SolarTable")
+    config.set("SolarTable", "Enabled", "True")
+    table = setup_solar_table(config, build=True)
+    print("Solar table: %s (%d rows)" % (table.data_path, table.periods))
@@ -0,0 +1,524 @@
+"""
+Live telemetry of the inverter: the current values of the Kostal Plenticore are polled
+each "Interval" seconds and written in batches to a time series sink.
+
+    inverter (REST API) --poll--> ReadingBuffer (ring buffer) --batch--> sink (SQLite / InfluxDB)
+
+- The readings keep the channel names of the csv export (DC1 U, DC1 I, DC1 P, ..., AC F,
+  see kostal_reader.CHANNELS, currents in mA), so the evaluation / calibration read live and
+  exported data the same way (SQLiteSink.read equals InverterLogStore.read).
+- ReadingBuffer holds the readings in preallocated arrays (int64 times, float32 values,
+  about 84 bytes per reading); when it is full the oldest readings are dropped (counted).
+- A batch is written when "BatchSize" readings are buffered or the oldest one is older than
+  "FlushInterval". Readings leave the buffer only after a successful write. A failing write
+  is retried with increasing delay (doubled up to "MaxBackoff") while the polling goes on,
+  the buffer takes up the readings meanwhile (backpressure) and the backlog is written in
+  batches afterwards.
+- Sinks: SQLiteSink (standard library, one row per reading, one transaction per batch) or
+  InfluxSink (InfluxDB line protocol via HTTP).
+
+"python -m pv_forecast.telemetry [--simulate]" runs the ingestion ("Telemetry" section of the
+configuration.ini), with "--simulate" against a local simulated inverter (SimulatedInverter).
+See "python -m benchmark.bench_telemetry" for throughput and write amplification.
+
+"""
+import os, json, math, time, sqlite3, logging, threading, contextlib, http.server
+import numpy as np
+import pandas as pd
+
+from pv_forecast.kostal_reader import CHANNELS
+
+logger = logging.getLogger(__name__)
+
+PROCESS_DATA_PATH = "/api/v1/processdata"
+# Process data of the Plenticore REST API per channel: module, process data id, factor (A -> mA)
+PROCESS_DATA = {}
+for _number in [1, 2, 3]:
+    PROCESS_DATA.update({"DC%d U" % _number: ("devices:local:pv%d" % _number, "U", 1.),
+                         "DC%d I" % _number: ("devices:local:pv%d" % _number, "I", 1000.),
+                         "DC%d P" % _number: ("devices:local:pv%d" % _number, "P", 1.),
+                         "AC%d U" % _number: ("devices:local:ac", "L%d_U" % _number, 1.),
+                         "AC%d I" % _number: ("devices:local:ac", "L%d_I" % _number, 1000.),
+                         "AC%d P" % _number: ("devices:local:ac", "L%d_P" % _number, 1.)})
+PROCESS_DATA["AC F"] = ("devices:local:ac", "Frequency", 1.)
+
+
+def process_data_request(channels=CHANNELS):
+    """ Body of the process data request (list of modules and their process data ids) """
+    modules = {}
+    for channel in channels:
+        module, data_id, _ = PROCESS_DATA[channel]
+        modules.setdefault(module, []).append(data_id)
+    return [{"moduleid": module, "processdataids": data_ids} for module, data_ids in modules.items()]
+
+
+class PlenticoreSource:
+    """
+    Current values of a Kostal Plenticore inverter (REST API, process data).
+
+    Parameter:
+    ==========
+
+    url: address of the inverter, e.g. http://192.168.178.50
+    session: session id of a login (sent as "Authorization: Session <id>"), None: no login
+    channels: channels read (see kostal_reader.CHANNELS)
+    """
+    def __init__(self, url, session=None, channels=CHANNELS, timeout=10.) -> None:
+        import requests
+        self.url = url.rstrip("/") + PROCESS_DATA_PATH
+        self.channels = list(channels)
+        self.timeout = timeout
+        self.request = process_data_request(self.channels)
+        self.http = requests.Session()
+        if session:
+            self.http.headers["Authorization"] = "Session " + session
+
+    def read(self):
+        """ Values of the channels (float32 array, nan if not delivered) """
+        response = self.http.post(self.url, json=self.request, timeout=self.timeout)
+        response.raise_for_status()
+        values = {(module["moduleid"], data["id"]): data["value"]
+                  for module in response.json() for data in module["processdata"]}
+        result = np.full(len(self.channels), np.nan, dtype=np.float32)
+        for position, channel in enumerate(self.channels):
+            module, data_id, factor = PROCESS_DATA[channel]
+            value = values.get((module, data_id))
+            if value is not None:
+                result[position] = value * factor
+        return result
+
+
+class ReadingBuffer:
+    """
+    Ring buffer of the readings: times (epoch seconds) and values (float32) in
+    preallocated arrays. Pushing into the full buffer drops the oldest reading.
+
+    Parameter:
+    ==========
+
+    capacity: maximum number of readings
+    channel_count: number of values per reading
+    """
+    def __init__(self, capacity, channel_count) -> None:
+        self.capacity = capacity
+        self.times = np.zeros(capacity, dtype=np.int64)
+        self.values = np.full((capacity, channel_count), np.nan, dtype=np.float32)
+        self.start = 0
+        self.size = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return self.size
+
+    def push(self, time_stamp, values) -> bool:
+        """ Append a reading, returns False if the oldest reading was dropped for it """
+        dropped = self.size == self.capacity
+        if dropped:
+            self.start = (self.start + 1) % self.capacity
+            self.size -= 1
+            self.dropped += 1
+        position = (self.start + self.size) % self.capacity
+        self.times[position] = time_stamp
+        self.values[position] = values
+        self.size += 1
+        return not dropped
+
+    def oldest_time(self):
+        return int(self.times[self.start]) if self.size else None
+
+    def peek(self, count):
+        """ Copy of the oldest count readings (times, values), they stay in the buffer """
+        positions = (self.start + np.arange(min(count, self.size))) % self.capacity
+        return self.times[positions], self.values[positions]
+
+    def pop(self, count) -> None:
+        """ Remove the oldest count readings (after they were written) """
+        count = min(count, self.size)
+        self.start = (self.start + count) % self.capacity
+        self.size -= count
+
+
+def _utc(time_stamp):
+    time_stamp = pd.Timestamp(time_stamp)
+    return time_stamp.tz_localize("UTC") if time_stamp.tz is None else time_stamp
+
+
+class SQLiteSink:
+    """
+    SQLite database of the readings, one table per inverter ("inverter_<number>": time
+    [epoch seconds] as primary key, one column per channel). A batch is written in one
+    transaction, readings of the same time are replaced.
+
+    Parameter:
+    ==========
+
+    path: file of the database
+    inverter: number of the inverter (table) written
+    channels: channels (columns) stored
+    """
+    def __init__(self, path, inverter=1, channels=CHANNELS) -> None:
+        self.path = path
+        self.inverter = inverter
+        self.channels = list(channels)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._create(connection, inverter)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # One connection per call: the sink may be used by the ingestion thread and by readers
+        connection = sqlite3.connect(self.path)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _table(inverter):
+        return "inverter_%d" % inverter
+
+    def _columns(self, channels):
+        return ", ".join('"%s"' % channel for channel in channels)
+
+    def _create(self, connection, inverter):
+        connection.execute('CREATE TABLE IF NOT EXISTS %s (time INTEGER PRIMARY KEY, %s)' %
+                           (self._table(inverter), ", ".join('"%s" REAL' % channel for channel in self.channels)))
+
+    def write(self, times, values) -> None:
+        """ Write a batch of readings (times [epoch seconds], values [rows x channels]) """
+        rows = [(int(time_stamp),) + tuple(None if math.isnan(value) else value for value in row)
+                for time_stamp, row in zip(times, values.tolist())]
+        with self._connect() as connection:
+            connection.executemany("INSERT OR REPLACE INTO %s (time, %s) VALUES (%s)" %
+                                   (self._table(self.inverter), self._columns(self.channels),
+                                    ", ".join("?" * (len(self.channels) + 1))), rows)
+
+    def last_timestamp(self, inverter=1):
+        """ Time of the last stored reading (None if nothing is stored yet). """
+        with self._connect() as connection:
+            self._create(connection, inverter)
+            last = connection.execute("SELECT MAX(time) FROM %s" % self._table(inverter)).fetchone()[0]
+        return None if last is None else pd.Timestamp(last, unit="s", tz="UTC")
+
+    def read(self, start=None, end=None, inverter=1, channels=None):
+        """ Stored readings with time in [start, end), like InverterLogStore.read """
+        channels = self.channels if channels is None else list(channels)
+        where, parameters = [], []
+        if start is not None:
+            where.append("time >= ?")
+            parameters.append(_utc(start).value // 10**9)
+        if end is not None:
+            where.append("time < ?")
+            parameters.append(_utc(end).value // 10**9)
+        with self._connect() as connection:
+            self._create(connection, inverter)
+            rows = connection.execute("SELECT time, %s FROM %s%s ORDER BY time" %
+                                      (self._columns(channels), self._table(inverter),
+                                       " WHERE " + " AND ".join(where) if where else ""), parameters).fetchall()
+        data = np.array(rows, dtype=np.float64).reshape(len(rows), len(channels) + 1)
+        index = pd.DatetimeIndex(pd.to_datetime(data[:, 0].astype(np.int64), unit="s", utc=True), name="time")
+        return pd.DataFrame(data[:, 1:].astype(np.float32), index=index, columns=channels)
+
+    def size(self):
+        """ Bytes of the database on disk (including the write ahead log) """
+        return sum(os.path.getsize(path) for path in [self.path, self.path + "-wal"] if os.path.exists(path))
+
+
+def _escape(key):
+    return key.replace(",", r"\,").replace("=", r"\=").replace(" ", r"\ ")
+
+
+def line_protocol(times, values, channels, measurement="pv", tags=None):
+    """ Readings as InfluxDB line protocol (one line per reading, nan values are skipped) """
+    prefix = _escape(measurement) + "".join(",%s=%s" % (_escape(key), _escape(str(value)))
+                                            for key, value in (tags or {}).items())
+    keys = [_escape(channel) for channel in channels]
+    lines = []
+    for time_stamp, row in zip(times, values.tolist()):
+        fields = ",".join("%s=%r" % (key, value) for key, value in zip(keys, row) if not math.isnan(value))
+        if fields:
+            lines.append("%s %s %d" % (prefix, fields, int(time_stamp) * 10**9))
+    return "\n".join(lines)
+
+
+class InfluxSink:
+    """
+    InfluxDB (line protocol via HTTP), e.g. url http://localhost:8086/api/v2/write?org=home&bucket=pv
+    (token: "Authorization: Token <token>") or http://localhost:8086/write?db=pv of InfluxDB 1.x.
+    """
+    def __init__(self, url, token=None, inverter=1, channels=CHANNELS, measurement="pv", timeout=10.) -> None:
+        import requests
+        self.url = url
+        self.inverter = inverter
+        self.channels = list(channels)
+        self.measurement = measurement
+        self.timeout = timeout
+        self.bytes_written = 0
+        self.http = requests.Session()
+        if token:
+            self.http.headers["Authorization"] = "Token " + token
+
+    def write(self, times, values) -> None:
+        body = line_protocol(times, values, self.channels, self.measurement, {"inverter": self.inverter})
+        if not body:
+            return
+        body = body.encode("utf-8")
+        response = self.http.post(self.url, data=body, timeout=self.timeout)
+        response.raise_for_status()
+        self.bytes_written += len(body)
+
+
+class TelemetryIngest:
+    """
+    Polls the source and writes the readings in batches to the sink.
+
+    Parameter:
+    ==========
+
+    source: inverter (read() -> values of the channels)
+    sink: time series sink (write(times, values))
+    interval: polling interval [s]
+    batch_size: readings per write
+    flush_interval: maximum age [s] of a buffered reading before it is written
+    capacity: size of the buffer (readings)
+    backoff, max_backoff: delay [s] of the first retry of a failed write, maximum delay
+    clock: time source (epoch seconds)
+    """
+    def __init__(self, source, sink, interval=60., batch_size=60, flush_interval=600., capacity=10080,
+                 backoff=5., max_backoff=600., clock=time.time) -> None:
+        self.source = source
+        self.sink = sink
+        self.interval = interval
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self.buffer = ReadingBuffer(capacity, len(source.channels))
+        self.counters = {"polled": 0, "poll_errors": 0, "written": 0, "batches": 0, "write_errors": 0}
+        self._failures = 0
+        self._retry_at = 0.
+        self._next_poll = 0.
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def stats(self):
+        return dict(self.counters, buffered=len(self.buffer), dropped=self.buffer.dropped)
+
+    def poll(self, now=None) -> None:
+        """ Read the source once and buffer the reading """
+        now = self.clock() if now is None else now
+        try:
+            values = self.source.read()
+        except Exception as exception:
+            self.counters["poll_errors"] += 1
+            logger.warning("Polling the inverter failed: %s", exception)
+            return
+        self.counters["polled"] += 1
+        if not self.buffer.push(int(now), values):
+            logger.warning("Telemetry buffer full, oldest reading dropped (%d dropped)", self.buffer.dropped)
+
+    def flush(self, now=None, force=False) -> int:
+        """
+        Write the buffered readings in batches if a batch is full or the oldest reading is
+        due (force: all readings). Returns the number of readings written.
+        """
+        now = self.clock() if now is None else now
+        if now < self._retry_at and not force:
+            return 0
+        written = 0
+        while len(self.buffer):
+            due = force or now - self.buffer.oldest_time() >= self.flush_interval
+            if len(self.buffer) < self.batch_size and not due:
+                break
+            times, values = self.buffer.peek(self.batch_size)
+            try:
+                self.sink.write(times, values)
+            except Exception as exception:
+                # Keep the readings and retry later, the buffer takes up new readings meanwhile
+                self.counters["write_errors"] += 1
+                delay = min(self.backoff * 2 ** self._failures, self.max_backoff)
+                self._failures += 1
+                self._retry_at = now + delay
+                logger.warning("Writing %d readings failed (%s), retry in %.0f s", len(times), exception, delay)
+                break
+            self.buffer.pop(len(times))
+            self._failures = 0
+            self._retry_at = 0.
+            self.counters["written"] += len(times)
+            self.counters["batches"] += 1
+            written += len(times)
+        return written
+
+    def step(self, now=None):
+        """ Poll if the interval elapsed and write due batches. Returns the time of the next poll. """
+        now = self.clock() if now is None else now
+        if now >= self._next_poll:
+            self.poll(now)
+            # Next poll on the interval grid (no drift by the time of the poll itself)
+            self._next_poll = (math.floor(now / self.interval) + 1) * self.interval
+        self.flush(now)
+        return self._next_poll
+
+    def run_forever(self) -> None:
+        """ Poll and write until stop() is called, the remaining readings are written on stop. """
+        self._stopped.clear()
+        while not self._stopped.is_set():
+            next_poll = self.step()
+            self._stopped.wait(timeout=max(next_poll - self.clock(), 0.))
+        self.flush(force=True)
+
+    def start(self) -> threading.Thread:
+        """ Run the ingestion in a background thread. """
+        self._thread = threading.Thread(target=self.run_forever, name="TelemetryIngest", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout=None) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+def simulated_values(now, peak=4200.):
+    """ Process data of a simulated inverter at the time (epoch seconds): dict (module, id) -> value """
+    hour = (now % 86400) / 3600.
+    ac_power = peak * max(math.sin((hour - 6.) / 12. * math.pi), 0.)
+    values = {}
+    for number, share in [(1, 0.55), (2, 0.45), (3, 0.)]:
+        dc_power = ac_power * share / 0.96
+        voltage = 350. if dc_power > 0 else 0.
+        values.update({("devices:local:pv%d" % number, "U"): voltage,
+                       ("devices:local:pv%d" % number, "I"): dc_power / voltage if voltage else 0.,
+                       ("devices:local:pv%d" % number, "P"): dc_power})
+    for number in [1, 2, 3]:
+        values.update({("devices:local:ac", "L%d_U" % number): 230.,
+                       ("devices:local:ac", "L%d_I" % number): ac_power / 3 / 230.,
+                       ("devices:local:ac", "L%d_P" % number): ac_power / 3})
+    values[("devices:local:ac", "Frequency")] = 50.
+    return values
+
+
+class SimulatedInverter:
+    """
+    Local HTTP endpoint answering the process data requests like a Plenticore inverter
+    (clear sky day profile of the dc / ac values) for tests and benchmarks.
+
+    Parameter:
+    ==========
+
+    peak: ac power [W] at noon (UTC)
+    clock: time source (epoch seconds)
+    """
+    def __init__(self, host="127.0.0.1", port=0, peak=4200., clock=time.time) -> None:
+        self.peak = peak
+        self.clock = clock
+        self.requests = 0
+        self.server = http.server.ThreadingHTTPServer((host, port), SimulatedInverterHandler)
+        self.server.daemon_threads = True
+        self.server.inverter = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return "http://%s:%d" % (host, port)
+
+    def values(self, now=None):
+        """ Process data of the time: dict (module, id) -> value """
+        return simulated_values(self.clock() if now is None else now, self.peak)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="SimulatedInverter", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class SimulatedInverterHandler(http.server.BaseHTTPRequestHandler):
+    def do_POST(self):
+        if self.path != PROCESS_DATA_PATH:
+            self.send_error(404)
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        inverter = self.server.inverter
+        inverter.requests += 1
+        values = inverter.values()
+        answer = [{"moduleid": module["moduleid"],
+                   "processdata": [{"id": data_id, "unit": "", "value": values[module["moduleid"], data_id]}
+                                   for data_id in module["processdataids"]]} for module in request]
+        body = json.dumps(answer).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+def setup_telemetry_sink(config):
+    """ Sink of the "Telemetry" section: sqlite (default) or influx """
+    inverter = config.getint("Telemetry", "Inverter", fallback=1)
+    if config.get("Telemetry", "Sink", fallback="sqlite") == "influx":
+        return InfluxSink(config.get("Telemetry", "InfluxUrl"), token=config.get("Telemetry", "InfluxToken", fallback=None),
+                          inverter=inverter)
+    return SQLiteSink(config.get("Telemetry", "Database", fallback=os.path.join("results", "telemetry.db")),
+                      inverter=inverter)
+
+
+def setup_telemetry(config, url=None):
+    """ TelemetryIngest as configured in the "Telemetry" section, None if disabled. """
+    if not config.getboolean("Telemetry", "Enabled", fallback=False):
+        return None
+    source = PlenticoreSource(url or config.get("Telemetry", "Url"),
+                              session=config.get("Telemetry", "Session", fallback=None) or None)
+    return TelemetryIngest(source, setup_telemetry_sink(config),
+                           interval=config.getfloat("Telemetry", "Interval", fallback=60.),
+                           batch_size=config.getint("Telemetry", "BatchSize", fallback=60),
+                           flush_interval=config.getfloat("Telemetry", "FlushInterval", fallback=600.),
+                           capacity=config.getint("Telemetry", "Buffer", fallback=10080),
+                           max_backoff=config.getfloat("Telemetry", "MaxBackoff", fallback=600.))
+
+
+def setup_measured_store(config):
+    """
+    Store of the measured data read by the evaluation / calibration: the telemetry database
+    if the telemetry is enabled (with the SQLite sink), else the store of the exported logs.
+    """
+    if config.getboolean("Telemetry", "Enabled", fallback=False) and \
+            config.get("Telemetry", "Sink", fallback="sqlite") == "sqlite":
+        return setup_telemetry_sink(config)
+    from pv_forecast.kostal_reader import setup_inverter_log_store
+    return setup_inverter_log_store(config)
+
+
+if __name__ == "__main__":
+    # Ingestion of the live values: python -m pv_forecast.telemetry [--simulate]
+    import sys, signal, configparser
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s: %(message)s")
+    config = configparser.ConfigParser()
+    config.read("configuration.ini")
+    config.set("Telemetry", "Enabled", "True")
+    simulator = SimulatedInverter().start() if "--simulate" in sys.argv else None
+    ingest = setup_telemetry(config, url=simulator.url if simulator is not None else None)
+    signal.signal(signal.SIGTERM, lambda signum, frame: ingest.stop())
+    try:
+        ingest.run_forever()
+    except KeyboardInterrupt:
+        ingest.flush(force=True)
+    logger.info("Telemetry stopped: %s", ingest.stats())
+    if simulator is not None:
+        simulator.stop()
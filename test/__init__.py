@@ -0,0 +1,17 @@
+import os, atexit, shutil, tempfile, configparser
+
+TEST_DIR = os.path.dirname(__file__)
+
+# Component database of the tests (built once per test run, removed at exit) instead of
+# the one of the working copy
+COMPONENT_DIR = tempfile.mkdtemp(prefix="pv_forecast_test_")
+COMPONENT_DATABASE = os.path.join(COMPONENT_DIR, "components.db")
+atexit.register(shutil.rmtree, COMPONENT_DIR, ignore_errors=True)
+
+
+def read_config():
+    """ configuration.ini of the repository with the component database of the tests """
+    config = configparser.ConfigParser()
+    config.read(os.path.join(TEST_DIR, "..", "configuration.ini"))
+    config.set("Components", "Database", COMPONENT_DATABASE)
+    return config
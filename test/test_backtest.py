@@ -0,0 +1,99 @@
+import unittest, os, tempfile
+import pandas as pd
+
+from test import read_config
+from pv_forecast.dwd_async import parse_observation_zip
+from pv_forecast.reshape import reshape_observation
+from pv_forecast.calculation import setup_solar_processing, setup_pv_system, calculate_forecast
+from pv_forecast.backtest import history_chunks, frame_chunks, run_backtest, csv_writer, store_writer
+from pv_forecast.result_store import ResultStore, SOURCE_HISTORY
+from pv_forecast.dwd_history import DWD_History, PERIOD_AUTO
+
+TEST_DIR = os.path.dirname(__file__)
+
+
+class TestBacktest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.config = read_config()
+        raw_data = []
+        for tag in ["TU", "SOLAR", "wind"]:
+            with open(os.path.join(TEST_DIR, "data", "10minutenwerte_%s_01078_now.zip" % tag), "rb") as zip_file:
+                raw_data.append(parse_observation_zip(zip_file.read(), 1078))
+        raw_data = pd.concat(raw_data, ignore_index=True)
+        raw_data["parameter"] = raw_data["parameter"].astype("category")
+        self.raw_data = raw_data
+        self.dwddata = reshape_observation(raw_data)
+        self.solar_proc = setup_solar_processing(self.config)
+        self.pv_system = setup_pv_system(self.config, self.solar_proc.location)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.pv_system.close()
+        self.tmp_dir.cleanup()
+
+    def test_same_as_one_shot(self):
+        expected = calculate_forecast(self.dwddata.copy(), self.solar_proc, self.pv_system)
+
+        results = []
+        csv_path = os.path.join(self.tmp_dir.name, "backtest.csv")
+        chunks = history_chunks(lambda start, end: self.dwddata.loc[start:end], self.dwddata.index[0],
+                                self.dwddata.index[-1], chunk=pd.Timedelta(hours=5))
+        stats = run_backtest(chunks, self.solar_proc, self.pv_system, [results.append, csv_writer(csv_path)])
+        self.assertEqual(stats["chunks"], 5)
+        self.assertEqual(stats["rows"], len(self.dwddata))
+        pd.testing.assert_frame_equal(pd.concat(results), expected, check_exact=True)
+
+        expected_csv = os.path.join(self.tmp_dir.name, "expected.csv")
+        expected.to_csv(expected_csv)
+        with open(csv_path) as result_file, open(expected_csv) as expected_file:
+            self.assertEqual(result_file.read(), expected_file.read())
+
+    def test_older_periods_and_gaps(self):
+        # Each chunk requests its own time range, chunks without observations are skipped
+        requested = []
+
+        def fetcher(station_id, start, end):
+            requested.append((start, end))
+            return self.raw_data[(self.raw_data["date"] >= start) & (self.raw_data["date"] <= end)]
+
+        dwd_history = DWD_History(1078, fetcher=fetcher, period=PERIOD_AUTO)
+        start = self.dwddata.index[0] - pd.Timedelta(days=14)
+        chunks = history_chunks(dwd_history.retrieve_data, start, self.dwddata.index[-1], chunk=pd.Timedelta(days=7))
+        results = []
+        stats = run_backtest(chunks, self.solar_proc, self.pv_system, [results.append])
+        self.assertEqual(requested[0][0], start)
+        self.assertGreater(len(requested), stats["chunks"])
+        self.assertEqual(stats["rows"], len(self.dwddata))
+
+    def test_fetch_span(self):
+        # The chunks within the span are sliced from one download
+        requested = []
+
+        def fetcher(station_id, start, end):
+            requested.append((start, end))
+            return self.raw_data[(self.raw_data["date"] >= start) & (self.raw_data["date"] <= end)]
+
+        dwd_history = DWD_History(1078, fetcher=fetcher, period=PERIOD_AUTO, fetch_span=pd.Timedelta(days=28))
+        start = self.dwddata.index[0] - pd.Timedelta(days=14)
+        chunks = history_chunks(dwd_history.retrieve_data, start, self.dwddata.index[-1], chunk=pd.Timedelta(hours=6))
+        results = []
+        stats = run_backtest(chunks, self.solar_proc, self.pv_system, [results.append])
+        self.assertEqual(requested, [(start.floor("D"), start.floor("D") + pd.Timedelta(days=28) - pd.Timedelta(1, "ns"))])
+        self.assertEqual(stats["rows"], len(self.dwddata))
+        pd.testing.assert_frame_equal(pd.concat(results),
+                                      calculate_forecast(self.dwddata.copy(), self.solar_proc, self.pv_system))
+
+    def test_result_store(self):
+        store = ResultStore(os.path.join(self.tmp_dir.name, "results"))
+        issue_time = pd.Timestamp("2021-04-02 00:00", tz="UTC")
+        stats = run_backtest(frame_chunks(self.dwddata, 50), self.solar_proc, self.pv_system,
+                             [store_writer(store, "station_01078", issue_time)])
+        self.assertEqual(stats["chunks"], 3)
+        runs = store.runs("station_01078", SOURCE_HISTORY)
+        self.assertEqual(len(runs), 1)
+        stored = store.forecasts(self.dwddata.index[0], self.dwddata.index[-1] + pd.Timedelta(minutes=10),
+                                 site="station_01078", source=SOURCE_HISTORY, mode="disc")
+        self.assertEqual(len(stored), len(self.dwddata))
+
+if __name__ == '__main__':
+    unittest.main()
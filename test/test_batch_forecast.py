@@ -0,0 +1,89 @@
+import unittest, os
+import numpy as np
+import pandas as pd
+
+from test import read_config
+from pv_forecast.reshape import reshape_mosmix
+from pv_forecast.batch_forecast import BatchForecast
+from pv_forecast.component_db import setup_component_database
+from pv_forecast.calculation import setup_solar_processing, setup_pv_system, calculate_forecast, LIST_OF_MODES
+
+TEST_DIR = os.path.dirname(__file__)
+
+
+class TestBatchForecast(unittest.TestCase):
+    def setUp(self) -> None:
+        self.config = read_config()
+
+        raw_data = pd.read_pickle(os.path.join(TEST_DIR, "data", "test_dwd_forecast_data.p"))
+        raw_data.columns = raw_data.columns.str.lower()
+        self.dwddata = reshape_mosmix(raw_data)
+        self.fetched = []
+
+        get = lambda key: self.config.get("SolarSystem", key, raw=True)
+        self.latitude = float(get("Latitude"))
+        self.longitude = float(get("Longitute"))
+        self.altitude = float(get("Altitude"))
+        self.batch = BatchForecast(self.weather_source, pv_module=get("ModuleName"), inverter=get("InverterName"),
+                                   albedo=float(get("Albedo")), timezone=get("MyTimezone"), workers=2,
+                                   components=setup_component_database(self.config))
+        self.site_arrays = [("Ost", float(get("Elevation")), float(get("Azimuth_1")), int(get("NumPanels_1"))),
+                            ("West", float(get("Elevation")), float(get("Azimuth_2")), int(get("NumPanels_2")))]
+
+    def weather_source(self, station):
+        self.fetched.append(station)
+        return self.dwddata.copy()
+
+    def site_tables(self, site_ids, stations):
+        sites = pd.DataFrame({"site_id": site_ids, "latitude": self.latitude, "longitude": self.longitude,
+                              "altitude": self.altitude, "station": stations})
+        arrays = pd.DataFrame([(site_id,) + array for site_id in site_ids for array in self.site_arrays],
+                              columns=["site_id", "array_id", "surface_tilt", "surface_azimuth", "modules_per_string"])
+        return sites, arrays
+
+    def test_matches_model_chain(self):
+        sites, arrays = self.site_tables(["home"], ["P0031"])
+        result = self.batch.run(sites, arrays)
+
+        solar_proc = setup_solar_processing(self.config)
+        pv_system = setup_pv_system(self.config, solar_proc.location)
+        expected = calculate_forecast(self.dwddata.copy(), solar_proc, pv_system)
+
+        for mode in LIST_OF_MODES:
+            for array_id, column in [("Ost", "Ost_ac_"), ("West", "West_ac_"), ("ALL", "ALL_AC_POWER_")]:
+                selected = result[(result["array_id"] == array_id) & (result["mode"] == mode)].set_index("date")
+                pd.testing.assert_index_equal(selected.index, expected.index, check_names=False)
+                # The solar position of the ModelChain is slightly different (pressure / temperature
+                # of the refraction correction)
+                np.testing.assert_allclose(selected["ac_power"], expected[column + mode], rtol=1e-3, atol=0.5)
+
+    def test_shared_stations_and_locations(self):
+        site_ids = ["s%d" % i for i in range(6)]
+        sites, arrays = self.site_tables(site_ids, ["P0031", "P0031", "P0031", "10410", "10410", "10410"])
+        sites.loc[5, "latitude"] = 52.0
+        # one site with a single array only
+        arrays = arrays[~((arrays["site_id"] == "s0") & (arrays["array_id"] == "West"))]
+        result = self.batch.run(sites, arrays)
+
+        self.assertEqual(sorted(self.fetched), ["10410", "P0031"])
+        self.assertEqual(self.batch.stats["locations"], 2)
+        self.assertEqual(self.batch.stats["sites"], 6)
+        self.assertEqual(len(result), (len(arrays) + len(sites)) * len(LIST_OF_MODES) * len(self.dwddata))
+
+        per_array = result[result["array_id"] != "ALL"].groupby(["site_id", "mode", "date"])["ac_power"].sum()
+        all_arrays = result[result["array_id"] == "ALL"].set_index(["site_id", "mode", "date"])["ac_power"]
+        np.testing.assert_allclose(per_array.sort_index(), all_arrays.sort_index())
+        # Same location, same weather --> same result
+        site_1 = result[result["site_id"] == "s1"]["ac_power"].to_numpy()
+        site_4 = result[result["site_id"] == "s4"]["ac_power"].to_numpy()
+        np.testing.assert_array_equal(site_1, site_4)
+
+    def test_missing_columns(self):
+        sites, arrays = self.site_tables(["home"], ["P0031"])
+        with self.assertRaises(ValueError):
+            self.batch.run(sites.drop(columns="station"), arrays)
+        with self.assertRaises(ValueError):
+            self.batch.run(sites, arrays.drop(columns="modules_per_string"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest, os
+import numpy as np
+import pandas as pd
+
+from test import read_config
+from pv_forecast.reshape import reshape_mosmix
+from pv_forecast.calculation import setup_solar_processing, setup_pv_system, calculate_forecast, LIST_OF_MODES
+from pv_forecast.calibration import setup_parameter_sweep, parameter_grid
+
+TEST_DIR = os.path.dirname(__file__)
+
+
+class TestParameterSweep(unittest.TestCase):
+    def setUp(self) -> None:
+        self.config = read_config()
+        raw_data = pd.read_pickle(os.path.join(TEST_DIR, "data", "test_dwd_forecast_data.p"))
+        raw_data.columns = raw_data.columns.str.lower()
+        self.dwddata = reshape_mosmix(raw_data)
+        self.sweep = setup_parameter_sweep(self.config).prepare(self.dwddata)
+
+    def test_base_matches_forecast(self):
+        solar_proc = setup_solar_processing(self.config)
+        pv_system = setup_pv_system(self.config, solar_proc.location)
+        expected = calculate_forecast(self.dwddata.copy(), solar_proc, pv_system)
+
+        combinations = self.sweep.combinations({"mode": LIST_OF_MODES})
+        ac = self.sweep.simulate(combinations)
+        for index, mode in combinations["mode"].items():
+            np.testing.assert_allclose(ac[index].to_numpy(), expected["ALL_AC_POWER_" + mode].to_numpy(),
+                                       rtol=1e-3, atol=0.5)
+
+    def test_rank_finds_parameters(self):
+        truth = parameter_grid({"surface_tilt": [30], "albedo": [0.25], "aoi_model": ["physical"]},
+                               self.sweep.base)
+        measured = self.sweep.simulate(truth)[0]
+        # every 4th value missing
+        measured.iloc[::4] = np.nan
+
+        combinations = self.sweep.combinations({"surface_tilt": [20, 30, 40], "albedo": [0.15, 0.25],
+                                                "aoi_model": ["no_loss", "physical"],
+                                                "spectral_model": ["no_loss", "first_solar"]})
+        ranking = self.sweep.rank(combinations, measured)
+        self.assertEqual(len(ranking), 24)
+        best = ranking.iloc[0]
+        self.assertEqual((best.surface_tilt, best.albedo, best.aoi_model, best.spectral_model),
+                         (30, 0.25, "physical", "no_loss"))
+        self.assertAlmostEqual(best.rmse, 0.)
+        self.assertEqual(best["count"], measured.count())
+        self.assertTrue(ranking.rmse.is_monotonic_increasing)
+
+        with self.assertRaises(ValueError):
+            self.sweep.combinations({"tilt": [30]})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest, os, json, tempfile
+import pandas as pd
+import pvlib
+
+from pv_forecast.component_db import build_database, load_or_build, ComponentDatabase, DATA_DIRECTORY
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "pv_forecast", "data")
+
+
+class TestComponentDatabase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.own_directory = os.path.join(cls.tmp_dir.name, "components")
+        os.makedirs(cls.own_directory)
+        cls.path = os.path.join(cls.tmp_dir.name, "components.db")
+        build_database(cls.path, [DATA_DIRECTORY, cls.own_directory])
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.tmp_dir.cleanup()
+
+    def test_lookup_and_search(self):
+        database = ComponentDatabase(self.path)
+        modules = pvlib.pvsystem.retrieve_sam("cecmod")
+        inverters = pvlib.pvsystem.retrieve_sam("cecinverter")
+        self.assertEqual(len(database.names("inverter")), inverters.shape[1] + 1)
+        for name in [modules.columns[0], modules.columns[12345]]:
+            pd.testing.assert_series_equal(database.module(name), modules[name])
+        pd.testing.assert_series_equal(database.inverter(inverters.columns[7]), inverters[inverters.columns[7]])
+        # Only the requested records are deserialized (and kept)
+        self.assertEqual(len(database._records), 3)
+        self.assertIs(database.module(modules.columns[0]), database.module(modules.columns[0]))
+
+        # Own components of pv_forecast/data
+        pd.testing.assert_series_equal(database.module("LG_Electronics_Inc__LG355N1C_V5"),
+                                       pd.read_pickle(os.path.join(DATA_DIR, "LG355N1C_V5_Module.p")))
+        with open(os.path.join(DATA_DIR, "Kostal_Plenticore__Plus_4_2.json")) as inverter_file:
+            self.assertEqual(database.inverter("Kostal_Plenticore__Plus_4_2").to_dict(), json.load(inverter_file))
+
+        self.assertIn("LG_Electronics_Inc__LG355N1C_V5", database.search("module", "LG Electronics Inc. LG355"))
+        self.assertEqual(database.search("module", "lg electronics inc lg355n1c"), ["LG_Electronics_Inc__LG355N1C_V5"])
+        self.assertEqual(database.fuzzy("inverter", "Kostal Plentikore Plus 4.2"), ["Kostal_Plenticore__Plus_4_2"])
+        self.assertEqual(database.fuzzy("module", "LG Electronic LG355N1C-V5")[0], "LG_Electronics_Inc__LG355N1C_V5")
+        with self.assertRaisesRegex(KeyError, "LG_Electronics_Inc__LG355N1C_V5"):
+            database.module("LG355N1C")
+
+    def test_own_components_rebuild(self):
+        directories = [DATA_DIRECTORY, self.own_directory]
+        self.assertEqual(load_or_build(self.path, directories).fingerprint, ComponentDatabase(self.path).fingerprint)
+        with self.assertRaises(KeyError):
+            ComponentDatabase(self.path).inverter("My_Inverter")
+
+        # New own components: an inverter (json) and a module replacing the SAM parameters (csv)
+        parameters = {"Vac": 230.0, "Paco": 3000.0, "Pdco": 3100.0, "Vdco": 360.0, "Pso": 15.0,
+                      "C0": 0.0, "C1": 0.0, "C2": 0.0, "C3": 0.0, "Pnt": 1.0}
+        with open(os.path.join(self.own_directory, "My_Inverter.json"), "w") as inverter_file:
+            json.dump(parameters, inverter_file)
+        library = os.path.join(os.path.dirname(pvlib.__file__), "data", "sam-library-cec-modules-2019-03-05.csv")
+        with open(library) as library_file:
+            lines = [next(library_file) for _ in range(4)]
+        own_library = os.path.join(self.own_directory, "my_modules.csv")
+        with open(own_library, "w") as library_file:
+            library_file.writelines(lines[:3] + [lines[3].replace(",Mono-c-Si,", ",Multi-c-Si,")])
+        module = pvlib.pvsystem.retrieve_sam("cecmod").columns[0]
+
+        database = load_or_build(self.path, directories)
+        self.assertEqual(database.inverter("My_Inverter").to_dict(), parameters)
+        self.assertEqual(database.module(module)["Technology"], "Multi-c-Si")
+        self.assertEqual(database.module(module)["STC"], 175.0914)
+        # Unchanged sources: the database is opened without rebuild
+        modified = os.stat(self.path).st_mtime_ns
+        load_or_build(self.path, directories)
+        self.assertEqual(os.stat(self.path).st_mtime_ns, modified)
+        # Removed own components: rebuilt from the SAM libraries
+        os.remove(own_library)
+        os.remove(os.path.join(self.own_directory, "My_Inverter.json"))
+        self.assertEqual(load_or_build(self.path, directories).module(module)["Technology"], "Mono-c-Si")
+
+if __name__ == '__main__':
+    unittest.main()
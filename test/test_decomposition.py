@@ -0,0 +1,62 @@
+import unittest, os
+import numpy as np
+import pandas as pd
+from pvlib.irradiance import disc, dirindex, erbs
+
+from pv_forecast.dwd_async import parse_observation_zip
+from pv_forecast.reshape import reshape_observation
+from pv_forecast.solar_parameters import Solar_Processing
+from pv_forecast.decomposition import decompose
+
+TEST_DIR = os.path.dirname(__file__)
+
+
+class TestDecomposition(unittest.TestCase):
+    def setUp(self) -> None:
+        raw_data = []
+        for tag in ["TU", "SOLAR", "wind"]:
+            with open(os.path.join(TEST_DIR, "data", "10minutenwerte_%s_01078_now.zip" % tag), "rb") as zip_file:
+                raw_data.append(parse_observation_zip(zip_file.read(), 1078))
+        raw_data = pd.concat(raw_data, ignore_index=True)
+        raw_data["parameter"] = raw_data["parameter"].astype("category")
+        self.dwddata = reshape_observation(raw_data)
+        self.solar_proc = Solar_Processing(51.4, 6.86, 90, "UTC")
+        self.solar_proc.process_weather_data(self.dwddata.index)
+
+    def test_same_as_pvlib(self):
+        dwddata = self.dwddata
+        times, ghi, dew_point = dwddata.index, dwddata.RAD_WH.copy(), dwddata.DEW_POINT_DEGC
+        pressure = dwddata.PRESSURE_AIR_SURFACE_REDUCED.copy()
+        self.assertTrue(((pressure > 95000) & (pressure < 105000)).all())
+        # Missing values: nan results (ghi) / standard pressure
+        ghi.iloc[70:72] = np.nan
+        pressure.iloc[60:66] = np.nan
+        zenith, clearsky = self.solar_proc.solpos.zenith, self.solar_proc.clearsky
+        result = self.solar_proc.decompose(times, ghi, pressure, dew_point)
+
+        expected_disc = disc(ghi, zenith, times, pressure=pressure.fillna(101325.))
+        expected_dirindex = dirindex(ghi, clearsky.ghi, clearsky.dni, zenith, times, pressure=pressure.fillna(101325.),
+                                     temp_dew=dew_point)
+        expected_erbs = erbs(ghi, zenith, times)
+        np.testing.assert_allclose(result["disc", "dni"], expected_disc.dni, rtol=1e-9, atol=1e-9)
+        np.testing.assert_allclose(result["dirindex", "dni"], expected_dirindex, rtol=1e-9, atol=1e-9)
+        np.testing.assert_allclose(result["erbs", "dni"], expected_erbs.dni, rtol=1e-9, atol=1e-9)
+        np.testing.assert_allclose(result["erbs", "dhi"], expected_erbs.dhi, rtol=1e-9, atol=1e-9)
+        self.assertTrue(np.isnan(result["disc", "dni"].iloc[70:72]).all())
+        # Closure: ghi = dni * cos(zenith) + dhi
+        np.testing.assert_allclose(result["disc", "dhi"] + result["disc", "dni"] * np.cos(np.radians(zenith)), ghi)
+        # The pressure is used (DISC without pressure: standard pressure)
+        self.assertGreater(np.nanmax(np.abs(result["disc", "dni"] - disc(ghi, zenith, times).dni)), 0.1)
+
+    def test_models_and_single_row(self):
+        dwddata = self.dwddata.iloc[[72]]
+        result = decompose(dwddata.index, dwddata.RAD_WH, self.solar_proc.solpos.zenith.iloc[[72]],
+                           models=["erbs"])
+        self.assertEqual(result.columns.tolist(), [("erbs", "ghi"), ("erbs", "dni"), ("erbs", "dhi")])
+        expected = erbs(dwddata.RAD_WH, self.solar_proc.solpos.zenith.iloc[[72]], dwddata.index)
+        np.testing.assert_allclose(result["erbs", "dhi"], expected.dhi)
+        with self.assertRaises(ValueError):
+            decompose(dwddata.index, dwddata.RAD_WH, self.solar_proc.solpos.zenith.iloc[[72]], models=["dirint"])
+
+if __name__ == '__main__':
+    unittest.main()
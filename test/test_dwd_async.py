@@ -0,0 +1,136 @@
+import unittest, os, io, time, zipfile, asyncio, threading, http.server
+import numpy as np
+import pandas as pd
+
+from pv_forecast.reshape import reshape_mosmix
+from pv_forecast.dwd_async import (AsyncDWDClient, acquire_all, MOSMIX_L_PATH, OBSERVATION_PATH,
+                                   KIND_FORECAST, KIND_HISTORY)
+
+TEST_DIR = os.path.dirname(__file__)
+
+
+def read_file(name):
+    with open(os.path.join(TEST_DIR, "data", name), "rb") as data_file:
+        return data_file.read()
+
+
+def station_kmz(kmz, station):
+    """ Recorded MOSMIX file of P0031 renamed to another station """
+    with zipfile.ZipFile(io.BytesIO(kmz)) as archive:
+        name = archive.namelist()[0]
+        kml = archive.read(name).replace(b"P0031", station.encode())
+    content = io.BytesIO()
+    with zipfile.ZipFile(content, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(name, kml)
+    return content.getvalue()
+
+
+class StubDWDServer(http.server.ThreadingHTTPServer):
+    """ Local HTTP server serving recorded DWD files (path -> content). """
+    def __init__(self, files, delay=0.) -> None:
+        self.files = files
+        self.delay = delay
+        self.failures = {}        # path -> number of HTTP 503 responses before serving the file
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d" % self.server_address[1]
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+            failing = server.failures.get(self.path, 0)
+            if failing:
+                server.failures[self.path] = failing - 1
+        try:
+            time.sleep(server.delay)
+            content = server.files.get(self.path)
+            if failing or content is None:
+                self.send_response(503 if failing else 404)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+class TestAsyncAcquisition(unittest.TestCase):
+    def setUp(self) -> None:
+        kmz = read_file("MOSMIX_L_LATEST_P0031.kmz")
+        files = {}
+        # The recorded forecast is served for several stations:
+        for station in ["P0031", "P0032", "P0033", "P0034"]:
+            files[MOSMIX_L_PATH.format(station=station)] = station_kmz(kmz, station)
+        for directory, tag in [("air_temperature", "TU"), ("solar", "SOLAR"), ("wind", "wind")]:
+            files[OBSERVATION_PATH.format(directory=directory, period="now", tag=tag, station="01078",
+                                          suffix="now")] = read_file("10minutenwerte_%s_01078_now.zip" % tag)
+        self.server = StubDWDServer(files, delay=0.05)
+
+    def tearDown(self) -> None:
+        self.server.stop()
+
+    def test_forecast_and_history(self):
+        with AsyncDWDClient(self.server.url, max_connections=2, timeout=5, retries=2, backoff=0.01) as client:
+            acquired = acquire_all(client, ["P0031", "P0032", "P0033", "P0034"], [1078],
+                                   start=pd.Timestamp("2021-04-01 06:00", tz="utc"),
+                                   end=pd.Timestamp("2021-04-01 18:00", tz="utc"))
+        self.assertEqual(len(self.server.requests), 4 + 3)
+        self.assertEqual(self.server.max_active, 2)
+        self.assertTrue(all(station.error is None for station in acquired))
+        forecasts = {station.station_id: station for station in acquired if station.kind == KIND_FORECAST}
+        self.assertEqual(sorted(forecasts), ["P0031", "P0032", "P0033", "P0034"])
+
+        raw_data = pd.read_pickle(os.path.join(TEST_DIR, "data", "test_dwd_forecast_data.p"))
+        raw_data.columns = raw_data.columns.str.lower()
+        pd.testing.assert_frame_equal(forecasts["P0033"].data, reshape_mosmix(raw_data), check_names=False)
+        self.assertEqual(forecasts["P0031"].issue_time, pd.Timestamp("2021-03-29 09:00", tz="utc"))
+
+        history = [station for station in acquired if station.kind == KIND_HISTORY][0]
+        self.assertEqual(len(history.data), 6 * 12 + 1)
+        for column in ["TEMPERATURE_AIR_200DEGC", "DEW_POINT_DEGC", "RAD_WH", "RAD_DIFFUS", "WIND_SPEED",
+                       "PRESSURE_AIR_SURFACE_REDUCED"]:
+            self.assertIn(column, history.data.columns)
+        self.assertTrue((history.data.RAD_WH > 0).any())
+
+    def test_retry_and_failed_station(self):
+        path = MOSMIX_L_PATH.format(station="P0031")
+        self.server.failures[path] = 2
+        with AsyncDWDClient(self.server.url, max_connections=4, timeout=5, retries=2, backoff=0.01) as client:
+            async def first_arrival():
+                arrived = []
+                async for station in client.acquire(["P0031", "P9999"]):
+                    arrived.append(station)
+                return arrived
+            arrived = asyncio.run(first_arrival())
+        self.assertEqual(self.server.requests.count(path), 3)
+        # The unknown station fails at once (404, no retry) and arrives first
+        self.assertEqual([station.station_id for station in arrived], ["P9999", "P0031"])
+        self.assertIsNotNone(arrived[0].error)
+        self.assertIsNone(arrived[0].data)
+        self.assertFalse(np.isnan(arrived[1].data.RAD_WH).all())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+import unittest, os, shutil, tempfile, time
+import numpy as np
+import pandas as pd
+
+from pv_forecast.dwd_cache import DWD_Cache, KIND_MOSMIX, KIND_OBSERVATION, LAST_FETCH_MARKER, latest_mosmix_issue
+from pv_forecast.dwd_forecast import DWD_Forecast, MOSMIX_ELEMENTS
+from pv_forecast.dwd_history import DWD_History, HISTORY_PARAMETERS, HISTORY_PARAMETER_CODES, MIN_FETCH_INTERVAL
+
+TEST_DIR = os.path.dirname(__file__)
+
+
+def load_fixture():
+    """ Recorded MOSMIX data (long format) of station P0031. """
+    raw_data = pd.read_pickle(os.path.join(TEST_DIR, "data", "test_dwd_forecast_data.p"))
+    raw_data.columns = raw_data.columns.str.lower()
+    raw_data["value"] = pd.to_numeric(raw_data["value"].where(raw_data["value"].notna(), np.nan))
+    return raw_data
+
+
+def observation_frame(start, periods):
+    """ Synthetic 10 minute observations in long format. """
+    dates = pd.date_range(start, periods=periods, freq="10min", tz="utc")
+    parameters = ["temperature_air_200", "radiation_global", "radiation_sky_diffuse",
+                  "temperature_dew_point_200", "pressure_air_station_height", "wind_speed"]
+    frames = [pd.DataFrame({"station_id": "01078", "date": dates, "parameter": parameter,
+                            "value": np.arange(periods, dtype=float), "quality": 3.0})
+              for parameter in parameters]
+    raw_data = pd.concat(frames, ignore_index=True)
+    raw_data["station_id"] = raw_data["station_id"].astype("category")
+    raw_data["parameter"] = raw_data["parameter"].astype("category")
+    return raw_data
+
+
+class TestDWDCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = DWD_Cache(self.cache_dir)
+        self.fetch_count = 0
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.cache_dir)
+
+    def test_store_and_load(self):
+        raw_data = load_fixture()
+        issue = pd.Timestamp("2021-03-29 09:00", tz="utc")
+        self.assertIsNone(self.cache.load(KIND_MOSMIX, "P0031", MOSMIX_ELEMENTS, issue))
+        self.cache.store(KIND_MOSMIX, "P0031", MOSMIX_ELEMENTS, issue, raw_data)
+        self.assertEqual(self.cache.keys(KIND_MOSMIX, "P0031", MOSMIX_ELEMENTS), [issue])
+        cached = self.cache.load(KIND_MOSMIX, "P0031", MOSMIX_ELEMENTS, issue)
+        np.testing.assert_array_equal(cached["value"].values, raw_data["value"].values)
+        self.assertTrue(pd.api.types.is_categorical_dtype(cached["parameter"]))
+        # other parameter set is a different entry
+        self.assertEqual(self.cache.keys(KIND_MOSMIX, "P0031", ["TTT"]), [])
+
+    def test_forecast_uses_cache_for_current_issue(self):
+        def fetcher(station_id):
+            self.fetch_count += 1
+            return load_fixture(), latest_mosmix_issue()
+
+        dwd_fc = DWD_Forecast("P0031", cache=self.cache, fetcher=fetcher)
+        first = dwd_fc.retrieve_data()
+        second = dwd_fc.retrieve_data()
+        self.assertEqual(self.fetch_count, 1)
+        pd.testing.assert_frame_equal(first, second, check_categorical=False, check_column_type=False)
+        self.assertEqual(first.attrs["issue_time"], latest_mosmix_issue())
+        self.assertEqual(second.attrs["issue_time"], latest_mosmix_issue())
+
+    def test_forecast_offline_fallback(self):
+        issue = pd.Timestamp("2021-03-29 09:00", tz="utc")
+        self.cache.store(KIND_MOSMIX, "P0031", MOSMIX_ELEMENTS, issue, load_fixture())
+
+        def offline(station_id):
+            self.fetch_count += 1
+            raise ConnectionError("no network")
+
+        dwd_fc = DWD_Forecast("P0031", cache=self.cache, fetcher=offline)
+        data = dwd_fc.retrieve_data()
+        self.assertEqual(self.fetch_count, 1)
+        self.assertTrue("RAD_WH" in data.columns)
+        self.assertTrue(len(data) > 1)
+        self.assertEqual(data.attrs["issue_time"], issue)
+
+        dwd_fc = DWD_Forecast("P0042", cache=self.cache, fetcher=offline)
+        self.assertRaises(ConnectionError, dwd_fc.retrieve_raw_data)
+
+    def test_history_fetches_missing_days_only(self):
+        today = pd.Timestamp.now(tz="utc").floor("D")
+        start = today - pd.Timedelta(days=2)
+        history = observation_frame(start, 6 * 24 * 3)
+
+        def fetcher(station_id):
+            self.fetch_count += 1
+            return history
+
+        dwd_hist = DWD_History(1078, cache=self.cache, fetcher=fetcher)
+        raw_data = dwd_hist.retrieve_raw_data(start, today + pd.Timedelta(days=1))
+        self.assertEqual(self.fetch_count, 1)
+        self.assertEqual(len(raw_data), len(history))
+        self.assertEqual(len(self.cache.keys(KIND_OBSERVATION, 1078, HISTORY_PARAMETERS)), 3)
+
+        # past days are served from the cache
+        end = today - pd.Timedelta(minutes=10)
+        raw_data = dwd_hist.retrieve_raw_data(start, end)
+        self.assertEqual(self.fetch_count, 1)
+        self.assertEqual(raw_data["date"].max(), end)
+        data = dwd_hist.reshape_data(raw_data)
+        self.assertEqual(len(data), 6 * 24 * 2)
+
+    def test_history_current_day_within_fetch_interval(self):
+        today = pd.Timestamp.now(tz="utc").floor("D")
+        start = today - pd.Timedelta(days=1)
+        history = observation_frame(start, 6 * 24 * 2)
+
+        def fetcher(station_id):
+            self.fetch_count += 1
+            return history
+
+        dwd_hist = DWD_History(1078, cache=self.cache, fetcher=fetcher)
+        dwd_hist.retrieve_raw_data(start, today + pd.Timedelta(days=1))
+        # The current day is served from the cache until the last download is older than the interval
+        raw_data = dwd_hist.retrieve_raw_data(start, today + pd.Timedelta(days=1))
+        dwd_hist.retrieve_raw_data()
+        self.assertEqual(self.fetch_count, 1)
+        self.assertEqual(len(raw_data), len(history))
+
+        marker = os.path.join(self.cache._entry_dir(KIND_OBSERVATION, 1078, HISTORY_PARAMETER_CODES), LAST_FETCH_MARKER)
+        outdated = time.time() - MIN_FETCH_INTERVAL.total_seconds() - 60
+        os.utime(marker, (outdated, outdated))
+        dwd_hist.retrieve_raw_data(start, today + pd.Timedelta(days=1))
+        self.assertEqual(self.fetch_count, 2)
+
+    def test_eviction(self):
+        raw_data = load_fixture()
+        issues = pd.date_range("2021-03-29 03:00", periods=4, freq="6H", tz="utc")
+        for issue in issues:
+            self.cache.store(KIND_MOSMIX, "P0031", MOSMIX_ELEMENTS, issue, raw_data)
+        entry_size = self.cache.size() / 4
+
+        self.cache.max_size_mb = 2.5 * entry_size / 1024 / 1024
+        self.assertEqual(self.cache.evict(), 2)
+        self.assertEqual(self.cache.keys(KIND_MOSMIX, "P0031", MOSMIX_ELEMENTS), list(issues[2:]))
+
+        path = self.cache._entry_path(KIND_MOSMIX, "P0031", MOSMIX_ELEMENTS, issues[2])
+        old = time.time() - 10 * 86400
+        os.utime(path, (old, old))
+        self.cache.max_age_days = 5
+        self.assertEqual(self.cache.evict(), 1)
+        self.assertEqual(self.cache.keys(KIND_MOSMIX, "P0031", MOSMIX_ELEMENTS), [issues[3]])
+
+    def test_latest_mosmix_issue(self):
+        self.assertEqual(latest_mosmix_issue(pd.Timestamp("2021-04-01 12:00", tz="utc")),
+                         pd.Timestamp("2021-04-01 09:00", tz="utc"))
+        self.assertEqual(latest_mosmix_issue(pd.Timestamp("2021-04-01 04:00", tz="utc")),
+                         pd.Timestamp("2021-03-31 21:00", tz="utc"))
+
+if __name__ == '__main__':
+    unittest.main()
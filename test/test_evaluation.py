@@ -0,0 +1,69 @@
+import unittest
+import numpy as np
+import pandas as pd
+
+from pv_forecast.evaluation import measured_ac, align, evaluate, AC_POWER_CHANNELS
+
+
+def log_data(start="2021-04-01", days=3):
+    """ Inverter log (5 minutes): constant 300 W per phase from 06:00 to 18:00 UTC """
+    index = pd.date_range(start, periods=days * 24 * 12, freq="5min", tz="UTC")
+    power = np.where((index.hour >= 6) & (index.hour < 18), 300., 0.)
+    return pd.DataFrame({channel: power.astype(np.float32) for channel in AC_POWER_CHANNELS}, index=index)
+
+
+def forecasts(measured, issue_time, offsets):
+    """ Long forecast table: measured power + offset per mode for the next 48 hours """
+    issue_time = pd.Timestamp(issue_time, tz="UTC")
+    target_time = pd.date_range(issue_time + pd.Timedelta(hours=1), periods=48, freq="1h")
+    return pd.concat([pd.DataFrame({"issue_time": issue_time, "target_time": target_time, "mode": mode,
+                                    "ac": measured.reindex(target_time).to_numpy() + offset})
+                      for mode, offset in offsets.items()], ignore_index=True)
+
+
+class TestEvaluation(unittest.TestCase):
+    def setUp(self) -> None:
+        self.measured = measured_ac(log_data())
+
+    def test_measured_ac(self):
+        # The value at t is the mean of [t, t + 1h) like the forecast
+        self.assertEqual(self.measured["2021-04-01 06:00"], 900.)
+        self.assertEqual(self.measured["2021-04-01 17:00"], 900.)
+        self.assertEqual(self.measured["2021-04-01 05:00"], 0.)
+        self.assertEqual(self.measured["2021-04-01 18:00"], 0.)
+        # Right labelled: interval (05:00, 06:00] contains the first value of 06:00 only
+        right = measured_ac(log_data(), label="right")
+        self.assertAlmostEqual(right["2021-04-01 06:00"], 900. / 12)
+
+    def test_metrics(self):
+        data = pd.concat([forecasts(self.measured, "2021-04-01 00:00", {"clearsky": 200., "disc": -50., "dirint": 100.}),
+                          forecasts(self.measured, "2021-04-01 12:00", {"clearsky": 200., "disc": 50.})],
+                         ignore_index=True)
+        aligned = align(data, self.measured)
+        self.assertEqual(len(aligned), len(data))
+        np.testing.assert_allclose(aligned["reference_error"], 200.)
+
+        evaluation = evaluate(data, self.measured)
+        by_mode = evaluation["mode"]
+        self.assertEqual(by_mode.loc["disc", "count"], 96)
+        self.assertAlmostEqual(by_mode.loc["disc", "bias"], 0.)
+        self.assertAlmostEqual(by_mode.loc["disc", "mae"], 50.)
+        self.assertAlmostEqual(by_mode.loc["dirint", "rmse"], 100.)
+        self.assertAlmostEqual(by_mode.loc["disc", "skill"], 1. - 50.**2 / 200.**2)
+        self.assertAlmostEqual(by_mode.loc["clearsky", "skill"], 0.)
+
+        by_lead_time = evaluation["lead_time"]
+        self.assertEqual(by_lead_time.loc[("disc", 1.), "count"], 2)
+        self.assertEqual(by_lead_time.loc[("dirint", 1.), "count"], 1)
+        self.assertAlmostEqual(evaluation["issue_time"].loc[("disc", pd.Timestamp("2021-04-01 12:00", tz="UTC")),
+                                                           "bias"], 50.)
+
+        # Complete days only: 2021-04-02 of both runs, energy error 24 h * 50 W
+        energy = evaluation["daily_energy"].loc["disc"]
+        self.assertEqual(len(energy), 2)
+        np.testing.assert_allclose(energy["measured"], 12 * 0.9)
+        np.testing.assert_allclose(np.abs(energy["error"]), 24 * 0.05)
+        self.assertAlmostEqual(evaluation["daily_energy_error"].loc["disc", "mae"], 1.2)
+
+if __name__ == '__main__':
+    unittest.main()
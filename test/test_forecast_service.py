@@ -0,0 +1,99 @@
+import unittest, os, tempfile, threading
+import pandas as pd
+
+from test import read_config
+from pv_forecast.reshape import reshape_mosmix
+from pv_forecast.forecast_service import ForecastService, setup_weather_source
+
+TEST_DIR = os.path.dirname(__file__)
+
+
+class TestForecastService(unittest.TestCase):
+    def setUp(self) -> None:
+        self.config = read_config()
+
+        raw_data = pd.read_pickle(os.path.join(TEST_DIR, "data", "test_dwd_forecast_data.p"))
+        raw_data.columns = raw_data.columns.str.lower()
+        self.dwddata = reshape_mosmix(raw_data)
+        self.fetch_count = 0
+
+    def weather_source(self):
+        self.fetch_count += 1
+        return self.dwddata.copy()
+
+    def test_models_are_kept_between_refreshs(self):
+        service = ForecastService(self.config, weather_source=self.weather_source)
+        model_chains = dict(service.pv_system.model_chain)
+
+        published = []
+        service.subscribe(published.append)
+        first = service.refresh()
+        second = service.refresh()
+
+        self.assertEqual(self.fetch_count, 2)
+        self.assertEqual(len(published), 2)
+        self.assertIs(service.latest, second)
+        pd.testing.assert_frame_equal(first, second)
+        self.assertTrue("ALL_AC_POWER_disc" in second.columns)
+        # Model chains are set up once only
+        for id, model_chain in service.pv_system.model_chain.items():
+            self.assertIs(model_chain, model_chains[id])
+
+    def test_subscriber_reads_latest(self):
+        # Subscribers run after the result is set and may read it without a deadlock
+        service = ForecastService(self.config, weather_source=self.weather_source)
+        seen = []
+        service.subscribe(lambda result: seen.append((service.latest is result, service.latest_time)))
+        thread = threading.Thread(target=service.refresh, daemon=True)
+        thread.start()
+        thread.join(timeout=60)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(seen), 1)
+        self.assertTrue(seen[0][0])
+        self.assertIsNotNone(seen[0][1])
+
+    def test_weather_from_file(self):
+        # The output of a previous run is read without its calculated columns
+        service = ForecastService(self.config, weather_source=self.weather_source)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "result.csv")
+            service.refresh().to_csv(path)
+            self.config.set("DWD", "Mode", "from_file")
+            self.config.set("DWD", "File", path)
+            dwddata = setup_weather_source(self.config)()
+        self.assertEqual(list(dwddata.columns), list(self.dwddata.columns))
+        self.assertEqual(len(dwddata), len(self.dwddata))
+        self.assertEqual(str(dwddata.index.tz), "UTC")
+
+    def test_latency_report(self):
+        service = ForecastService(self.config, weather_source=self.weather_source)
+        self.assertIsNone(service.latest)
+        service.refresh()
+        stats = service.stats()
+        self.assertTrue(stats["startup_seconds"] > 0)
+        self.assertEqual(stats["refresh_count"], 1)
+        for key in ["fetch_seconds", "calculate_seconds", "publish_seconds", "total_seconds"]:
+            self.assertTrue(key in stats["last_refresh"])
+
+    def test_background_refresh_on_demand(self):
+        self.config.set("Service", "RefreshInterval", "1000")
+        service = ForecastService(self.config, weather_source=self.weather_source)
+        refreshed = []
+        service.subscribe(refreshed.append)
+        service.start()
+        try:
+            for _ in range(200):
+                if len(refreshed) >= 1:
+                    break
+                service._stopped.wait(0.05)
+            service.request_refresh()
+            for _ in range(200):
+                if len(refreshed) >= 2:
+                    break
+                service._stopped.wait(0.05)
+        finally:
+            service.stop(timeout=10)
+        self.assertTrue(len(refreshed) >= 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest, os, tempfile
+import pandas as pd
+
+from test import read_config
+from pv_forecast.reshape import reshape_mosmix
+from pv_forecast.calculation import setup_solar_processing, setup_pv_system, calculate_forecast
+from pv_forecast.incremental import IncrementalForecast, setup_key
+from pv_forecast.forecast_service import ForecastService
+
+TEST_DIR = os.path.dirname(__file__)
+
+
+class TestIncrementalForecast(unittest.TestCase):
+    def setUp(self) -> None:
+        self.config = read_config()
+        raw_data = pd.read_pickle(os.path.join(TEST_DIR, "data", "test_dwd_forecast_data.p"))
+        raw_data.columns = raw_data.columns.str.lower()
+        self.dwddata = reshape_mosmix(raw_data)
+        self.solar_proc = setup_solar_processing(self.config)
+        self.pv_system = setup_pv_system(self.config, self.solar_proc.location)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def assert_full_recompute(self, incremental, dwddata):
+        expected = calculate_forecast(dwddata.copy(), self.solar_proc, self.pv_system)
+        original = dwddata.copy()
+        result = incremental.calculate(dwddata)
+        pd.testing.assert_frame_equal(result, expected, check_exact=True)
+        pd.testing.assert_frame_equal(dwddata, original)
+        return incremental.last_run
+
+    def test_identical_to_full_recompute(self):
+        incremental = IncrementalForecast(self.solar_proc, self.pv_system)
+        self.assertEqual(self.assert_full_recompute(incremental, self.dwddata.iloc[:48])["reused_rows"], 0)
+
+        # Next issue: window shifted by 6 hours
+        shifted = self.dwddata.iloc[6:54]
+        run = self.assert_full_recompute(incremental, shifted)
+        # new rows, the new first row and the previous last row (neighbours changed)
+        self.assertEqual(run["recomputed_rows"], 6 + 2)
+        self.assertEqual(run["reused_rows"], 40)
+
+        # Changed values of single hours: the neighbours are recomputed as well (DIRINDEX)
+        changed = shifted.copy()
+        changed.iloc[20, changed.columns.get_loc("RAD_WH")] += 50.
+        changed.iloc[30, changed.columns.get_loc("DEW_POINT_DEGC")] -= 1.
+        run = self.assert_full_recompute(incremental, changed)
+        self.assertEqual(run["recomputed_rows"], 6)
+        self.assertAlmostEqual(run["reused_fraction"], 42 / 48)
+
+        run = self.assert_full_recompute(incremental, changed)
+        self.assertEqual(run["reused_fraction"], 1.)
+        self.assertEqual(run["calculated_rows"], 0)
+
+    def test_cache_file(self):
+        cache_path = os.path.join(self.tmp_dir.name, "incremental.p")
+        key = setup_key(self.config)
+        IncrementalForecast(self.solar_proc, self.pv_system, cache_path, key).calculate(self.dwddata.iloc[:48])
+
+        incremental = IncrementalForecast(self.solar_proc, self.pv_system, cache_path, key)
+        self.assertEqual(self.assert_full_recompute(incremental, self.dwddata.iloc[:48])["reused_fraction"], 1.)
+        # Other configuration: the cache is not used
+        self.config.set("SolarSystem", "Albedo", "0.3")
+        other = IncrementalForecast(self.solar_proc, self.pv_system, cache_path, setup_key(self.config))
+        self.assertFalse(other.reusable_rows(self.dwddata.iloc[:48]).any())
+
+    def test_service(self):
+        self.config.set("Calculation", "Incremental", "True")
+        self.config.set("Calculation", "IncrementalCache", "")
+        service = ForecastService(self.config, weather_source=lambda: self.dwddata.copy())
+        first = service.refresh()
+        second = service.refresh()
+        pd.testing.assert_frame_equal(first, second)
+        self.assertEqual(service.stats()["last_refresh"]["reused_fraction"], 1.)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest, os, json, tempfile, configparser
+import numpy as np
+import pandas as pd
+
+from test import read_config
+from pv_forecast.reshape import reshape_mosmix
+from pv_forecast.calculation import setup_solar_processing, setup_pv_system, calculate_forecast
+from pv_forecast.instrumentation import Instrumentation, activate, active, stage, setup_instrumentation
+
+TEST_DIR = os.path.dirname(__file__)
+
+
+class TestInstrumentation(unittest.TestCase):
+    def test_nested_stages(self):
+        instrumentation = Instrumentation(trace_memory=True)
+        with activate(instrumentation):
+            self.assertIs(active(), instrumentation)
+            with stage("outer"):
+                for _ in range(3):
+                    with stage("inner"):
+                        data = np.ones(2**20)   # 8 MB
+                        del data
+        self.assertIsNone(active())
+
+        stages = {record["stage"]: record for record in instrumentation.report()["stages"]}
+        self.assertEqual(list(stages), ["outer", "outer/inner"])
+        self.assertEqual(stages["outer/inner"]["calls"], 3)
+        self.assertTrue(stages["outer"]["wall_seconds"] >= stages["outer/inner"]["wall_seconds"])
+        for record in stages.values():
+            self.assertTrue(7.5 < record["peak_memory_mb"] < 12)
+
+    def test_inactive(self):
+        with stage("nothing"):
+            pass
+        config = configparser.ConfigParser()
+        self.assertIsNone(setup_instrumentation(config))
+        self.assertIsNotNone(setup_instrumentation(config, enabled=True))
+
+    def test_calculation_report(self):
+        config = read_config()
+        raw_data = pd.read_pickle(os.path.join(TEST_DIR, "data", "test_dwd_forecast_data.p"))
+        raw_data.columns = raw_data.columns.str.lower()
+        solar_proc = setup_solar_processing(config)
+        pv_system = setup_pv_system(config, solar_proc.location)
+
+        instrumentation = Instrumentation(trace_memory=False)
+        with activate(instrumentation):
+            with stage("calculate"):
+                calculate_forecast(reshape_mosmix(raw_data), solar_proc, pv_system)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "report.jsonl")
+            instrumentation.write_report(path)
+            instrumentation.write_report(path)
+            with open(path) as report_file:
+                reports = [json.loads(line) for line in report_file]
+        self.assertEqual(len(reports), 2)
+        stages = {record["stage"]: record for record in reports[0]["stages"]}
+        for name in ["calculate/process_weather_data", "calculate/decompose/disc", "calculate/decompose/dirindex",
+                     "calculate/decompose/erbs", "calculate/run_model/disc/Ost", "calculate/run_model/dirint/West"]:
+            self.assertEqual(stages[name]["calls"], 1)
+        self.assertEqual(stages["calculate/combine_data"]["calls"], 3)
+        self.assertIsNone(stages["calculate"]["peak_memory_mb"])
+
+if __name__ == '__main__':
+    unittest.main()
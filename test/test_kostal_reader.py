@@ -0,0 +1,63 @@
+import unittest, os, tempfile
+import numpy as np
+import pandas as pd
+
+from pv_forecast.kostal_reader import read_header, read_log, iter_log_chunks, InverterLogStore, CHANNELS
+
+PV_DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "pv_data")
+LOG_FILE = os.path.join(PV_DATA_DIR, "2021_04_01.csv")
+
+
+class TestKostalReader(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_header(self):
+        header = read_header(LOG_FILE)
+        self.assertEqual(header["inverter"], 1)
+        self.assertEqual(header["export_time"], pd.Timestamp(1617298898, unit="s", tz="UTC"))
+        self.assertEqual(len(header["columns"]), 56)
+
+    def test_read_log(self):
+        data = read_log(LOG_FILE)
+        expected = pd.read_csv(LOG_FILE, sep="\t", skiprows=6).dropna(subset=CHANNELS, how="all")
+        self.assertEqual(list(data.columns), CHANNELS)
+        self.assertTrue((data.dtypes == np.float32).all())
+        self.assertEqual(data.index[0], pd.Timestamp(1616626801, unit="s", tz="UTC"))
+        np.testing.assert_array_equal(data.to_numpy(), expected[CHANNELS].to_numpy(np.float32))
+        chunks = list(iter_log_chunks(LOG_FILE, ["AC1 P"], chunksize=500))
+        self.assertTrue(len(chunks) > 1)
+        pd.testing.assert_series_equal(pd.concat(chunks)["AC1 P"], data["AC1 P"])
+        # Binary search of the first new row
+        after = data.index[1000]
+        pd.testing.assert_frame_equal(read_log(LOG_FILE, after=after), data[data.index > after])
+        self.assertEqual(len(read_log(LOG_FILE, after=data.index[-1])), 0)
+
+    def test_incremental_ingest(self):
+        # Growing export: the first part of the file is ingested, then the whole file
+        with open(LOG_FILE, "rb") as log_file:
+            lines = log_file.readlines()
+        growing_file = os.path.join(self.tmp_dir.name, "log.csv")
+        with open(growing_file, "wb") as log_file:
+            log_file.writelines(lines[:1000])
+
+        store = InverterLogStore(os.path.join(self.tmp_dir.name, "pv_data.h5"))
+        first = store.ingest(growing_file)
+        with open(growing_file, "wb") as log_file:
+            log_file.writelines(lines)
+        second = store.ingest(growing_file)
+        self.assertEqual(store.ingest(growing_file), 0)
+
+        data = read_log(LOG_FILE)
+        self.assertEqual(first + second, len(data))
+        pd.testing.assert_frame_equal(store.read(), data, check_freq=False)
+        self.assertEqual(store.last_timestamp(), data.index[-1])
+        day = store.read("2021-03-30", "2021-03-31", channels=["AC1 P"])
+        self.assertEqual(list(day.columns), ["AC1 P"])
+        self.assertTrue(((day.index >= "2021-03-30") & (day.index < "2021-03-31")).all())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest, os
+import pandas as pd
+
+from test import read_config
+from pv_forecast.reshape import reshape_mosmix
+from pv_forecast.calculation import setup_solar_processing, setup_pv_system, calculate_forecast
+
+TEST_DIR = os.path.dirname(__file__)
+
+
+class TestParallelCalculation(unittest.TestCase):
+    def setUp(self) -> None:
+        self.config = read_config()
+
+        raw_data = pd.read_pickle(os.path.join(TEST_DIR, "data", "test_dwd_forecast_data.p"))
+        raw_data.columns = raw_data.columns.str.lower()
+        self.dwddata = reshape_mosmix(raw_data)
+
+    def calculate(self, workers, executor="process", runs=1):
+        self.config.set("Calculation", "Workers", str(workers))
+        self.config.set("Calculation", "Executor", executor)
+        solar_proc = setup_solar_processing(self.config)
+        pv_system = setup_pv_system(self.config, solar_proc.location)
+        try:
+            return [calculate_forecast(self.dwddata.copy(), solar_proc, pv_system) for _ in range(runs)]
+        finally:
+            pv_system.close()
+
+    def test_identical_to_serial(self):
+        serial = self.calculate(workers=1)[0]
+        for executor in ["process", "thread"]:
+            # second run re-uses the pool and the model chains set up within the workers
+            for parallel in self.calculate(workers=2, executor=executor, runs=2):
+                pd.testing.assert_frame_equal(parallel, serial)
+
+    def test_run_model_keeps_results(self):
+        self.config.set("Calculation", "Workers", "2")
+        self.config.set("Calculation", "Executor", "thread")
+        solar_proc = setup_solar_processing(self.config)
+        solar_proc.process_weather_data(self.dwddata.index)
+        pv_system = setup_pv_system(self.config, solar_proc.location)
+        weather_data = pv_system.setup_weather_data(ghi=solar_proc.clearsky.ghi, dhi=solar_proc.clearsky.dhi,
+                                                    dni=solar_proc.clearsky.dni,
+                                                    temp_air=self.dwddata.TEMPERATURE_AIR_200DEGC,
+                                                    wind_speed=self.dwddata.WIND_SPEED)
+        try:
+            pv_system.run_model(weather_data)
+        finally:
+            pv_system.close()
+        self.assertEqual(sorted(pv_system.results), ["Ost", "West"])
+        self.assertTrue("ALL_AC_POWER_clearsky" in pv_system.combine_data("clearsky").columns)
+
+if __name__ == '__main__':
+    unittest.main()
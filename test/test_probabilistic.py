@@ -0,0 +1,71 @@
+import unittest, os, tempfile
+import numpy as np
+import pandas as pd
+
+from test import read_config
+from pv_forecast.reshape import reshape_mosmix
+from pv_forecast.calculation import setup_solar_processing, setup_pv_system, calculate_forecast
+from pv_forecast.probabilistic import (ProbabilisticForecast, ErrorStatistics, error_statistics,
+                                       CLOUD_COVER_BINS, RELATIVE_IRRADIANCE_BINS)
+
+TEST_DIR = os.path.dirname(__file__)
+
+
+class TestProbabilisticForecast(unittest.TestCase):
+    def setUp(self) -> None:
+        self.config = read_config()
+        self.config.set("Calculation", "Engine", "stacked")
+        raw_data = pd.read_pickle(os.path.join(TEST_DIR, "data", "test_dwd_forecast_data.p"))
+        raw_data.columns = raw_data.columns.str.lower()
+        self.dwddata = reshape_mosmix(raw_data)
+        self.solar_proc = setup_solar_processing(self.config)
+        self.pv_system = setup_pv_system(self.config, self.solar_proc.location)
+
+    def tearDown(self) -> None:
+        self.pv_system.close()
+
+    def test_without_errors(self):
+        # Without forecast errors, all scenarios equal the deterministic forecast
+        expected = calculate_forecast(self.dwddata.copy(), self.solar_proc, self.pv_system)
+        shape = (len(CLOUD_COVER_BINS), len(RELATIVE_IRRADIANCE_BINS))
+        statistics = ErrorStatistics(std=np.zeros(shape), temp_std=0.)
+        for mode in ["disc", "dirint"]:
+            power, energy = ProbabilisticForecast(self.solar_proc, self.pv_system, statistics, scenarios=4,
+                                                  mode=mode).calculate(self.dwddata)
+            for q in [10, 50, 90]:
+                np.testing.assert_allclose(power["ALL_AC_POWER_P%d_%s" % (q, mode)],
+                                           expected["ALL_AC_POWER_" + mode], rtol=1e-9, atol=1e-9)
+            daily = expected["ALL_AC_POWER_" + mode].groupby(
+                expected.index.tz_convert(self.solar_proc.location.tz).date).sum() / 1000.
+            np.testing.assert_allclose(energy["ALL_AC_ENERGY_P50_" + mode], daily.to_numpy())
+        self.assertEqual(energy["HOURS"].sum(), len(self.dwddata))
+
+    def test_scenarios_and_calibration(self):
+        forecast = ProbabilisticForecast(self.solar_proc, self.pv_system, scenarios=200, seed=1)
+        power, energy = forecast.calculate(self.dwddata)
+        self.assertTrue((power.iloc[:, 0] <= power.iloc[:, 1]).all() and (power.iloc[:, 1] <= power.iloc[:, 2]).all())
+        self.assertGreater((power.iloc[:, 2] - power.iloc[:, 0]).max(), 500.)
+        # Same seed, same scenarios
+        pd.testing.assert_frame_equal(forecast.calculate(self.dwddata)[1], energy)
+
+        # Calibration: observations with a known error of the clear-sky index (clear sky, no cloud cover)
+        clearsky = self.solar_proc.clearsky.ghi
+        index = self.dwddata.index
+        rng = np.random.default_rng(0)
+        clear = pd.DataFrame({"RAD_WH": 0.7 * clearsky, "CLOUD_COVER_TOTAL": 5.,
+                              "PROBABILITY_RADIATION_GLOBAL_LAST_1H": 70., "TEMPERATURE_AIR_200DEGC": 10.}, index=index)
+        observed = pd.DataFrame({"RAD_WH": (0.75 + 0.05 * rng.standard_normal(len(index))) * clearsky,
+                                 "TEMPERATURE_AIR_200DEGC": 10. + rng.standard_normal(len(index))}, index=index)
+        statistics = error_statistics(clear, observed, clearsky)
+        self.assertAlmostEqual(statistics.bias[0, 3], 0.05, delta=0.015)
+        self.assertAlmostEqual(statistics.std[0, 3], 0.05, delta=0.015)
+        self.assertAlmostEqual(statistics.temp_std, 1., delta=0.15)
+        # Classes without samples keep the defaults
+        self.assertEqual(statistics.std[2, 2], ErrorStatistics().std[2, 2])
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            statistics.save(os.path.join(tmp_dir, "error_statistics.json"))
+            loaded = ErrorStatistics.load(os.path.join(tmp_dir, "error_statistics.json"))
+        np.testing.assert_array_equal(loaded.std, statistics.std)
+
+if __name__ == '__main__':
+    unittest.main()
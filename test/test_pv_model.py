@@ -0,0 +1,105 @@
+import unittest, os
+import numpy as np
+import pandas as pd
+
+from test import read_config
+from pv_forecast.reshape import reshape_mosmix
+from pv_forecast.calculation import setup_solar_processing, setup_pv_system, calculate_forecast
+from pv_forecast.pv_model import SolarGeometry, evaluate_array, evaluate_arrays
+from pv_forecast.pv_system import TEMP_MOD_PARA, build_model_chain
+from pvlib.temperature import TEMPERATURE_MODEL_PARAMETERS
+
+TEST_DIR = os.path.dirname(__file__)
+
+
+class TestPVModel(unittest.TestCase):
+    def setUp(self) -> None:
+        self.config = read_config()
+
+        raw_data = pd.read_pickle(os.path.join(TEST_DIR, "data", "test_dwd_forecast_data.p"))
+        raw_data.columns = raw_data.columns.str.lower()
+        self.dwddata = reshape_mosmix(raw_data)
+
+        self.solar_proc = setup_solar_processing(self.config)
+        self.solar_proc.process_weather_data(self.dwddata.index)
+        self.geometry = SolarGeometry(self.solar_proc.solpos)
+        self.pv_system = setup_pv_system(self.config, self.solar_proc.location)
+        self.inputs = (self.solar_proc.clearsky.ghi, self.solar_proc.clearsky.dni, self.solar_proc.clearsky.dhi,
+                       self.dwddata.TEMPERATURE_AIR_200DEGC, self.dwddata.WIND_SPEED)
+
+    def evaluate(self, surface_tilt, surface_azimuth, modules_per_string, **kwargs):
+        return evaluate_arrays(self.geometry, *self.inputs, surface_tilt, surface_azimuth, modules_per_string,
+                               self.pv_system.pv_module, self.pv_system.inverter, self.pv_system.albedo,
+                               TEMP_MOD_PARA, **kwargs)
+
+    def test_stacked_arrays_match_single_arrays(self):
+        surface_tilt = [40, 40, 10, 30]
+        surface_azimuth = [101, 281, 180, 135]
+        modules_per_string = [7, 8, 10, 5]
+        stacked = self.evaluate(surface_tilt, surface_azimuth, modules_per_string)
+        self.assertEqual(stacked["ac"].shape, (len(self.dwddata), 4))
+        for index in range(4):
+            single = evaluate_array(self.geometry, *self.inputs, surface_tilt[index], surface_azimuth[index],
+                                    modules_per_string[index], self.pv_system.pv_module, self.pv_system.inverter,
+                                    self.pv_system.albedo, TEMP_MOD_PARA)
+            np.testing.assert_allclose(stacked["ac"][:, index], single["ac"], rtol=1e-12)
+            np.testing.assert_allclose(stacked["dc"]["p_mp"][:, index], single["dc"]["p_mp"], rtol=1e-12)
+            np.testing.assert_allclose(stacked["total_irrad"]["poa_global"][:, index],
+                                       single["total_irrad"]["poa_global"], rtol=1e-12)
+
+    def test_aoi_model_and_parameters_per_array(self):
+        # ModelChain with physical aoi losses as reference
+        parameters = dict(self.pv_system.system_parameters["Ost"])
+        model_chain = build_model_chain(parameters, self.pv_system._location_parameters())
+        model_chain.aoi_model = "physical"
+        ghi, dni, dhi, temp_air, wind_speed = self.inputs
+        model_chain.run_model(self.pv_system.setup_weather_data(ghi=ghi, dni=dni, dhi=dhi, temp_air=temp_air,
+                                                                wind_speed=wind_speed))
+        polymer = TEMPERATURE_MODEL_PARAMETERS["sapm"]["open_rack_glass_polymer"]
+        temperature_parameters = {key: np.array([TEMP_MOD_PARA[key], polymer[key]]) for key in ["a", "b", "deltaT"]}
+        result = evaluate_arrays(self.geometry, *self.inputs, [40, 40], [101, 101], [7, 7],
+                                 self.pv_system.pv_module, self.pv_system.inverter, [self.pv_system.albedo, 0.3],
+                                 temperature_parameters, aoi_model=["physical", "no_loss"])
+        np.testing.assert_allclose(result["ac"][:, 0], model_chain.ac, rtol=1e-3, atol=0.5)
+        # Second array: no aoi losses, more ground reflection, other temperature model
+        no_loss = self.evaluate([40], [101], [7])
+        self.assertTrue(np.all(result["effective_irradiance"][:, 1] >= no_loss["effective_irradiance"][:, 0]))
+        self.assertTrue(np.all(result["effective_irradiance"][:, 0] <= no_loss["effective_irradiance"][:, 0]))
+        self.assertFalse(np.allclose(result["cell_temperature"][:, 1], no_loss["cell_temperature"][:, 0]))
+
+    def test_shared_inverter(self):
+        separate = self.evaluate([40, 40], [101, 281], [7, 8])
+        shared = self.evaluate([40, 40], [101, 281], [7, 8], inverter_groups=[0, 0])
+        np.testing.assert_array_equal(shared["dc"]["p_mp"], separate["dc"]["p_mp"])
+        # ac of the arrays sums up to the ac of the inverter
+        np.testing.assert_allclose(shared["ac"].sum(axis=1), shared["inverter_ac"][:, 0])
+        # one inverter: night tare losses and self consumption only once
+        night = separate["dc"]["p_mp"].sum(axis=1) == 0
+        np.testing.assert_allclose(shared["inverter_ac"][night, 0], -abs(self.pv_system.inverter["Pnt"]))
+        day = separate["dc"]["p_mp"].sum(axis=1) > 500
+        self.assertTrue(np.all(shared["inverter_ac"][day, 0] > separate["ac"][day].sum(axis=1)))
+        self.assertTrue(np.all(shared["inverter_ac"][:, 0] <= self.pv_system.inverter["Paco"]))
+
+    def test_stacked_engine(self):
+        expected = calculate_forecast(self.dwddata.copy(), self.solar_proc, self.pv_system)
+        self.config.set("Calculation", "Engine", "stacked")
+        pv_system = setup_pv_system(self.config, self.solar_proc.location)
+        result = calculate_forecast(self.dwddata.copy(), self.solar_proc, pv_system)
+        self.assertEqual(list(result.columns), list(expected.columns))
+        # The solar position of the ModelChain is slightly different (pressure / temperature
+        # of the refraction correction)
+        for mode in ["clearsky", "disc", "dirint"]:
+            np.testing.assert_allclose(result["ALL_AC_POWER_" + mode], expected["ALL_AC_POWER_" + mode],
+                                       rtol=1e-3, atol=0.5)
+
+        self.config.set("Calculation", "SharedInverter", "True")
+        pv_system = setup_pv_system(self.config, self.solar_proc.location)
+        result = calculate_forecast(self.dwddata.copy(), self.solar_proc, pv_system)
+        np.testing.assert_allclose(result["ALL_AC_POWER_clearsky"], result["Ost_ac_clearsky"] + result["West_ac_clearsky"])
+
+        self.config.set("Calculation", "Engine", "modelchain")
+        with self.assertRaises(ValueError):
+            setup_pv_system(self.config, self.solar_proc.location)
+
+if __name__ == '__main__':
+    unittest.main()
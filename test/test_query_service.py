@@ -0,0 +1,112 @@
+import unittest, json, urllib.request, urllib.error
+import numpy as np
+import pandas as pd
+
+from pv_forecast.query_service import ForecastSnapshot, QueryService, QueryError
+
+START = pd.Timestamp("2021-04-01 00:00", tz="UTC")
+
+
+def forecast_result(peak=2000., hours=48):
+    """ Result like calculate_forecast: hourly values, -15.8 W at night """
+    index = pd.date_range(START, periods=hours, freq="H", name="date")
+    daylight = np.clip(np.sin((index.hour.to_numpy() - 6) / 12 * np.pi), 0, None)
+    power = np.where(daylight > 0, peak * daylight, -15.8)
+    return pd.DataFrame({"ALL_AC_POWER_clearsky": power * 1.2, "ALL_AC_POWER_disc": power,
+                         "ALL_AC_POWER_dirint": power * 0.9}, index=index)
+
+
+class TestQueryService(unittest.TestCase):
+    def setUp(self) -> None:
+        self.result = forecast_result()
+        self.snapshot = ForecastSnapshot(self.result)
+
+    def test_snapshot_queries(self):
+        power = self.result.ALL_AC_POWER_disc
+        forecast = self.snapshot.forecast(START + pd.Timedelta(minutes=90), 3)
+        # The running interval (01:00) is included
+        self.assertEqual(forecast["times"][0], "2021-04-01T01:00:00+00:00")
+        self.assertEqual(forecast["ac_power"], [round(value, 1) for value in power.iloc[1:5]])
+
+        # Energy: only production, partial intervals pro rata
+        energy = self.snapshot.energy_between(START + pd.Timedelta(hours=9, minutes=30),
+                                              START + pd.Timedelta(hours=12))
+        self.assertAlmostEqual(energy["energy"], 0.5 * power.iloc[9] + power.iloc[10] + power.iloc[11], places=0)
+        day = self.snapshot.energy_between(START, START + pd.Timedelta(days=1))["energy"]
+        self.assertAlmostEqual(day, power.iloc[:24].clip(lower=0).sum(), places=0)
+
+        best = self.snapshot.best_window(3, start=START + pd.Timedelta(hours=20))
+        self.assertEqual(best["start"], "2021-04-02T11:00:00+00:00")
+        self.assertEqual(best["end"], "2021-04-02T14:00:00+00:00")
+        best = self.snapshot.best_window(2, start=START + pd.Timedelta(hours=13, minutes=15),
+                                         end=START + pd.Timedelta(hours=20), mode="clearsky")
+        self.assertEqual(best["start"], "2021-04-01T13:15:00+00:00")
+
+    def test_etag_of_queries(self):
+        service = QueryService(port=0)
+        try:
+            service.update(self.result)
+            now = START + pd.Timedelta(hours=10, minutes=5)
+            # Queries starting now: the same ETag within the running interval, a new one for the next
+            answer, etag = service.answer("/energy", {"end": ["2021-04-02"]}, now=now)
+            later, later_etag = service.answer("/energy", {"end": ["2021-04-02"]}, now=now + pd.Timedelta(minutes=30))
+            self.assertNotEqual(answer, later)
+            self.assertEqual(later_etag, etag)
+            self.assertNotEqual(service.answer("/energy", {"end": ["2021-04-02"]}, now=now + pd.Timedelta(hours=1))[1],
+                                etag)
+            # Normalised parameters
+            self.assertEqual(service.answer("/best_window", {"hours": ["2"], "start": ["2021-04-01T06:00"]})[1],
+                             service.answer("/best_window", {"hours": ["2.0"], "start": ["2021-04-01 06:00+00:00"]})[1])
+
+            # No forecast rows: invalid query instead of an internal error
+            service.update(self.result.iloc[:0])
+            for path in ["/best_window", "/energy"]:
+                with self.assertRaises(QueryError):
+                    service.query(path, {"end": ["2021-04-02"]}, now=now)
+        finally:
+            service.server.server_close()
+
+    def test_http(self):
+        service = QueryService(port=0)
+        service.start()
+        url = "http://%s:%d" % service.address
+
+        def get(path, etag=None):
+            request = urllib.request.Request(url + path, headers={"If-None-Match": etag} if etag else {})
+            try:
+                with urllib.request.urlopen(request, timeout=5) as response:
+                    return response.status, response.headers.get("ETag"), json.loads(response.read())
+            except urllib.error.HTTPError as error:
+                return error.code, error.headers.get("ETag"), None
+
+        try:
+            self.assertEqual(get("/status")[0], 503)
+            service.update(self.result)
+            path = "/energy?start=2021-04-01T06:00&end=2021-04-01T18:00"
+            status, etag, answer = get(path)
+            self.assertEqual(status, 200)
+            self.assertGreater(answer["energy"], 0)
+            # Unchanged: not modified
+            self.assertEqual(get(path, etag)[:2], (304, etag))
+            self.assertEqual(get("/best_window?hours=2&start=2021-04-01T00:00&end=2021-04-02")[2]["start"],
+                             "2021-04-01T11:00:00+00:00")
+            self.assertEqual(get("/forecast?hours=2&start=2021-04-01T10:00&mode=dirint")[2]["ac_power"],
+                             list(self.result.ALL_AC_POWER_dirint.iloc[10:12].round(1)))
+            self.assertEqual(get("/energy?mode=other&end=2021-04-02")[0], 400)
+            self.assertEqual(get("/energy?start=2021-04-01")[0], 400)
+            self.assertEqual(get("/unknown")[0], 404)
+            # Polling a query starting now
+            status, etag_now, _ = get("/forecast?hours=2")
+            self.assertEqual(get("/forecast?hours=2", etag_now)[:2], (304, etag_now))
+
+            # New result: new answer
+            service.update(forecast_result(peak=1500.))
+            status, new_etag, new_answer = get(path, etag)
+            self.assertEqual(status, 200)
+            self.assertNotEqual(new_etag, etag)
+            self.assertAlmostEqual(new_answer["energy"], 0.75 * answer["energy"], places=0)
+        finally:
+            service.stop()
+
+if __name__ == '__main__':
+    unittest.main()
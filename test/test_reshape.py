@@ -0,0 +1,65 @@
+import unittest, os
+import numpy as np
+import pandas as pd
+
+from pv_forecast.reshape import unstack_long_frame, reshape_mosmix, reshape_observation
+
+TEST_DIR = os.path.dirname(__file__)
+
+
+def pivot_reference(raw_data):
+    """ Reshape as done by pandas.pivot_table (previous implementation). """
+    reshaped_data = pd.pivot_table(raw_data, values="value", index=["date"], columns="parameter", aggfunc='first')
+    reshaped_data.columns = reshaped_data.columns.tolist()
+    return reshaped_data.astype(float)
+
+
+class TestReshape(unittest.TestCase):
+    def setUp(self) -> None:
+        self.raw_data = pd.read_pickle(os.path.join(TEST_DIR, "data", "test_dwd_forecast_data.p"))
+        self.raw_data.columns = self.raw_data.columns.str.lower()
+
+    def test_unstack_matches_pivot_table(self):
+        reshaped_data = unstack_long_frame(self.raw_data)
+        expected = pivot_reference(self.raw_data)
+        self.assertFalse(isinstance(reshaped_data.columns, pd.CategoricalIndex))
+        self.assertTrue(all(dtype == float for dtype in reshaped_data.dtypes))
+        np.testing.assert_array_equal(reshaped_data.columns, expected.columns)
+        pd.testing.assert_frame_equal(reshaped_data, expected, check_names=False)
+
+    def test_duplicates_and_missing_values(self):
+        raw_data = pd.DataFrame({"date": pd.to_datetime(["2021-04-01 10:00", "2021-04-01 09:00", "2021-04-01 09:00",
+                                                         "2021-04-01 09:00", "2021-04-01 11:00", "2021-04-01 11:00"], utc=True),
+                                 "parameter": ["b", "a", "a", "a", "a", "c"],
+                                 "value": [1.0, np.nan, 2.0, 3.0, np.nan, np.nan]})
+        reshaped_data = unstack_long_frame(raw_data)
+        expected = pivot_reference(raw_data)
+        pd.testing.assert_frame_equal(reshaped_data, expected, check_names=False)
+        # first valid value is used, rows / columns without values are dropped
+        self.assertEqual(reshaped_data.loc["2021-04-01 09:00", "a"], 2.0)
+        self.assertEqual(len(reshaped_data), 2)
+        self.assertEqual(list(reshaped_data.columns), ["a", "b"])
+
+    def test_reshape_mosmix_units(self):
+        reshaped_data = reshape_mosmix(self.raw_data)
+        first_date = self.raw_data["date"].min() - pd.Timedelta(hours=1)
+        self.assertEqual(reshaped_data.index[0], first_date)
+        np.testing.assert_allclose(reshaped_data["TEMPERATURE_AIR_200DEGC"],
+                                   reshaped_data["TEMPERATURE_AIR_200"] - 273.15)
+        np.testing.assert_allclose(reshaped_data["RAD_WH"], reshaped_data["RADIATION_GLOBAL"] * 0.277778)
+
+    def test_reshape_observation_units(self):
+        dates = pd.date_range("2021-04-01", periods=6, freq="10min", tz="utc")
+        parameters = ["temperature_air_200", "radiation_global", "radiation_sky_diffuse",
+                      "temperature_dew_point_200", "pressure_air_station_height", "wind_speed"]
+        raw_data = pd.DataFrame({"date": np.tile(dates, len(parameters)),
+                                 "parameter": np.repeat(parameters, len(dates)),
+                                 "value": np.arange(len(dates) * len(parameters), dtype=float)})
+        reshaped_data = reshape_observation(raw_data)
+        np.testing.assert_allclose(reshaped_data["RAD_WH"], reshaped_data["radiation_global"] * 16.666666667)
+        np.testing.assert_allclose(reshaped_data["RAD_DIFFUS"], reshaped_data["radiation_sky_diffuse"] * 16.666666667)
+        self.assertEqual(list(reshaped_data.columns[-6:]), ["TEMPERATURE_AIR_200DEGC", "DEW_POINT_DEGC", "RAD_WH",
+                                                            "RAD_DIFFUS", "WIND_SPEED", "PRESSURE_AIR_SURFACE_REDUCED"])
+
+if __name__ == '__main__':
+    unittest.main()
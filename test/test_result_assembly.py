@@ -0,0 +1,71 @@
+import unittest, os
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+
+from test import read_config
+from pv_forecast.reshape import reshape_mosmix
+from pv_forecast.calculation import setup_solar_processing, setup_pv_system, calculate_forecast
+from pv_forecast.result_assembly import RESULT_SERIES, combine_results
+
+TEST_DIR = os.path.dirname(__file__)
+
+
+def model_results(index, offset):
+    values = np.arange(len(index), dtype=float) + offset
+    series = {pv_key: pd.Series(values * (number + 1), index=index) for number, pv_key in enumerate(RESULT_SERIES)}
+    frames = {"dc": pd.DataFrame({"p_mp": values, "v_mp": values / 2}, index=index),
+              "diode_params": pd.DataFrame({"I_L": values}, index=index),
+              "total_irrad": pd.DataFrame({"poa_global": values}, index=index)}
+    return SimpleNamespace(**series, **frames)
+
+
+class TestResultAssembly(unittest.TestCase):
+    def test_layout_and_total(self):
+        index = pd.date_range("2021-04-01", periods=5, freq="H", tz="UTC")
+        # "Garage_ac" contains "_ac": only the ac columns are added up
+        results = {"Garage_ac": model_results(index, 0.), "West": model_results(index, 10.)}
+        weather = pd.Series(np.linspace(0., 1., 5), index=index)
+        result = combine_results(index, {"disc": results}, ["Garage_ac", "West"], {"RAD_WH": weather[::-1]})
+
+        self.assertEqual(list(result.columns[:7]), ["RAD_WH", "Garage_ac_ac_disc", "Garage_ac_aoi_disc",
+                                                    "Garage_ac_cell_temperature_disc",
+                                                    "Garage_ac_effective_irradiance_disc",
+                                                    "Garage_ac_dc_p_mp_disc", "Garage_ac_dc_v_mp_disc"])
+        self.assertEqual(result.shape, (5, 1 + 2 * 8 + 1))
+        self.assertEqual(result._mgr.nblocks, 1)
+        # Leading Series are aligned to the index
+        np.testing.assert_array_equal(result["RAD_WH"], weather)
+        np.testing.assert_array_equal(result["ALL_AC_POWER_disc"], results["Garage_ac"].ac + results["West"].ac)
+
+        # Non-numeric leading columns are kept unchanged at their position
+        station = pd.Series(["01078"] * 5, index=index)
+        result = combine_results(index, {"disc": results}, ["Garage_ac", "West"],
+                                 {"STATION": station, "RAD_WH": weather, "QUALITY": np.array(list("abcde"))})
+        self.assertEqual(list(result.columns[:3]), ["STATION", "RAD_WH", "QUALITY"])
+        self.assertEqual(list(result["STATION"]), ["01078"] * 5)
+        self.assertEqual(list(result["QUALITY"]), list("abcde"))
+        np.testing.assert_array_equal(result["RAD_WH"], weather)
+        np.testing.assert_array_equal(result["ALL_AC_POWER_disc"], results["Garage_ac"].ac + results["West"].ac)
+
+    def test_calculate_forecast(self):
+        config = read_config()
+        raw_data = pd.read_pickle(os.path.join(TEST_DIR, "data", "test_dwd_forecast_data.p"))
+        raw_data.columns = raw_data.columns.str.lower()
+        dwddata = reshape_mosmix(raw_data)
+        original = dwddata.copy()
+        solar_proc = setup_solar_processing(config)
+        pv_system = setup_pv_system(config, solar_proc.location)
+
+        result = calculate_forecast(dwddata, solar_proc, pv_system)
+        # The input is not modified
+        pd.testing.assert_frame_equal(dwddata, original)
+        self.assertEqual(result._mgr.nblocks, 1)
+        self.assertEqual(list(result.columns[:len(dwddata.columns)]), list(dwddata.columns))
+        # The results of the last mode equal those of combine_data
+        pd.testing.assert_frame_equal(result[pv_system.combine_data("dirint").columns],
+                                      pv_system.combine_data("dirint"))
+        pv_system.close()
+
+if __name__ == '__main__':
+    unittest.main()
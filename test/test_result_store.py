@@ -0,0 +1,95 @@
+import unittest, os, shutil, tempfile, configparser
+import numpy as np
+import pandas as pd
+
+from pv_forecast.result_store import (ResultStore, split_result, import_csv_files, csv_issue_time, setup_result_writer,
+                                      ALL_ARRAYS)
+
+TEST_DIR = os.path.dirname(__file__)
+OUTPUT_DIR = os.path.join(TEST_DIR, "..", "output")
+
+
+def result_frame(start, value, periods=48):
+    """ Wide result like calculate_forecast (two arrays, modes clearsky / disc) """
+    index = pd.date_range(start, periods=periods, freq="1h", tz="UTC", name="date")
+    result = pd.DataFrame({"temperature_air_200": np.linspace(270., 290., periods)}, index=index)
+    for mode in ["clearsky", "disc"]:
+        for array in ["East", "West"]:
+            result["%s_ac_%s" % (array, mode)] = value
+            result["%s_dc_p_mp_%s" % (array, mode)] = value + 10.
+        result["ALL_AC_POWER_%s" % mode] = 2 * value
+    return result
+
+
+class TestResultStore(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = ResultStore(os.path.join(self.tmp_dir.name, "results"))
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_split_result(self):
+        pv, weather = split_result(result_frame("2021-04-01 00:00", 100.), pd.Timestamp("2021-03-31 18:00", tz="UTC"))
+        self.assertEqual(len(pv), 48 * 2 * 3)
+        self.assertEqual(set(pv["array"]), {"East", "West", ALL_ARRAYS})
+        self.assertEqual(pv["ac"].dtype, np.float32)
+        self.assertEqual(weather["value"].dtype, np.float32)
+        self.assertEqual(set(weather["parameter"]), {"temperature_air_200"})
+
+    def test_append_and_query(self):
+        # Two runs overlapping on 2021-04-01, the second one spanning the month border
+        self.store.append(result_frame("2021-03-31 00:00", 100.), issue_time="2021-03-30 21:00")
+        self.store.append(result_frame("2021-04-01 00:00", 200.), issue_time="2021-03-31 21:00")
+        self.assertEqual(len(self.store.runs("default")), 2)
+        self.assertEqual(len(os.listdir(os.path.join(self.store.directory, "default", "forecast"))), 2)
+
+        day = self.store.forecasts_for_day("2021-04-01", mode="disc")
+        self.assertEqual(len(day), 2 * 24)
+        self.assertEqual(sorted(day["ac"].unique()), [200., 400.])
+
+        latest = self.store.latest_forecast("2021-03-31", "2021-04-03", mode="disc", array="East")
+        self.assertEqual(len(latest), 72)
+        self.assertTrue((latest["ac"][latest["target_time"] < "2021-04-01"] == 100.).all())
+        self.assertTrue((latest["ac"][latest["target_time"] >= "2021-04-01"] == 200.).all())
+        as_of = self.store.latest_forecast("2021-04-01", "2021-04-02", mode="disc", array="East",
+                                           as_of="2021-03-31 12:00")
+        self.assertTrue((as_of["ac"] == 100.).all())
+
+        weather = self.store.weather("2021-04-01", "2021-04-03")
+        self.assertEqual(len(weather), 48)
+        self.assertEqual(list(weather.columns), ["temperature_air_200"])
+
+    def test_writer_uses_mosmix_issue_time(self):
+        config = configparser.ConfigParser()
+        config.read_dict({"ResultStore": {"Enabled": "True", "Directory": self.store.directory, "Site": "home"},
+                          "DWD": {"Mode": "None"}})
+        write_result = setup_result_writer(config)
+        for value in [100., 200.]:
+            result = result_frame("2021-04-01 00:00", value)
+            result.attrs["issue_time"] = pd.Timestamp("2021-03-31 21:00", tz="UTC")
+            write_result(result)
+        # Both runs of the same MOSMIX issue are one run of the store
+        runs = self.store.runs("home")
+        self.assertEqual([run["issue_time"] for run in runs], ["2021-03-31T21:00:00+00:00"])
+
+    def test_import_csv_files(self):
+        csv_dir = os.path.join(self.tmp_dir.name, "output")
+        os.makedirs(csv_dir)
+        for name in ["2021_04_01_08_Uhr.csv", "2021_04_01_11_54_Uhr.csv"]:
+            shutil.copy(os.path.join(OUTPUT_DIR, name), csv_dir)
+        self.assertEqual(csv_issue_time("2021_04_01_11_54_Uhr.csv"), pd.Timestamp("2021-04-01 09:54", tz="UTC"))
+
+        self.assertEqual(len(import_csv_files(self.store, csv_dir)), 2)
+        self.assertEqual(import_csv_files(self.store, csv_dir), [])
+        self.assertEqual(len(self.store.runs("default")), 2)
+
+        original = pd.read_csv(os.path.join(csv_dir, "2021_04_01_11_54_Uhr.csv"), index_col=0)
+        original.index = pd.to_datetime(original.index, utc=True)
+        # Written before the calculation modes were introduced: stored as mode disc
+        stored = self.store.forecasts(original.index[0], original.index[-1] + pd.Timedelta(hours=1), mode="disc")
+        stored = stored[stored["issue_time"] == pd.Timestamp("2021-04-01 09:54", tz="UTC")]
+        np.testing.assert_allclose(stored["ac"], original["ALL_AC_POWER"], rtol=1e-6)
+
+if __name__ == '__main__':
+    unittest.main()
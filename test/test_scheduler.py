@@ -0,0 +1,72 @@
+import unittest
+import numpy as np
+import pandas as pd
+
+from pv_forecast.scheduler import Scheduler, Load
+
+
+def pv_forecast(days=2, peak=5000.):
+    """ Hourly ac power of a clear day (UTC, noon at 12:00) """
+    index = pd.date_range("2021-06-01", periods=24 * days, freq="H", tz="UTC")
+    power = np.clip(np.sin((index.hour - 5) / 14 * np.pi), 0, None) * peak
+    return pd.Series(power, index=index, name="ALL_AC_POWER_disc")
+
+
+class TestScheduler(unittest.TestCase):
+    def test_fixed_load(self):
+        # The start of the fixed load equals the best start by brute force
+        forecast = pv_forecast()
+        load = Load("dishwasher", profile=[[0.5, 2000], [1.0, 150], [0.75, 1800]],
+                    earliest="2021-06-01T14:00", deadline="2021-06-02T11:00")
+        scheduler = Scheduler([load], base_load=300.)
+        schedule = scheduler.plan(forecast)
+        entry = schedule.entries[0]
+        self.assertTrue(entry["feasible"])
+
+        plan = schedule.plan
+        surplus = np.clip(plan.PV - plan.BASE_LOAD, 0, None).to_numpy()
+        profile = np.repeat([2000., 150., 1800.], [2, 4, 3])
+        starts = np.flatnonzero((plan.index >= pd.Timestamp("2021-06-01T14:00Z")) &
+                                (plan.index + pd.Timedelta("15min") * len(profile) <=
+                                 pd.Timestamp("2021-06-02T11:00Z")))
+        solar = [np.minimum(profile, surplus[start:start + len(profile)]).sum() / 4 for start in starts]
+        self.assertAlmostEqual(entry["solar_energy"], max(solar), places=1)
+        self.assertEqual(pd.Timestamp(entry["start"]), plan.index[starts[int(np.argmax(np.round(solar, 3)))]])
+        self.assertAlmostEqual(entry["energy"], 2000 * 0.5 + 150 + 1800 * 0.75)
+        np.testing.assert_allclose(plan.dishwasher[plan.dishwasher > 0], profile)
+
+    def test_interruptible_load(self):
+        forecast = pv_forecast()
+        car = Load("car", interruptible=True, energy=30000, power=11000, min_power=4000,
+                   earliest="2021-06-01T06:00", deadline="2021-06-01T20:00")
+        washer = Load("washer", power=2000, duration=2)
+        schedule = Scheduler([car, washer], base_load=300.).plan(forecast)
+        washer_entry, car_entry = schedule.entries
+        plan = schedule.plan
+        # Fixed loads first, the car uses the surplus left within its window
+        self.assertEqual(washer_entry["grid_energy"], 0.)
+        self.assertTrue(car_entry["feasible"])
+        self.assertAlmostEqual(plan.car.sum() / 4, 30000., places=6)
+        window = (plan.index >= pd.Timestamp("2021-06-01T06:00Z")) & (plan.index < pd.Timestamp("2021-06-01T20:00Z"))
+        self.assertEqual(plan.car[~window].sum(), 0.)
+        # At least min_power in every slot charged
+        self.assertFalse(((plan.car > 0) & (plan.car < 4000 - 1e-9)).any())
+        self.assertTrue((plan.car <= 11000).all())
+        self.assertTrue((plan.SURPLUS >= 0).all())
+
+        # Not enough time: charged at full power until the deadline, not feasible
+        car = Load("car", interruptible=True, energy=30000, power=11000, earliest="2021-06-01T18:00",
+                   deadline="2021-06-01T20:00")
+        entry = Scheduler([car]).plan(forecast).entries[0]
+        self.assertFalse(entry["feasible"])
+        self.assertAlmostEqual(entry["energy"], 22000.)
+
+        # A small energy is charged at min_power (rounded up), naive times are UTC
+        car = Load("car", interruptible=True, energy=500, power=11000, min_power=4000)
+        plan = Scheduler([car], base_load=300.).plan(forecast, now="2021-06-01T10:05").plan
+        self.assertEqual(plan.index[0], pd.Timestamp("2021-06-01T10:15Z"))
+        np.testing.assert_allclose(plan.car[plan.car > 0], [4000.])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest, unittest.mock, os, tempfile
+import numpy as np
+import pandas as pd
+
+from test import read_config
+from pv_forecast.reshape import reshape_mosmix
+from pv_forecast.solar_parameters import Solar_Processing
+from pv_forecast.solar_table import build_solar_table, load_solar_table, load_or_build, setup_solar_table
+from pv_forecast.calculation import setup_solar_processing, setup_pv_system, calculate_forecast
+
+TEST_DIR = os.path.dirname(__file__)
+LATITUDE, LONGITUDE, ALTITUDE = 51.4, 6.86, 90.0
+
+
+class TestSolarTable(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.directory = self.tmp_dir.name
+        self.time_grid = pd.date_range("2021-03-25", "2021-04-10", freq="10min", tz="UTC")
+        self.table = build_solar_table(self.directory, LATITUDE, LONGITUDE, ALTITUDE, self.time_grid)
+        self.solar_proc = Solar_Processing(LATITUDE, LONGITUDE, ALTITUDE, "UTC")
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_exact_on_grid(self):
+        time_range = pd.date_range("2021-03-29 01:00", "2021-04-03 23:00", freq="1h", tz="UTC")
+        pd.testing.assert_frame_equal(self.table.solar_position(time_range),
+                                      self.solar_proc.get_solar_postition(time_range))
+        pd.testing.assert_frame_equal(self.table.clearsky(time_range),
+                                      self.solar_proc.get_clearsky_weather(time_range))
+
+    def test_interpolation(self):
+        time_range = pd.date_range("2021-03-29 00:03", "2021-04-03 23:00", freq="7min", tz="UTC")
+        solpos = self.table.solar_position(time_range)
+        expected = self.solar_proc.get_solar_postition(time_range)
+        np.testing.assert_allclose(solpos["zenith"], expected["zenith"], atol=0.05)
+        azimuth_error = (solpos["azimuth"] - expected["azimuth"] + 180.) % 360. - 180.
+        self.assertTrue(np.abs(azimuth_error).max() < 0.5)
+        clearsky = self.table.clearsky(time_range)
+        np.testing.assert_allclose(clearsky, self.solar_proc.get_clearsky_weather(time_range), atol=5.)
+
+    def test_rebuild_on_site_change(self):
+        self.assertIsNotNone(load_solar_table(self.directory, LATITUDE, LONGITUDE, ALTITUDE))
+        self.assertIsNone(load_solar_table(self.directory, LATITUDE, LONGITUDE, 100.0))
+        table = load_or_build(self.directory, LATITUDE, LONGITUDE, 100.0, self.time_grid)
+        self.assertEqual(table.altitude, 100.0)
+        self.assertIsNot(table.data_path, self.table.data_path)
+        # Same site and grid: the existing table is opened (no rebuild)
+        modified = os.path.getmtime(table.data_path)
+        self.assertEqual(os.path.getmtime(load_or_build(self.directory, LATITUDE, LONGITUDE, 100.0,
+                                                        self.time_grid).data_path), modified)
+        # Other grid: rebuild
+        other_grid = pd.date_range("2021-03-25", "2021-04-10", freq="15min", tz="UTC")
+        self.assertEqual(load_or_build(self.directory, LATITUDE, LONGITUDE, 100.0, other_grid).periods, len(other_grid))
+
+    def test_forecast_with_solar_table(self):
+        config = read_config()
+        raw_data = pd.read_pickle(os.path.join(TEST_DIR, "data", "test_dwd_forecast_data.p"))
+        raw_data.columns = raw_data.columns.str.lower()
+        dwddata = reshape_mosmix(raw_data)
+
+        # A run opens an existing table only, it is not built on the fly
+        config.set("SolarTable", "Enabled", "True")
+        config.set("SolarTable", "Directory", os.path.join(self.directory, "run"))
+        self.assertIsNone(setup_solar_table(config))
+        self.assertFalse(os.path.exists(os.path.join(self.directory, "run")))
+        config.set("SolarTable", "Enabled", "False")
+
+        solar_proc = setup_solar_processing(config)
+        expected = calculate_forecast(dwddata.copy(), solar_proc, setup_pv_system(config, solar_proc.location))
+
+        table = build_solar_table(self.directory, solar_proc.mylatitude, solar_proc.mylongitude, solar_proc.myaltitude,
+                                  self.time_grid)
+        solar_proc.solar_table = table
+        self.assertTrue(table.covers(dwddata.index))
+        pv_system = setup_pv_system(config, solar_proc.location)
+        with unittest.mock.patch.object(solar_proc.location, "get_clearsky") as get_clearsky:
+            result = calculate_forecast(dwddata.copy(), solar_proc, pv_system)
+        get_clearsky.assert_not_called()
+        pd.testing.assert_frame_equal(result, expected)
+
+        # Not covered by the table: computed directly
+        time_range = pd.date_range("2022-06-01", periods=24, freq="1h", tz="UTC")
+        self.assertFalse(table.covers(time_range))
+        self.assertEqual(len(solar_proc.get_solar_postition(time_range)), 24)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest, os, sys, json, subprocess, tempfile
+import pandas as pd
+
+from test import read_config
+from pv_forecast.dwd_async import parse_observation_zip
+from pv_forecast.reshape import reshape_observation
+
+TEST_DIR = os.path.dirname(__file__)
+ROOT_DIR = os.path.abspath(os.path.join(TEST_DIR, ".."))
+# Import time [s] and packages (besides the standard library) allowed per startup case,
+# extend the baseline only if a new import is intended:
+with open(os.path.join(TEST_DIR, "data", "startup_baseline.json")) as baseline_file:
+    BASELINE = json.load(baseline_file)
+# The import times depend on the host, they are only checked on request (PV_FORECAST_TIMING=1)
+CHECK_TIMES = os.environ.get("PV_FORECAST_TIMING") == "1"
+
+IMPORT_MAIN = """
+import json, sys, time
+loaded = set(sys.modules)
+start = time.perf_counter()
+import main
+seconds = time.perf_counter() - start
+print(json.dumps({"seconds": seconds, "packages": main.top_level_packages(set(sys.modules) - loaded - {"main"})}))
+"""
+
+
+class TestStartup(unittest.TestCase):
+    def test_import_main(self):
+        output = subprocess.run([sys.executable, "-c", IMPORT_MAIN], cwd=ROOT_DIR, check=True,
+                                capture_output=True, text=True).stdout
+        startup = json.loads(output)
+        self.assertEqual(startup["packages"], BASELINE["import_main"]["packages"])
+        if CHECK_TIMES:
+            self.assertLess(startup["seconds"], BASELINE["import_main"]["max_seconds"])
+
+    def test_from_file(self):
+        raw_data = []
+        for tag in ["TU", "SOLAR", "wind"]:
+            with open(os.path.join(TEST_DIR, "data", "10minutenwerte_%s_01078_now.zip" % tag), "rb") as zip_file:
+                raw_data.append(parse_observation_zip(zip_file.read(), 1078))
+        raw_data = pd.concat(raw_data, ignore_index=True)
+        raw_data["parameter"] = raw_data["parameter"].astype("category")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            reshape_observation(raw_data).to_csv(os.path.join(tmp_dir, "weather.csv"))
+            # The component database of the tests is used (built by the first run)
+            with open(os.path.join(tmp_dir, "configuration.ini"), "w") as config_file:
+                read_config().write(config_file)
+
+            subprocess.run([sys.executable, os.path.join(ROOT_DIR, "main.py"), "--mode", "from_file",
+                            "--input", "weather.csv", "--start", "2021-04-01T06:00", "--end", "2021-04-01T18:00",
+                            "--output", "out", "--import-report", "imports.json"],
+                           cwd=tmp_dir, check=True, capture_output=True)
+            with open(os.path.join(tmp_dir, "imports.json")) as report_file:
+                report = json.load(report_file)
+            result = pd.read_csv(os.path.join(tmp_dir, "out", os.listdir(os.path.join(tmp_dir, "out"))[0]),
+                                 index_col=0)
+
+        self.assertEqual(len(result), 73)
+        self.assertNotIn("wetterdienst", report["packages"])
+        self.assertEqual(set(report["packages"]) - set(BASELINE["from_file"]["packages"]), set())
+        if CHECK_TIMES:
+            self.assertLess(report["seconds"], BASELINE["from_file"]["max_seconds"])
+
+if __name__ == '__main__':
+    unittest.main()
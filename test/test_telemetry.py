@@ -0,0 +1,92 @@
+import unittest, os, tempfile
+import numpy as np
+import pandas as pd
+
+from pv_forecast.kostal_reader import CHANNELS
+from pv_forecast.evaluation import measured_ac
+from pv_forecast.telemetry import PlenticoreSource, SQLiteSink, TelemetryIngest, SimulatedInverter
+
+NOON = pd.Timestamp("2021-06-01T12:00Z").value // 10**9
+
+
+class RecordingSink:
+    """ Sink failing the first writes """
+    def __init__(self, failures=0) -> None:
+        self.failures = failures
+        self.batches = []
+
+    def write(self, times, values):
+        if self.failures:
+            self.failures -= 1
+            raise IOError("sink not available")
+        self.batches.append((times.copy(), values.copy()))
+
+
+class CountingSource:
+    channels = CHANNELS
+
+    def __init__(self) -> None:
+        self.count = 0
+
+    def read(self):
+        self.count += 1
+        return np.full(len(self.channels), self.count, dtype=np.float32)
+
+
+class TestTelemetry(unittest.TestCase):
+    def test_simulated_inverter(self):
+        # Readings of the simulated inverter are stored with the channels of the csv export
+        clock = {"now": NOON}
+        inverter = SimulatedInverter(peak=4200., clock=lambda: clock["now"]).start()
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                sink = SQLiteSink(os.path.join(directory, "telemetry.db"))
+                ingest = TelemetryIngest(PlenticoreSource(inverter.url), sink, interval=60, batch_size=10,
+                                         clock=lambda: clock["now"])
+                for minute in range(25):
+                    clock["now"] = NOON + 60 * minute
+                    ingest.step()
+                self.assertEqual(ingest.stats()["written"], 20)
+                self.assertEqual(ingest.stats()["buffered"], 5)
+                ingest.flush(force=True)
+
+                data = sink.read("2021-06-01T12:00", "2021-06-01T13:00")
+                self.assertEqual(list(data.columns), CHANNELS)
+                self.assertEqual(len(data), 25)
+                self.assertEqual(data.index[1] - data.index[0], pd.Timedelta(minutes=1))
+                self.assertEqual(inverter.requests, 25)
+                first = data.iloc[0]
+                self.assertAlmostEqual(float(first["AC1 P"] + first["AC2 P"] + first["AC3 P"]), 4200., places=1)
+                # Currents in mA like the export
+                self.assertAlmostEqual(float(first["AC1 I"]), 1400. / 230. * 1000., places=1)
+                # Read by the evaluation like the exported logs
+                self.assertAlmostEqual(measured_ac(data)[pd.Timestamp("2021-06-01T12:00Z")],
+                                       data[["AC1 P", "AC2 P", "AC3 P"]].sum(axis=1).mean(), places=1)
+                self.assertEqual(sink.last_timestamp(), data.index[-1])
+        finally:
+            inverter.stop()
+
+    def test_backpressure_and_retry(self):
+        sink = RecordingSink(failures=3)
+        ingest = TelemetryIngest(CountingSource(), sink, interval=60, batch_size=4, capacity=10, backoff=60,
+                                 max_backoff=240)
+        # Writes fail for 3 attempts (retries after 60, 120, 240 s), the buffer keeps the last 10 readings
+        for minute in range(20):
+            ingest.step(NOON + 60 * minute)
+        stats = ingest.stats()
+        self.assertEqual(stats["write_errors"], 3)
+        self.assertEqual(stats["polled"], 20)
+        self.assertEqual(stats["polled"], stats["written"] + stats["buffered"] + stats["dropped"])
+        self.assertGreater(stats["dropped"], 0)
+        ingest.flush(NOON + 3600, force=True)
+        self.assertEqual(len(ingest.buffer), 0)
+        times = np.concatenate([times for times, _ in sink.batches])
+        values = np.concatenate([values[:, 0] for _, values in sink.batches])
+        # Written in order without gaps after the dropped readings
+        np.testing.assert_array_equal(np.diff(times), 60)
+        np.testing.assert_array_equal(values, np.arange(stats["dropped"] + 1, 21))
+        self.assertTrue(all(len(batch) <= 4 for batch, _ in sink.batches))
+
+
+if __name__ == '__main__':
+    unittest.main()